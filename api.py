@@ -1,33 +1,70 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-import json
-from typing import Optional, Dict, List, Any, cast # Import 'cast'
+from collections import OrderedDict
+from typing import Optional, Dict, List, Any, Tuple, cast # Import 'cast'
+from contextlib import asynccontextmanager
+import asyncio
+import copy
 import uuid # Import uuid for generating project_id
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import GraphState and individual node functions from nodes.py
 # Now importing the internal, granular generation functions
 from nodes import (
+    RetrievalMemo,
     generate_variables,
     generate_questionnaire,
+    generate_questionnaire_stream,
+    generate_questionnaire_sectioned,
     modify_variables_intelligent,
     modify_questionnaire_llm,
     analyze_questionnaire_impact,
-    write_to_supabase, # The single function used for multiple save points
-    fetch_supabase_tables,
+    enqueue_write_to_supabase, # The single function used for multiple save points
+    afetch_supabase_tables,
+    afetch_project_tables,
     analyze_variable_dependencies,
     export_sections_for_card_generator
 )
 
+from scoring import score_answers
+from bulk_scoring import records_to_columns, score_responses_batch, table_to_records
+from formula_validation import validate_project_formulas
+from metrics import metrics_report
+from save_outbox import get_outbox, start_outbox_flusher, stop_outbox_flusher
+from http_client import aclose_clients
+from single_flight import generation_flights, normalize_prompt, request_key
+from template_library import find_closest_template, load_template_index
+from storage import aload_save_ledger, get_storage, row_hash
+import serialization
+
 # Import the GraphState schema
 from schemas.schemas import GraphState
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Saves are persisted in the background from the durable outbox (see save_outbox.py)
+    start_outbox_flusher()
+    # Builds data_store/template_index.json on first start (or after the flow export changed)
+    await asyncio.to_thread(load_template_index)
+    yield
+    stop_outbox_flusher()
+    await aclose_clients()  # Pooled Supabase connections (see http_client.py)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with serialization.dumps (orjson when installed)."""
+
+    def render(self, content: Any) -> bytes:
+        return serialization.dumps(content)
+
 # Initialize the FastAPI application
 api_app = FastAPI(
     title="Langraph Financial Assessment API (Step-by-Step with Finalize)",
     description="API to run the Langraph workflow with explicit finalization steps for variables and questionnaire.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 api_app.add_middleware(
@@ -62,6 +99,8 @@ class SharedWorkflowState(BaseModel):
     status: Optional[str] = None  # New: Track workflow status
     needs_review: Optional[bool] = None  # New: Indicates if modifications need review
     questionnaire_title: Optional[str] = None  # New: Title of the generated questionnaire
+    stage_timings: Optional[Dict[str, Any]] = None  # Stage start/end times (ms) of the last node runs
+    template_name: Optional[str] = None  # Occupation template the project was seeded from, if any
 
 
 class ModificationRequest(BaseModel):
@@ -70,40 +109,94 @@ class ModificationRequest(BaseModel):
     modification_prompt: str = ""
 
 
+class ScoreRequest(BaseModel):
+    """Schema for scoring a filled questionnaire against the current state."""
+    current_state: SharedWorkflowState
+    answers: Dict[str, Any]  # Answers keyed by question variable_name
+
+class BatchScoreRequest(BaseModel):
+    """Schema for scoring many filled questionnaires against the current state in one call."""
+    current_state: SharedWorkflowState
+    responses: List[Dict[str, Any]]  # One answers dict per applicant, keyed by question variable_name
+    include_raw_indicators: bool = True
+
+
+class BatchGenerateRequest(BaseModel):
+    """Schema for generating the variables of many assessments in one call."""
+    prompts: List[str]
+    max_concurrency: Optional[int] = None  # Generations running at once (default BATCH_MAX_CONCURRENCY)
+
+
 class ProjectIdRequest(BaseModel):
     """Schema for requests that require a project_id."""
     project_id: str
 
 
+# --- Response encoding ---
+# Node outputs are plain GraphState dicts. Rebuilding a SharedWorkflowState from them only to have FastAPI
+# validate and re-encode it again costs more than the node bookkeeping itself on large questionnaires, so
+# state endpoints encode the SharedWorkflowState fields of the dict directly (response_model stays for docs).
+
+def state_fields(state: GraphState) -> Dict[str, Any]:
+    """The SharedWorkflowState fields of a state (absent fields take their defaults)."""
+    return {name: state.get(name, None if field.is_required() else field.default)
+            for name, field in SharedWorkflowState.model_fields.items()}
+
+
+def state_response(state: GraphState) -> FastJSONResponse:
+    return FastJSONResponse(state_fields(state))
+
+
 # --- API Endpoints for Step-by-Step Workflow ---
 
+def _generate_variables_pipeline(prompt: str, retrieval: Optional[RetrievalMemo] = None) -> GraphState:
+    new_project_id = str(uuid.uuid4()) # Generate a new UUID for the project
+
+    # Create an initial GraphState for the first node
+    initial_state = cast(GraphState, {
+        "prompt": prompt,
+        "modification_prompt": None,
+        "raw_indicators": None, # Ensure RIs are explicitly None to trigger generation
+        "decision_variables": None, # Ensure DVs are explicitly None to trigger generation
+        "questionnaire": None,
+        "error": None,
+        "project_id": new_project_id, # Set the new project_id
+        "status": "variables_generated",
+        "needs_review": False
+    })
+
+    # Use the existing generate_variables function which handles both types
+    return generate_variables(initial_state, retrieval)
+
+
+def _as_new_project(shared_state: GraphState) -> GraphState:
+    """
+    Copy of a coalesced variable generation under a fresh project_id (variable ids are re-prefixed), so
+    callers sharing one generation never share a project.
+    """
+    state = copy.deepcopy(shared_state)
+    old_project_id, new_project_id = state.get("project_id"), str(uuid.uuid4())
+    state["project_id"] = new_project_id
+    for var in (state.get("raw_indicators") or []) + (state.get("decision_variables") or []):
+        var_id = var.get("id")
+        if old_project_id and isinstance(var_id, str) and var_id.startswith(f"{old_project_id}_"):
+            var["id"] = f"{new_project_id}_{var_id[len(old_project_id) + 1:]}"
+        var["project_id"] = new_project_id
+    return state
+
+
 @api_app.post("/step/generate-variables", response_model=SharedWorkflowState, summary="Step 1: Generate Initial Variables")
 async def step_generate_variables(request: InitialWorkflowRequest):
     """
     Initiates the workflow by generating initial raw indicators and decision variables based on the provided prompt.
     A unique `project_id` is generated for this workflow run.
     Returns the initial state with both raw indicators and decision variables populated.
+    Identical prompts already being generated share that generation; every caller still gets its own project_id.
     """
     try:
-        new_project_id = str(uuid.uuid4()) # Generate a new UUID for the project
-
-        # Create an initial GraphState for the first node
-        initial_state = cast(GraphState, {
-            "prompt": request.prompt,
-            "modification_prompt": None,
-            "raw_indicators": None, # Ensure RIs are explicitly None to trigger generation
-            "decision_variables": None, # Ensure DVs are explicitly None to trigger generation
-            "questionnaire": None,
-            "error": None,
-            "project_id": new_project_id, # Set the new project_id
-            "status": "variables_generated",
-            "needs_review": False
-        })
-        
-        # Use the existing generate_variables function which handles both types
-        updated_state = generate_variables(initial_state)
-
-        return SharedWorkflowState(**updated_state)
+        shared_state = await generation_flights.run(
+            request_key("generate_variables", {"prompt": request.prompt}), _generate_variables_pipeline, request.prompt)
+        return state_response(_as_new_project(shared_state))
 
     except Exception as e:
         print(f"Error in /step/generate-variables: {e}")
@@ -126,37 +219,158 @@ async def step_modify_variables(request: ModificationRequest):
         current_state["modification_prompt"] = request.modification_prompt
         current_state["status"] = "variables_modified"
         updated_state = modify_variables_intelligent(current_state)
-        return SharedWorkflowState(**updated_state)
+        return state_response(updated_state)
     except Exception as e:
         print(f"Error in /step/modify-variables: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+def _generate_questionnaire_pipeline(current_state: GraphState, mode: str) -> GraphState:
+    current_state["status"] = "questionnaire_generated"
+    if mode == "sectioned":
+        updated_state = generate_questionnaire_sectioned(current_state)
+    else:
+        updated_state = generate_questionnaire(current_state)
+
+    # Always analyze impact after generation
+    updated_state = analyze_questionnaire_impact(updated_state)
+
+    # Set needs_review based on impact analysis
+    updated_state["needs_review"] = bool(updated_state.get("error"))
+    return updated_state
+
+
 @api_app.post("/step/generate-questionnaire", response_model=SharedWorkflowState, summary="Step 3: Generate Questionnaire")
-async def step_generate_questionnaire(request: SharedWorkflowState):
+async def step_generate_questionnaire(request: SharedWorkflowState, mode: str = "single"):
     """
     Generates the questionnaire based on the finalized raw indicators and decision variables.
+    `mode=sectioned` plans an outline first and generates the sections concurrently.
     Returns the updated state with the questionnaire populated.
+    Identical requests already being generated share that generation.
     """
     try:
+        if mode not in ("single", "sectioned"):
+            raise HTTPException(status_code=400, detail="mode must be 'single' or 'sectioned'")
         current_state = cast(GraphState, request.model_dump())
-        
-        current_state["status"] = "questionnaire_generated"
-        updated_state = generate_questionnaire(current_state)
-        
-        # Always analyze impact after generation
-        updated_state = analyze_questionnaire_impact(updated_state)
-        
-        # Set needs_review based on impact analysis
-        updated_state["needs_review"] = bool(updated_state.get("error"))
-        
-        return SharedWorkflowState(**updated_state)
+        updated_state = await generation_flights.run(
+            request_key(f"generate_questionnaire_{mode}", current_state), _generate_questionnaire_pipeline, current_state, mode)
+        return state_response(updated_state)
 
+    except HTTPException as he:
+        raise he
     except Exception as e:
         print(f"Error in /step/generate-questionnaire: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+def _sse_event(event: str, data: Any) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {serialization.dumps_str(data)}\n\n"
+
+
+@api_app.post("/step/generate-questionnaire/stream", summary="Step 3 (streaming): Generate Questionnaire section by section")
+def step_generate_questionnaire_stream(request: SharedWorkflowState):
+    """
+    Streams the questionnaire as Server-Sent Events:
+    - `section`: one processed section as soon as the model has finished writing it
+    - `state`: the final state (after impact analysis), same shape as /step/generate-questionnaire
+    - `error`: emitted instead of `state` if generation fails
+    """
+    current_state = cast(GraphState, request.model_dump())
+    current_state["status"] = "questionnaire_generated"
+
+    def event_stream():
+        try:
+            for event in generate_questionnaire_stream(current_state):
+                yield _sse_event(event["event"], event["section"])
+
+            if not current_state.get("questionnaire"):
+                yield _sse_event("error", {"detail": current_state.get("error") or "Questionnaire generation failed"})
+                return
+
+            # Always analyze impact after generation
+            updated_state = analyze_questionnaire_impact(current_state)
+            updated_state["needs_review"] = bool(updated_state.get("error"))
+            yield _sse_event("state", state_fields(updated_state))
+
+        except Exception as e:
+            print(f"Error in /step/generate-questionnaire/stream: {e}")
+            yield _sse_event("error", {"detail": f"Internal server error: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Generations of one /batch/generate-variables call running at once, and prompts accepted per call
+BATCH_MAX_CONCURRENCY = 4
+BATCH_MAX_PROMPTS = 100
+
+
+@api_app.post("/batch/generate-variables", summary="Generate variables for many prompts, streamed per prompt")
+async def batch_generate_variables(request: BatchGenerateRequest):
+    """
+    Generates the raw indicators and decision variables of every prompt (each one a new project, as with
+    /step/generate-variables) with bounded concurrency, and streams Server-Sent Events in completion order:
+    - `result`: {"index", "prompt", "state"} per prompt
+    - `error`: {"index", "prompt", "detail"} per prompt whose generation failed
+    - `done`: counts of prompts, generations and retrievals
+    Duplicate prompts share one generation (each index still gets its own project_id), the raw indicator
+    retrievals of all prompts are embedded in one batched call and every retrieval query runs once per batch.
+    """
+    prompts = request.prompts
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required")
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_PROMPTS} prompts per batch")
+    concurrency = max(1, min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+
+    # Duplicate prompts (after normalization) map to one generation
+    indices_by_key: Dict[str, List[int]] = {}
+    for index, prompt in enumerate(prompts):
+        indices_by_key.setdefault(request_key("generate_variables", {"prompt": prompt}), []).append(index)
+    retrieval = RetrievalMemo()
+
+    def prefetch_retrievals():
+        # Template-matched prompts are adapted from their template and retrieve nothing
+        unique_prompts = {normalize_prompt(prompts[indices[0]]): prompts[indices[0]] for indices in indices_by_key.values()}
+        retrieval.prefetch([prompt for prompt in unique_prompts.values() if find_closest_template(prompt) is None],
+                           "raw indicators")
+
+    async def event_stream():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(key: str) -> Tuple[str, Any]:
+            prompt = prompts[indices_by_key[key][0]]
+            async with semaphore:
+                try:
+                    return key, await generation_flights.run(key, _generate_variables_pipeline, prompt, retrieval)
+                except Exception as e:
+                    print(f"Error in /batch/generate-variables for prompt '{prompt}': {e}")
+                    return key, e
+
+        try:
+            await asyncio.to_thread(prefetch_retrievals)
+            failed = 0
+            for next_done in asyncio.as_completed([run_one(key) for key in indices_by_key]):
+                key, result = await next_done
+                for index in indices_by_key[key]:
+                    if isinstance(result, Exception):
+                        failed += 1
+                        yield _sse_event("error", {"index": index, "prompt": prompts[index],
+                                                   "detail": f"Internal server error: {str(result)}"})
+                    else:
+                        yield _sse_event("result", {"index": index, "prompt": prompts[index],
+                                                    "state": state_fields(_as_new_project(result))})
+            yield _sse_event("done", {"prompts": len(prompts), "generations": len(indices_by_key), "failed": failed,
+                                      "retrievals": retrieval.retrievals, "retrieval_hits": retrieval.hits})
+        except Exception as e:
+            print(f"Error in /batch/generate-variables: {e}")
+            yield _sse_event("error", {"detail": f"Internal server error: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @api_app.post("/step/modify-questionnaire", response_model=SharedWorkflowState, summary="Step 4: Modify Questionnaire")
 async def step_modify_questionnaire(request: ModificationRequest):
     """
@@ -189,7 +403,7 @@ async def step_modify_questionnaire(request: ModificationRequest):
             print("\n--- Questionnaire Modification Reasoning ---")
             print(updated_state["modification_reasoning"])
         
-        return SharedWorkflowState(**updated_state)
+        return state_response(updated_state)
 
     except Exception as e:
         print(f"Error in /step/modify-questionnaire: {e}")
@@ -212,7 +426,7 @@ async def step_analyze_impact(request: SharedWorkflowState):
         # Set needs_review based on impact analysis
         updated_state["needs_review"] = bool(updated_state.get("error"))
         
-        return SharedWorkflowState(**updated_state)
+        return state_response(updated_state)
 
     except Exception as e:
         print(f"Error in /step/analyze-impact: {e}")
@@ -223,10 +437,13 @@ async def step_analyze_impact(request: SharedWorkflowState):
 async def step_save_questionnaire(request: SharedWorkflowState):
     """
     Saves all finalized raw indicators, decision variables, and the questionnaire to Supabase. This is the ONLY endpoint that writes to the database.
-    Returns the final state with potential errors from the save operation.
+    The save is committed to the durable outbox and written to Supabase in the background (with retries);
+    the returned state has status 'save_queued' and /api/save-status/{project_id} reports its progress.
     """
     try:
         current_state = cast(GraphState, request.model_dump())
+        if not current_state.get("project_id"):
+            raise HTTPException(status_code=400, detail="project_id is required to save a questionnaire")
         
         # Run one final impact analysis
         current_state = analyze_questionnaire_impact(current_state)
@@ -237,10 +454,9 @@ async def step_save_questionnaire(request: SharedWorkflowState):
                 detail="Cannot save questionnaire with pending issues. Please resolve all issues first."
             )
         
-        current_state["status"] = "saved"
         current_state["needs_review"] = False
-        updated_state = write_to_supabase(current_state)
-        return SharedWorkflowState(**updated_state)
+        updated_state = enqueue_write_to_supabase(current_state)
+        return state_response(updated_state)
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -332,24 +548,126 @@ async def analyze_dependencies(request: ModificationRequest):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@api_app.post("/api/score-responses", response_model=Dict[str, Any], summary="Compute raw indicators and decision variables from questionnaire answers.")
+async def score_responses(request: ScoreRequest):
+    """
+    Evaluates the questionnaire's raw_indicator_calculation entries and the decision variable formulas
+    for one set of answers, without any external JavaScript runtime.
+    """
+    try:
+        current_state = cast(GraphState, request.current_state.model_dump())
+        if not current_state.get("raw_indicators") and not current_state.get("decision_variables"):
+            raise HTTPException(status_code=400, detail="At least one raw indicator or decision variable is required")
+
+        result = score_answers(current_state, request.answers)
+        return {"success": not result["errors"], **result}
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        print(f"Error in /api/score-responses: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@api_app.post("/api/score-responses/batch", response_model=Dict[str, Any], summary="Compute raw indicators and decision variables for many questionnaire responses.")
+async def score_responses_batch_api(request: BatchScoreRequest):
+    """
+    Scores a batch of responses column-wise: formulas are compiled once and evaluated as array
+    expressions where possible, falling back to per-row evaluation otherwise. Each result row
+    carries a has_error flag and an errors summary.
+    """
+    try:
+        current_state = cast(GraphState, request.current_state.model_dump())
+        if not current_state.get("raw_indicators") and not current_state.get("decision_variables"):
+            raise HTTPException(status_code=400, detail="At least one raw indicator or decision variable is required")
+
+        batch = records_to_columns(request.responses)
+        result = score_responses_batch(current_state, batch, include_raw_indicators=request.include_raw_indicators)
+        rows = table_to_records(result["table"])
+        return {
+            "success": not any(row["has_error"] for row in rows) and not result["issues"],
+            "rows": rows,
+            "issues": result["issues"],
+            "vectorized": result["vectorized"],
+            "row_fallback": result["row_fallback"],
+        }
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        print(f"Error in /api/score-responses/batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@api_app.post("/api/validate-formulas", response_model=Dict[str, Any], summary="Statically validate every formula and triggering criteria of a project.")
+async def validate_formulas(current_state: SharedWorkflowState):
+    """
+    Parses each JS expression (question formulas, triggering criteria, raw indicator calculations,
+    decision variable formulas) and resolves its identifiers against the project's variables.
+    Returns one entry per expression classified as valid, unknown_identifier, syntax_error or placeholder.
+    """
+    try:
+        state = cast(GraphState, current_state.model_dump())
+        report = validate_project_formulas(state)
+        return {"success": not report["invalid"], "project_id": state.get("project_id"), **report}
+
+    except Exception as e:
+        print(f"Error in /api/validate-formulas: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@api_app.get("/api/metrics-report", response_model=Dict[str, Any], summary="Runtime metrics of the LLM pipeline, per section.")
+def metrics_report_api(section: Optional[str] = None):
+    """
+    Returns every registered metrics section, or only ?section=<name>:
+    prompt_payloads (token counts of the encoded prompt inputs vs pretty-printed JSON), prompt_cache
+    (provider prompt cache hits per prompt prefix), model_routing (route and p50/p90/p99 latency per LLM node),
+    output_budget (max_tokens usage, truncations and continuations) and coalescing (identical in-flight
+    generations shared).
+    """
+    try:
+        return metrics_report(section)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown metrics section '{section}'")
+
+
 @api_app.get("/api/fetch-supabase-tables", response_model=Dict[str, Any], summary="Fetch all rows from raw_indicators, decision_variables, and questionnaire tables in Supabase.")
-def fetch_supabase_tables_api():
+async def fetch_supabase_tables_api():
     """
     Fetch all rows from the three Supabase tables for display in the saved questionnaires section.
     """
     try:
-        result = fetch_supabase_tables()
+        result = await afetch_supabase_tables()
         return {"success": True, "data": result}
     except Exception as e:
         print(f"Error in /api/fetch-supabase-tables: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+# Serialized /api/fetch-assessment bodies: project_id -> (fingerprint of the project's save ledger, body).
+# The ledger changes with every save that writes or deletes a row, so a matching fingerprint means the
+# stored rows (and hence the body) are unchanged and the table reads and encoding can be skipped.
+ASSESSMENT_BODY_CACHE_SIZE = 256
+_assessment_body_cache: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+
+
+async def _assessment_fingerprint(project_id: str) -> Optional[str]:
+    ledger = await aload_save_ledger(get_storage(), project_id)
+    return row_hash(ledger) if ledger else None
+
+
 @api_app.get("/api/fetch-assessment/{project_id}", response_model=SharedWorkflowState)
 async def fetch_assessment(project_id: str):
     """Fetch a specific assessment by project_id, including prompt and title from the prompts table."""
     try:
-        tables = fetch_supabase_tables()
+        fingerprint = await _assessment_fingerprint(project_id)
+        cached = _assessment_body_cache.get(project_id)
+        if fingerprint is not None and cached is not None and cached[0] == fingerprint:
+            _assessment_body_cache.move_to_end(project_id)
+            return Response(content=cached[1], media_type="application/json")
+
+        failed_tables: List[str] = []
+        tables = await afetch_project_tables(project_id, failed_tables)
         # Find the prompt and title from the prompts table
         prompt_entry = None
         for entry in tables.get("prompts", []):
@@ -363,20 +681,27 @@ async def fetch_assessment(project_id: str):
         # Attempt to reconstruct questionnaire from questions (if needed)
         questionnaire = None # You may want to implement logic to reconstruct this if needed
         # Compose the state
-        state = SharedWorkflowState(
-            prompt=prompt_entry.get("prompt", "") if prompt_entry else "",
-            project_id=project_id,
-            questionnaire_title=prompt_entry.get("title", "") if prompt_entry else "",
-            raw_indicators=raw_indicators,
-            decision_variables=decision_variables,
-            questionnaire=questionnaire,
-            status="unknown",
-            modification_history=[],
-            dependency_graph=None,
-            modification_reasoning=None,
-            needs_review=False
-        )
-        return state
+        state = {
+            "prompt": prompt_entry.get("prompt", "") if prompt_entry else "",
+            "project_id": project_id,
+            "questionnaire_title": prompt_entry.get("title", "") if prompt_entry else "",
+            "raw_indicators": raw_indicators,
+            "decision_variables": decision_variables,
+            "questionnaire": questionnaire,
+            "status": "unknown",
+            "modification_history": [],
+            "dependency_graph": None,
+            "modification_reasoning": None,
+            "needs_review": False
+        }
+        body = serialization.dumps(state_fields(cast(GraphState, state)))
+        # A body missing a table that failed to load (storage error, open circuit breaker) is never cached
+        if fingerprint is not None and not failed_tables:
+            _assessment_body_cache[project_id] = (fingerprint, body)
+            _assessment_body_cache.move_to_end(project_id)
+            while len(_assessment_body_cache) > ASSESSMENT_BODY_CACHE_SIZE:
+                _assessment_body_cache.popitem(last=False)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         print(f"Error in /api/fetch-assessment: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -386,7 +711,7 @@ async def fetch_assessment(project_id: str):
 async def check_status(project_id: str):
     """Check the status of an assessment workflow"""
     try:
-        tables = fetch_supabase_tables()
+        tables = await afetch_supabase_tables()
         for assessment in tables:
             if isinstance(assessment, dict) and assessment.get("project_id") == project_id:
                 return {
@@ -401,6 +726,19 @@ async def check_status(project_id: str):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@api_app.get("/api/save-status/{project_id}", response_model=Dict[str, Any], summary="Status of the latest save of a project.")
+def save_status(project_id: str):
+    """
+    Reports whether the latest save of a project is queued, saving, retrying, saved or failed,
+    with the number of attempts and the last error.
+    """
+    try:
+        return dict(get_outbox().status(project_id))
+    except Exception as e:
+        print(f"Error in /api/save-status: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
 @api_app.post("/api/export-card-design", summary="Export card design spec using LLM")
 async def export_card_design(request: SharedWorkflowState):
     """
@@ -0,0 +1,669 @@
+import argparse
+import asyncio
+import copy
+import json
+import math
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+# Offline runs never reach OpenAI, but ChatOpenAI refuses to construct without a key
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+
+import llm_backend
+import nodes
+from metrics import percentile
+from model_routing import model_router
+import serialization
+import storage
+import template_library
+from compact_state import CompactAssessment
+from schemas.schemas import GraphState
+
+# --- End-to-end benchmark suite ---
+# Runs the workflow fully offline: LLM calls are served by a synthetic model (or by recorded fixtures with
+# --llm replay, see llm_backend.py) and Supabase by a local PostgREST-compatible stub (or, with --storage sqlite,
+# by the embedded SQLite backend of storage.py in a temporary directory). Measures per-node
+# latency, run_workflow latency, /step endpoint throughput under concurrent clients, write_to_supabase time
+# by questionnaire size, memory per project and JSON encode/decode time of a 50-question state, and writes the metrics as JSON. With --baseline the metrics
+# are compared to an earlier results file and the exit status is 1 when one regressed beyond --tolerance.
+#
+#   python benchmark.py --latency-ms 200-600 --output bench_results.json
+#   python benchmark.py --baseline bench_results.json
+
+BENCHMARKS = ("nodes", "workflow", "endpoints", "supabase", "memory", "serialization")
+BENCH_PROMPT = "Assess income for a bicycle courier"  # Matches no template, so the full pipeline runs
+SYNTHETIC_RI_PATTERN = re.compile(r'\bsynthetic_ri_\d+\b')
+SYNTHETIC_STREAM_CHUNKS = 20  # Pieces a streaming synthetic response is emitted in
+RIS_PER_SECTION = 5
+
+
+# --- Synthetic LLM ---
+
+def _synthetic_raw_indicators(count: int) -> List[Dict]:
+    return [{
+        "id": f"synthetic_ri_{i}",
+        "name": f"Synthetic indicator {i}",
+        "var_name": f"synthetic_ri_{i}",
+        "description": f"Synthetic raw indicator {i}",
+        "type": "float",
+        "priority": 50,
+        "priority_rationale": "Synthetic benchmark variable.",
+        "formula": None,
+    } for i in range(count)]
+
+
+def _synthetic_decision_variables(ri_names: List[str]) -> List[Dict]:
+    groups = [ri_names[i:i + 3] for i in range(0, len(ri_names), 3)] or [[]]
+    return [{
+        "id": f"synthetic_dv_{i}",
+        "name": f"Synthetic decision {i}",
+        "var_name": f"synthetic_dv_{i}",
+        "description": f"Synthetic decision variable {i}",
+        "type": "float",
+        "priority": 50,
+        "priority_rationale": "Synthetic benchmark variable.",
+        "formula": f"return {' + '.join(names) or '0'};",
+    } for i, names in enumerate(groups)]
+
+
+def _synthetic_question(ri_name: str) -> Dict:
+    return {
+        "id": f"q_{ri_name}",
+        "text": f"What is the value of {ri_name.replace('_', ' ')}?",
+        "type": "float",
+        "variable_name": f"q_{ri_name}",
+        "triggering_criteria": None,
+        "raw_indicators": [ri_name],
+        "formula": f"return Number(q_{ri_name});",
+        "is_conditional": False,
+    }
+
+
+def synthetic_questionnaire(ri_names: List[str]) -> Dict:
+    """One float question per raw indicator, RIS_PER_SECTION indicators per section."""
+    sections = []
+    for order, start in enumerate(range(0, len(ri_names), RIS_PER_SECTION), start=1):
+        section_ris = ri_names[start:start + RIS_PER_SECTION]
+        sections.append({
+            "title": f"Section {order}",
+            "description": f"Synthetic section {order}",
+            "order": order,
+            "is_mandatory": True,
+            "rationale": "Synthetic benchmark section.",
+            "triggering_criteria": None,
+            "data_validation": "",
+            "core_questions": [_synthetic_question(name) for name in section_ris],
+            "conditional_questions": [],
+        })
+    return {
+        "title": "Synthetic Income Assessment",
+        "sections": sections,
+        "raw_indicator_calculation": {name: f"return Number(q_{name});" for name in ri_names},
+    }
+
+
+def _synthetic_output(schema_name: str, ri_names: List[str], ri_count: int) -> Dict[str, Any]:
+    """Deterministic structured output per output schema; raw indicators are taken from the prompt."""
+    if schema_name == "RawIndicatorsOutput":
+        return {"raw_indicators": _synthetic_raw_indicators(ri_count)}
+    if schema_name == "DecisionVariablesOutput":
+        return {"decision_variables": _synthetic_decision_variables(ri_names)}
+    if schema_name == "QuestionnaireOutput":
+        return synthetic_questionnaire(ri_names)
+    if schema_name == "QuestionnaireOutline":
+        outline = synthetic_questionnaire(ri_names)
+        return {"title": outline["title"], "sections": [
+            {**{key: section[key] for key in ("title", "description", "order", "is_mandatory", "rationale", "triggering_criteria")},
+             "raw_indicators": [question["raw_indicators"][0] for question in section["core_questions"]],
+             "target_question_count": len(section["core_questions"])}
+            for section in outline["sections"]]}
+    if schema_name == "SectionQuestionsOutput":
+        return {"core_questions": [_synthetic_question(name) for name in ri_names], "conditional_questions": [],
+                "raw_indicator_calculation": {name: f"return Number(q_{name});" for name in ri_names}}
+    if schema_name == "ModificationTargetsOutput":
+        return {"section_orders": [1], "question_variable_names": [], "needs_full_questionnaire": False}
+    if schema_name == "IntelligentVariableModificationsOutput":
+        return {"primary_modifications": {}, "compensatory_modifications": {}, "removed_variables": [],
+                "updated_formulas": {}, "new_variables": [], "reasoning": "No change (synthetic)."}
+    if schema_name == "StringOutput":
+        return {"expression": "return 0;"}
+    return {}  # Modification / remediation / adaptation outputs: no deltas
+
+
+class SyntheticChatOpenAI(ChatOpenAI):
+    """
+    Offline chat model returning deterministic structured outputs, after llm_backend.simulate_latency.
+    Raw indicators are named synthetic_ri_<n>; later stages find them in their prompt. Streaming models
+    emit function-call arguments in SYNTHETIC_STREAM_CHUNKS pieces spread over the same latency.
+    """
+    ri_count: int = 12
+
+    def _respond(self, messages: List[BaseMessage], **kwargs: Any) -> Tuple[str, Optional[str], Any]:
+        """(request key, function name or None for plain content, output) of a synthetic response."""
+        prompt_text = "\n".join(str(message.content) for message in messages)
+        ri_names = sorted(set(SYNTHETIC_RI_PATTERN.findall(prompt_text)), key=lambda name: int(name.rsplit("_", 1)[1]))
+        key = llm_backend.request_key("synthetic", {"prompt": prompt_text})
+        tools = kwargs.get("tools") or []
+        if tools:
+            schema_name = tools[0]["function"]["name"]
+            return key, schema_name, _synthetic_output(schema_name, ri_names, self.ri_count)
+        return key, None, _synthetic_output("StringOutput", ri_names, self.ri_count)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        key, schema_name, output = self._respond(messages, **kwargs)
+        llm_backend.simulate_latency(key)
+        if schema_name:
+            message = AIMessage(content="", tool_calls=[{"name": schema_name, "args": output, "id": "call_synthetic"}])
+        else:
+            message = AIMessage(content=json.dumps(output))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key, schema_name, output = self._respond(messages, **kwargs)
+        text = json.dumps(output)
+        size = max(1, math.ceil(len(text) / SYNTHETIC_STREAM_CHUNKS))
+        delay = llm_backend.replay_latency_seconds(key) / SYNTHETIC_STREAM_CHUNKS
+        for index, start in enumerate(range(0, len(text), size)):
+            time.sleep(delay)
+            piece = text[start:start + size]
+            if schema_name:
+                message = AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": schema_name if index == 0 else None, "args": piece,
+                    "id": "call_synthetic" if index == 0 else None, "index": 0}])
+            else:
+                message = AIMessageChunk(content=piece)
+            yield ChatGenerationChunk(message=message)
+        yield ChatGenerationChunk(message=AIMessageChunk(content=""), generation_info={"finish_reason": "stop"})
+
+
+def install_llm(kind: str, ri_count: int) -> None:
+    """Points every LLM in nodes.py at the offline stand-in and disables RAG (no embeddings offline)."""
+    if kind == "replay":
+        os.environ["LLM_BACKEND"] = llm_backend.REPLAY
+        model_router.set_model_factory(None)
+    else:
+        model_router.set_model_factory(lambda model, temperature, callbacks=None, **options: SyntheticChatOpenAI(
+            model=model, temperature=temperature, callbacks=callbacks, ri_count=ri_count,
+            streaming=bool(options.get("streaming"))))
+    nodes._rag_cache.update({"rag_chain": None, "retriever": None, "init": True})
+
+
+# --- PostgREST-compatible stub ---
+
+class PostgrestStub:
+    """
+    In-memory PostgREST subset on 127.0.0.1: POST (upsert by id, object or list), GET / PATCH / DELETE with
+    `column=eq.value` / `column=in.("a","b")` filters. Counts requests per method so saves can be compared by round trips.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, Dict[str, Dict]] = {}
+        self.request_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: Any = None):
+                payload = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _parse(self) -> Tuple[str, List[Tuple[str, str]]]:
+                url = urlparse(self.path)
+                filters = []
+                for key, value in parse_qsl(url.query):
+                    if value.startswith("eq."):
+                        filters.append((key, {value[3:]}))
+                    elif value.startswith("in.(") and value.endswith(")"):
+                        filters.append((key, {str(item) for item in json.loads(f"[{value[4:-1]}]")}))
+                return url.path.rstrip("/").rsplit("/", 1)[-1], filters
+
+            def _body(self) -> Any:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"null")
+
+            def do_GET(self):
+                table, filters = self._parse()
+                self._reply(200, stub.select(table, filters, "GET"))
+
+            def do_POST(self):
+                table, _filters = self._parse()
+                body = self._body()
+                stub.upsert(table, body if isinstance(body, list) else [body])
+                self._reply(201)
+
+            def do_PATCH(self):
+                table, filters = self._parse()
+                stub.update(table, filters, self._body())
+                self._reply(204)
+
+            def do_DELETE(self):
+                table, filters = self._parse()
+                stub.delete(table, filters)
+                self._reply(204)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def _count(self, method: str) -> None:
+        self.request_counts[method] = self.request_counts.get(method, 0) + 1
+
+    def _matches(self, row: Dict, filters: List[Tuple[str, Set[str]]]) -> bool:
+        return all(str(row.get(key)) in values for key, values in filters)
+
+    def select(self, table: str, filters: List[Tuple[str, Set[str]]], method: str) -> List[Dict]:
+        with self._lock:
+            self._count(method)
+            return [row for row in self.tables.get(table, {}).values() if self._matches(row, filters)]
+
+    def upsert(self, table: str, rows: List[Dict]) -> None:
+        with self._lock:
+            self._count("POST")
+            rows_by_id = self.tables.setdefault(table, {})
+            for row in rows:
+                rows_by_id[str(row.get("id"))] = {**rows_by_id.get(str(row.get("id")), {}), **row}
+
+    def update(self, table: str, filters: List[Tuple[str, Set[str]]], changes: Dict) -> None:
+        with self._lock:
+            self._count("PATCH")
+            for row in self.tables.get(table, {}).values():
+                if self._matches(row, filters):
+                    row.update(changes)
+
+    def delete(self, table: str, filters: List[Tuple[str, Set[str]]]) -> None:
+        with self._lock:
+            self._count("DELETE")
+            rows_by_id = self.tables.get(table, {})
+            for row_id in [row_id for row_id, row in rows_by_id.items() if self._matches(row, filters)]:
+                del rows_by_id[row_id]
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.request_counts = {}
+
+    def __enter__(self) -> "PostgrestStub":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Measurement helpers ---
+
+@contextmanager
+def quiet(verbose: bool) -> Iterator[None]:
+    """Silences the nodes' progress prints while measuring (they are not part of the pipeline cost)."""
+    if verbose:
+        yield
+        return
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def time_calls(fn: Callable[[], Any], repeats: int) -> List[float]:
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+class Metrics:
+    def __init__(self):
+        self.values: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, value: float, unit: str = "ms", better: str = "lower") -> None:
+        self.values[name] = {"value": round(value, 3), "unit": unit, "better": better}
+
+    def add_latencies(self, prefix: str, durations: List[float]) -> None:
+        self.add(f"{prefix}.p50_ms", percentile(durations, 0.5))
+        self.add(f"{prefix}.p95_ms", percentile(durations, 0.95))
+        self.add(f"{prefix}.mean_ms", sum(durations) / len(durations))
+
+
+def new_state(prompt: str = BENCH_PROMPT) -> GraphState:
+    return {"prompt": prompt, "project_id": str(uuid.uuid4()), "raw_indicators": None,
+            "decision_variables": None, "questionnaire": None, "error": None}
+
+
+def generated_project(verbose: bool) -> GraphState:
+    """Variables plus questionnaire, as after step 3."""
+    with quiet(verbose):
+        state = nodes.generate_variables(new_state())
+        state = nodes.generate_questionnaire(state)
+        return nodes.analyze_questionnaire_impact(state)
+
+
+# --- Benchmarks ---
+
+def bench_nodes(metrics: Metrics, args: argparse.Namespace) -> None:
+    project = generated_project(args.verbose)
+    with_modification = dict(project, modification_prompt="Add a variable for monthly rent")
+    cases: Dict[str, Tuple[Callable[[GraphState], Any], GraphState]] = {
+        "generate_variables": (nodes.generate_variables, new_state()),
+        "generate_questionnaire": (nodes.generate_questionnaire, project),
+        "generate_questionnaire_sectioned": (nodes.generate_questionnaire_sectioned, project),
+        "analyze_questionnaire_impact": (nodes.analyze_questionnaire_impact, project),
+        "modify_variables_intelligent": (nodes.modify_variables_intelligent, with_modification),
+        "modify_questionnaire_llm": (nodes.modify_questionnaire_llm, with_modification),
+        "write_to_supabase": (nodes.write_to_supabase, project),
+    }
+    for name, (node, state) in cases.items():
+        with quiet(args.verbose):
+            durations = time_calls(lambda: node(copy.deepcopy(state)), args.repeats)
+        metrics.add_latencies(f"node.{name}", durations)
+
+
+def bench_workflow(metrics: Metrics, args: argparse.Namespace) -> None:
+    from main import run_workflow  # langgraph app; imported lazily like the optional benchmarks it serves
+    with quiet(args.verbose):
+        durations = time_calls(lambda: run_workflow(BENCH_PROMPT), args.repeats)
+    metrics.add_latencies("workflow.run_workflow", durations)
+
+
+def _client_body(body: Dict, client_index: int, request_index: int) -> Dict:
+    """A body no other request sends, so that request coalescing does not share work between clients."""
+    tag = f"client {client_index} request {request_index}"
+    return dict(body, prompt=f"{body['prompt']} ({tag})", project_id=f"{body.get('project_id') or 'benchmark'}-{tag}")
+
+
+async def _drive_endpoint(client: Any, path: str, body: Dict, clients: int, requests_per_client: int,
+                          identical: bool = False) -> Tuple[List[float], int, float]:
+    """Runs `clients` concurrent clients; each request sends a distinct body unless `identical`."""
+    durations: List[float] = []
+    failures = 0
+
+    async def one_client(client_index: int):
+        nonlocal failures
+        for request_index in range(requests_per_client):
+            start = time.perf_counter()
+            request_body = body if identical else _client_body(body, client_index, request_index)
+            response = await client.post(path, json=request_body)
+            durations.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_client(i) for i in range(clients)))
+    return durations, failures, time.perf_counter() - start
+
+
+def bench_endpoints(metrics: Metrics, args: argparse.Namespace) -> None:
+    import httpx
+    from api import api_app
+    from single_flight import generation_flights
+
+    project = json.loads(json.dumps(generated_project(args.verbose), default=str))
+    scenarios = {
+        "generate_variables": ("/step/generate-variables", {"prompt": BENCH_PROMPT}),
+        "generate_questionnaire": ("/step/generate-questionnaire", project),
+    }
+
+    async def run_all():
+        transport = httpx.ASGITransport(app=api_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for name, (path, body) in scenarios.items():
+                for clients in args.clients:
+                    durations, failures, elapsed = await _drive_endpoint(client, path, body, clients, args.requests_per_client)
+                    prefix = f"endpoint.{name}.c{clients}"
+                    metrics.add(f"{prefix}.throughput_rps", len(durations) / elapsed, unit="req/s", better="higher")
+                    metrics.add(f"{prefix}.p50_ms", percentile(durations, 0.5))
+                    metrics.add(f"{prefix}.p95_ms", percentile(durations, 0.95))
+                    metrics.add(f"{prefix}.failures", failures, unit="count")
+
+                # Identical concurrent requests (double clicks, several reviewers) coalesce onto one generation
+                clients = max(args.clients)
+                kind = path.rsplit("/", 1)[-1].replace("-", "_") + ("_single" if name == "generate_questionnaire" else "")
+                before = generation_flights.stats().get(kind, {}).get("coalesced", 0)
+                durations, failures, elapsed = await _drive_endpoint(client, path, body, clients, 1, identical=True)
+                coalesced = generation_flights.stats().get(kind, {}).get("coalesced", 0) - before
+                prefix = f"endpoint.{name}.identical.c{clients}"
+                metrics.add(f"{prefix}.elapsed_ms", elapsed * 1000)
+                metrics.add(f"{prefix}.coalesced_ratio", coalesced / len(durations), unit="ratio", better="higher")
+                metrics.add(f"{prefix}.failures", failures, unit="count")
+
+    with quiet(args.verbose):
+        asyncio.run(run_all())
+
+
+def bench_supabase(metrics: Metrics, args: argparse.Namespace, stub: PostgrestStub) -> None:
+    """First save of a new project (every row written) and re-save of an unchanged one (delta: nothing written)."""
+    for size in args.sizes:
+        ri_names = [ri["var_name"] for ri in _synthetic_raw_indicators(size)]
+        state = dict(new_state(), raw_indicators=_synthetic_raw_indicators(size),
+                     decision_variables=_synthetic_decision_variables(ri_names),
+                     questionnaire=synthetic_questionnaire(ri_names), questionnaire_title="Synthetic")
+        for name, fresh_project in (("write", True), ("resave", False)):
+            def save():
+                project_state = copy.deepcopy(state)
+                if fresh_project:
+                    project_state["project_id"] = str(uuid.uuid4())
+                nodes.write_to_supabase(project_state)
+
+            with quiet(args.verbose):
+                if not fresh_project:
+                    save()  # Establish the ledger
+                stub.reset_counts()
+                durations = time_calls(save, args.repeats)
+            metrics.add_latencies(f"supabase.{name}.q{size}", durations)
+            if args.storage == "postgrest":
+                metrics.add(f"supabase.{name}.q{size}.requests", sum(stub.request_counts.values()) / args.repeats, unit="count")
+
+
+def bench_serialization(metrics: Metrics, args: argparse.Namespace) -> None:
+    """Request decode and response encode of a 50-question state: Pydantic + stdlib json vs the fast path."""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from api import SharedWorkflowState, state_response
+
+    ri_names = [ri["var_name"] for ri in _synthetic_raw_indicators(50)]
+    state = dict(new_state(), raw_indicators=_synthetic_raw_indicators(50),
+                 decision_variables=_synthetic_decision_variables(ri_names),
+                 questionnaire=synthetic_questionnaire(ri_names), questionnaire_title="Synthetic")
+    body = json.dumps(state).encode("utf-8")
+    rows = nodes.build_supabase_rows(state)
+    repeats = max(args.repeats, 50)
+
+    metrics.add_latencies("serialization.request_decode", time_calls(
+        lambda: SharedWorkflowState.model_validate_json(body).model_dump(), repeats))
+    metrics.add_latencies("serialization.response_pydantic", time_calls(
+        lambda: JSONResponse(jsonable_encoder(SharedWorkflowState(**state))).body, repeats))
+    metrics.add_latencies("serialization.response_fast", time_calls(lambda: state_response(state).body, repeats))
+    metrics.add_latencies("serialization.supabase_rows_stdlib", time_calls(
+        lambda: json.dumps(rows, default=str).encode("utf-8"), repeats))
+    metrics.add_latencies("serialization.supabase_rows_fast", time_calls(lambda: serialization.dumps(rows), repeats))
+    metrics.add("serialization.orjson", 1 if serialization.ORJSON_AVAILABLE else 0, unit="bool", better="higher")
+
+
+def bench_memory(metrics: Metrics, args: argparse.Namespace) -> None:
+    projects = []
+    tracemalloc.start()
+    try:
+        baseline, _peak = tracemalloc.get_traced_memory()
+        peaks = []
+        for _ in range(args.projects):
+            tracemalloc.reset_peak()
+            before, _peak = tracemalloc.get_traced_memory()
+            projects.append(generated_project(args.verbose))
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        retained, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    metrics.add("memory.retained_kb_per_project", (retained - baseline) / 1024 / args.projects, unit="KiB")
+    metrics.add("memory.peak_kb_per_project", max(peaks) / 1024, unit="KiB")
+    metrics.add("memory.state_json_kb", len(json.dumps(projects[-1], default=str)) / 1024, unit="KiB")
+
+    # The same projects held as compact records (compact_state.py), and the template index cache
+    template_library.ensure_template_index()
+    tracemalloc.start()
+    try:
+        baseline, _peak = tracemalloc.get_traced_memory()
+        dict_projects = [copy.deepcopy({key: project.get(key) for key in CompactAssessment.STATE_KEYS}) for project in projects]
+        retained, _peak = tracemalloc.get_traced_memory()
+        metrics.add("memory.dict_retained_kb_per_project", (retained - baseline) / 1024 / len(dict_projects), unit="KiB")
+        del dict_projects
+        baseline, _peak = tracemalloc.get_traced_memory()
+        compact_projects = [CompactAssessment.from_state(project) for project in projects]
+        retained, _peak = tracemalloc.get_traced_memory()
+        metrics.add("memory.compact_retained_kb_per_project", (retained - baseline) / 1024 / len(compact_projects), unit="KiB")
+        baseline, _peak = tracemalloc.get_traced_memory()
+        with open(template_library.TEMPLATE_INDEX_PATH, encoding="utf-8") as f:
+            template_dicts = json.load(f).get("templates", [])
+        retained, _peak = tracemalloc.get_traced_memory()
+        metrics.add("memory.template_index_dict_kb", (retained - baseline) / 1024, unit="KiB")
+        del template_dicts
+        template_library._template_index_cache["path"] = None
+        baseline, _peak = tracemalloc.get_traced_memory()
+        template_library.load_template_index()
+        retained, _peak = tracemalloc.get_traced_memory()
+        metrics.add("memory.template_index_kb", (retained - baseline) / 1024, unit="KiB")
+    finally:
+        tracemalloc.stop()
+    if compact_projects[-1].to_state() != {key: projects[-1].get(key) for key in CompactAssessment.STATE_KEYS}:
+        raise AssertionError("Compact records do not round-trip the generated project")
+
+
+# --- Baseline comparison ---
+
+def compare_to_baseline(metrics: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    for name, previous in baseline.items():
+        current = metrics.get(name)
+        if current is None or not previous["value"]:
+            continue
+        change = (current["value"] - previous["value"]) / previous["value"]
+        if previous.get("better") == "higher":
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{name}: {previous['value']} -> {current['value']} {current['unit']} ({change:+.0%})")
+    return regressions
+
+
+def _int_list(text: str) -> List[int]:
+    return [int(item) for item in text.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks for the assessment workflow and API.")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help=f"Comma-separated subset of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--llm", choices=("synthetic", "replay"), default="synthetic",
+                        help="synthetic outputs, or fixtures recorded with LLM_BACKEND=record")
+    parser.add_argument("--storage", choices=("postgrest", "sqlite"), default="postgrest",
+                        help="Save through the local PostgREST stub or an embedded SQLite database")
+    parser.add_argument("--latency-ms", default=os.getenv("LLM_REPLAY_LATENCY_MS", "0"),
+                        help="Synthetic LLM latency per call, e.g. 300 or 200-800")
+    parser.add_argument("--raw-indicators", type=int, default=12, help="Raw indicators the synthetic LLM generates")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--clients", type=_int_list, default=[1, 4, 16], help="Concurrent API clients, e.g. 1,4,16")
+    parser.add_argument("--requests-per-client", type=int, default=3)
+    parser.add_argument("--sizes", type=_int_list, default=[10, 50, 200], help="Questionnaire sizes for write_to_supabase")
+    parser.add_argument("--projects", type=int, default=5, help="Projects generated for the memory benchmark")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the nodes' progress output")
+    args = parser.parse_args(argv)
+
+    selected = [name for name in args.only.split(",") if name]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    os.environ["LLM_REPLAY_LATENCY_MS"] = args.latency_ms
+    install_llm(args.llm, args.raw_indicators)
+    metrics = Metrics()
+    skipped: Dict[str, str] = {}
+    with PostgrestStub() as stub, tempfile.TemporaryDirectory() as tmp_dir:
+        if args.storage == "sqlite":
+            storage.set_storage(storage.SQLiteStorage(os.path.join(tmp_dir, "benchmark.db")))
+        else:
+            storage.set_storage(storage.PostgrestStorage(stub.url, "benchmark"))
+        runners: Dict[str, Callable[[], None]] = {
+            "nodes": lambda: bench_nodes(metrics, args),
+            "workflow": lambda: bench_workflow(metrics, args),
+            "endpoints": lambda: bench_endpoints(metrics, args),
+            "supabase": lambda: bench_supabase(metrics, args, stub),
+            "memory": lambda: bench_memory(metrics, args),
+            "serialization": lambda: bench_serialization(metrics, args),
+        }
+        for name in selected:
+            print(f"Running {name} benchmark...")
+            start = time.perf_counter()
+            try:
+                runners[name]()
+            except ImportError as e:
+                skipped[name] = str(e)
+                print(f"Skipped {name}: {e}")
+                continue
+            print(f"  done in {time.perf_counter() - start:.1f}s")
+
+    results = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "llm": args.llm,
+            "latency_ms": args.latency_ms,
+            "raw_indicators": args.raw_indicators,
+            "repeats": args.repeats,
+            "storage": args.storage,
+            "rag": "disabled",
+            "skipped": skipped,
+        },
+        "metrics": metrics.values,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {len(metrics.values)} metrics to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(metrics.values, baseline.get("metrics", {}), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,579 @@
+import math
+from typing import Any, Callable, Dict, List, Mapping, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from formula_engine import (
+    UNDEFINED,
+    FormulaError,
+    FormulaEvaluationError,
+    formula_hash,
+    loose_equals,
+    parse_float,
+    parse_int,
+    strict_equals,
+    to_boolean,
+    to_number,
+    to_output_value,
+    tokenize,
+)
+from schemas.schemas import BulkScoringResult, GraphState
+from scoring import RAW_INDICATOR, ScoringPlan, ScoringStep, build_scoring_plan
+
+# --- Vectorized bulk scoring ---
+# Scores a columnar batch of responses (one column per question variable_name). Formulas inside the
+# vectorizable subset (single expression: arithmetic, comparisons, &&/||, ternary, Math.*, parseFloat,
+# parseInt, Number, isNaN) run as NumPy array expressions over the whole batch; anything else, or any
+# operation whose JS semantics depend on per-row types (string concatenation, string ordering, ...),
+# falls back to the row-by-row formula engine for that step only. Missing answers are NaN / undefined;
+# None answers are JS null, as in scoring.py.
+
+BatchInput = Union[pd.DataFrame, Mapping[str, Any]]
+
+ERROR_FLAG_COLUMN = "has_error"
+ERROR_DETAIL_COLUMN = "errors"
+
+
+class NotVectorizable(Exception):
+    """Raised when a formula (or an operation on the batch's dtypes) is outside the vectorizable subset."""
+
+
+_vector_formula_cache: Dict[str, Any] = {}
+MAX_CACHED_VECTOR_FORMULAS = 4096
+
+_VECTOR_BINDING_POWER = {
+    "?": 2,
+    "||": 3,
+    "&&": 4,
+    "==": 6, "!=": 6, "===": 6, "!==": 6,
+    "<": 7, ">": 7, "<=": 7, ">=": 7,
+    "+": 9, "-": 9,
+    "*": 10, "/": 10, "%": 10,
+    "**": 11,
+}
+_VECTOR_UNARY_BINDING_POWER = 12
+
+_VECTOR_LITERALS = {"true": True, "false": False, "null": None, "undefined": UNDEFINED, "NaN": math.nan, "Infinity": math.inf}
+
+
+# --- Array helpers with JS semantics ---
+
+def _is_numeric(array: np.ndarray) -> bool:
+    return array.dtype.kind in "iuf"
+
+
+def _is_bool(array: np.ndarray) -> bool:
+    return array.dtype.kind == "b"
+
+
+def _object_map(function: Callable[..., Any], *arrays: np.ndarray) -> np.ndarray:
+    return np.frompyfunc(function, len(arrays), 1)(*arrays)
+
+
+def _numeric(array: np.ndarray) -> np.ndarray:
+    """JS ToNumber over an array."""
+    if array.dtype.kind in "iufb":
+        return array.astype(float)
+    return _object_map(to_number, array).astype(float)
+
+
+def _truthy(array: np.ndarray) -> np.ndarray:
+    """JS ToBoolean over an array."""
+    if _is_bool(array):
+        return array
+    if _is_numeric(array):
+        return (array != 0) & ~np.isnan(array.astype(float))
+    return _object_map(to_boolean, array).astype(bool)
+
+
+def _all_numeric(*arrays: np.ndarray) -> bool:
+    """True when every array converts to numbers without per-row JS type rules (numbers and booleans)."""
+    return all(array.dtype.kind in "iufb" for array in arrays)
+
+
+def _same_value_kind(left: np.ndarray, right: np.ndarray) -> bool:
+    """True when np.where can mix the two operands without changing their JS type."""
+    if _is_bool(left) or _is_bool(right):
+        return _is_bool(left) and _is_bool(right)
+    return _is_numeric(left) and _is_numeric(right)
+
+
+def _is_nullish_constant(array: np.ndarray) -> bool:
+    return array.ndim == 0 and array.dtype.kind == "O" and (array.item() is None or array.item() is UNDEFINED)
+
+
+def _vector_add(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    if _all_numeric(left, right):
+        return _numeric(left) + _numeric(right)
+    raise NotVectorizable("'+' on non-numeric values concatenates strings")
+
+
+def _vector_relational(python_operator: Callable[[Any, Any], Any]) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    def compare(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        if not (_all_numeric(left) or _all_numeric(right)):
+            raise NotVectorizable("relational comparison between strings")
+        # NaN compares False, as in JS
+        return python_operator(_numeric(left), _numeric(right))
+    return compare
+
+
+def _vector_equality(strict: bool, negate: bool) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    def compare(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        if _is_nullish_constant(left) or _is_nullish_constant(right):
+            # Missing answers are NaN in numeric columns, so null/undefined checks need per-row semantics
+            raise NotVectorizable("comparison with null/undefined")
+        if _is_numeric(left) and _is_numeric(right) or _is_bool(left) and _is_bool(right):
+            result = left == right
+        elif strict and _all_numeric(left, right):
+            # number === boolean is always false
+            result = np.zeros(np.broadcast(left, right).shape, dtype=bool)
+        else:
+            result = _object_map(strict_equals if strict else loose_equals,
+                                 left.astype(object), right.astype(object)).astype(bool)
+        return ~result if negate else result
+    return compare
+
+
+_VECTOR_BINARY_OPERATORS: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    "+": _vector_add,
+    "-": lambda left, right: _numeric(left) - _numeric(right),
+    "*": lambda left, right: _numeric(left) * _numeric(right),
+    "/": lambda left, right: np.divide(_numeric(left), _numeric(right)),
+    "%": lambda left, right: np.fmod(_numeric(left), _numeric(right)),
+    "**": lambda left, right: np.power(_numeric(left), _numeric(right)),
+    "<": _vector_relational(np.less),
+    ">": _vector_relational(np.greater),
+    "<=": _vector_relational(np.less_equal),
+    ">=": _vector_relational(np.greater_equal),
+    "===": _vector_equality(strict=True, negate=False),
+    "!==": _vector_equality(strict=True, negate=True),
+    "==": _vector_equality(strict=False, negate=False),
+    "!=": _vector_equality(strict=False, negate=True),
+}
+
+
+def _vector_parse_float(array: np.ndarray) -> np.ndarray:
+    if _is_numeric(array):
+        return array.astype(float)
+    if _is_bool(array):
+        return np.full(array.shape, np.nan)
+    return _object_map(parse_float, array).astype(float)
+
+
+def _vector_parse_int(array: np.ndarray) -> np.ndarray:
+    if _is_numeric(array):
+        values = array.astype(float)
+        return np.where(np.isfinite(values), np.trunc(values), np.nan)
+    if _is_bool(array):
+        return np.full(array.shape, np.nan)
+    return _object_map(parse_int, array).astype(float)
+
+
+def _vector_round(array: np.ndarray) -> np.ndarray:
+    return np.floor(_numeric(array) + 0.5)
+
+
+def _vector_extreme(reduce: Callable[[np.ndarray, np.ndarray], np.ndarray], empty: float) -> Callable[..., np.ndarray]:
+    def apply(*arrays: np.ndarray) -> np.ndarray:
+        if not arrays:
+            return np.asarray(empty)
+        result = _numeric(arrays[0])
+        for array in arrays[1:]:
+            result = reduce(result, _numeric(array))  # np.maximum/np.minimum propagate NaN like JS
+        return result
+    return apply
+
+
+_VECTOR_FUNCTIONS: Dict[str, Callable[..., np.ndarray]] = {
+    "parseFloat": _vector_parse_float,
+    "parseInt": _vector_parse_int,
+    "Number": _numeric,
+    "isNaN": lambda array: np.isnan(_numeric(array)),
+    "Math.max": _vector_extreme(np.maximum, -math.inf),
+    "Math.min": _vector_extreme(np.minimum, math.inf),
+    "Math.round": _vector_round,
+    "Math.floor": lambda array: np.floor(_numeric(array)),
+    "Math.ceil": lambda array: np.ceil(_numeric(array)),
+    "Math.trunc": lambda array: np.trunc(_numeric(array)),
+    "Math.abs": lambda array: np.abs(_numeric(array)),
+    "Math.sqrt": lambda array: np.sqrt(_numeric(array)),
+    "Math.log": lambda array: np.log(_numeric(array)),
+    "Math.exp": lambda array: np.exp(_numeric(array)),
+    "Math.sign": lambda array: np.sign(_numeric(array)),
+    "Math.pow": lambda base, exponent: np.power(_numeric(base), _numeric(exponent)),
+}
+_VECTOR_CONSTANTS = {"Math.PI": math.pi, "Math.E": math.e}
+
+
+# --- Vector compiler ---
+
+class _VectorCompiler:
+    """Compiles the single-expression formula subset into a function of the batch columns."""
+
+    def __init__(self, source: str):
+        self.tokens = tokenize(source)
+        self.position = 0
+
+    def _peek(self, offset: int = 0):
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def _advance(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _at_op(self, value: str) -> bool:
+        return self._peek() == ("op", value)
+
+    def _expect_op(self, value: str) -> None:
+        if not self._at_op(value):
+            raise NotVectorizable(f"expected '{value}'")
+        self._advance()
+
+    def compile(self) -> Callable[[Mapping[str, np.ndarray]], np.ndarray]:
+        wrapped = False
+        if self._peek() == ("name", "function"):
+            # function name(params) { return expr; }
+            self._advance()
+            if self._peek()[0] == "name":
+                self._advance()
+            self._expect_op("(")
+            while not self._at_op(")"):
+                if self._advance()[0] == "eof":
+                    raise NotVectorizable("unterminated parameter list")
+            self._expect_op(")")
+            self._expect_op("{")
+            wrapped = True
+        if self._peek() == ("name", "return"):
+            self._advance()
+        if self._peek()[0] == "eof":
+            raise NotVectorizable("empty formula")
+        expression = self._expression()
+        while self._at_op(";"):
+            self._advance()
+        if wrapped:
+            self._expect_op("}")
+            while self._at_op(";"):
+                self._advance()
+        if self._peek()[0] != "eof":
+            raise NotVectorizable("more than one statement")
+        return expression
+
+    def _expression(self, min_power: int = 0):
+        left = self._prefix()
+        while True:
+            kind, operator = self._peek()
+            if kind != "op" or operator not in _VECTOR_BINDING_POWER:
+                if kind == "op" and operator in ("??", "[", "."):
+                    raise NotVectorizable(f"operator '{operator}'")
+                break
+            power = _VECTOR_BINDING_POWER[operator]
+            if power <= min_power and not (operator == "**" and power == min_power):
+                break
+            self._advance()
+            left = self._infix(left, operator, power)
+        return left
+
+    def _prefix(self):
+        kind, value = self._advance()
+        if kind in ("num", "str"):
+            constant = np.asarray(value, dtype=object if kind == "str" else None)
+            return lambda columns: constant
+        if kind == "name":
+            if value in _VECTOR_LITERALS:
+                literal = _VECTOR_LITERALS[value]
+                constant = np.asarray(literal, dtype=object if literal is None or literal is UNDEFINED else None)
+                return lambda columns: constant
+            if value == "Math":
+                self._expect_op(".")
+                _kind, member = self._advance()
+                value = f"Math.{member}"
+                if value in _VECTOR_CONSTANTS:
+                    constant = np.asarray(_VECTOR_CONSTANTS[value])
+                    return lambda columns: constant
+            if value in _VECTOR_FUNCTIONS:
+                return self._call(_VECTOR_FUNCTIONS[value])
+            if value.startswith("Math.") or value in ("return", "if", "const", "let", "var", "typeof", "function"):
+                raise NotVectorizable(f"'{value}'")
+
+            def column(columns: Mapping[str, np.ndarray], name: str = value) -> np.ndarray:
+                if name not in columns:
+                    raise FormulaEvaluationError(f"{name} is not defined")
+                return columns[name]
+            return column
+        if kind == "op":
+            if value == "(":
+                inner = self._expression()
+                self._expect_op(")")
+                return inner
+            if value in ("!", "-", "+"):
+                operand = self._expression(_VECTOR_UNARY_BINDING_POWER)
+                if value == "!":
+                    return lambda columns: ~_truthy(operand(columns))
+                if value == "-":
+                    return lambda columns: -_numeric(operand(columns))
+                return lambda columns: _numeric(operand(columns))
+        raise NotVectorizable(f"unexpected token {value!r}")
+
+    def _call(self, function: Callable[..., np.ndarray]):
+        self._expect_op("(")
+        arguments = []
+        while not self._at_op(")"):
+            arguments.append(self._expression())
+            if not self._at_op(","):
+                break
+            self._advance()
+        self._expect_op(")")
+        return lambda columns: function(*[argument(columns) for argument in arguments])
+
+    def _infix(self, left, operator: str, power: int):
+        if operator == "?":
+            consequent = self._expression()
+            self._expect_op(":")
+            alternate = self._expression(power - 1)
+
+            def ternary(columns: Mapping[str, np.ndarray]) -> np.ndarray:
+                when_true, when_false = consequent(columns), alternate(columns)
+                if not _same_value_kind(when_true, when_false):
+                    raise NotVectorizable("ternary branches of different types")
+                return np.where(_truthy(left(columns)), when_true, when_false)
+            return ternary
+        right = self._expression(power)
+        if operator in ("&&", "||"):
+            def logical(columns: Mapping[str, np.ndarray]) -> np.ndarray:
+                left_value, right_value = left(columns), right(columns)
+                if not _same_value_kind(left_value, right_value):
+                    raise NotVectorizable(f"'{operator}' on operands of different types")
+                if operator == "&&":
+                    return np.where(_truthy(left_value), right_value, left_value)
+                return np.where(_truthy(left_value), left_value, right_value)
+            return logical
+        function = _VECTOR_BINARY_OPERATORS[operator]
+        return lambda columns: function(left(columns), right(columns))
+
+
+def compile_vector_formula(source: str) -> Optional[Callable[[Mapping[str, np.ndarray]], np.ndarray]]:
+    """Compiles a formula into a batch function, or returns None if it is outside the vectorizable subset."""
+    key = formula_hash(source or "")
+    if key not in _vector_formula_cache:
+        try:
+            compiled = _VectorCompiler(source or "").compile()
+        except (NotVectorizable, FormulaError):
+            compiled = None
+        if len(_vector_formula_cache) >= MAX_CACHED_VECTOR_FORMULAS:
+            _vector_formula_cache.clear()
+        _vector_formula_cache[key] = compiled
+    return _vector_formula_cache[key]
+
+
+# --- Batch evaluation ---
+
+def _is_missing(value: Any) -> bool:
+    return value is UNDEFINED or (isinstance(value, float) and math.isnan(value))
+
+
+def _input_column(values: Any) -> np.ndarray:
+    """
+    Normalizes an input column. Numbers with missing answers become a float column (NaN for missing);
+    other columns become object arrays where missing answers (absent, NaN) are undefined and None
+    answers stay JS null, as in scoring.score_answers.
+    """
+    array = values.to_numpy() if isinstance(values, pd.Series) else np.asarray(values, dtype=object)
+    if array.dtype.kind in "iufb":
+        return array
+    array = array.astype(object)
+    items = array.tolist()
+    if all(_is_missing(value) or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in items):
+        return np.asarray([math.nan if _is_missing(value) else to_number(value) for value in items], dtype=float)
+    return np.asarray([UNDEFINED if _is_missing(value) else value for value in items], dtype=object)
+
+
+def _result_column(values: List[Any]) -> np.ndarray:
+    """Packs per-row engine values into a float column when they are all numbers, else an object column."""
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return np.asarray(values, dtype=float)
+    return np.asarray(values, dtype=object)
+
+
+class _BatchEvaluator:
+    def __init__(self, plan: ScoringPlan, batch: BatchInput):
+        if isinstance(batch, pd.DataFrame):
+            self.index = batch.index
+            raw_columns = {str(name): batch[name] for name in batch.columns}
+        else:
+            raw_columns = dict(batch)
+            self.index = None
+        lengths = {len(column) for column in raw_columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"All batch columns must have the same length, got lengths {sorted(lengths)}")
+        self.size = lengths.pop() if lengths else 0
+        self.plan = plan
+        self.columns: Dict[str, np.ndarray] = {name: _input_column(column) for name, column in raw_columns.items()}
+        for question_var in plan.question_vars:
+            if question_var not in self.columns:
+                self.columns[question_var] = np.full(self.size, UNDEFINED, dtype=object)
+        self.input_names = set(self.columns)
+        self.row_errors: Dict[int, Dict[str, str]] = {}
+        self.failed: Dict[str, np.ndarray] = {}
+        self.vectorized: List[str] = []
+        self.row_fallback: List[str] = []
+        self._row_value_cache: Dict[str, List[Any]] = {}
+
+    def _broadcast(self, array: np.ndarray) -> np.ndarray:
+        if array.shape == (self.size,):
+            return array
+        return np.broadcast_to(array, (self.size,)).copy()
+
+    def _row_values(self, name: str) -> List[Any]:
+        """Python values of a column for the per-row engine (missing numeric answers become undefined)."""
+        if name not in self._row_value_cache:
+            values = self.columns[name].tolist()
+            if name in self.input_names and self.columns[name].dtype.kind == "f":
+                values = [UNDEFINED if isinstance(value, float) and math.isnan(value) else value for value in values]
+            self._row_value_cache[name] = values
+        return self._row_value_cache[name]
+
+    def _vector_value(self, step: ScoringStep) -> Optional[np.ndarray]:
+        """Evaluates a step over the whole batch, or returns None if it must run row by row."""
+        with np.errstate(all="ignore"):
+            try:
+                if step.formula is not None:
+                    vector_formula = compile_vector_formula(step.formula.source)
+                    return None if vector_formula is None else self._broadcast(vector_formula(self.columns))
+                contributions = []
+                for question_var, question_formula in step.sources:
+                    if question_formula is None:
+                        contributions.append(self.columns[question_var])
+                        continue
+                    vector_formula = compile_vector_formula(question_formula.source)
+                    if vector_formula is None:
+                        return None
+                    contributions.append(self._broadcast(vector_formula(self.columns)))
+                if len(contributions) == 1:
+                    return self._broadcast(contributions[0])
+                return self._broadcast(sum(_numeric(contribution) for contribution in contributions))
+            except (NotVectorizable, FormulaEvaluationError):
+                return None
+
+    def _row_value(self, step: ScoringStep, row: int) -> Any:
+        if step.formula is not None:
+            return step.formula.evaluate({name: self._row_values(name)[row]
+                                          for name in step.formula.identifiers if name in self.columns})
+        contributions = []
+        for question_var, question_formula in step.sources:
+            if question_formula is not None:
+                contributions.append(question_formula.evaluate({name: self._row_values(name)[row]
+                                                                for name in question_formula.identifiers if name in self.columns}))
+            else:
+                contributions.append(self._row_values(question_var)[row])
+        if len(contributions) == 1:
+            return contributions[0]
+        return sum(to_number(value) for value in contributions)
+
+    def _record_error(self, name: str, rows: np.ndarray, message: str) -> None:
+        for row in np.flatnonzero(rows):
+            self.row_errors.setdefault(int(row), {})[name] = message
+
+    def run_step(self, step: ScoringStep) -> None:
+        failed = np.zeros(self.size, dtype=bool)
+        for dependency in step.dependencies:
+            dependency_failed = self.failed.get(dependency)
+            if dependency in self.plan.issues:
+                dependency_failed = np.ones(self.size, dtype=bool)
+            if dependency_failed is not None and dependency_failed.any():
+                newly_failed = dependency_failed & ~failed
+                self._record_error(step.name, newly_failed, f"Depends on '{dependency}', which could not be computed.")
+                failed |= dependency_failed
+
+        if step.name in self.plan.issues:
+            values = np.full(self.size, np.nan)
+        else:
+            values = self._vector_value(step)
+            if values is not None:
+                self.vectorized.append(step.name)
+                if failed.any():
+                    values = values.astype(float) if _is_numeric(values) else values.astype(object)
+                    values[failed] = np.nan if values.dtype.kind == "f" else UNDEFINED
+            else:
+                self.row_fallback.append(step.name)
+                row_values: List[Any] = []
+                for row in range(self.size):
+                    if failed[row]:
+                        row_values.append(UNDEFINED)
+                        continue
+                    try:
+                        row_values.append(self._row_value(step, row))
+                    except FormulaError as e:
+                        failed[row] = True
+                        self.row_errors.setdefault(row, {})[step.name] = str(e)
+                        row_values.append(UNDEFINED)
+                values = _result_column(row_values)
+
+        self.failed[step.name] = failed
+        self.columns[step.name] = values
+        alias = f"q_{step.name}"
+        if step.kind == RAW_INDICATOR and alias not in self.plan.question_vars:
+            self.columns[alias] = values
+
+    def output_column(self, name: str) -> Any:
+        values = self.columns[name]
+        if values.dtype.kind == "f":
+            return np.where(np.isfinite(values), values, np.nan)
+        if values.dtype.kind == "O":
+            return [to_output_value(value) for value in values.tolist()]
+        return values
+
+
+def score_batch(plan: ScoringPlan, batch: BatchInput, include_raw_indicators: bool = True) -> BulkScoringResult:
+    """
+    Scores a columnar batch of responses with a prebuilt plan.
+    Returns a DataFrame with one column per decision variable (and raw indicator, if requested),
+    a boolean `has_error` column and an `errors` column describing the failures of each row.
+    """
+    evaluator = _BatchEvaluator(plan, batch)
+    for step in plan.steps:
+        evaluator.run_step(step)
+
+    output_names = (plan.raw_indicator_names if include_raw_indicators else []) + plan.decision_variable_names
+    table = pd.DataFrame({name: evaluator.output_column(name) for name in output_names}, index=evaluator.index)
+    error_flags = np.zeros(evaluator.size, dtype=bool)
+    error_details: List[Optional[str]] = [None] * evaluator.size
+    for row, errors in evaluator.row_errors.items():
+        error_flags[row] = True
+        error_details[row] = "; ".join(f"{name}: {message}" for name, message in errors.items())
+    table[ERROR_FLAG_COLUMN] = error_flags
+    table[ERROR_DETAIL_COLUMN] = error_details
+
+    return {
+        "table": table,
+        "issues": dict(plan.issues),
+        "vectorized": evaluator.vectorized,
+        "row_fallback": evaluator.row_fallback,
+    }
+
+
+def score_responses_batch(state: GraphState, batch: BatchInput, include_raw_indicators: bool = True) -> BulkScoringResult:
+    """Scores many filled questionnaires (columns keyed by question variable_name) for the project in `state`."""
+    return score_batch(build_scoring_plan(state), batch, include_raw_indicators=include_raw_indicators)
+
+
+def table_to_records(table: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Converts a scored batch table into JSON-safe row dicts (NaN becomes None)."""
+    records = table.astype(object).to_dict(orient="records")
+    for record in records:
+        for name, value in record.items():
+            if isinstance(value, np.generic):
+                value = record[name] = value.item()
+            if isinstance(value, float):
+                record[name] = to_output_value(value)
+    return records
+
+
+def records_to_columns(records: List[Mapping[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Converts answer records into batch columns. Unlike pandas, a record without an answer gives undefined
+    and an explicit None answer stays JS null, as each record would be scored by scoring.score_answers.
+    """
+    names = list(dict.fromkeys(name for record in records for name in record))
+    return {name: [record.get(name, UNDEFINED) for record in records] for name in names}
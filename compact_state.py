@@ -0,0 +1,259 @@
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# --- Compact assessment records ---
+# Raw indicators, decision variables and questions travel as plain dicts (the GraphState / API shape), which
+# costs a hash table per item, a project_id prefix on every id and a default priority_rationale string per
+# variable. Anything that holds assessments in memory (the template library cache, benchmarks) keeps them
+# as these records instead:
+#   - __slots__ objects, one pointer per field and no per-item dict
+#   - var_names, variable_names, types, project_ids and raw indicator links interned (shared str objects)
+#   - ids stored without the "<project_id>_" prefix, default priority_rationale texts not stored at all
+#   - records and their lists are immutable (tuples), so evolve() copies share every unchanged item
+# to_dict / to_state rebuild the exact dict shape (fields that were absent stay absent).
+
+
+class _Missing:
+    """Marks a field that was absent from the dict (as opposed to present with None)."""
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "<missing>"
+
+
+_MISSING = _Missing()
+
+
+def intern_str(value: Any) -> Any:
+    """Interns strings so equal names share one object; other values are returned unchanged."""
+    return sys.intern(value) if type(value) is str else value
+
+
+def default_priority_rationale(impact_score: Any) -> str:
+    """Rationale _apply_default_variable_properties assigns when the LLM does not provide one."""
+    return f"Priority {impact_score} assigned based on importance for income assessment"
+
+
+def _strip_prefix(item_id: Any, project_id: Optional[str]) -> Tuple[Any, bool]:
+    prefix = f"{project_id}_" if project_id else None
+    if prefix and isinstance(item_id, str) and item_id.startswith(prefix):
+        return item_id[len(prefix):], True
+    return item_id, False
+
+
+class _Record:
+    """Base of the slotted records; FIELDS are the known dict keys, anything else goes to `extra`."""
+    __slots__ = ("id_prefixed", "extra")
+    FIELDS: Tuple[str, ...] = ()
+    INTERNED: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], project_id: Optional[str] = None) -> "_Record":
+        record = cls.__new__(cls)
+        for field in cls.FIELDS:
+            value = data.get(field, _MISSING)
+            if field in cls.INTERNED:
+                value = intern_str(value)
+            object.__setattr__(record, field, value)
+        extra = tuple((intern_str(key), value) for key, value in data.items() if key not in cls.FIELDS)
+        object.__setattr__(record, "extra", extra or None)
+        item_id, prefixed = _strip_prefix(data.get("id", _MISSING), project_id) if "id" in cls.FIELDS else (_MISSING, False)
+        if prefixed:
+            object.__setattr__(record, "id", item_id)
+        object.__setattr__(record, "id_prefixed", prefixed)
+        record._compact()
+        return record
+
+    def _compact(self) -> None:
+        """Hook for per-record space savings after from_dict."""
+
+    def _expand(self, data: Dict[str, Any], project_id: Optional[str]) -> None:
+        """Hook undoing _compact in to_dict."""
+
+    def to_dict(self, project_id: Optional[str] = None) -> Dict[str, Any]:
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not _MISSING:
+                data[field] = value
+        if self.id_prefixed:
+            data["id"] = f"{project_id}_{data['id']}"
+        if self.extra:
+            data.update(self.extra)
+        self._expand(data, project_id)
+        return data
+
+    def get(self, field: str, default: Any = None) -> Any:
+        value = getattr(self, field, _MISSING) if field in self.FIELDS else dict(self.extra or ()).get(field, _MISSING)
+        return default if value is _MISSING else value
+
+    def evolve(self, **changes: Any) -> "_Record":
+        """Returns a copy with the given fields replaced; every other field is shared with this record."""
+        record = self.__class__.__new__(self.__class__)
+        for slot in self._all_slots():
+            value = changes.pop(slot) if slot in changes else getattr(self, slot)
+            object.__setattr__(record, slot, intern_str(value) if slot in self.INTERNED else value)
+        if changes:
+            raise AttributeError(f"{self.__class__.__name__} has no fields {sorted(changes)}")
+        return record
+
+    @classmethod
+    def _all_slots(cls) -> List[str]:
+        slots = []
+        for klass in reversed(cls.__mro__):
+            slots.extend(getattr(klass, "__slots__", ()))
+        return slots
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{self.__class__.__name__} is immutable; use evolve()")
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and all(getattr(self, s) == getattr(other, s) for s in self._all_slots())
+
+    __hash__ = None
+
+
+class VariableRecord(_Record):
+    """A raw indicator or decision variable (VariableSchema)."""
+    FIELDS = ("id", "name", "var_name", "impact_score", "description", "priority_rationale",
+              "formula", "function", "type", "value", "project_id")
+    INTERNED = ("var_name", "type", "project_id")
+    __slots__ = FIELDS + ("default_rationale",)
+
+    def _compact(self) -> None:
+        is_default = (self.impact_score is not _MISSING and
+                      self.priority_rationale == default_priority_rationale(self.impact_score))
+        object.__setattr__(self, "default_rationale", is_default)
+        if is_default:
+            object.__setattr__(self, "priority_rationale", _MISSING)
+
+    def get(self, field: str, default: Any = None) -> Any:
+        if field == "priority_rationale" and self.default_rationale:
+            return default_priority_rationale(self.impact_score)
+        return super().get(field, default)
+
+    def _expand(self, data: Dict[str, Any], project_id: Optional[str]) -> None:
+        if self.default_rationale:
+            data["priority_rationale"] = default_priority_rationale(self.impact_score)
+
+
+class QuestionRecord(_Record):
+    """A questionnaire question (Question); raw_indicators is kept as a tuple of interned var_names."""
+    FIELDS = ("id", "text", "type", "variable_name", "raw_indicators", "formula", "function", "is_conditional",
+              "triggering_criteria", "question_triggering_criteria", "project_id")
+    INTERNED = ("type", "variable_name", "project_id")
+    __slots__ = FIELDS
+
+    def _compact(self) -> None:
+        if isinstance(self.raw_indicators, list):
+            object.__setattr__(self, "raw_indicators", tuple(intern_str(name) for name in self.raw_indicators))
+
+    def _expand(self, data: Dict[str, Any], project_id: Optional[str]) -> None:
+        if isinstance(self.raw_indicators, tuple):
+            data["raw_indicators"] = list(self.raw_indicators)
+
+
+class SectionRecord(_Record):
+    """A questionnaire section (Section) with its question lists as tuples of QuestionRecord."""
+    FIELDS = ("title", "description", "order", "is_mandatory", "rationale", "core_questions",
+              "conditional_questions", "triggering_criteria", "data_validation", "project_id")
+    INTERNED = ("project_id",)
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], project_id: Optional[str] = None) -> "SectionRecord":
+        record = super().from_dict(data, project_id)
+        for list_key in ("core_questions", "conditional_questions"):
+            questions = getattr(record, list_key)
+            if isinstance(questions, list):
+                object.__setattr__(record, list_key, tuple(QuestionRecord.from_dict(q, project_id) for q in questions))
+        return record
+
+    def _expand(self, data: Dict[str, Any], project_id: Optional[str]) -> None:
+        for list_key in ("core_questions", "conditional_questions"):
+            questions = getattr(self, list_key)
+            if isinstance(questions, tuple):
+                data[list_key] = [question.to_dict(project_id) for question in questions]
+
+
+class QuestionnaireRecord(_Record):
+    """A questionnaire (QuestionnaireOutput plus title and raw_indicator_calculation)."""
+    FIELDS = ("title", "sections", "raw_indicator_calculation")
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], project_id: Optional[str] = None) -> "QuestionnaireRecord":
+        record = super().from_dict(data, project_id)
+        if isinstance(record.sections, list):
+            object.__setattr__(record, "sections", tuple(SectionRecord.from_dict(s, project_id) for s in record.sections))
+        if isinstance(record.raw_indicator_calculation, dict):
+            object.__setattr__(record, "raw_indicator_calculation", tuple(
+                (intern_str(name), formula) for name, formula in record.raw_indicator_calculation.items()))
+        return record
+
+    def _expand(self, data: Dict[str, Any], project_id: Optional[str]) -> None:
+        if isinstance(self.sections, tuple):
+            data["sections"] = [section.to_dict(project_id) for section in self.sections]
+        if isinstance(self.raw_indicator_calculation, tuple):
+            data["raw_indicator_calculation"] = dict(self.raw_indicator_calculation)
+
+    def replace_section(self, order: Any, section: SectionRecord) -> "QuestionnaireRecord":
+        """Copy with the section of the given order replaced; all other sections are shared."""
+        return self.evolve(sections=tuple(section if s.order == order else s for s in self.sections))
+
+
+class CompactAssessment:
+    """
+    The assessment part of a GraphState (project_id, raw indicators, decision variables, questionnaire) as
+    records. `extra` keeps any other top-level keys (template metadata, prompt) as given.
+    """
+    __slots__ = ("project_id", "raw_indicators", "decision_variables", "questionnaire", "extra")
+
+    STATE_KEYS = ("project_id", "raw_indicators", "decision_variables", "questionnaire")
+
+    def __init__(self, project_id: Optional[str], raw_indicators: Tuple[VariableRecord, ...],
+                 decision_variables: Tuple[VariableRecord, ...], questionnaire: Optional[QuestionnaireRecord],
+                 extra: Optional[Tuple[Tuple[str, Any], ...]] = None):
+        self.project_id = intern_str(project_id)
+        self.raw_indicators = raw_indicators
+        self.decision_variables = decision_variables
+        self.questionnaire = questionnaire
+        self.extra = extra
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], extra_keys: Iterable[str] = ()) -> "CompactAssessment":
+        """Builds the records from a GraphState-shaped dict; `extra_keys` are kept alongside as is."""
+        project_id = state.get("project_id")
+        questionnaire = state.get("questionnaire")
+        extra = tuple((key, state[key]) for key in extra_keys if key in state)
+        return cls(
+            project_id,
+            tuple(VariableRecord.from_dict(var, project_id) for var in state.get("raw_indicators") or []),
+            tuple(VariableRecord.from_dict(var, project_id) for var in state.get("decision_variables") or []),
+            QuestionnaireRecord.from_dict(questionnaire, project_id) if questionnaire is not None else None,
+            extra or None,
+        )
+
+    def to_state(self) -> Dict[str, Any]:
+        """Rebuilds fresh dicts in the GraphState shape (safe for the caller to mutate)."""
+        state = {
+            "project_id": self.project_id,
+            "raw_indicators": [var.to_dict(self.project_id) for var in self.raw_indicators],
+            "decision_variables": [var.to_dict(self.project_id) for var in self.decision_variables],
+            "questionnaire": self.questionnaire.to_dict(self.project_id) if self.questionnaire is not None else None,
+        }
+        if self.extra:
+            state.update(self.extra)
+        return state
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.STATE_KEYS:
+            return getattr(self, key)
+        return dict(self.extra or ()).get(key, default)
+
+    def evolve(self, **changes: Any) -> "CompactAssessment":
+        """Returns a copy with the given attributes replaced; unchanged records are shared, not copied."""
+        values = {slot: changes.pop(slot) if slot in changes else getattr(self, slot) for slot in self.__slots__}
+        if changes:
+            raise AttributeError(f"CompactAssessment has no fields {sorted(changes)}")
+        return CompactAssessment(**values)
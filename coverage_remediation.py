@@ -0,0 +1,154 @@
+import difflib
+import re
+from typing import Collection, Dict, List, Optional, Set, TypedDict
+
+from formula_validation import SYNTAX_ERROR, UNKNOWN_IDENTIFIER, validate_expression
+from questionnaire_index import QuestionnaireIndex, QUESTION_LIST_KEYS
+
+# Question variables referenced from raw_indicator_calculation formulas
+Q_VAR_PATTERN = re.compile(r'\b(q_[a-zA-Z0-9_]+)\b')
+
+# Minimum difflib ratio for treating a missing q_ variable as a renamed question
+RENAME_MATCH_CUTOFF = 0.85
+
+# Number of best-matching sections (besides the remediation target) sent to the LLM
+MAX_RELEVANT_SECTIONS = 2
+
+
+class LocalRemediationResult(TypedDict):
+    resolved: List[str]  # RI var_names fixed without the LLM
+    unresolved: List[str]  # RI var_names that still need LLM remediation
+    actions: List[str]  # Human-readable log of every change applied
+
+
+def _normalize_name(name: str) -> str:
+    """Normalizes a variable name for comparison: drops the q_ prefix, case and separators."""
+    name = name or ""
+    if name.lower().startswith("q_"):
+        name = name[2:]
+    # camelCase -> snake_case before stripping separators
+    name = re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name)
+    return name.lower().replace("_", "").replace("-", "")
+
+
+def _find_renamed_question_var(missing_var: str, q_index: QuestionnaireIndex) -> Optional[str]:
+    """Finds the question variable a missing q_ reference most likely refers to after a rename."""
+    normalized_missing = _normalize_name(missing_var)
+    question_vars = sorted(v for v in q_index.question_vars() if v)
+    for candidate in question_vars:
+        if _normalize_name(candidate) == normalized_missing:
+            return candidate
+    matches = difflib.get_close_matches(missing_var, question_vars, n=1, cutoff=RENAME_MATCH_CUTOFF)
+    return matches[0] if matches else None
+
+
+def _find_question_by_ri_name(ri: Dict, q_index: QuestionnaireIndex) -> Optional[str]:
+    """Finds a question whose variable_name is the raw indicator's var_name (with or without the q_ prefix)."""
+    normalized_ri = _normalize_name(ri.get("var_name", ""))
+    if not normalized_ri:
+        return None
+    for candidate in sorted(v for v in q_index.question_vars() if v):
+        if _normalize_name(candidate) == normalized_ri:
+            return candidate
+    return None
+
+
+def remediate_coverage_locally(q_index: QuestionnaireIndex, ri_varname_map: Dict[str, Dict],
+                               ri_calculation_map: Dict[str, str], vars_to_address: List[str],
+                               known_names: Optional[Collection[str]] = None) -> LocalRemediationResult:
+    """
+    Rule-based coverage remediation, applied before falling back to the LLM.
+    For every raw indicator needing attention it:
+    1. Rewrites calculation references to q_ variables that were renamed in the questionnaire.
+    2. Links the questions a calculation formula already reads (direct mappings).
+    3. Links a question that captures the raw indicator by name and maps the calculation onto it.
+    The questionnaire (through the index) and ri_calculation_map are updated in place.
+    When `known_names` (RI/DV names) is given, a raw indicator whose calculation still fails static
+    validation afterwards is left unresolved.
+    """
+    resolved: List[str] = []
+    unresolved: List[str] = []
+    actions: List[str] = []
+
+    for ri_var_name in vars_to_address:
+        ri = ri_varname_map.get(ri_var_name)
+        if ri is None:
+            unresolved.append(ri_var_name)
+            continue
+
+        formula = ri_calculation_map.get(ri_var_name) or ""
+        referenced = list(dict.fromkeys(Q_VAR_PATTERN.findall(formula)))
+        missing = [var for var in referenced if var not in q_index]
+
+        # Rule 1: rewrite references to renamed question variables
+        if missing:
+            renames = {var: _find_renamed_question_var(var, q_index) for var in missing}
+            if all(renames.values()):
+                for old_var, new_var in renames.items():
+                    formula = re.sub(r'\b' + re.escape(old_var) + r'\b', str(new_var), formula)
+                    actions.append(f"Rewrote '{old_var}' -> '{new_var}' in calculation of '{ri_var_name}'.")
+                ri_calculation_map[ri_var_name] = formula
+                referenced = list(dict.fromkeys(Q_VAR_PATTERN.findall(formula)))
+                missing = []
+
+        # Rule 2: a valid formula already reads existing questions, so those questions capture the RI
+        if referenced and not missing:
+            for question_var in referenced:
+                if q_index.link_raw_indicator(question_var, ri_var_name):
+                    actions.append(f"Linked question '{question_var}' to raw indicator '{ri_var_name}' from its calculation.")
+
+        # Rule 3: a question already captures the RI by name
+        if not q_index.questions_for_ri(ri_var_name) or missing:
+            question_var = _find_question_by_ri_name(ri, q_index)
+            if question_var:
+                if q_index.link_raw_indicator(question_var, ri_var_name):
+                    actions.append(f"Linked question '{question_var}' to raw indicator '{ri_var_name}' by name.")
+                if missing or not formula.strip():
+                    ri_calculation_map[ri_var_name] = f"return {question_var};"
+                    actions.append(f"Mapped calculation of '{ri_var_name}' onto question '{question_var}'.")
+                    missing = []
+
+        if known_names is not None and not missing and formula.strip():
+            validation = validate_expression(ri_calculation_map.get(ri_var_name), set(known_names) | q_index.question_vars())
+            missing = validation["status"] in (SYNTAX_ERROR, UNKNOWN_IDENTIFIER)
+
+        if q_index.questions_for_ri(ri_var_name) and not missing:
+            resolved.append(ri_var_name)
+        else:
+            unresolved.append(ri_var_name)
+
+    return {"resolved": resolved, "unresolved": unresolved, "actions": actions}
+
+
+def _section_tokens(section: Dict) -> Set[str]:
+    text_parts = [section.get("title") or "", section.get("description") or ""]
+    for list_key in QUESTION_LIST_KEYS:
+        for question in section.get(list_key) or []:
+            text_parts.append(question.get("text") or "")
+            text_parts.append(question.get("variable_name") or "")
+            text_parts.extend(question.get("raw_indicators") or [])
+    return set(re.findall(r'[a-z0-9]+', " ".join(text_parts).replace("_", " ").lower()))
+
+
+def select_relevant_sections(q_index: QuestionnaireIndex, raw_indicators: List[Dict],
+                             target_section: Optional[Dict] = None,
+                             max_sections: int = MAX_RELEVANT_SECTIONS) -> List[Dict]:
+    """
+    Picks the sections most lexically related to the given raw indicators, plus the remediation
+    target section, so the LLM only receives the part of the questionnaire it needs.
+    Sections are returned in questionnaire order.
+    """
+    ri_tokens: Set[str] = set()
+    for ri in raw_indicators:
+        ri_text = " ".join([ri.get("var_name") or "", ri.get("name") or "", ri.get("description") or ""])
+        ri_tokens.update(re.findall(r'[a-z0-9]+', ri_text.replace("_", " ").lower()))
+
+    scored = []
+    for position, section in enumerate(q_index.sections):
+        overlap = len(ri_tokens & _section_tokens(section))
+        if overlap:
+            scored.append((-overlap, position, section))
+    chosen = {id(section) for _score, _position, section in sorted(scored, key=lambda item: item[:2])[:max_sections]}
+    if target_section is not None:
+        chosen.add(id(target_section))
+    return [section for section in q_index.sections if id(section) in chosen]
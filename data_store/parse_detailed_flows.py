@@ -1,20 +1,260 @@
 import pandas as pd
+import hashlib
 import json
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI # Import the OpenAI client
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from a .env file if it exists
 
-def transform_csv_to_json_openai(csv_file_path):
+# --- Chunked conversion pipeline ---
+# The CSV is partitioned by template_name and every template is converted by its own LLM call,
+# with bounded parallelism. Each finished template is appended to questionnaire_output.jsonl as soon
+# as it completes, together with the content hash of its rows, prompt and model; a re-run only
+# converts templates whose hash changed or that failed before. questionnaire_output.json is then
+# rebuilt from the JSONL as {template_name: converted template}.
+
+DATA_STORE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV_PATH = os.path.join(DATA_STORE_DIR, 'filtered_flow_data.csv')
+DEFAULT_JSONL_PATH = os.path.join(DATA_STORE_DIR, 'questionnaire_output.jsonl')
+DEFAULT_JSON_PATH = os.path.join(DATA_STORE_DIR, 'questionnaire_output.json')
+
+CONVERSION_MODEL = "gpt-4o"
+MAX_CONCURRENT_CONVERSIONS = 4
+MAX_OUTPUT_TOKENS = 4000 # Per template; a whole export never fit in one response
+
+# --- Define the desired JSON schema for the LLM's response ---
+RESPONSE_SCHEMA = {
+    "type": "object", # Use "object" for top-level dictionaries
+    "properties": {
+        "assessment_variables": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "name": {"type": "string"},
+                    "var_name": {"type": "string"},
+                    "priority": {"type": "integer"},
+                    "description": {"type": "string"},
+                    "formula": {"type": ["string", "null"]},
+                    "type": {"type": "string"},
+                    "value": {"type": ["string", "null"]},
+                    "project_id": {"type": ["string", "null"]}
+                },
+                "required": ["id", "name", "var_name", "priority", "description", "type"]
+            }
+        },
+        "computational_variables": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "name": {"type": "string"},
+                    "var_name": {"type": "string"},
+                    "priority": {"type": "integer"},
+                    "description": {"type": "string"},
+                    "formula": {"type": ["string", "null"]},
+                    "type": {"type": "string"},
+                    "value": {"type": ["string", "null"]},
+                    "project_id": {"type": ["string", "null"]}
+                },
+                "required": ["id", "name", "var_name", "priority", "description", "type"]
+            }
+        },
+        "questionnaire": {
+            "type": "object",
+            "properties": {
+                "sections": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "title": {"type": "string"},
+                            "description": {"type": "string"},
+                            "order": {"type": "integer"},
+                            "is_mandatory": {"type": "boolean"},
+                            "rationale": {"type": "string"},
+                            "core_questions": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "id": {"type": "string"},
+                                        "text": {"type": "string"},
+                                        "type": {"type": "string"},
+                                        "variable_name": {"type": "string"},
+                                        "triggering_criteria": {"type": ["string", "null"]},
+                                        "assessment_variables": {
+                                            "type": "array",
+                                            "items": {"type": "string"}
+                                        },
+                                        "formula": {"type": ["string", "null"]},
+                                        "is_conditional": {"type": ["boolean", "null"]},
+                                        "project_id": {"type": ["string", "null"]}
+                                    },
+                                    "required": ["id", "text", "type", "variable_name", "assessment_variables"]
+                                }
+                            },
+                            "conditional_questions": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "id": {"type": "string"},
+                                        "text": {"type": "string"},
+                                        "type": {"type": "string"},
+                                        "variable_name": {"type": "string"},
+                                        "triggering_criteria": {"type": ["string", "null"]},
+                                        "assessment_variables": {
+                                            "type": "array",
+                                            "items": {"type": "string"}
+                                        },
+                                        "formula": {"type": ["string", "null"]},
+                                        "is_conditional": {"type": ["boolean", "null"]},
+                                        "project_id": {"type": ["string", "null"]}
+                                    },
+                                    "required": ["id", "text", "type", "variable_name", "assessment_variables"]
+                                }
+                            },
+                            "triggering_criteria": {"type": ["string", "null"]}
+                        },
+                        "required": ["title", "description", "order", "is_mandatory", "rationale", "core_questions", "conditional_questions"]
+                    }
+                }
+            },
+            "required": ["sections"]
+        }
+    },
+    "required": ["assessment_variables", "computational_variables", "questionnaire"]
+}
+
+# --- Conversion prompt (one template per call) ---
+CONVERSION_PROMPT = """
+You are an expert in generating loan questionnaires based on provided data.
+Below is raw questionnaire data in CSV format, representing past assessments for low-income, thin-file individuals applying for loans.
+Your task is to intelligently parse this data and transform it into a structured JSON output, adhering strictly to the provided JSON schema.
+
+Infer the following information based on the CSV data and the context of loan assessments:
+- **Sections**: Divide the questionnaire into logical sections (e.g., "Basic Information", "Business Details", "Financials", "References"). Each section should have a title, description, order, and rationale.
+  - A section should be `is_mandatory: True` by default. If a section primarily contains questions with `Triggering Criteria` or if its title implies it's a follow-up, it might be `is_mandatory: False` and have a `triggering_criteria`.
+- **Assessment Variables**: These are the key pieces of information (variables) that the relationship manager needs to determine from the questions.
+  - Generate a unique `id` for each assessment variable (camelCase of the variable name if possible, otherwise a UUID).
+  - Infer `name`, `var_name`, `priority`, `description`, and `type` (e.g., "string", "integer", "boolean", "array") based on the "Variable Name" and "Question Type" columns. For `description`, provide a concise summary.
+  - `formula` and `value` should be `null` for assessment variables.
+  - The `project_id` should be extracted from the 'Project id' column in the CSV for each relevant variable or question.
+- **Computational Variables**: These are variables that the credit team must compute from the assessment variables to determine loan worthiness.
+  - Invent plausible `computational_variables` (e.g., "Loan Eligibility Score", "Debt-to-Income Ratio", "Profit Margin").
+  - Provide a `formula` for each computational variable, expressed in terms of the `var_name` of the *assessment variables*. If an assessment variable isn't explicitly mentioned in the CSV but is common for such calculations, you can infer it as an assessment variable first.
+  - Assign `priority` and a concise `description`.
+  - `value` should be `null`.
+- **Questions**:
+  - Each question needs a unique `id` (use UUIDs for unique identification within the JSON, as text is not unique).
+  - `text` is the actual question.
+  - `type` is the input type (e.g., "text", "number", "radio", "select", "textArea").
+  - `variable_name` maps to an `assessment_variable`'s `var_name`.
+  - `triggering_criteria` and `is_conditional` should be inferred from the CSV's 'Triggering Criteria' column. If 'Triggering Criteria' is present, `is_conditional` is `True`.
+  - `assessment_variables` should be an array containing the `var_name` of the assessment variable(s) this question is intended to determine.
+  - `formula` should be `null` for questions.
+  - `project_id` should be extracted from the 'Project id' column.
+  - Place questions into `core_questions` or `conditional_questions` arrays within their respective sections based on `is_conditional`.
+
+**Important Considerations:**
+- The 'Project id' column in the CSV is crucial; it acts as a unique identifier for each questionnaire (or segment of a questionnaire related to a specific occupation). Ensure variables and questions derived from different 'Project id' values are correctly assigned their respective project IDs.
+- Assume `is_mandatory` is `True` for sections unless there's explicit evidence or a strong inference for a `triggering_criteria`.
+- Be intelligent in inferring relationships and missing data points to create a comprehensive and logical questionnaire.
+- Use camelCase for `id` and `var_name` where derived from existing names. For new auto-generated IDs, use UUIDs.
+- If a 'Variable Name' is mentioned multiple times across different 'Project id's, treat them as distinct for their respective project contexts if their 'Question' or 'Question Type' differs, or as the same underlying assessment variable if consistent. For simplicity, the LLM should primarily map questions to the `assessment_variables` it creates.
+
+CSV Data (all rows belong to the template "{template_name}"):
+{csv_content_string}
+
+JSON Schema:
+{response_schema}
+
+Provide the JSON output strictly following this schema. Ensure all fields are populated according to the schema, inferring where necessary. Do not include any conversational text or explanation outside the JSON.
+"""
+
+
+def partition_by_template(df):
+    """Splits the export into one DataFrame per template_name, in order of first appearance."""
+    return {name: rows for name, rows in df.groupby("template_name", sort=False)}
+
+
+def template_content_hash(template_name, csv_chunk):
+    """Hash of everything that determines a template's conversion: its rows, the prompt and the model."""
+    digest = hashlib.sha256()
+    for part in (CONVERSION_MODEL, CONVERSION_PROMPT, json.dumps(RESPONSE_SCHEMA, sort_keys=True), template_name, csv_chunk):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_converted_templates(jsonl_path):
+    """Reads the incremental output; later lines for the same template replace earlier ones."""
+    converted = {}
+    if not os.path.exists(jsonl_path):
+        return converted
+    with open(jsonl_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue # Partial line from an interrupted run
+            converted[record["template_name"]] = record
+    return converted
+
+
+def _parse_json_content(content):
+    content = (content or "").strip()
+    fenced = re.match(r'^```(?:json)?\s*(.*?)\s*```$', content, re.S)
+    return json.loads(fenced.group(1) if fenced else content)
+
+
+def convert_template(client, template_name, csv_chunk):
+    """Converts the CSV rows of one template with one LLM call and returns the parsed JSON."""
+    from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
+
+    messages = [
+        ChatCompletionSystemMessageParam(role="system", content="You are a helpful assistant designed to output JSON."),
+        ChatCompletionUserMessageParam(role="user", content=CONVERSION_PROMPT.format(
+            template_name=template_name,
+            csv_content_string=csv_chunk,
+            response_schema=json.dumps(RESPONSE_SCHEMA, separators=(",", ":"))
+        ))
+    ]
+    response = client.chat.completions.create(
+        model=CONVERSION_MODEL,
+        messages=messages,
+        response_format={"type": "json_object"},
+        max_tokens=MAX_OUTPUT_TOKENS,
+        temperature=0.7 # Adjust creativity as needed
+    )
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        raise ValueError(f"response truncated at {MAX_OUTPUT_TOKENS} tokens")
+    return _parse_json_content(choice.message.content)
+
+
+def transform_csv_to_json_openai(csv_file_path, jsonl_path=DEFAULT_JSONL_PATH, max_workers=MAX_CONCURRENT_CONVERSIONS):
     """
-    Transforms a CSV file into a structured JSON questionnaire using OpenAI's GPT-4o model.
+    Transforms the flow export into structured JSON questionnaires, one OpenAI call per template.
 
     Args:
         csv_file_path (str): The path to the input CSV file.
+        jsonl_path (str): Incremental output; also serves as the per-template cache.
+        max_workers (int): Maximum number of concurrent conversions.
 
     Returns:
-        dict: A dictionary containing the transformed data in the specified schema.
+        dict: template_name -> transformed data in the specified schema (templates that failed are missing),
+        or None if the CSV or the OpenAI client is unavailable.
     """
     try:
         df = pd.read_csv(csv_file_path)
@@ -28,124 +268,6 @@ def transform_csv_to_json_openai(csv_file_path):
     # Clean column names by stripping whitespace
     df.columns = df.columns.str.strip()
 
-    # Convert DataFrame to a string representation for the LLM
-    # Using to_csv ensures column headers are preserved and gives a clear table format.
-    csv_content_string = df.to_csv(index=False)
-
-    # --- Define the desired JSON schema for the LLM's response ---
-    # This is the exact schema you provided.
-    response_schema = {
-        "type": "object", # Use "object" for top-level dictionaries
-        "properties": {
-            "assessment_variables": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "id": {"type": "string"},
-                        "name": {"type": "string"},
-                        "var_name": {"type": "string"},
-                        "priority": {"type": "integer"},
-                        "description": {"type": "string"},
-                        "formula": {"type": ["string", "null"]},
-                        "type": {"type": "string"},
-                        "value": {"type": ["string", "null"]},
-                        "project_id": {"type": ["string", "null"]}
-                    },
-                    "required": ["id", "name", "var_name", "priority", "description", "type"]
-                }
-            },
-            "computational_variables": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "id": {"type": "string"},
-                        "name": {"type": "string"},
-                        "var_name": {"type": "string"},
-                        "priority": {"type": "integer"},
-                        "description": {"type": "string"},
-                        "formula": {"type": ["string", "null"]},
-                        "type": {"type": "string"},
-                        "value": {"type": ["string", "null"]},
-                        "project_id": {"type": ["string", "null"]}
-                    },
-                    "required": ["id", "name", "var_name", "priority", "description", "type"]
-                }
-            },
-            "questionnaire": {
-                "type": "object",
-                "properties": {
-                    "sections": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "title": {"type": "string"},
-                                "description": {"type": "string"},
-                                "order": {"type": "integer"},
-                                "is_mandatory": {"type": "boolean"},
-                                "rationale": {"type": "string"},
-                                "core_questions": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "id": {"type": "string"},
-                                            "text": {"type": "string"},
-                                            "type": {"type": "string"},
-                                            "variable_name": {"type": "string"},
-                                            "triggering_criteria": {"type": ["string", "null"]},
-                                            "assessment_variables": {
-                                                "type": "array",
-                                                "items": {"type": "string"}
-                                            },
-                                            "formula": {"type": ["string", "null"]},
-                                            "is_conditional": {"type": ["boolean", "null"]},
-                                            "project_id": {"type": ["string", "null"]}
-                                        },
-                                        "required": ["id", "text", "type", "variable_name", "assessment_variables"]
-                                    }
-                                },
-                                "conditional_questions": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "id": {"type": "string"},
-                                            "text": {"type": "string"},
-                                            "type": {"type": "string"},
-                                            "variable_name": {"type": "string"},
-                                            "triggering_criteria": {"type": ["string", "null"]},
-                                            "assessment_variables": {
-                                                "type": "array",
-                                                "items": {"type": "string"}
-                                            },
-                                            "formula": {"type": ["string", "null"]},
-                                            "is_conditional": {"type": ["boolean", "null"]},
-                                            "project_id": {"type": ["string", "null"]}
-                                        },
-                                        "required": ["id", "text", "type", "variable_name", "assessment_variables"]
-                                    }
-                                },
-                                "triggering_criteria": {"type": ["string", "null"]}
-                            },
-                            "required": ["title", "description", "order", "is_mandatory", "rationale", "core_questions", "conditional_questions"]
-                        }
-                    }
-                },
-                "required": ["sections"]
-            }
-        },
-        "required": ["assessment_variables", "computational_variables", "questionnaire"]
-    }
-
-    # Initialize OpenAI client
-    # It's recommended to set your API key as an environment variable (OPENAI_API_KEY)
-    # or pass it directly.
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    # For demonstration, you might temporarily hardcode it, but this is NOT recommended for production.
-    # client = OpenAI(api_key="YOUR_OPENAI_API_KEY_HERE")
     try:
         client = OpenAI() # Assumes OPENAI_API_KEY env variable is set
     except Exception as e:
@@ -153,78 +275,42 @@ def transform_csv_to_json_openai(csv_file_path):
         print("Please set your OpenAI API key as an environment variable named OPENAI_API_KEY.")
         return None
 
+    # Using to_csv per template keeps the column headers and gives the LLM a clear table format
+    chunks = {name: rows.to_csv(index=False) for name, rows in partition_by_template(df).items()}
+    hashes = {name: template_content_hash(name, chunk) for name, chunk in chunks.items()}
+    converted = load_converted_templates(jsonl_path)
+    pending = [name for name in chunks if converted.get(name, {}).get("content_hash") != hashes[name]]
+    print(f"{len(chunks)} templates: {len(chunks) - len(pending)} unchanged, {len(pending)} to convert "
+          f"({max_workers} at a time)...")
 
-    # Construct the prompt for the LLM. Changed from f-string to a regular string with a placeholder.
-    prompt = """
-    You are an expert in generating loan questionnaires based on provided data.
-    Below is raw questionnaire data in CSV format, representing past assessments for low-income, thin-file individuals applying for loans.
-    Your task is to intelligently parse this data and transform it into a structured JSON output, adhering strictly to the provided JSON schema.
-
-    Infer the following information based on the CSV data and the context of loan assessments:
-    - **Sections**: Divide the questionnaire into logical sections (e.g., "Basic Information", "Business Details", "Financials", "References"). Each section should have a title, description, order, and rationale.
-      - A section should be `is_mandatory: True` by default. If a section primarily contains questions with `Triggering Criteria` or if its title implies it's a follow-up, it might be `is_mandatory: False` and have a `triggering_criteria`.
-    - **Assessment Variables**: These are the key pieces of information (variables) that the relationship manager needs to determine from the questions.
-      - Generate a unique `id` for each assessment variable (camelCase of the variable name if possible, otherwise a UUID).
-      - Infer `name`, `var_name`, `priority`, `description`, and `type` (e.g., "string", "integer", "boolean", "array") based on the "Variable Name" and "Question Type" columns. For `description`, provide a concise summary.
-      - `formula` and `value` should be `null` for assessment variables.
-      - The `project_id` should be extracted from the 'Project id' column in the CSV for each relevant variable or question.
-    - **Computational Variables**: These are variables that the credit team must compute from the assessment variables to determine loan worthiness.
-      - Invent plausible `computational_variables` (e.g., "Loan Eligibility Score", "Debt-to-Income Ratio", "Profit Margin").
-      - Provide a `formula` for each computational variable, expressed in terms of the `var_name` of the *assessment variables*. If an assessment variable isn't explicitly mentioned in the CSV but is common for such calculations, you can infer it as an assessment variable first.
-      - Assign `priority` and a concise `description`.
-      - `value` should be `null`.
-    - **Questions**:
-      - Each question needs a unique `id` (use UUIDs for unique identification within the JSON, as text is not unique).
-      - `text` is the actual question.
-      - `type` is the input type (e.g., "text", "number", "radio", "select", "textArea").
-      - `variable_name` maps to an `assessment_variable`'s `var_name`.
-      - `triggering_criteria` and `is_conditional` should be inferred from the CSV's 'Triggering Criteria' column. If 'Triggering Criteria' is present, `is_conditional` is `True`.
-      - `assessment_variables` should be an array containing the `var_name` of the assessment variable(s) this question is intended to determine.
-      - `formula` should be `null` for questions.
-      - `project_id` should be extracted from the 'Project id' column.
-      - Place questions into `core_questions` or `conditional_questions` arrays within their respective sections based on `is_conditional`.
-
-    **Important Considerations:**
-    - The 'Project id' column in the CSV is crucial; it acts as a unique identifier for each questionnaire (or segment of a questionnaire related to a specific occupation). Ensure variables and questions derived from different 'Project id' values are correctly assigned their respective project IDs.
-    - Assume `is_mandatory` is `True` for sections unless there's explicit evidence or a strong inference for a `triggering_criteria`.
-    - Be intelligent in inferring relationships and missing data points to create a comprehensive and logical questionnaire.
-    - Use camelCase for `id` and `var_name` where derived from existing names. For new auto-generated IDs, use UUIDs.
-    - If a 'Variable Name' is mentioned multiple times across different 'Project id's, treat them as distinct for their respective project contexts if their 'Question' or 'Question Type' differs, or as the same underlying assessment variable if consistent. For simplicity, the LLM should primarily map questions to the `assessment_variables` it creates.
-
-    CSV Data:
-    {csv_content_string}
-
-    Provide the JSON output strictly following this schema. Ensure all fields are populated according to the schema, inferring where necessary. Do not include any conversational text or explanation outside the JSON.
-    """
-
-    from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
-
-    messages = [
-        ChatCompletionSystemMessageParam(role="system", content="You are a helpful assistant designed to output JSON."),
-        ChatCompletionUserMessageParam(role="user", content=prompt.format(csv_content_string=csv_content_string))
-    ]
+    write_lock = threading.Lock()
+    failures = {}
+    with open(jsonl_path, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(convert_template, client, name, chunks[name]): name for name in pending}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures[name] = str(e)
+                print(f"Failed to convert template '{name}': {e}")
+                continue
+            record = {"template_name": name, "content_hash": hashes[name], "result": result}
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+            converted[name] = record
+            print(f"Converted template '{name}' ({len(converted)}/{len(chunks)})")
 
-    try:
-        print("Sending request to OpenAI LLM (gpt-4o)...")
-        # Make the API call to OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o",  # You can choose other models like "gpt-3.5-turbo"
-            messages=messages,
-            # For best results with structured output, consider setting response_format={"type": "json_object"}
-            # as well, if your client library version supports it alongside response_model.
-            # However, response_model is designed for this purpose directly.
-            # response_format={"type": "json_object"},
-            max_tokens=4000, # Adjust as needed for potentially large outputs
-            temperature=0.7 # Adjust creativity as needed
-        )
-
-        # The response_model feature directly gives you a Pydantic object
-        # which can be converted to a dictionary.
-        return response.model_dump()
+    # Rewrite the JSONL without superseded lines and templates no longer in the export
+    current = [converted[name] for name in chunks if converted.get(name, {}).get("content_hash") == hashes[name]]
+    with open(jsonl_path, 'w', encoding='utf-8') as out:
+        for record in current:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
 
-    except Exception as e:
-        print(f"An error occurred during OpenAI API call: {e}")
-        return None
+    if failures:
+        print(f"{len(failures)} templates failed and will be retried on the next run: {', '.join(failures)}")
+    return {record["template_name"]: record["result"] for record in current}
 
 if __name__ == "__main__":
     # Ensure your OpenAI API key is set as an environment variable named OPENAI_API_KEY
@@ -235,17 +321,14 @@ if __name__ == "__main__":
         print("Error: OPENAI_API_KEY environment variable not set.")
         print("Please set your OpenAI API key before running the script.")
     else:
-        csv_file = 'filtered_flow_data.csv'
-        output_json_file = 'questionnaire_output.json' # Define the output file name
-
-        transformed_json_data = transform_csv_to_json_openai(csv_file)
+        transformed_json_data = transform_csv_to_json_openai(DEFAULT_CSV_PATH)
 
         if transformed_json_data:
-            # Write the JSON output to a file
+            # Write the combined JSON output to a file
             try:
-                with open(output_json_file, 'w', encoding='utf-8') as f:
+                with open(DEFAULT_JSON_PATH, 'w', encoding='utf-8') as f:
                     json.dump(transformed_json_data, f, indent=2, ensure_ascii=False)
-                print(f"Successfully wrote transformed JSON data to {output_json_file}")
+                print(f"Successfully wrote {len(transformed_json_data)} transformed templates to {DEFAULT_JSON_PATH}")
             except Exception as e:
                 print(f"Error writing JSON data to file: {e}")
         else:
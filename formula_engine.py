@@ -0,0 +1,920 @@
+import hashlib
+import math
+import operator as _operator
+import re
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Set, Tuple
+
+# --- Sandboxed JavaScript-subset formula engine ---
+# Formulas, triggering criteria and raw_indicator_calculation entries are small JS snippets such as
+# "return q_daily_sales * q_days_per_week * 4;". They are parsed once into a tree of Python closures
+# and cached by source hash. The supported subset has no loops, no user functions and no property
+# access beyond a whitelist, so evaluation always terminates and cannot reach the host. Numbers are
+# IEEE doubles as in JS (Python floats; integer inputs are converted on use), so arithmetic overflows
+# to Infinity instead of growing unbounded integers.
+
+
+class FormulaError(Exception):
+    """Base class for formula engine errors."""
+
+
+class FormulaSyntaxError(FormulaError):
+    """Raised when a formula cannot be parsed by the supported JS subset."""
+
+
+class FormulaEvaluationError(FormulaError):
+    """Raised when a compiled formula fails at evaluation time (e.g. an unknown identifier)."""
+
+
+class _Undefined:
+    """JavaScript `undefined`; Python None stands for `null`."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "undefined"
+
+    def __bool__(self):
+        return False
+
+
+UNDEFINED = _Undefined()
+
+# Completion marker for statements that did not execute a `return`
+_NO_RETURN = object()
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<str>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<name>[A-Za-z_$][A-Za-z0-9_$]*)
+  | (?P<op>===|!==|\*\*|==|!=|<=|>=|&&|\|\||\?\?|\+=|-=|\*=|/=|[-+*/%<>!?:.,;(){}\[\]=])
+""", re.S | re.X)
+
+_STRING_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "0": "\0"}
+
+_KEYWORD_LITERALS = {
+    "true": True,
+    "false": False,
+    "null": None,
+    "undefined": UNDEFINED,
+    "NaN": math.nan,
+    "Infinity": math.inf,
+}
+
+_DECLARATION_KEYWORDS = {"const", "let", "var"}
+# Statements outside the sandboxed subset (loops, user functions, object construction, dynamic code)
+_UNSUPPORTED_KEYWORDS = {"for", "while", "do", "switch", "try", "throw", "new", "this", "class", "import", "eval", "delete"}
+_RESERVED_WORDS = {"return", "if", "else", "function", "typeof"} | _DECLARATION_KEYWORDS | set(_KEYWORD_LITERALS) | _UNSUPPORTED_KEYWORDS
+
+
+# --- JavaScript value semantics ---
+
+def _int_to_double(value: int) -> float:
+    try:
+        return float(value)
+    except OverflowError:
+        return math.inf if value > 0 else -math.inf
+
+
+def to_number(value: Any) -> float:
+    """JS ToNumber; always a double."""
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, float):
+        return value
+    if isinstance(value, int):
+        return _int_to_double(value)
+    if value is None:
+        return 0.0
+    if value is UNDEFINED:
+        return math.nan
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return 0.0
+        try:
+            return float(text)
+        except ValueError:
+            return math.nan
+    return math.nan
+
+
+def to_boolean(value: Any) -> bool:
+    """JS ToBoolean (truthiness)."""
+    if value is None or value is UNDEFINED:
+        return False
+    if isinstance(value, float) and math.isnan(value):
+        return False
+    if isinstance(value, (list, dict)):
+        return True
+    return bool(value)
+
+
+def to_js_string(value: Any) -> str:
+    """JS ToString."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    if value is UNDEFINED:
+        return "undefined"
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "Infinity" if value > 0 else "-Infinity"
+        if value.is_integer() and abs(value) < 1e21:
+            return str(int(value))
+        return repr(value)
+    if isinstance(value, list):
+        return ",".join("" if item is None or item is UNDEFINED else to_js_string(item) for item in value)
+    return str(value)
+
+
+# Strings are capped far below JS's own limit: a few doubling concatenations would otherwise exhaust memory
+MAX_STRING_LENGTH = 1_000_000
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _js_add(left: Any, right: Any) -> Any:
+    if isinstance(left, (str, list)) or isinstance(right, (str, list)):
+        text = to_js_string(left) + to_js_string(right)
+        if len(text) > MAX_STRING_LENGTH:
+            raise FormulaEvaluationError("RangeError: Invalid string length")
+        return text
+    return to_number(left) + to_number(right)
+
+
+def _js_divide(left: Any, right: Any) -> Any:
+    numerator, denominator = to_number(left), to_number(right)
+    if denominator == 0:
+        if numerator == 0 or math.isnan(numerator):
+            return math.nan
+        return math.copysign(math.inf, numerator) * math.copysign(1, denominator)
+    return numerator / denominator
+
+
+def _js_modulo(left: Any, right: Any) -> Any:
+    numerator, denominator = to_number(left), to_number(right)
+    if denominator == 0 or math.isnan(numerator) or math.isinf(numerator):
+        return math.nan
+    if math.isinf(denominator):
+        return numerator
+    return math.fmod(numerator, denominator)
+
+
+def _js_power(left: Any, right: Any) -> float:
+    base, exponent = to_number(left), to_number(right)
+    if math.isnan(exponent) or (abs(base) == 1 and math.isinf(exponent)):
+        return math.nan
+    # The result is negative only for a negative base and an odd integer exponent
+    odd_exponent = exponent.is_integer() and abs(exponent) < 2 ** 53 and int(exponent) % 2 == 1
+    try:
+        result = base ** exponent
+    except OverflowError:
+        return -math.inf if base < 0 and odd_exponent else math.inf
+    except ZeroDivisionError:  # 0 ** negative
+        return -math.inf if math.copysign(1, base) < 0 and odd_exponent else math.inf
+    return math.nan if isinstance(result, complex) else result
+
+
+def _js_subtract(left: Any, right: Any) -> Any:
+    return to_number(left) - to_number(right)
+
+
+def _js_multiply(left: Any, right: Any) -> Any:
+    return to_number(left) * to_number(right)
+
+
+def strict_equals(left: Any, right: Any) -> bool:
+    """JS ===."""
+    if _is_number(left) and _is_number(right):
+        return left == right  # NaN != NaN holds in Python as well
+    if type(left) is not type(right):
+        return False
+    if isinstance(left, (list, dict)):
+        return left is right
+    return left == right
+
+
+def loose_equals(left: Any, right: Any) -> bool:
+    """JS ==."""
+    left_nullish = left is None or left is UNDEFINED
+    right_nullish = right is None or right is UNDEFINED
+    if left_nullish or right_nullish:
+        return left_nullish and right_nullish
+    primitives = (str, bool, int, float)
+    if isinstance(left, primitives) and isinstance(right, primitives) and type(left) is not type(right):
+        if not (_is_number(left) and _is_number(right)):
+            return to_number(left) == to_number(right)
+    return strict_equals(left, right)
+
+
+def _js_compare(operator: str) -> Callable[[Any, Any], bool]:
+    python_operator = {"<": _operator.lt, ">": _operator.gt, "<=": _operator.le, ">=": _operator.ge}[operator]
+
+    def compare(left: Any, right: Any) -> bool:
+        if isinstance(left, str) and isinstance(right, str):
+            return python_operator(left, right)
+        left_number, right_number = to_number(left), to_number(right)
+        if math.isnan(left_number) or math.isnan(right_number):
+            return False
+        return python_operator(left_number, right_number)
+    return compare
+
+
+def _js_typeof(value: Any) -> str:
+    if value is UNDEFINED:
+        return "undefined"
+    if isinstance(value, bool):
+        return "boolean"
+    if _is_number(value):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return "object"
+
+
+_BINARY_OPERATORS: Dict[str, Callable[[Any, Any], Any]] = {
+    "+": _js_add,
+    "-": _js_subtract,
+    "*": _js_multiply,
+    "/": _js_divide,
+    "%": _js_modulo,
+    "**": _js_power,
+    "===": strict_equals,
+    "!==": lambda left, right: not strict_equals(left, right),
+    "==": loose_equals,
+    "!=": lambda left, right: not loose_equals(left, right),
+    "<": _js_compare("<"),
+    ">": _js_compare(">"),
+    "<=": _js_compare("<="),
+    ">=": _js_compare(">="),
+}
+
+_COMPOUND_ASSIGNMENTS = {"+=": "+", "-=": "-", "*=": "*", "/=": "/"}
+
+# Binding powers for the Pratt parser (higher binds tighter)
+_BINDING_POWER = {
+    "?": 2,
+    "??": 3, "||": 3,
+    "&&": 4,
+    "==": 6, "!=": 6, "===": 6, "!==": 6,
+    "<": 7, ">": 7, "<=": 7, ">=": 7,
+    "+": 9, "-": 9,
+    "*": 10, "/": 10, "%": 10,
+    "**": 11,
+    "(": 13, ".": 13, "[": 13,
+}
+_UNARY_BINDING_POWER = 12
+
+
+# --- Whitelisted globals and methods ---
+
+def parse_float(value: Any = UNDEFINED) -> Any:
+    match = re.match(r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[+-]?Infinity)', to_js_string(value))
+    if not match:
+        return math.nan
+    text = match.group(1)
+    if "Infinity" in text:
+        return -math.inf if text.startswith("-") else math.inf
+    return float(text)
+
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+# More significant digits than any finite double has in base 2
+_MAX_PARSE_INT_DIGITS = 1100
+
+
+def parse_int(value: Any = UNDEFINED, radix: Any = UNDEFINED) -> float:
+    base = 0 if radix is UNDEFINED else to_number(radix)
+    base = 0 if math.isnan(base) or math.isinf(base) else int(base)
+    if base != 0 and not 2 <= base <= 36:
+        return math.nan
+    text = to_js_string(value).strip()
+    sign = -1 if text.startswith("-") else 1
+    text = text[1:] if text[:1] in "+-" else text
+    if base in (0, 16) and text[:2].lower() == "0x":
+        base, text = 16, text[2:]
+    base = base or 10
+    valid = _DIGITS[:base]
+    end = 0
+    while end < len(text) and text[end].lower() in valid:
+        end += 1
+    digits = text[:end].lstrip("0") or text[:end]
+    if not digits:
+        return math.nan
+    if len(digits) > _MAX_PARSE_INT_DIGITS:
+        return sign * math.inf
+    return sign * _int_to_double(int(digits, base))
+
+
+def _math_round(value: Any) -> Any:
+    number = to_number(value)
+    if math.isnan(number) or math.isinf(number):
+        return number
+    return float(math.floor(number + 0.5))
+
+
+def _math_unary(function: Callable[[float], Any]) -> Callable[[Any], Any]:
+    def apply(value: Any = UNDEFINED) -> Any:
+        number = to_number(value)
+        if math.isnan(number):
+            return math.nan
+        try:
+            return function(number)
+        except (ValueError, OverflowError):
+            return math.nan
+    return apply
+
+
+def _math_extreme(pick: Callable[..., Any], empty: float) -> Callable[..., Any]:
+    def apply(*values: Any) -> Any:
+        numbers = [to_number(value) for value in values]
+        if any(math.isnan(number) for number in numbers):
+            return math.nan
+        return pick(numbers) if numbers else empty
+    return apply
+
+
+_MATH_MEMBERS: Dict[str, Any] = {
+    "max": _math_extreme(max, -math.inf),
+    "min": _math_extreme(min, math.inf),
+    "round": _math_round,
+    "floor": _math_unary(lambda n: n if math.isinf(n) else float(math.floor(n))),
+    "ceil": _math_unary(lambda n: n if math.isinf(n) else float(math.ceil(n))),
+    "trunc": _math_unary(lambda n: n if math.isinf(n) else float(math.trunc(n))),
+    "abs": _math_unary(abs),
+    "sqrt": _math_unary(math.sqrt),
+    "log": _math_unary(lambda n: -math.inf if n == 0 else math.log(n)),
+    "exp": _math_unary(lambda n: math.inf if n > 709.78 else math.exp(n)),
+    "sign": _math_unary(lambda n: float((n > 0) - (n < 0))),
+    "pow": lambda base=UNDEFINED, exponent=UNDEFINED: _js_power(base, exponent),
+    "PI": math.pi,
+    "E": math.e,
+}
+
+
+def _js_number(value: Any = 0) -> Any:
+    return to_number(value)
+
+
+def _js_string(value: Any = "") -> str:
+    return to_js_string(value)
+
+
+def _js_is_nan(value: Any = UNDEFINED) -> bool:
+    return math.isnan(to_number(value))
+
+
+def _js_is_finite(value: Any = UNDEFINED) -> bool:
+    number = to_number(value)
+    return not (math.isnan(number) or math.isinf(number))
+
+
+_GLOBAL_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "parseFloat": parse_float,
+    "parseInt": parse_int,
+    "Number": _js_number,
+    "String": _js_string,
+    "Boolean": lambda value=UNDEFINED: to_boolean(value),
+    "isNaN": _js_is_nan,
+    "isFinite": _js_is_finite,
+}
+
+_GLOBAL_OBJECTS: Dict[str, Dict[str, Any]] = {"Math": _MATH_MEMBERS}
+
+# Names that are never treated as data identifiers
+BUILTIN_NAMES: FrozenSet[str] = frozenset(_GLOBAL_FUNCTIONS) | frozenset(_GLOBAL_OBJECTS) | frozenset(_KEYWORD_LITERALS)
+
+
+def _to_fixed(value: Any, digits: Any = UNDEFINED) -> str:
+    precision = to_number(digits)
+    precision = 0 if math.isnan(precision) else math.trunc(precision) if not math.isinf(precision) else precision
+    if not 0 <= precision <= 100:
+        raise FormulaEvaluationError("RangeError: toFixed() digits argument must be between 0 and 100")
+    number = to_number(value)
+    if math.isnan(number) or math.isinf(number) or abs(number) >= 1e21:
+        return to_js_string(number)
+    return f"{number:.{int(precision)}f}"
+
+
+def _call_method(target: Any, method: str, args: List[Any]) -> Any:
+    """Dispatches the small set of whitelisted String/Array/Number methods."""
+    if isinstance(target, str):
+        if method == "includes":
+            return to_js_string(args[0] if args else UNDEFINED) in target
+        if method == "indexOf":
+            return target.find(to_js_string(args[0] if args else UNDEFINED))
+        if method == "startsWith":
+            return target.startswith(to_js_string(args[0] if args else UNDEFINED))
+        if method == "endsWith":
+            return target.endswith(to_js_string(args[0] if args else UNDEFINED))
+        if method == "toLowerCase":
+            return target.lower()
+        if method == "toUpperCase":
+            return target.upper()
+        if method == "trim":
+            return target.strip()
+        if method == "toString":
+            return target
+    elif isinstance(target, list):
+        if method == "includes":
+            needle = args[0] if args else UNDEFINED
+            return any(strict_equals(item, needle) for item in target)
+        if method == "indexOf":
+            needle = args[0] if args else UNDEFINED
+            return next((i for i, item in enumerate(target) if strict_equals(item, needle)), -1)
+        if method == "join":
+            separator = "," if not args or args[0] is UNDEFINED else to_js_string(args[0])
+            return separator.join(to_js_string(item) for item in target)
+    elif _is_number(target):
+        if method == "toFixed":
+            return _to_fixed(target, args[0] if args else UNDEFINED)
+        if method == "toString":
+            return to_js_string(target)
+    if target is None or target is UNDEFINED:
+        raise FormulaEvaluationError(f"Cannot read properties of {to_js_string(target)} (reading '{method}')")
+    raise FormulaEvaluationError(f"{method} is not a supported method on {_js_typeof(target)} values")
+
+
+def _get_property(target: Any, name: str) -> Any:
+    if name == "length" and isinstance(target, (str, list)):
+        return len(target)
+    if target is None or target is UNDEFINED:
+        raise FormulaEvaluationError(f"Cannot read properties of {to_js_string(target)} (reading '{name}')")
+    return UNDEFINED
+
+
+# --- Scope ---
+
+class _Scope:
+    """Formula-local variables layered over the read-only input values."""
+    __slots__ = ("locals", "values")
+
+    def __init__(self, values: Mapping[str, Any]):
+        self.locals: Dict[str, Any] = {}
+        self.values = values
+
+    def lookup(self, name: str) -> Any:
+        if name in self.locals:
+            return self.locals[name]
+        if name in self.values:
+            return self.values[name]
+        raise FormulaEvaluationError(f"{name} is not defined")
+
+
+# --- Tokenizer ---
+
+def tokenize(source: str) -> List[Tuple[str, Any]]:
+    tokens: List[Tuple[str, Any]] = []
+    position = 0
+    while position < len(source):
+        match = _TOKEN_RE.match(source, position)
+        if not match:
+            raise FormulaSyntaxError(f"Unexpected character {source[position]!r} at position {position}")
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "ws":
+            continue
+        if kind == "num":
+            tokens.append(("num", float(text)))
+        elif kind == "str":
+            body = text[1:-1]
+            tokens.append(("str", re.sub(r'\\(.)', lambda m: _STRING_ESCAPES.get(m.group(1), m.group(1)), body)))
+        else:
+            tokens.append((kind, text))
+    tokens.append(("eof", None))
+    return tokens
+
+
+# --- Parser / compiler ---
+
+class _Compiler:
+    """Recursive-descent parser that emits Python closures directly instead of an AST."""
+
+    def __init__(self, source: str):
+        self.tokens = tokenize(source)
+        self.position = 0
+        self.identifiers: Set[str] = set()
+        self.declared: Set[str] = set()
+        self.has_return = False
+
+    # Token helpers
+    def _peek(self, offset: int = 0) -> Tuple[str, Any]:
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def _advance(self) -> Tuple[str, Any]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _at(self, kind: str, value: Any = None) -> bool:
+        token_kind, token_value = self._peek()
+        return token_kind == kind and (value is None or token_value == value)
+
+    def _at_op(self, value: str) -> bool:
+        return self._at("op", value)
+
+    def _expect_op(self, value: str) -> None:
+        if not self._at_op(value):
+            raise FormulaSyntaxError(f"Expected '{value}' but found {self._describe(self._peek())}")
+        self._advance()
+
+    @staticmethod
+    def _describe(token: Tuple[str, Any]) -> str:
+        kind, value = token
+        return "end of formula" if kind == "eof" else repr(value)
+
+    def _consume_semicolon(self) -> None:
+        if self._at_op(";"):
+            self._advance()
+
+    # Program
+    def compile_program(self) -> Callable[[_Scope], Any]:
+        # Accept a single wrapping `function name(params) { ... }` declaration
+        if self._at("name", "function"):
+            self._advance()
+            if self._at("name"):
+                self._advance()
+            self._expect_op("(")
+            while not self._at_op(")"):
+                kind, value = self._advance()
+                if kind == "eof":
+                    raise FormulaSyntaxError("Unterminated parameter list")
+            self._expect_op(")")
+            body = self._block()
+            self._consume_semicolon()
+            if not self._at("eof"):
+                raise FormulaSyntaxError(f"Unexpected {self._describe(self._peek())} after function body")
+            return self._program_runner([body])
+
+        statements = []
+        while not self._at("eof"):
+            statements.append(self._statement())
+        return self._program_runner(statements)
+
+    @staticmethod
+    def _program_runner(statements: List[Callable[[_Scope], Any]]) -> Callable[[_Scope], Any]:
+        def run(scope: _Scope) -> Any:
+            completion = UNDEFINED
+            for statement in statements:
+                result = statement(scope)
+                if isinstance(result, _Completion):
+                    completion = result.value
+                elif result is not _NO_RETURN:
+                    return result
+            return completion
+        return run
+
+    # Statements
+    def _statement(self) -> Callable[[_Scope], Any]:
+        kind, value = self._peek()
+        if kind == "op" and value == "{":
+            return self._block()
+        if kind == "op" and value == ";":
+            self._advance()
+            return lambda scope: _NO_RETURN
+        if kind == "name" and value == "return":
+            return self._return_statement()
+        if kind == "name" and value == "if":
+            return self._if_statement()
+        if kind == "name" and value in _DECLARATION_KEYWORDS:
+            return self._declaration()
+        if kind == "name" and (value in _UNSUPPORTED_KEYWORDS or value == "function"):
+            raise FormulaSyntaxError(f"'{value}' is not supported in formulas")
+        if kind == "name" and value not in _RESERVED_WORDS and self._peek(1)[0] == "op" and (
+                self._peek(1)[1] == "=" or self._peek(1)[1] in _COMPOUND_ASSIGNMENTS):
+            return self._assignment()
+        expression = self._expression()
+        self._consume_semicolon()
+
+        def expression_statement(scope: _Scope) -> Any:
+            return _Completion(expression(scope))
+        return expression_statement
+
+    def _block(self) -> Callable[[_Scope], Any]:
+        self._expect_op("{")
+        statements = []
+        while not self._at_op("}"):
+            if self._at("eof"):
+                raise FormulaSyntaxError("Unterminated block: expected '}'")
+            statements.append(self._statement())
+        self._advance()
+
+        def block(scope: _Scope) -> Any:
+            for statement in statements:
+                result = statement(scope)
+                if result is not _NO_RETURN and not isinstance(result, _Completion):
+                    return result
+            return _NO_RETURN
+        return block
+
+    def _return_statement(self) -> Callable[[_Scope], Any]:
+        self._advance()
+        self.has_return = True
+        if self._at_op(";") or self._at_op("}") or self._at("eof"):
+            self._consume_semicolon()
+            return lambda scope: UNDEFINED
+        expression = self._expression()
+        self._consume_semicolon()
+        return expression
+
+    def _if_statement(self) -> Callable[[_Scope], Any]:
+        self._advance()
+        self._expect_op("(")
+        condition = self._expression()
+        self._expect_op(")")
+        consequent = self._statement()
+        alternate: Optional[Callable[[_Scope], Any]] = None
+        if self._at("name", "else"):
+            self._advance()
+            alternate = self._statement()
+
+        def if_statement(scope: _Scope) -> Any:
+            if to_boolean(condition(scope)):
+                result = consequent(scope)
+            elif alternate is not None:
+                result = alternate(scope)
+            else:
+                return _NO_RETURN
+            return _NO_RETURN if isinstance(result, _Completion) else result
+        return if_statement
+
+    def _declaration(self) -> Callable[[_Scope], Any]:
+        self._advance()
+        bindings: List[Tuple[str, Optional[Callable[[_Scope], Any]]]] = []
+        while True:
+            kind, name = self._advance()
+            if kind != "name" or name in _RESERVED_WORDS:
+                raise FormulaSyntaxError(f"Invalid variable name {name!r} in declaration")
+            self.declared.add(name)
+            initializer = None
+            if self._at_op("="):
+                self._advance()
+                initializer = self._expression()
+            bindings.append((name, initializer))
+            if not self._at_op(","):
+                break
+            self._advance()
+        self._consume_semicolon()
+
+        def declaration(scope: _Scope) -> Any:
+            for name, initializer in bindings:
+                scope.locals[name] = UNDEFINED if initializer is None else initializer(scope)
+            return _NO_RETURN
+        return declaration
+
+    def _assignment(self) -> Callable[[_Scope], Any]:
+        _kind, name = self._advance()
+        _kind, operator = self._advance()
+        self.declared.add(name)
+        expression = self._expression()
+        self._consume_semicolon()
+        combine = _BINARY_OPERATORS[_COMPOUND_ASSIGNMENTS[operator]] if operator in _COMPOUND_ASSIGNMENTS else None
+        if combine is not None:
+            self.identifiers.add(name)
+
+        def assignment(scope: _Scope) -> Any:
+            value = expression(scope)
+            if combine is not None:
+                value = combine(scope.lookup(name), value)
+            scope.locals[name] = value
+            return _Completion(value)
+        return assignment
+
+    # Expressions (Pratt parser)
+    def _expression(self, min_power: int = 0) -> Callable[[_Scope], Any]:
+        left = self._prefix()
+        while True:
+            kind, operator = self._peek()
+            if kind != "op" or operator not in _BINDING_POWER:
+                break
+            power = _BINDING_POWER[operator]
+            if power <= min_power and not (operator == "**" and power == min_power):
+                break
+            self._advance()
+            left = self._infix(left, operator, power)
+        return left
+
+    def _prefix(self) -> Callable[[_Scope], Any]:
+        kind, value = self._advance()
+        if kind in ("num", "str"):
+            return lambda scope, constant=value: constant
+        if kind == "name":
+            if value in _KEYWORD_LITERALS:
+                constant = _KEYWORD_LITERALS[value]
+                return lambda scope: constant
+            if value == "typeof":
+                operand = self._expression(_UNARY_BINDING_POWER)
+
+                def typeof(scope: _Scope) -> str:
+                    try:
+                        return _js_typeof(operand(scope))
+                    except FormulaEvaluationError:
+                        return "undefined"
+                return typeof
+            if value in _GLOBAL_OBJECTS:
+                return self._global_object(value)
+            if value in _GLOBAL_FUNCTIONS:
+                function = _GLOBAL_FUNCTIONS[value]
+                return lambda scope: function
+            if value in _RESERVED_WORDS:
+                raise FormulaSyntaxError(f"Unexpected keyword '{value}'")
+            self.identifiers.add(value)
+            return lambda scope, name=value: scope.lookup(name)
+        if kind == "op":
+            if value == "(":
+                inner = self._expression()
+                self._expect_op(")")
+                return inner
+            if value == "[":
+                return self._array_literal()
+            if value in ("!", "-", "+"):
+                operand = self._expression(_UNARY_BINDING_POWER)
+                if value == "!":
+                    return lambda scope: not to_boolean(operand(scope))
+                if value == "-":
+                    return lambda scope: -to_number(operand(scope))
+                return lambda scope: to_number(operand(scope))
+        raise FormulaSyntaxError(f"Unexpected {self._describe((kind, value))}")
+
+    def _array_literal(self) -> Callable[[_Scope], Any]:
+        items = []
+        while not self._at_op("]"):
+            items.append(self._expression())
+            if not self._at_op(","):
+                break
+            self._advance()
+        self._expect_op("]")
+        return lambda scope: [item(scope) for item in items]
+
+    def _global_object(self, object_name: str) -> Callable[[_Scope], Any]:
+        members = _GLOBAL_OBJECTS[object_name]
+        self._expect_op(".")
+        kind, member = self._advance()
+        if kind != "name" or member not in members:
+            raise FormulaSyntaxError(f"{object_name}.{member} is not supported")
+        constant = members[member]
+        return lambda scope: constant
+
+    def _arguments(self) -> List[Callable[[_Scope], Any]]:
+        arguments = []
+        while not self._at_op(")"):
+            arguments.append(self._expression())
+            if not self._at_op(","):
+                break
+            self._advance()
+        self._expect_op(")")
+        return arguments
+
+    def _infix(self, left: Callable[[_Scope], Any], operator: str, power: int) -> Callable[[_Scope], Any]:
+        if operator == "(":
+            arguments = self._arguments()
+
+            def call(scope: _Scope) -> Any:
+                function = left(scope)
+                if not callable(function):
+                    raise FormulaEvaluationError(f"{to_js_string(function)} is not a function")
+                return function(*[argument(scope) for argument in arguments])
+            return call
+        if operator == ".":
+            kind, name = self._advance()
+            if kind != "name":
+                raise FormulaSyntaxError(f"Expected property name after '.' but found {self._describe((kind, name))}")
+            if self._at_op("("):
+                self._advance()
+                arguments = self._arguments()
+                return lambda scope: _call_method(left(scope), name, [argument(scope) for argument in arguments])
+            return lambda scope: _get_property(left(scope), name)
+        if operator == "[":
+            index = self._expression()
+            self._expect_op("]")
+
+            def subscript(scope: _Scope) -> Any:
+                target, key = left(scope), index(scope)
+                if isinstance(target, (list, str)) and _is_number(key) and float(key).is_integer():
+                    return target[int(key)] if 0 <= key < len(target) else UNDEFINED
+                return _get_property(target, to_js_string(key))
+            return subscript
+        if operator == "?":
+            consequent = self._expression()
+            self._expect_op(":")
+            alternate = self._expression(power - 1)
+            return lambda scope: consequent(scope) if to_boolean(left(scope)) else alternate(scope)
+        right = self._expression(power)
+        if operator == "&&":
+            def logical_and(scope: _Scope) -> Any:
+                value = left(scope)
+                return right(scope) if to_boolean(value) else value
+            return logical_and
+        if operator == "||":
+            def logical_or(scope: _Scope) -> Any:
+                value = left(scope)
+                return value if to_boolean(value) else right(scope)
+            return logical_or
+        if operator == "??":
+            def nullish(scope: _Scope) -> Any:
+                value = left(scope)
+                return right(scope) if value is None or value is UNDEFINED else value
+            return nullish
+        function = _BINARY_OPERATORS[operator]
+        return lambda scope: function(left(scope), right(scope))
+
+
+class _Completion:
+    """Wraps the value of an expression statement (the program's completion value when no return runs)."""
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+class CompiledFormula:
+    """A parsed formula, ready to be evaluated against a mapping of variable values."""
+    __slots__ = ("source", "identifiers", "has_return", "is_empty", "_program")
+
+    def __init__(self, source: str):
+        compiler = _Compiler(source)
+        self._program = compiler.compile_program()
+        self.source = source
+        # Free identifiers the formula reads from its inputs (locals it declares are excluded)
+        self.identifiers: FrozenSet[str] = frozenset(compiler.identifiers - compiler.declared)
+        self.has_return = compiler.has_return
+        self.is_empty = len(compiler.tokens) == 1
+
+    def evaluate(self, values: Mapping[str, Any]) -> Any:
+        """Runs the formula; raises FormulaEvaluationError on runtime failures."""
+        try:
+            return self._program(_Scope(values))
+        except FormulaError:
+            raise
+        except (TypeError, ValueError, OverflowError, IndexError, RecursionError) as e:
+            raise FormulaEvaluationError(str(e)) from e
+
+    def __repr__(self):
+        return f"CompiledFormula({self.source!r})"
+
+
+# --- Compiled formula cache ---
+_compiled_formula_cache: Dict[str, Any] = {}
+MAX_CACHED_FORMULAS = 4096
+
+
+def formula_hash(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def compile_formula(source: Optional[str]) -> CompiledFormula:
+    """
+    Compiles a JS formula, reusing the cached compilation for identical sources.
+    Raises FormulaSyntaxError if the formula is outside the supported subset.
+    """
+    source = source or ""
+    key = formula_hash(source)
+    cached = _compiled_formula_cache.get(key)
+    if cached is None:
+        try:
+            cached = CompiledFormula(source)
+        except RecursionError:
+            cached = FormulaSyntaxError("Formula is nested too deeply")
+        except FormulaSyntaxError as e:
+            cached = e
+        if len(_compiled_formula_cache) >= MAX_CACHED_FORMULAS:
+            _compiled_formula_cache.clear()
+        _compiled_formula_cache[key] = cached
+    if isinstance(cached, FormulaSyntaxError):
+        raise FormulaSyntaxError(str(cached))
+    return cached
+
+
+def evaluate_formula(source: Optional[str], values: Mapping[str, Any]) -> Any:
+    """Compiles (cached) and evaluates a formula in one call."""
+    return compile_formula(source).evaluate(values)
+
+
+# Integral doubles up to this magnitude are output as ints, like JSON.stringify prints them
+_MAX_EXACT_INTEGER = 2 ** 53
+
+
+def to_output_value(value: Any) -> Any:
+    """
+    Converts an engine value into a JSON-safe Python value: undefined/NaN/Infinity become None,
+    integral doubles become ints.
+    """
+    if value is UNDEFINED or callable(value):
+        return None
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        return int(value) if value.is_integer() and abs(value) <= _MAX_EXACT_INTEGER else value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return to_output_value(to_number(value))
+    if isinstance(value, list):
+        return [to_output_value(item) for item in value]
+    return value
@@ -0,0 +1,103 @@
+from typing import Collection, Dict, List, Optional, Set
+
+from formula_engine import BUILTIN_NAMES, FormulaError, compile_formula
+from questionnaire_index import QuestionnaireIndex
+from schemas.schemas import ExpressionValidation, FormulaValidationEntry, FormulaValidationReport, GraphState
+
+# --- Static validation of JS formulas and triggering criteria ---
+# Expressions are parsed with the sandboxed formula engine (no evaluation) and their free identifiers
+# are resolved against the project's question variables and RI/DV names. Only expressions that are not
+# VALID need an LLM refinement round trip.
+
+VALID = "valid"
+UNKNOWN_IDENTIFIER = "unknown_identifier"
+SYNTAX_ERROR = "syntax_error"
+PLACEHOLDER = "placeholder"
+
+VALIDATION_STATUSES = (VALID, UNKNOWN_IDENTIFIER, SYNTAX_ERROR, PLACEHOLDER)
+
+# Markers left behind by failed LLM refinements and default values that carry no logic
+PLACEHOLDER_MARKERS = ("// LLM FAILED", "// Placeholder")
+TRIVIAL_EXPRESSIONS = {"return true;", "return true", "true"}
+
+
+def needs_refinement(validation: ExpressionValidation) -> bool:
+    return validation["status"] != VALID
+
+
+def validate_expression(expression: Optional[str], known_names: Collection[str]) -> ExpressionValidation:
+    """
+    Classifies a JS expression as valid, placeholder, syntax error or unknown identifier.
+    `known_names` are the variables the expression may read (question variables, RI and DV names).
+    """
+    source = (expression or "").strip()
+    if not source or source in TRIVIAL_EXPRESSIONS or any(marker in source for marker in PLACEHOLDER_MARKERS):
+        return {"status": PLACEHOLDER, "message": "Expression is empty or a placeholder.", "unknown_identifiers": []}
+    try:
+        compiled = compile_formula(source)
+    except FormulaError as e:
+        return {"status": SYNTAX_ERROR, "message": str(e), "unknown_identifiers": []}
+    if compiled.is_empty:
+        return {"status": PLACEHOLDER, "message": "Expression contains no code.", "unknown_identifiers": []}
+    unknown = sorted(name for name in compiled.identifiers if name not in known_names and name not in BUILTIN_NAMES)
+    if unknown:
+        return {"status": UNKNOWN_IDENTIFIER, "message": f"Unknown identifiers: {', '.join(unknown)}",
+                "unknown_identifiers": unknown}
+    return {"status": VALID, "message": "", "unknown_identifiers": []}
+
+
+def known_variable_names(questionnaire: Optional[Dict], raw_indicators: Optional[List[Dict]],
+                         decision_variables: Optional[List[Dict]]) -> Set[str]:
+    """Names a project formula may reference: question variables, RIs (also through a q_ prefix) and DVs."""
+    questionnaire = questionnaire or {}
+    names = {var for var in QuestionnaireIndex({"sections": questionnaire.get("sections") or []}).question_vars() if var}
+    for ri in raw_indicators or []:
+        if ri.get("var_name"):
+            names.add(ri["var_name"])
+            names.add(f"q_{ri['var_name']}")
+    for dv in decision_variables or []:
+        if dv.get("var_name"):
+            names.add(dv["var_name"])
+    return names
+
+
+def _entry(target: str, expression_type: str, expression: Optional[str], known_names: Collection[str]) -> FormulaValidationEntry:
+    return {"target": target, "expression_type": expression_type, "expression": expression or "",
+            **validate_expression(expression, known_names)}
+
+
+def validate_project_formulas(state: GraphState) -> FormulaValidationReport:
+    """
+    Validates every expression of a project: section and question triggering criteria, question
+    formulas, raw indicator calculations and decision variable formulas.
+    """
+    questionnaire = state.get("questionnaire") or {}
+    known_names = known_variable_names(questionnaire, state.get("raw_indicators"), state.get("decision_variables"))
+    entries: List[FormulaValidationEntry] = []
+
+    q_index = QuestionnaireIndex({"sections": questionnaire.get("sections") or []})
+    for section in q_index.sections:
+        section_label = f"section:{section.get('order')}"
+        if not section.get("is_mandatory", True) or section.get("triggering_criteria"):
+            entries.append(_entry(section_label, "triggering_criteria", section.get("triggering_criteria"), known_names))
+    for _section, _list_key, question in q_index.iter_questions():
+        question_label = f"question:{question.get('variable_name')}"
+        if question.get("is_conditional") or question.get("question_triggering_criteria"):
+            entries.append(_entry(question_label, "question_triggering_criteria",
+                                  question.get("question_triggering_criteria"), known_names))
+        if question.get("formula"):
+            entries.append(_entry(question_label, "formula", question.get("formula"), known_names))
+
+    for ri_var_name, calculation in (questionnaire.get("raw_indicator_calculation") or {}).items():
+        entries.append(_entry(f"raw_indicator:{ri_var_name}", "raw_indicator_calculation", calculation, known_names))
+    for dv in state.get("decision_variables") or []:
+        entries.append(_entry(f"decision_variable:{dv.get('var_name')}", "formula", dv.get("formula"), known_names))
+
+    counts: Dict[str, int] = {status: 0 for status in VALIDATION_STATUSES}
+    for entry in entries:
+        counts[entry["status"]] += 1
+    return {
+        "entries": entries,
+        "counts": counts,
+        "invalid": [entry["target"] for entry in entries if entry["status"] != VALID],
+    }
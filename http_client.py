@@ -0,0 +1,189 @@
+import gzip
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+import serialization
+
+# --- Shared HTTP client for Supabase ---
+# One pooled httpx client (sync, plus an async twin for the async API paths) instead of a new connection per
+# requests.post/get: keep-alive connection pooling, connect/read timeouts so a hung Supabase request cannot
+# pin a worker, HTTP/2 multiplexing (the `h2` package from httpx[http2] in requirements.txt; HTTP/1.1 without it),
+# gzip-compressed responses (httpx sends Accept-Encoding and decodes) and, with SUPABASE_GZIP_REQUESTS=1,
+# gzip-compressed JSON request bodies for gateways that accept them. A circuit breaker fails fast while
+# Supabase is down: after SUPABASE_BREAKER_FAILURES consecutive failures (network errors, timeouts, 429/5xx)
+# calls raise CircuitOpenError for SUPABASE_BREAKER_RESET_SECONDS, then a single trial call is let through.
+
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_READ_TIMEOUT", "30"))
+MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "10"))
+GZIP_REQUESTS = os.getenv("SUPABASE_GZIP_REQUESTS", "0").lower() in ("1", "true", "yes")
+GZIP_MIN_BYTES = 1024  # Smaller bodies are sent as is
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("SUPABASE_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("SUPABASE_BREAKER_RESET_SECONDS", "30"))
+
+try:
+    import h2  # noqa: F401  (installed with httpx[http2]; enables HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client_cache: Dict[str, Any] = {"sync": None, "async": None}
+_client_lock = threading.Lock()
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Supabase while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open -> closed)."""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True  # Exactly one trial call while half-open
+                return
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(f"Supabase circuit open after {self.failures} consecutive failures; retry in {retry_in:.0f}s")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Ends a call that neither succeeded nor failed against Supabase (e.g. an error raised locally)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"Warning: Supabase circuit opened after {self.failures} consecutive failures.")
+                self.opened_at = time.monotonic()
+
+
+supabase_breaker = CircuitBreaker()
+
+
+def _client_options() -> Dict[str, Any]:
+    return {
+        "timeout": httpx.Timeout(READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        "limits": httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+        "http2": HTTP2_AVAILABLE,
+    }
+
+
+def get_client() -> httpx.Client:
+    with _client_lock:
+        if _client_cache["sync"] is None:
+            _client_cache["sync"] = httpx.Client(**_client_options())
+        return _client_cache["sync"]
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Async twin of get_client; must be used from one event loop (the API's)."""
+    with _client_lock:
+        if _client_cache["async"] is None:
+            _client_cache["async"] = httpx.AsyncClient(**_client_options())
+        return _client_cache["async"]
+
+
+def _request_options(headers: Optional[Dict[str, str]], json_body: Any, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Encodes a JSON body (gzip-compressed when enabled and large enough) into the request options."""
+    headers = dict(headers or {})
+    if json_body is not None:
+        body = serialization.dumps(json_body)
+        headers["Content-Type"] = "application/json"
+        if GZIP_REQUESTS and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        options["content"] = body
+    options["headers"] = headers
+    return options
+
+
+def _is_failure(response: httpx.Response) -> bool:
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def _settle(breaker: CircuitBreaker, succeeded: Optional[bool]) -> None:
+    # Every exit clears a half-open trial, including exceptions that say nothing about Supabase
+    if succeeded is None:
+        breaker.release_trial()
+    elif succeeded:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+
+def request(method: str, url: str, headers: Optional[Dict[str, str]] = None, json_body: Any = None,
+            breaker: CircuitBreaker = supabase_breaker, **options: Any) -> httpx.Response:
+    """Sends a request through the pooled client and the circuit breaker."""
+    # Encoding errors are the caller's, not Supabase's: raise them before the breaker is involved
+    request_options = _request_options(headers, json_body, options)
+    breaker.before_call()
+    succeeded: Optional[bool] = None
+    try:
+        response = get_client().request(method, url, **request_options)
+        succeeded = not _is_failure(response)
+        return response
+    except httpx.HTTPError:
+        succeeded = False
+        raise
+    finally:
+        _settle(breaker, succeeded)
+
+
+async def arequest(method: str, url: str, headers: Optional[Dict[str, str]] = None, json_body: Any = None,
+                   breaker: CircuitBreaker = supabase_breaker, **options: Any) -> httpx.Response:
+    """Async variant of request, on the async client."""
+    request_options = _request_options(headers, json_body, options)
+    breaker.before_call()
+    succeeded: Optional[bool] = None
+    try:
+        response = await get_async_client().request(method, url, **request_options)
+        succeeded = not _is_failure(response)
+        return response
+    except httpx.HTTPError:
+        succeeded = False
+        raise
+    finally:
+        _settle(breaker, succeeded)
+
+
+async def aclose_clients() -> None:
+    """Closes the pooled clients (on API shutdown, from the event loop the async client ran on)."""
+    with _client_lock:
+        sync_client, async_client = _client_cache["sync"], _client_cache["async"]
+        _client_cache["sync"] = _client_cache["async"] = None
+    if sync_client is not None:
+        sync_client.close()
+    if async_client is not None:
+        await async_client.aclose()
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import openai
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+
+from prompt_cache import prompt_cache_recorder
+
+# --- Pluggable LLM backend ---
+# LLM_BACKEND selects how every LLM call in nodes.py is served:
+#   live   (default) - calls OpenAI.
+#   record           - calls OpenAI and stores each response as a fixture keyed by the hash of the exact request.
+#   replay           - serves responses from the fixtures only (no network), sleeping LLM_REPLAY_LATENCY_MS
+#                      ("800" or a "500-1500" range) per call to mimic model latency.
+# Fixtures live in LLM_FIXTURE_DIR (default data_store/llm_fixtures), one JSON file per request. The
+# synthetic latency of a fixture is drawn from a generator seeded with its key, so replays are reproducible.
+# Prompts embed the project id (business context, "<project_id>_" variable ids), which is a fresh UUID per
+# project; it is replaced by a placeholder before hashing so a recorded request replays for any project.
+
+LIVE = "live"
+RECORD = "record"
+REPLAY = "replay"
+LLM_BACKENDS = (LIVE, RECORD, REPLAY)
+
+PROJECT_ID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
+PROJECT_ID_PLACEHOLDER = "<project_id>"
+
+DEFAULT_FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_store", "llm_fixtures")
+
+_fixture_lock = threading.Lock()
+
+
+class FixtureNotFoundError(LookupError):
+    """Raised in replay mode when no fixture was recorded for a request."""
+
+
+def get_llm_backend() -> str:
+    backend = os.getenv("LLM_BACKEND", LIVE).strip().lower()
+    if backend not in LLM_BACKENDS:
+        print(f"Warning: Unknown LLM_BACKEND '{backend}', using '{LIVE}'.")
+        return LIVE
+    return backend
+
+
+def get_fixture_dir() -> str:
+    return os.getenv("LLM_FIXTURE_DIR", DEFAULT_FIXTURE_DIR)
+
+
+def _latency_range_ms() -> Tuple[float, float]:
+    spec = os.getenv("LLM_REPLAY_LATENCY_MS", "0").strip()
+    try:
+        low, _, high = spec.partition("-")
+        low_ms = float(low)
+        return low_ms, float(high) if high else low_ms
+    except ValueError:
+        print(f"Warning: Invalid LLM_REPLAY_LATENCY_MS '{spec}', replaying without latency.")
+        return 0.0, 0.0
+
+
+def replay_latency_seconds(key: str) -> float:
+    """The configured LLM_REPLAY_LATENCY_MS for a key; the same key always gets the same latency."""
+    low_ms, high_ms = _latency_range_ms()
+    return random.Random(key).uniform(low_ms, high_ms) / 1000 if high_ms > 0 else 0.0
+
+
+def simulate_latency(key: str) -> None:
+    """Sleeps the configured LLM_REPLAY_LATENCY_MS; the same key always sleeps the same time."""
+    latency = replay_latency_seconds(key)
+    if latency > 0:
+        time.sleep(latency)
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    """Stable hash of a request (prompt, model, parameters, tools), independent of the project id."""
+    canonical = json.dumps({"kind": kind, "request": request}, sort_keys=True, separators=(",", ":"), default=str)
+    canonical = PROJECT_ID_PATTERN.sub(PROJECT_ID_PLACEHOLDER, canonical)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _fixture_path(key: str) -> str:
+    return os.path.join(get_fixture_dir(), f"{key}.json")
+
+
+def save_fixture(key: str, kind: str, request: Dict[str, Any], response: Dict[str, Any]) -> None:
+    fixture = {"kind": kind, "request": request, "response": response}
+    path = _fixture_path(key)
+    with _fixture_lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp_path, path)
+
+
+def load_fixture(key: str, kind: str) -> Dict[str, Any]:
+    """Returns the recorded response for `key`, after the configured synthetic latency."""
+    path = _fixture_path(key)
+    try:
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+    except FileNotFoundError:
+        raise FixtureNotFoundError(f"No recorded {kind} fixture {key[:12]} in {get_fixture_dir()}; "
+                                   f"run once with LLM_BACKEND={RECORD}.") from None
+    simulate_latency(key)
+    return fixture["response"]
+
+
+class RecordReplayChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose completions are recorded to / replayed from fixtures.
+    Structured output (function calling, json mode) works unchanged: the tools and response format
+    bound by with_structured_output are part of the hashed request payload.
+    """
+    backend: str = RECORD
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        request = self._get_request_payload(messages, stop=stop, **kwargs)
+        key = request_key("chat_model", request)
+        if self.backend == REPLAY:
+            response = load_fixture(key, "chat_model")
+            return ChatResult(
+                generations=[
+                    ChatGeneration(message=message, generation_info=info)
+                    for message, info in zip(messages_from_dict(response["messages"]), response["generation_info"])
+                ],
+                llm_output=response.get("llm_output"),
+            )
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        save_fixture(key, "chat_model", request, {
+            "messages": [message_to_dict(generation.message) for generation in result.generations],
+            "generation_info": [generation.generation_info for generation in result.generations],
+            "llm_output": result.llm_output,
+        })
+        return result
+
+
+def get_chat_model(model: str, temperature: float, callbacks: Optional[List[Any]] = None, **options: Any) -> ChatOpenAI:
+    """
+    Chat model for the configured LLM_BACKEND; prompt cache usage is recorded per call (prompt_cache.py).
+    `options` are passed to ChatOpenAI (max_tokens, timeout, max_retries, streaming); None values are dropped.
+    Streaming models also request usage, so output token counts are reported as for a single completion.
+    """
+    backend = get_llm_backend()
+    options = {key: value for key, value in options.items() if value is not None}
+    if options.get("streaming"):
+        options.setdefault("stream_usage", True)
+    options["callbacks"] = [prompt_cache_recorder, *(callbacks or [])]
+    if backend == LIVE:
+        return ChatOpenAI(model=model, temperature=temperature, **options)
+    if backend == REPLAY and not os.getenv("OPENAI_API_KEY"):
+        options["api_key"] = "replay"  # The client is never used, but ChatOpenAI requires a key
+    # One completion per invoke, so recorded and replayed calls go through _generate
+    return RecordReplayChatOpenAI(model=model, temperature=temperature, backend=backend,
+                                  disable_streaming=True, **options)
+
+
+def chat_completion(**request: Any) -> Any:
+    """
+    Drop-in for openai.chat.completions.create(**request) that honours LLM_BACKEND.
+    Replayed responses are rebuilt as ChatCompletion objects.
+    """
+    backend = get_llm_backend()
+    if backend == LIVE:
+        return openai.chat.completions.create(**request)
+    # The timeout is a transport setting, not part of the request a fixture is recorded for
+    key = request_key("chat_completion", {k: v for k, v in request.items() if k != "timeout"})
+    if backend == REPLAY:
+        from openai.types.chat import ChatCompletion
+        return ChatCompletion.model_validate(load_fixture(key, "chat_completion"))
+    response = openai.chat.completions.create(**request)
+    save_fixture(key, "chat_completion", request, response.model_dump())
+    return response
@@ -0,0 +1,57 @@
+import math
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Generic, Iterable, List, Optional, TypeVar
+
+# --- Runtime metrics ---
+# Prompt payload sizes, prompt cache hits, model route latencies, output budget usage and request coalescing
+# are recorded by the module that observes them. Each of those modules registers its report as a section
+# here, and /api/metrics-report serves every section (or one of them) from one place. CallLog is the
+# bounded log of recent calls used by the per-call reports, and percentile is the single latency summary
+# shared by the reports and benchmark.py.
+
+T = TypeVar("T")
+
+_sections: Dict[str, Callable[[], Any]] = {}
+
+
+def percentile(values: Iterable[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile; None without samples."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)] if ordered else None
+
+
+def percentile_ms(values: Iterable[float], fraction: float) -> Optional[float]:
+    """percentile of latencies in milliseconds, rounded for reports."""
+    value = percentile(values, fraction)
+    return round(value, 1) if value is not None else None
+
+
+class CallLog(Generic[T]):
+    """The most recent per-call reports of one kind, oldest first."""
+
+    def __init__(self, maxlen: int):
+        self._entries: Deque[T] = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def append(self, entry: T) -> None:
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self) -> List[T]:
+        with self._lock:
+            return list(self._entries)
+
+
+def register_section(name: str, report: Callable[[], Any]) -> None:
+    """Adds a section to the metrics report; report() is called on every request for it."""
+    _sections[name] = report
+
+
+def metrics_report(section: Optional[str] = None) -> Dict[str, Any]:
+    """All registered sections, or only the named one (KeyError when unknown)."""
+    if section is not None:
+        if section not in _sections:
+            raise KeyError(section)
+        return {section: _sections[section]()}
+    return {name: report() for name, report in sorted(_sections.items())}
@@ -0,0 +1,249 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypedDict
+from uuid import UUID
+
+import openai
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+
+from llm_backend import chat_completion, get_chat_model
+from metrics import percentile_ms, register_section
+
+# --- Model routing ---
+# Each LLM call site in nodes.py names its node; the node's route decides the model, temperature, output
+# token cap and timeout. Routes come in two tiers: extraction-style nodes (JS repair, targeting, outlines,
+# template adaptation, raw indicator lists) run on SMALL_MODEL with short timeouts, while the nodes that
+# write formulas, redesign variables or design the questionnaire run on LARGE_MODEL with room to work.
+# When the primary model times out or is rate limited the call is retried once on the route's fallback
+# model (the other tier for large nodes). Every call is timed per (node, model) so routes can be tuned
+# from the percentiles in get_routing_report.
+# Routes can be overridden without a deploy through MODEL_ROUTES, a JSON object of per-node partial routes,
+# e.g. MODEL_ROUTES='{"questionnaire": {"model": "gpt-4.1", "timeout": 240}}'.
+# The tier models themselves are set with LLM_SMALL_MODEL, LLM_SMALL_FALLBACK_MODEL and LLM_LARGE_MODEL.
+
+# Provider-side retries before falling back (ChatOpenAI retries twice by default)
+ROUTE_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+FALLBACK_EXCEPTIONS = (openai.APITimeoutError, openai.RateLimitError)
+MAX_LATENCY_SAMPLES = 1000  # Per node and model
+
+SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "gpt-4o-mini")
+SMALL_FALLBACK_MODEL = os.getenv("LLM_SMALL_FALLBACK_MODEL", "gpt-4.1-mini")
+LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "gpt-4o")
+
+
+class ModelRoute(TypedDict):
+    model: str
+    temperature: float
+    max_tokens: Optional[int]  # Output token cap; None leaves it to the model
+    timeout: float  # Seconds per request
+    fallback_model: Optional[str]  # Used on timeout or rate limit; None disables the fallback
+
+
+def _route(model: str, temperature: float, max_tokens: Optional[int], timeout: float,
+           fallback_model: Optional[str]) -> ModelRoute:
+    return {"model": model, "temperature": temperature, "max_tokens": max_tokens, "timeout": timeout,
+            "fallback_model": fallback_model}
+
+
+DEFAULT_ROUTES: Dict[str, ModelRoute] = {
+    # Small tier: short, latency-sensitive or extraction-style calls
+    "js_refinement": _route(SMALL_MODEL, 0.3, 256, 20, SMALL_FALLBACK_MODEL),
+    "modification_targeting": _route(SMALL_MODEL, 0.3, 512, 20, SMALL_FALLBACK_MODEL),
+    "template_adaptation": _route(SMALL_MODEL, 0.3, None, 45, SMALL_FALLBACK_MODEL),
+    "questionnaire_outline": _route(SMALL_MODEL, 0.3, None, 45, SMALL_FALLBACK_MODEL),
+    "raw_indicators": _route(SMALL_MODEL, 0.3, None, 60, SMALL_FALLBACK_MODEL),
+    "coverage_remediation": _route(SMALL_MODEL, 0.3, None, 60, SMALL_FALLBACK_MODEL),
+    # Large tier: formula writing, variable redesign and questionnaire design
+    "decision_variables": _route(LARGE_MODEL, 0.3, None, 90, SMALL_MODEL),
+    "variable_modifications": _route(LARGE_MODEL, 0.7, None, 120, SMALL_MODEL),
+    "questionnaire": _route(LARGE_MODEL, 0.3, None, 180, SMALL_MODEL),
+    "questionnaire_section": _route(LARGE_MODEL, 0.3, None, 90, SMALL_MODEL),
+    "questionnaire_modifications": _route(LARGE_MODEL, 0.3, None, 180, SMALL_MODEL),
+    # Card design spec (free text, plain chat completion)
+    "export_section_cards": _route(LARGE_MODEL, 0.3, 2000, 90, SMALL_MODEL),
+}
+
+
+def _load_overrides() -> Dict[str, Dict[str, Any]]:
+    spec = os.getenv("MODEL_ROUTES", "").strip()
+    if not spec:
+        return {}
+    try:
+        overrides = json.loads(spec)
+        if not isinstance(overrides, dict):
+            raise ValueError("expected a JSON object")
+        return overrides
+    except ValueError as e:
+        print(f"Warning: Invalid MODEL_ROUTES ({e}), using the default routes.")
+        return {}
+
+
+class _ModelStats:
+    __slots__ = ("calls", "errors", "fallback_calls", "latencies_ms")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors: Dict[str, int] = {}
+        self.fallback_calls = 0
+        self.latencies_ms: Deque[float] = deque(maxlen=MAX_LATENCY_SAMPLES)
+
+
+class RouteLatencyRecorder(BaseCallbackHandler):
+    """Times every chat model call of one node and counts errors, per model."""
+
+    def __init__(self, router: "ModelRouter", node: str, model: str, is_fallback: bool):
+        self.router = router
+        self.node = node
+        self.model = model
+        self.is_fallback = is_fallback
+        self._started: Dict[UUID, float] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            **kwargs: Any) -> None:
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is not None:
+            self.router.record(self.node, self.model, (time.perf_counter() - started) * 1000, is_fallback=self.is_fallback)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._started.pop(run_id, None)
+        self.router.record(self.node, self.model, None, error=type(error).__name__, is_fallback=self.is_fallback)
+
+
+class ModelRouter:
+    """Builds (and caches) the chat models of each node's route and records their latencies."""
+
+    def __init__(self, routes: Dict[str, ModelRoute], model_factory: Optional[Callable[..., Any]] = None):
+        self.routes = routes
+        self._model_factory = model_factory
+        self._models: Dict[Tuple[str, str, bool], Any] = {}
+        self._stats: Dict[Tuple[str, str], _ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def route(self, node: str) -> ModelRoute:
+        if node not in self.routes:
+            raise KeyError(f"No model route for node '{node}'")
+        return self.routes[node]
+
+    def set_model_factory(self, model_factory: Optional[Callable[..., Any]]) -> None:
+        """Replaces how chat models are built (model, temperature, **options); cached models are dropped."""
+        with self._lock:
+            self._model_factory = model_factory
+            self._models.clear()
+
+    def _factory(self) -> Callable[..., Any]:
+        return self._model_factory or get_chat_model
+
+    def chat_model(self, node: str, fallback: bool = False, streaming: bool = False) -> Any:
+        """
+        The node's primary (or fallback) chat model, configured from its route. A streaming model still
+        returns the whole response from invoke, but emits each chunk to on_llm_new_token callbacks.
+        """
+        route = self.route(node)
+        model = route["fallback_model"] if fallback else route["model"]
+        with self._lock:
+            key = (node, model, streaming)
+            if key not in self._models:
+                options = {"streaming": True} if streaming else {}
+                self._models[key] = self._factory()(
+                    model, route["temperature"], max_tokens=route["max_tokens"], timeout=route["timeout"],
+                    max_retries=ROUTE_MAX_RETRIES, callbacks=[RouteLatencyRecorder(self, node, model, fallback)],
+                    **options)
+            return self._models[key]
+
+    def structured(self, node: str, schema: Any, streaming: bool = False, **kwargs: Any) -> Runnable:
+        """chat_model(node).with_structured_output(schema), falling back on timeout or rate limit."""
+        primary = self.chat_model(node, streaming=streaming).with_structured_output(schema, **kwargs)
+        if not self.route(node)["fallback_model"]:
+            return primary
+        fallback = self.chat_model(node, fallback=True, streaming=streaming).with_structured_output(schema, **kwargs)
+        return primary.with_fallbacks([fallback], exceptions_to_handle=FALLBACK_EXCEPTIONS)
+
+    def complete(self, node: str, messages: List[Dict[str, str]], **request: Any) -> Any:
+        """Plain chat completion (llm_backend.chat_completion) with the node's route and fallback."""
+        route = self.route(node)
+        models = [route["model"]] + ([route["fallback_model"]] if route["fallback_model"] else [])
+        for attempt, model in enumerate(models):
+            options = {"max_tokens": route["max_tokens"]} if route["max_tokens"] else {}
+            started = time.perf_counter()
+            try:
+                response = chat_completion(model=model, messages=messages, temperature=route["temperature"],
+                                           timeout=route["timeout"], **options, **request)
+            except FALLBACK_EXCEPTIONS as e:
+                self.record(node, model, None, error=type(e).__name__, is_fallback=attempt > 0)
+                if attempt == len(models) - 1:
+                    raise
+                print(f"{node}: {model} failed ({type(e).__name__}), falling back to {models[attempt + 1]}")
+                continue
+            self.record(node, model, (time.perf_counter() - started) * 1000, is_fallback=attempt > 0)
+            return response
+
+    def record(self, node: str, model: str, latency_ms: Optional[float], error: Optional[str] = None,
+               is_fallback: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.setdefault((node, model), _ModelStats())
+            stats.calls += 1
+            if is_fallback:
+                stats.fallback_calls += 1
+            if error:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+            elif latency_ms is not None:
+                stats.latencies_ms.append(latency_ms)
+
+    def report(self) -> Dict[str, Any]:
+        """Per node: its route and, per model that served it, call/error counts and latency percentiles."""
+        with self._lock:
+            nodes: Dict[str, Any] = {node: {"route": dict(route), "models": {}} for node, route in self.routes.items()}
+            for (node, model), stats in sorted(self._stats.items()):
+                latencies = list(stats.latencies_ms)
+                nodes.setdefault(node, {"route": None, "models": {}})["models"][model] = {
+                    "calls": stats.calls,
+                    "fallback_calls": stats.fallback_calls,
+                    "errors": dict(stats.errors),
+                    "p50_ms": percentile_ms(latencies, 0.5),
+                    "p90_ms": percentile_ms(latencies, 0.9),
+                    "p99_ms": percentile_ms(latencies, 0.99),
+                }
+        return {"nodes": nodes}
+
+
+def cast_route(route: Dict[str, Any]) -> ModelRoute:
+    """Normalizes a route's value types (routes from MODEL_ROUTES are plain JSON)."""
+    return _route(route["model"], float(route["temperature"]),
+                  int(route["max_tokens"]) if route.get("max_tokens") else None,
+                  float(route["timeout"]), route.get("fallback_model") or None)
+
+
+def build_routes() -> Dict[str, ModelRoute]:
+    """DEFAULT_ROUTES with the MODEL_ROUTES overrides applied."""
+    routes = {node: cast_route(dict(route)) for node, route in DEFAULT_ROUTES.items()}
+    for node, override in _load_overrides().items():
+        if node not in routes or not isinstance(override, dict):
+            print(f"Warning: Ignoring MODEL_ROUTES entry '{node}' (unknown node or not an object).")
+            continue
+        unknown = set(override) - set(ModelRoute.__annotations__)
+        if unknown:
+            print(f"Warning: Ignoring unknown MODEL_ROUTES fields {sorted(unknown)} for '{node}'.")
+        routes[node] = cast_route({**routes[node], **{k: v for k, v in override.items() if k not in unknown}})
+    return routes
+
+
+model_router = ModelRouter(build_routes())
+
+
+def get_routing_report() -> Dict[str, Any]:
+    return model_router.report()
+
+
+register_section("model_routing", get_routing_report)
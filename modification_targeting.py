@@ -0,0 +1,134 @@
+import re
+from typing import Any, Collection, Dict, List, Optional, Set, TypedDict
+
+from questionnaire_index import QuestionnaireIndex, QUESTION_LIST_KEYS
+
+# --- Modification targeting ---
+# Resolves which sections a questionnaire modification_prompt touches so that only those sections
+# (plus a compact outline of the rest) are sent to the modification LLM.
+
+# Questionnaires this small are always sent in full; targeting would not save anything
+MIN_SECTIONS_FOR_TARGETING = 3
+
+# Minimum share of a section title's words that must appear in the prompt for a lexical match
+TITLE_MATCH_THRESHOLD = 0.5
+
+# Requests that inherently span the whole questionnaire
+GLOBAL_SCOPE_PATTERN = re.compile(
+    r'\b(all|every|entire|whole|each|overall|throughout|everywhere|reorder|restructure|reorganize|reorganise)\b', re.I)
+SECTION_NUMBER_PATTERN = re.compile(r'\bsection\s*(?:no\.?|number|#)?\s*(\d+)\b', re.I)
+
+_STOPWORDS = {"and", "the", "for", "with", "of", "to", "in", "on", "a", "an", "or", "your", "about", "section", "details",
+              "information", "info", "questions"}
+
+FULL_SCOPE = "full"
+LEXICAL_SCOPE = "lexical"
+LLM_SCOPE = "llm"
+
+
+class ModificationTargets(TypedDict):
+    scope: str  # full / lexical / llm
+    section_orders: List[Any]  # Orders of the sections sent in full (empty with scope 'full')
+    question_variable_names: List[str]  # Questions explicitly referenced by the prompt
+
+
+def _words(text: str) -> Set[str]:
+    return {word for word in re.findall(r'[a-z0-9]+', (text or "").replace("_", " ").lower())
+            if len(word) > 2 and word not in _STOPWORDS}
+
+
+def questionnaire_outline(q_index: QuestionnaireIndex, exclude_orders: Collection[Any] = ()) -> List[Dict]:
+    """Compact outline of the sections: order, title, mandatory flag and question variable names."""
+    return [
+        {
+            "order": section.get("order"),
+            "title": section.get("title"),
+            "is_mandatory": section.get("is_mandatory"),
+            "question_variable_names": [question.get("variable_name")
+                                        for list_key in QUESTION_LIST_KEYS for question in section.get(list_key) or []],
+        }
+        for section in q_index.sections if section.get("order") not in exclude_orders
+    ]
+
+
+def resolve_targets_lexically(q_index: QuestionnaireIndex, modification_prompt: str) -> Optional[ModificationTargets]:
+    """
+    Matches the prompt against section numbers, section titles, question variable names and raw
+    indicator names. Returns full scope for requests spanning the questionnaire, None if nothing matched.
+    """
+    if len(q_index.sections) < MIN_SECTIONS_FOR_TARGETING or GLOBAL_SCOPE_PATTERN.search(modification_prompt):
+        return {"scope": FULL_SCOPE, "section_orders": [], "question_variable_names": []}
+
+    prompt_lower = modification_prompt.lower()
+    prompt_words = _words(modification_prompt)
+    orders: Set[Any] = set()
+    question_vars: List[str] = []
+
+    for match in SECTION_NUMBER_PATTERN.finditer(modification_prompt):
+        number = int(match.group(1))
+        if q_index.section_by_order(number) is not None:
+            orders.add(number)
+        elif 1 <= number <= len(q_index.sections):
+            # Users count sections by position when orders are not 1..n
+            orders.add(q_index.sections[number - 1].get("order"))
+
+    for section in q_index.sections:
+        title = (section.get("title") or "").lower()
+        title_words = _words(title)
+        if title and title in prompt_lower:
+            orders.add(section.get("order"))
+        elif title_words and len(title_words & prompt_words) / len(title_words) >= TITLE_MATCH_THRESHOLD:
+            orders.add(section.get("order"))
+
+    for section, _list_key, question in q_index.iter_questions():
+        variable_name = question.get("variable_name") or ""
+        spelled_out = variable_name[2:] if variable_name.startswith("q_") else variable_name
+        if not variable_name:
+            continue
+        if re.search(r'\b' + re.escape(variable_name.lower()) + r'\b', prompt_lower) or (
+                "_" in spelled_out and spelled_out.replace("_", " ").lower() in prompt_lower):
+            question_vars.append(variable_name)
+            orders.add(section.get("order"))
+            continue
+        for ri_name in question.get("raw_indicators") or []:
+            if re.search(r'\b' + re.escape(ri_name.lower()) + r'\b', prompt_lower):
+                orders.add(section.get("order"))
+
+    if not orders:
+        return None
+    return {"scope": LEXICAL_SCOPE, "section_orders": [s.get("order") for s in q_index.sections if s.get("order") in orders],
+            "question_variable_names": question_vars}
+
+
+def build_scoped_questionnaire(q_index: QuestionnaireIndex, section_orders: Collection[Any]) -> Dict:
+    """
+    The part of the questionnaire sent to the modification LLM: the targeted sections in full, an
+    outline of the other sections and the calculations of the raw indicators the targeted questions capture.
+    """
+    questionnaire = q_index.questionnaire
+    in_scope = [section for section in q_index.sections if section.get("order") in section_orders]
+    ri_names = {ri_name for section in in_scope for list_key in QUESTION_LIST_KEYS
+                for question in section.get(list_key) or [] for ri_name in question.get("raw_indicators") or []}
+    ri_calculation_map = questionnaire.get("raw_indicator_calculation") or {}
+    return {
+        "title": questionnaire.get("title"),
+        "sections": in_scope,
+        "other_sections_outline": questionnaire_outline(q_index, exclude_orders=section_orders),
+        "raw_indicator_calculation": {name: formula for name, formula in ri_calculation_map.items() if name in ri_names},
+    }
+
+
+def restrict_modifications_to_scope(modifications: Dict, section_orders: Collection[Any]) -> List[str]:
+    """
+    Drops question-list replacements for sections the LLM only saw in outline form, so a scoped
+    response cannot wipe questions it was never shown. Returns a note per dropped replacement.
+    """
+    notes = []
+    for update in modifications.get("updated_sections") or []:
+        if update.get("order") in section_orders:
+            continue
+        for list_key in QUESTION_LIST_KEYS:
+            if list_key in update:
+                del update[list_key]
+                notes.append(f"Ignored {list_key} replacement for out-of-scope section {update.get('order')}.")
+    return notes
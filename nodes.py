@@ -1,11 +1,13 @@
 import os
+import asyncio
 import json
 import uuid
-import requests
 import re
-from typing import List, Dict, Optional, Any, cast
+from typing import Callable, Collection, Iterator, List, Dict, Optional, Any, Tuple, cast
 from dotenv import load_dotenv
+import threading
 import time # Import for sleep function
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
@@ -18,9 +20,14 @@ from prompts import (
     INTELLIGENT_VARIABLE_MODIFICATIONS_PROMPT,
     DEPENDENCY_ANALYSIS_PROMPT,
     QUESTIONNAIRE_PROMPT,
+    TEMPLATE_ADAPTATION_PROMPT,
+    QUESTIONNAIRE_OUTLINE_PROMPT,
+    QUESTIONNAIRE_SECTION_PROMPT,
     JS_REFINEMENT_PROMPT,
     INTELLIGENT_QUESTIONNAIRE_MODIFICATIONS_PROMPT,
-    EXPORT_SECTION_CARDS_PROMPT
+    MODIFICATION_TARGETING_PROMPT,
+    EXPORT_SECTION_CARDS_PROMPT,
+    EXPORT_SECTION_CARDS_SYSTEM
 )
 
 # Import schemas from the new schemas.py file
@@ -38,22 +45,67 @@ from schemas.schemas import (
     Question,
     Section,
     QuestionnaireOutput,
+    QuestionnaireOutline,
+    SectionQuestionsOutput,
+    TemplateAdaptationOutput,
+    TemplateMatch,
     QuestionnaireModificationsOutput,
+    ModificationTargetsOutput,
     RemediationOutput,
     StringOutput
     
 )
 from rag_implementation import get_rag_chain_and_retriever
+from questionnaire_index import QUESTION_LIST_KEYS, QuestionnaireIndex
+from coverage_remediation import remediate_coverage_locally, select_relevant_sections
+from modification_targeting import (
+    FULL_SCOPE,
+    LLM_SCOPE,
+    ModificationTargets,
+    build_scoped_questionnaire,
+    questionnaire_outline,
+    resolve_targets_lexically,
+    restrict_modifications_to_scope,
+)
+from prompt_payloads import (
+    CARD_QUESTION_FIELDS,
+    VARIABLE_DESCRIBED_FIELDS,
+    VARIABLE_FORMULA_FIELDS,
+    VARIABLE_SUMMARY_FIELDS,
+    VARIABLE_TYPED_FIELDS,
+    PromptPayload,
+    compact_json,
+    project,
+)
+from stage_timing import StageTimer
+from model_routing import model_router
+from output_budget import budgeted_chain, output_budget
+from prompt_cache import record_usage
+from storage import STORAGE_TABLES, get_storage, save_project_rows
+from save_outbox import get_outbox
+from template_library import find_closest_template, get_template
+from compact_state import default_priority_rationale
+import serialization
+from sectioned_generation import DEFAULT_SECTION_QUESTION_COUNT, complete_outline, merge_section_outputs
+from formula_validation import SYNTAX_ERROR, UNKNOWN_IDENTIFIER, known_variable_names, needs_refinement, validate_expression
 
 load_dotenv()  # Load environment variables from .env file
 
-# --- Supabase Configuration (placeholders) ---
-SUPABASE_URL = "https://kvzvonrozcmpiflnzcjy.supabase.co/rest/v1"
-SUPABASE_API_KEY = os.getenv("SUPABASE_CLIENT_ANON_KEY", "YOUR_SUPABASE_CLIENT_ANON_KEY")
+# Concurrent per-section calls in outline-then-sections questionnaire generation
+MAX_SECTION_CONCURRENCY = 8
+
+# Raw indicators one generation is budgeted for (RAW_INDICATORS_PROMPT asks for at least 15)
+EXPECTED_RAW_INDICATORS = 20
+
+# Decision-variable RAG context: raw indicator names per retrieval query (queries start while the raw
+# indicators are still streaming in) and the documents kept across all queries
+DV_RETRIEVAL_NAMES_PER_QUERY = 5
+DV_CONTEXT_MAX_DOCS = 6
+# Worker threads of one generate_variables call (prompt retrieval, then decision-variable retrievals)
+RETRIEVAL_WORKERS = 2
 
-# Initialize the Language Model
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
-llm_modification = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+# Chat models are built per node by the model router (model, temperature, limits and fallback per node;
+# live, record or replay; see model_routing.py and llm_backend.py)
 
 # --- LAZY RAG LOADING ---
 _rag_cache = {"rag_chain": None, "retriever": None, "init": False}
@@ -72,11 +124,15 @@ def get_lazy_rag_components():
     return _rag_cache["rag_chain"], _rag_cache["retriever"]
 
 # Helper for refining JS expressions with retry mechanism
-def _refine_js_expression(llm_instance: ChatOpenAI, expression_type: str, current_expression: Optional[str],
+def _refine_js_expression(llm_instance: Optional[ChatOpenAI], expression_type: str, current_expression: Optional[str],
                           context_question_vars: List[str], target_entity_description: str,
-                          is_mandatory_flag: bool = True, max_retries: int = 3) -> str:
+                          is_mandatory_flag: bool = True, max_retries: int = 3,
+                          known_variables: Optional[Collection[str]] = None) -> str:
     """
     Attempts to refine a given JavaScript expression (triggering_criteria or formula).
+    llm_instance=None uses the "js_refinement" model route.
+    The expression is statically validated first and only sent to the LLM when it is a placeholder,
+    has a syntax error or reads variables outside context_question_vars / known_variables.
     Includes a retry mechanism to force the LLM to generate a meaningful expression.
     If, after max_retries, it still cannot, it will return an explicit error string.
     """
@@ -86,9 +142,11 @@ def _refine_js_expression(llm_instance: ChatOpenAI, expression_type: str, curren
 
     retries = 0
     
-    # If current_expression is already a non-trivial, non-failed expression, return it immediately
-    if current_expression and current_expression.strip() != "return true;" and "// LLM FAILED" not in current_expression and "// LLM FAILED TO RESPOND" not in current_expression:
-        return current_expression.strip()
+    # If current_expression already parses and only reads known variables, return it immediately
+    validation = validate_expression(current_expression, set(context_question_vars or []) | set(known_variables or []))
+    if not needs_refinement(validation):
+        return (current_expression or "").strip()
+    print(f"Refining {expression_type} on {target_entity_description}: {validation['status']} {validation['message']}".rstrip())
 
     while retries < max_retries:
         if retries > 0:
@@ -99,7 +157,8 @@ def _refine_js_expression(llm_instance: ChatOpenAI, expression_type: str, curren
             expression_type=expression_type,
             context_question_vars=', '.join(context_question_vars) if context_question_vars else 'None',
             target_entity_description=target_entity_description
-        ) | llm_instance.with_structured_output(StringOutput, method='json_mode')
+        ) | (llm_instance.with_structured_output(StringOutput, method='json_mode') if llm_instance is not None
+             else model_router.structured("js_refinement", StringOutput, method='json_mode'))
 
         generated_expression = None
         raw_response = None
@@ -166,7 +225,7 @@ def _apply_default_variable_properties(var: Dict, is_raw_indicator: bool = True,
     
     # Add priority_rationale if not present
     if 'priority_rationale' not in var or not var['priority_rationale']:
-        var['priority_rationale'] = f"Priority {var.get('impact_score', 50)} assigned based on importance for income assessment"
+        var['priority_rationale'] = default_priority_rationale(var.get('impact_score', 50))
     
     if is_raw_indicator:
         var["formula"] = None # Raw indicators have null formula
@@ -242,11 +301,202 @@ def _process_question_properties(question: Dict, is_core_question: bool, all_exi
     return question
 
 # --- Langraph Node 1: generate_variables ---
-def generate_variables(state: GraphState) -> GraphState:
+def _retrieve_rag_context(query: str, purpose: str) -> List[Any]:
+    """Retrieves RAG context documents for a query; returns [] when RAG is unavailable."""
+    _rag_chain, retriever = get_lazy_rag_components()
+    if not retriever:
+        return []
+    try:
+        print(f"Retrieving RAG context for {purpose}: {query}")
+        context_docs = retriever.invoke(query)
+        print(f"Retrieved {len(context_docs)} context documents for {purpose}.")
+        return context_docs
+    except Exception as e:
+        print(f"Warning: Could not retrieve RAG context for {purpose}: {e}")
+        return []
+
+
+class RetrievalMemo:
+    """
+    RAG retrievals shared between the generations of one batch: each distinct query (compared after
+    whitespace and case normalization) is retrieved once, and prefetch() embeds many queries in one call.
+    Thread-safe; concurrent lookups of a query in flight wait for it.
+    """
+
+    def __init__(self):
+        self._results: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.retrievals = 0
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return " ".join(query.split()).lower()
+
+    def prefetch(self, queries: List[str], purpose: str) -> None:
+        """Retrieves the queries not seen yet with one batched retriever call."""
+        _rag_chain, retriever = get_lazy_rag_components()
+        pending: Dict[str, Tuple[str, Future]] = {}
+        with self._lock:
+            for query in queries:
+                key = self._key(query)
+                if key not in self._results and key not in pending:
+                    pending[key] = (query, Future())
+                    self._results[key] = pending[key][1]
+            self.retrievals += len(pending)
+        if not pending:
+            return
+        documents: List[List[Any]] = [[] for _ in pending]
+        if retriever:
+            try:
+                print(f"Retrieving RAG context for {purpose}: {len(pending)} queries in one batch")
+                documents = retriever.batch([query for query, _future in pending.values()])
+            except Exception as e:
+                print(f"Warning: Could not retrieve RAG context for {purpose}: {e}")
+        for (_query, future), docs in zip(pending.values(), documents):
+            future.set_result(docs)
+
+    def retrieve(self, query: str, purpose: str) -> List[Any]:
+        key = self._key(query)
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+                self.retrievals += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+        docs = _retrieve_rag_context(query, purpose)
+        future.set_result(docs)
+        return docs
+
+
+class DecisionContextPrefetch:
+    """
+    Decision-variable RAG context, retrieved while the raw indicators are still being generated: each
+    group of DV_RETRIEVAL_NAMES_PER_QUERY completed raw indicator names streamed out of the raw indicator
+    call is retrieved as one query on a worker thread. collect() retrieves the groups the stream did not
+    complete and merges the documents of all groups.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, retrieve: Callable[[str, str], List[Any]], timer: StageTimer):
+        self._executor = executor
+        self._retrieve = retrieve
+        self._timer = timer
+        self._queries: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _group_queries(names: List[str]) -> List[str]:
+        return [", ".join(names[start:start + DV_RETRIEVAL_NAMES_PER_QUERY])
+                for start in range(0, len(names), DV_RETRIEVAL_NAMES_PER_QUERY)]
+
+    def _submit(self, query: str) -> Future:
+        with self._lock:
+            if query not in self._queries:
+                stage = f"dv_retrieval_{len(self._queries) + 1}"
+                self._queries[query] = self._executor.submit(
+                    self._timer.timed, stage, self._retrieve, query, "decision variables")
+            return self._queries[query]
+
+    def on_partial_raw_indicators(self, output: Dict[str, Any]) -> None:
+        """on_partial hook of the raw indicator chain: starts the queries of complete name groups."""
+        items = output.get("raw_indicators")
+        if not isinstance(items, list):
+            return
+        # The last item may still be streaming; its name is picked up by the next call or by collect()
+        names = [item["var_name"] for item in items[:-1] if isinstance(item, dict) and isinstance(item.get("var_name"), str)]
+        for query in self._group_queries(names)[:len(names) // DV_RETRIEVAL_NAMES_PER_QUERY]:
+            self._submit(query)
+
+    def collect(self, raw_indicator_names: List[str]) -> List[Any]:
+        """Context documents for the final raw indicator names, interleaved across the groups and deduplicated."""
+        futures = [self._submit(query) for query in self._group_queries(raw_indicator_names)]
+        results = [future.result() for future in futures]
+        documents: List[Any] = []
+        seen = set()
+        for rank in range(max((len(docs) for docs in results), default=0)):
+            for docs in results:
+                if rank < len(docs):
+                    content = getattr(docs[rank], "page_content", str(docs[rank]))
+                    if content not in seen:
+                        seen.add(content)
+                        documents.append(docs[rank])
+        return documents[:DV_CONTEXT_MAX_DOCS]
+
+
+def _seed_variables_from_template(state: GraphState, template_match: TemplateMatch, timer: StageTimer) -> bool:
+    """
+    Template library fast path: starts from the matched occupation template's variables and asks the
+    LLM only for the deltas the prompt requires (one short call). Returns False if the template is missing.
+    """
+    template = get_template(template_match["name"])
+    if template is None:
+        return False
+    project_id = state.get("project_id")
+    raw_indicators = template["raw_indicators"]
+    decision_variables = template["decision_variables"]
+
+    try:
+        with timer.stage("template_adaptation"):
+            adaptation_chain = budgeted_chain("template_adaptation", TEMPLATE_ADAPTATION_PROMPT, TemplateAdaptationOutput,
+                                              output_budget(raw_indicator=6, decision_variable=6, name=10))
+            payload = PromptPayload("template_adaptation")
+            payload.table("raw_indicators", raw_indicators, VARIABLE_DESCRIBED_FIELDS)
+            payload.table("decision_variables", decision_variables, VARIABLE_FORMULA_FIELDS)
+            adaptation = adaptation_chain.invoke({
+                **payload.values,
+                "user_input": state["prompt"],
+                "template_name": template["name"]
+            })
+        payload.report()
+
+        removed_ris = set(adaptation.get("removed_raw_indicators") or [])
+        removed_dvs = set(adaptation.get("removed_decision_variables") or [])
+        raw_indicators = [ri for ri in raw_indicators if ri["var_name"] not in removed_ris]
+        decision_variables = [dv for dv in decision_variables if dv["var_name"] not in removed_dvs]
+        existing_names = {var["var_name"] for var in raw_indicators + decision_variables}
+        for new_var in adaptation.get("added_raw_indicators") or []:
+            if new_var.get("var_name") not in existing_names:
+                raw_indicators.append(new_var)
+                existing_names.add(new_var.get("var_name"))
+        for new_var in adaptation.get("added_decision_variables") or []:
+            if new_var.get("var_name") not in existing_names:
+                decision_variables.append(new_var)
+                existing_names.add(new_var.get("var_name"))
+        updated_formulas = adaptation.get("updated_formulas") or {}
+        for dv in decision_variables:
+            if dv["var_name"] in updated_formulas:
+                dv["formula"] = updated_formulas[dv["var_name"]]
+        if adaptation.get("reasoning"):
+            print(f"Template adaptation: {adaptation['reasoning']}")
+    except Exception as e:
+        print(f"Warning: Could not adapt template '{template['name']}', using it unchanged: {e}")
+
+    for var in raw_indicators:
+        _apply_default_variable_properties(var, is_raw_indicator=True, project_id=project_id)
+    for var in decision_variables:
+        _apply_default_variable_properties(var, is_raw_indicator=False, project_id=project_id)
+    state["raw_indicators"] = raw_indicators
+    state["decision_variables"] = decision_variables
+    state["template_name"] = template["name"]
+    print(f"\n---Variables seeded from template '{template['name']}': "
+          f"{len(raw_indicators)} raw indicators, {len(decision_variables)} decision variables---")
+    return True
+
+
+def generate_variables(state: GraphState, retrieval: Optional[RetrievalMemo] = None) -> GraphState:
     """
     Generates initial raw indicators and decision variables based on the user's prompt.
     It prompts an LLM twice: first for raw indicators, then for decision variables
     based on the suggested raw indicators.
+    Retrievals run on worker threads: the prompt retrieval overlaps the template lookup and prompt rendering,
+    and the raw indicator call streams, so the decision-variable retrievals start from the names already
+    generated (DecisionContextPrefetch). Stage timings are stored in state["stage_timings"]["generate_variables"].
+    Prompts naming a known occupation start from the template library instead (one short adaptation call).
+    Batch generation passes a shared RetrievalMemo so that identical retrieval queries run once.
     """
     print("---GENERATING INITIAL VARIABLES---")
     # Ensure state["error"] is a string at the start of this node
@@ -256,83 +506,103 @@ def generate_variables(state: GraphState) -> GraphState:
     project_id = state.get("project_id") # Get project_id from state
     current_raw_indicators = state.get("raw_indicators", [])
     current_decision_variables = state.get("decision_variables", [])
+    timer = StageTimer()
+    retrieve = retrieval.retrieve if retrieval is not None else _retrieve_rag_context
+    executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS)
+    decision_context = DecisionContextPrefetch(executor, retrieve, timer)
 
-    # Get RAG context
-    context_docs = []
-    _rag_chain, retriever = get_lazy_rag_components()
-    if retriever:
-        try:
-            print(f"Retrieving RAG context for prompt: {prompt_text}")
-            context_docs = retriever.invoke(prompt_text)
-            print(f"Retrieved {len(context_docs)} context documents.")
-        except Exception as e:
-            print(f"Warning: Could not retrieve RAG context: {e}")
-            context_docs = []
-
-    # Step 1: Identify Raw Indicators using LLM
-    if not current_raw_indicators:
-        print("Generating Raw Indicators...")
-        raw_indicators_chain = RAW_INDICATORS_PROMPT | llm.with_structured_output(RawIndicatorsOutput, method='function_calling')
-
-        try:
-            llm_response = raw_indicators_chain.invoke({
-                "user_input": prompt_text,
-                "existing_variables": json.dumps(current_raw_indicators),
-                "context": context_docs # Pass RAG context
-            })
-            suggested_raw_indicators = llm_response.get("raw_indicators", [])
-
-            for var in suggested_raw_indicators:
-                _apply_default_variable_properties(var, is_raw_indicator=True, project_id=project_id) # Pass project_id
+    try:
+        if not current_raw_indicators:
+            # Runs alongside the template lookup; discarded when a template matches
+            context_future = executor.submit(timer.timed, "ri_retrieval", retrieve, prompt_text, "raw indicators")
+
+        # Template library fast path for known occupations
+        if not current_raw_indicators and not current_decision_variables:
+            with timer.stage("template_lookup"):
+                template_match = find_closest_template(prompt_text)
+            if template_match is not None:
+                print(f"Prompt matches template '{template_match['name']}' (score {template_match['score']}).")
+                if _seed_variables_from_template(state, template_match, timer):
+                    return state
+
+        # Step 1: Identify Raw Indicators using LLM
+        if not current_raw_indicators:
+            print("Generating Raw Indicators...")
+            with timer.stage("ri_prompt_rendering"):
+                raw_indicators_chain = budgeted_chain(
+                    "raw_indicators", RAW_INDICATORS_PROMPT, RawIndicatorsOutput,
+                    output_budget(raw_indicator=EXPECTED_RAW_INDICATORS),
+                    on_partial=None if current_decision_variables else decision_context.on_partial_raw_indicators)
+                payload = PromptPayload("raw_indicators")
+                payload.json("existing_variables", current_raw_indicators)
+            context_docs = context_future.result()
 
-            state["raw_indicators"] = suggested_raw_indicators
-            print("\n---Initial Suggested Raw Indicators:---")
-            print(json.dumps(suggested_raw_indicators, indent=2))
+            try:
+                with timer.stage("ri_generation"):
+                    llm_response = raw_indicators_chain.invoke({
+                        **payload.values,
+                        "user_input": prompt_text,
+                        "context": context_docs # Pass RAG context
+                    })
+                payload.report()
+                suggested_raw_indicators = llm_response.get("raw_indicators", [])
 
-        except Exception as e:
-            state["error"] = (state.get("error") or "") + f"Error generating raw indicators: {e}" # Concatenate
-            print(f"Error generating raw indicators: {e}")
-            return state # Critical failure, stop workflow
+                for var in suggested_raw_indicators:
+                    _apply_default_variable_properties(var, is_raw_indicator=True, project_id=project_id) # Pass project_id
 
-    # Step 2: Create Decision Variables using LLM
-    if state["raw_indicators"] and not current_decision_variables:
-        print("\nGenerating Decision Variables...")
-        raw_indicator_names = ", ".join([v["var_name"] for v in state["raw_indicators"]])
+                state["raw_indicators"] = suggested_raw_indicators
 
-        # Use RAG context for decision variables based on raw indicator names
-        decision_context_docs = []
-        _rag_chain, retriever = get_lazy_rag_components()
-        if retriever:
-            try:
-                print(f"Retrieving RAG context for decision variables based on: {raw_indicator_names}")
-                decision_context_docs = retriever.invoke(raw_indicator_names)
-                print(f"Retrieved {len(decision_context_docs)} context documents for decision variables.")
             except Exception as e:
-                print(f"Warning: Could not retrieve RAG context for decision variables: {e}")
-                decision_context_docs = []
+                state["error"] = (state.get("error") or "") + f"Error generating raw indicators: {e}" # Concatenate
+                print(f"Error generating raw indicators: {e}")
+                return state # Critical failure, stop workflow
+
+        if not current_raw_indicators and state["raw_indicators"]:
+            with timer.stage("ri_postprocessing"):
+                print("\n---Initial Suggested Raw Indicators:---")
+                print(json.dumps(state["raw_indicators"], indent=2))
+
+        if state["raw_indicators"] and not current_decision_variables:
+            print("\nGenerating Decision Variables...")
+            # Step 2: Create Decision Variables using LLM, with RAG context based on the raw indicator names
+            with timer.stage("dv_retrieval_wait"):
+                decision_context_docs = decision_context.collect([v["var_name"] for v in state["raw_indicators"]])
+            with timer.stage("dv_prompt_rendering"):
+                decision_variables_chain = budgeted_chain(
+                    "decision_variables", DECISION_VARIABLES_PROMPT, DecisionVariablesOutput,
+                    output_budget(decision_variable=max(10, len(state["raw_indicators"]))))
+                payload = PromptPayload("decision_variables")
+                payload.table("raw_indicators", state["raw_indicators"], VARIABLE_TYPED_FIELDS)
+                payload.json("existing_decision_variables", current_decision_variables)
 
-        decision_variables_chain = DECISION_VARIABLES_PROMPT | llm.with_structured_output(DecisionVariablesOutput, method='function_calling')
-
-        try:
-            llm_response = decision_variables_chain.invoke({
-                "raw_indicators": json.dumps([{"var_name": v["var_name"], "name": v["name"], "type": v["type"]} for v in state["raw_indicators"]]),
-                "existing_decision_variables": json.dumps(current_decision_variables),
-                "user_input": prompt_text,
-                "context": decision_context_docs # Pass RAG context
-            })
-            suggested_decision_vars = llm_response.get("decision_variables", [])
-
-            for var in suggested_decision_vars:
-                _apply_default_variable_properties(var, is_raw_indicator=False, project_id=project_id) # Pass project_id
+            try:
+                with timer.stage("dv_generation"):
+                    llm_response = decision_variables_chain.invoke({
+                        **payload.values,
+                        "user_input": prompt_text,
+                        "context": decision_context_docs # Pass RAG context
+                    })
+                payload.report()
+                suggested_decision_vars = llm_response.get("decision_variables", [])
+
+                for var in suggested_decision_vars:
+                    _apply_default_variable_properties(var, is_raw_indicator=False, project_id=project_id) # Pass project_id
+
+                state["decision_variables"] = suggested_decision_vars
+                print("\n---Initial Suggested Decision Variables:---")
+                print(json.dumps(suggested_decision_vars, indent=2))
 
-            state["decision_variables"] = suggested_decision_vars
-            print("\n---Initial Suggested Decision Variables:---")
-            print(json.dumps(suggested_decision_vars, indent=2))
+            except Exception as e:
+                state["error"] = (state.get("error") or "") + f"Error generating decision variables: {e}" # Concatenate
+                print(f"Error generating decision variables: {e}")
+                return state # Critical failure, stop workflow
 
-        except Exception as e:
-            state["error"] = (state.get("error") or "") + f"Error generating decision variables: {e}" # Concatenate
-            print(f"Error generating decision variables: {e}")
-            return state # Critical failure, stop workflow
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        timings = timer.summary()
+        state["stage_timings"] = {**(state.get("stage_timings") or {}), "generate_variables": timings}
+        print(f"generate_variables stage timings (ms): "
+              f"{ {name: (stage['start_ms'], stage['end_ms']) for name, stage in timings['stages'].items()} }")
 
     return state
 
@@ -361,28 +631,21 @@ def modify_variables_intelligent(state: GraphState) -> GraphState:
         # Prepare the intelligent modification request
         business_context = f"Financial assessment for small business income evaluation. Project ID: {project_id}"
         
-        # Determine modification type based on the prompt
-        modification_type = determine_modification_type(modification_prompt)
-        
-        intelligent_request = {
-            "primary_modifications": modification_prompt,
-            "dependency_analysis": json.dumps(dependency_graph, indent=2),
-            "auto_sync_enabled": True,
-            "business_context": business_context,
-            "modification_type": modification_type
-        }
-        
         # Use the intelligent modification prompt
-        intelligent_chain = INTELLIGENT_VARIABLE_MODIFICATIONS_PROMPT | llm_modification.with_structured_output(
-            IntelligentVariableModificationsOutput, method='function_calling'
+        intelligent_chain = budgeted_chain(
+            "variable_modifications", INTELLIGENT_VARIABLE_MODIFICATIONS_PROMPT, IntelligentVariableModificationsOutput,
+            output_budget(modification=max(8, (len(raw_indicators) + len(decision_variables)) // 2))
         )
         
+        payload = PromptPayload("variable_modifications")
+        payload.json("dependency_analysis", dependency_graph)
+        payload.table("raw_indicators", raw_indicators, VARIABLE_SUMMARY_FIELDS)
         llm_response = intelligent_chain.invoke({
+            **payload.values,
             "primary_modifications": modification_prompt,
-            "dependency_analysis": json.dumps(dependency_graph, indent=2),
-            "raw_indicators": json.dumps([{"var_name": ri["var_name"], "name": ri["name"]} for ri in raw_indicators]),
             "business_context": business_context
         })
+        payload.report()
         # print("[DEBUG] LLM Response from intelligent modification:")
         # print(json.dumps(llm_response, indent=2, default=str))
         
@@ -519,16 +782,12 @@ def apply_intelligent_modifications(state: GraphState, llm_response: Dict, proje
     return state
 
 # --- Langraph Node 3: generate_questionnaire ---
-def generate_questionnaire(state: GraphState) -> GraphState:
+def _questionnaire_generation_inputs(state: GraphState) -> Optional[Tuple[PromptPayload, Dict[str, Any]]]:
     """
-    Generates a questionnaire based on the raw indicators and decision variables.
-    Also generates a title for the questionnaire and stores it in state['questionnaire_title'].
+    Builds the QUESTIONNAIRE_PROMPT inputs (variable tables and RAG context).
+    Returns None, with state["error"] set, when there is nothing to generate from.
     """
-    print("\n---GENERATING QUESTIONNAIRE---")
-    state["error"] = state.get("error", "")
-
     prompt_text = state["prompt"]
-    project_id = state.get("project_id")
     raw_indicators = state.get("raw_indicators", [])
     decision_variables = state.get("decision_variables")
 
@@ -538,29 +797,13 @@ def generate_questionnaire(state: GraphState) -> GraphState:
     if not raw_indicators:
         state["error"] = (state.get("error") or "") + "No raw indicators available for questionnaire generation."
         print("No raw indicators available for questionnaire generation.")
-        return state
+        return None
 
     prompt_context = f"User request: {prompt_text}. Generate a questionnaire to assess income for small business owners."
 
-    raw_indicators_info = [
-        {
-            "var_name": var["var_name"],
-            "name": var["name"],
-            "description": var["description"],
-            "type": var["type"]
-        } for var in raw_indicators
-    ]
-    raw_indicators_json = json.dumps(raw_indicators_info, indent=2)
-
-    decision_vars_info = [
-        {
-            "var_name": var["var_name"],
-            "name": var["name"],
-            "description": var["description"],
-            "type": var["type"]
-        } for var in decision_variables
-    ]
-    decision_vars_json = json.dumps(decision_vars_info, indent=2)
+    payload = PromptPayload("questionnaire")
+    payload.table("raw_indicators", raw_indicators, VARIABLE_DESCRIBED_FIELDS)
+    payload.table("decision_variables", decision_variables, VARIABLE_DESCRIBED_FIELDS)
 
     context_docs = []
     _rag_chain, retriever = get_lazy_rag_components()
@@ -573,45 +816,115 @@ def generate_questionnaire(state: GraphState) -> GraphState:
             print(f"Warning: Could not retrieve RAG context for questionnaire: {e}")
             context_docs = []
 
-    questionnaire_chain = QUESTIONNAIRE_PROMPT | llm.with_structured_output(QuestionnaireOutput, method='function_calling')
+    return payload, {**payload.values, "user_input": prompt_context, "context": context_docs}
+
+
+def _questionnaire_budget(state: GraphState) -> int:
+    """Output budget of a full questionnaire: about two questions and one calculation per raw indicator."""
+    ri_count = len(state.get("raw_indicators") or [])
+    return output_budget(section=7, question=2 * ri_count, calculation=ri_count)
+
+
+def _question_count(questionnaire: Optional[Dict]) -> int:
+    return sum(len(section.get(key) or []) for section in (questionnaire or {}).get("sections") or []
+               for key in QUESTION_LIST_KEYS)
+
+
+def _set_questionnaire_title(state: GraphState, generated_questionnaire: Dict) -> str:
+    """Stores the generated questionnaire title in state['questionnaire_title'], falling back to the prompt."""
+    title = generated_questionnaire.get("title")
+    if not title or not title.strip():
+        # Fallback: use the first 3 words of the prompt, title-cased, with '...' at the end
+        words = state["prompt"].strip().split()
+        title = " ".join(words[:6]).title() + "..."
+    print(f"[DEBUG] Extracted questionnaire title: '{title}'")  # DEBUG PRINT
+    state["questionnaire_title"] = title
+    return title
+
+
+def _process_generated_section(section: Dict, sec_idx: int, all_existing_q_vars_set: set, state: GraphState,
+                               project_id: Optional[str] = None) -> Dict:
+    """Applies section and question defaults/validation to one generated section."""
+    section['order'] = section.get('order', sec_idx + 1)
+    _process_section_properties(section, all_existing_q_vars_set, state, project_id=project_id)
+    for q_list, is_core_q_flag in [
+        (section['core_questions'], True),
+        (section['conditional_questions'], False)
+    ]:
+        for q_idx, question in enumerate(q_list):
+            _process_question_properties(question, is_core_q_flag, all_existing_q_vars_set, state, project_id=project_id)
+    return section
+
+
+def _questionnaire_from_template(state: GraphState, template: Dict) -> Dict:
+    """
+    Builds the questionnaire from a template without any LLM call. Links and calculations of raw
+    indicators removed during template adaptation are dropped, as are questions (and then sections) that
+    no longer capture any raw indicator; indicators added by the adaptation are left to
+    analyze_questionnaire_impact, which remediates coverage.
+    """
+    questionnaire = template["questionnaire"]
+    ri_names = {ri.get("var_name") for ri in state.get("raw_indicators") or []}
+    sections = []
+    for section in questionnaire.get("sections", []):
+        for list_key in QUESTION_LIST_KEYS:
+            questions = section.get(list_key) or []
+            for question in questions:
+                question["raw_indicators"] = [name for name in question.get("raw_indicators") or [] if name in ri_names]
+            section[list_key] = [question for question in questions if question["raw_indicators"]]
+        if any(section.get(list_key) for list_key in QUESTION_LIST_KEYS):
+            section["order"] = len(sections) + 1
+            sections.append(section)
+    questionnaire["sections"] = sections
+    questionnaire["raw_indicator_calculation"] = {
+        name: formula for name, formula in (questionnaire.get("raw_indicator_calculation") or {}).items() if name in ri_names
+    }
+    return questionnaire
+
+
+def generate_questionnaire(state: GraphState) -> GraphState:
+    """
+    Generates a questionnaire based on the raw indicators and decision variables.
+    Also generates a title for the questionnaire and stores it in state['questionnaire_title'].
+    Projects seeded from an occupation template reuse the template's questionnaire directly.
+    """
+    print("\n---GENERATING QUESTIONNAIRE---")
+    state["error"] = state.get("error", "")
+    project_id = state.get("project_id")
+
+    template = get_template(state["template_name"]) if state.get("template_name") else None
+    if template is not None and state.get("raw_indicators"):
+        generated_questionnaire = _questionnaire_from_template(state, template)
+        _set_questionnaire_title(state, generated_questionnaire)
+        all_existing_q_vars_set = QuestionnaireIndex(generated_questionnaire).question_vars()
+        for sec_idx, section in enumerate(generated_questionnaire.get("sections", [])):
+            _process_generated_section(section, sec_idx, all_existing_q_vars_set, state, project_id=project_id)
+        state["questionnaire"] = generated_questionnaire
+        print(f"\n---Questionnaire built from template '{template['name']}': "
+              f"{len(generated_questionnaire['sections'])} sections---")
+        return state
+
+    generation_inputs = _questionnaire_generation_inputs(state)
+    if generation_inputs is None:
+        return state
+    payload, chain_inputs = generation_inputs
+
+    questionnaire_chain = budgeted_chain("questionnaire", QUESTIONNAIRE_PROMPT, QuestionnaireOutput,
+                                         _questionnaire_budget(state))
 
     try:
-        llm_response = questionnaire_chain.invoke({
-            "user_input": prompt_context,
-            "raw_indicators": raw_indicators_json,
-            "decision_variables": decision_vars_json,
-            "context": context_docs
-        })
+        llm_response = questionnaire_chain.invoke(chain_inputs)
+        payload.report()
         generated_questionnaire = llm_response
 
-        
-
         # Generate a title for the questionnaire
-        title = generated_questionnaire.get("title")
-        if not title or not title.strip():
-            # Fallback: use the first 3 words of the prompt, title-cased, with '...' at the end
-            words = prompt_text.strip().split()
-            title = " ".join(words[:6]).title() + "..."
-        print(f"[DEBUG] Extracted questionnaire title: '{title}'")  # DEBUG PRINT
-        state["questionnaire_title"] = title
+        _set_questionnaire_title(state, generated_questionnaire)
 
         # Collect initial q_vars from generated_questionnaire to populate all_existing_q_vars_set
-        all_existing_q_vars_set = set()
-        for section in generated_questionnaire.get("sections", []):
-            for q_list in [section.get('core_questions', []), section.get('conditional_questions', [])]:
-                for question in q_list:
-                    if question.get('variable_name'):
-                        all_existing_q_vars_set.add(question['variable_name'])
+        all_existing_q_vars_set = QuestionnaireIndex(generated_questionnaire).question_vars()
 
         for sec_idx, section in enumerate(generated_questionnaire.get("sections", [])):
-            section['order'] = section.get('order', sec_idx + 1)
-            _process_section_properties(section, all_existing_q_vars_set, state, project_id=project_id)
-            for q_list, is_core_q_flag in [
-                (section['core_questions'], True),
-                (section['conditional_questions'], False)
-            ]:
-                for q_idx, question in enumerate(q_list):
-                    _process_question_properties(question, is_core_q_flag, all_existing_q_vars_set, state, project_id=project_id)
+            _process_generated_section(section, sec_idx, all_existing_q_vars_set, state, project_id=project_id)
 
         state["questionnaire"] = generated_questionnaire
         print("\n---Generated Questionnaire:---")
@@ -624,6 +937,178 @@ def generate_questionnaire(state: GraphState) -> GraphState:
     return state
 
 
+def generate_questionnaire_stream(state: GraphState) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of generate_questionnaire.
+    The structured output is streamed and parsed incrementally; a section is complete as soon as the
+    next one starts, so each section is processed and yielded as {"event": "section", ...} while the
+    model is still writing the rest. The final questionnaire is stored in state like generate_questionnaire.
+    """
+    print("\n---GENERATING QUESTIONNAIRE (STREAMING)---")
+    state["error"] = state.get("error", "")
+    project_id = state.get("project_id")
+
+    generation_inputs = _questionnaire_generation_inputs(state)
+    if generation_inputs is None:
+        return
+    payload, chain_inputs = generation_inputs
+
+    # Streamed partial outputs carry no finish_reason, so the stream is budgeted but not continued
+    questionnaire_chain = QUESTIONNAIRE_PROMPT | model_router.structured(
+        "questionnaire", QuestionnaireOutput, method='function_calling', max_tokens=_questionnaire_budget(state))
+
+    processed_sections: List[Dict] = []
+    all_existing_q_vars_set: set = set()
+    latest: Dict = {}
+    try:
+        for partial in questionnaire_chain.stream(chain_inputs):
+            if not isinstance(partial, dict):
+                continue
+            latest = partial
+            streamed_sections = partial.get("sections") or []
+            # Every section except the last streamed one is final
+            while len(processed_sections) < len(streamed_sections) - 1:
+                section = _process_generated_section(streamed_sections[len(processed_sections)], len(processed_sections),
+                                                     all_existing_q_vars_set, state, project_id=project_id)
+                processed_sections.append(section)
+                yield {"event": "section", "section": section}
+        payload.report()
+
+        for section in (latest.get("sections") or [])[len(processed_sections):]:
+            section = _process_generated_section(section, len(processed_sections), all_existing_q_vars_set, state,
+                                                 project_id=project_id)
+            processed_sections.append(section)
+            yield {"event": "section", "section": section}
+
+        generated_questionnaire = {**latest, "sections": processed_sections}
+        _set_questionnaire_title(state, generated_questionnaire)
+        state["questionnaire"] = generated_questionnaire
+        print(f"\n---Generated Questionnaire: {len(processed_sections)} sections streamed---")
+
+    except Exception as e:
+        state["error"] = (state.get("error") or "") + f"Error generating questionnaire: {e}"
+        print(f"Error generating questionnaire: {e}")
+
+
+
+def generate_questionnaire_sectioned(state: GraphState) -> GraphState:
+    """
+    Outline-then-sections variant of generate_questionnaire.
+    One short call plans the sections and assigns raw indicators to them, then every section's
+    questions are generated concurrently, so wall-clock time approaches that of the largest section.
+    The sections are merged (duplicate variable_names dropped) and processed like generate_questionnaire.
+    """
+    print("\n---GENERATING QUESTIONNAIRE (OUTLINE THEN SECTIONS)---")
+    state["error"] = state.get("error", "")
+    project_id = state.get("project_id")
+
+    generation_inputs = _questionnaire_generation_inputs(state)
+    if generation_inputs is None:
+        return state
+    payload, chain_inputs = generation_inputs
+
+    try:
+        # Stage 1: outline with raw indicator assignments (no questions, so few output tokens)
+        outline_chain = budgeted_chain("questionnaire_outline", QUESTIONNAIRE_OUTLINE_PROMPT, QuestionnaireOutline,
+                                       output_budget(section=7, name=len(state.get("raw_indicators") or [])))
+        outline = outline_chain.invoke(chain_inputs)
+        payload.report()
+        outline_sections = complete_outline(outline.get("sections"), state.get("raw_indicators") or [])
+        if not outline_sections:
+            state["error"] = (state.get("error") or "") + "Error generating questionnaire: the outline has no sections."
+            print("Error generating questionnaire: the outline has no sections.")
+            return state
+        print(f"Outline: {[(section['order'], section.get('title'), section['raw_indicators']) for section in outline_sections]}")
+
+        # Stage 2: one concurrent call per section
+        ri_map = {ri["var_name"]: ri for ri in state.get("raw_indicators") or []}
+        outline_json = compact_json([
+            {"order": section["order"], "title": section.get("title"), "raw_indicators": section["raw_indicators"]}
+            for section in outline_sections
+        ])
+        section_payloads = []
+        section_inputs = []
+        for section in outline_sections:
+            section_payload = PromptPayload(f"questionnaire_section_{section['order']}")
+            section_payload.table("raw_indicators", [ri_map[name] for name in section["raw_indicators"]], VARIABLE_DESCRIBED_FIELDS)
+            section_payloads.append(section_payload)
+            section_inputs.append({
+                **section_payload.values,
+                "user_input": chain_inputs["user_input"],
+                "context": chain_inputs["context"],
+                "questionnaire_outline": outline_json,
+                "section_order": section["order"],
+                "section_title": section.get("title") or "",
+                "section_description": section.get("description") or "",
+                "target_question_count": section.get("target_question_count") or DEFAULT_SECTION_QUESTION_COUNT,
+            })
+        section_chain = budgeted_chain(
+            "questionnaire_section", QUESTIONNAIRE_SECTION_PROMPT, SectionQuestionsOutput,
+            lambda inputs: output_budget(question=1.5 * inputs["target_question_count"],
+                                         calculation=inputs["target_question_count"]))
+        section_outputs = section_chain.batch(section_inputs, config={"max_concurrency": MAX_SECTION_CONCURRENCY},
+                                              return_exceptions=True)
+        for section_payload in section_payloads:
+            section_payload.report()
+
+        for section, output in zip(outline_sections, section_outputs):
+            if isinstance(output, Exception):
+                state["error"] = (state.get("error") or "") + f"Error generating section '{section.get('title')}': {output}"
+                print(f"Error generating section '{section.get('title')}': {output}")
+        section_outputs = [None if isinstance(output, Exception) else output for output in section_outputs]
+
+        # Merge: dedupe variable_names and assemble raw_indicator_calculation
+        generated_questionnaire = merge_section_outputs(outline_sections, section_outputs, title=outline.get("title"))
+        _set_questionnaire_title(state, generated_questionnaire)
+
+        all_existing_q_vars_set = QuestionnaireIndex(generated_questionnaire).question_vars()
+        for sec_idx, section in enumerate(generated_questionnaire["sections"]):
+            _process_generated_section(section, sec_idx, all_existing_q_vars_set, state, project_id=project_id)
+
+        state["questionnaire"] = generated_questionnaire
+        print(f"\n---Generated Questionnaire: {len(generated_questionnaire['sections'])} sections, "
+              f"{len(all_existing_q_vars_set)} questions---")
+
+    except Exception as e:
+        state["error"] = (state.get("error") or "") + f"Error generating questionnaire: {e}"
+        print(f"Error generating questionnaire: {e}")
+
+    return state
+
+
+def _resolve_modification_targets(q_index: QuestionnaireIndex, modification_prompt: str) -> ModificationTargets:
+    """
+    Resolves the sections a questionnaire modification touches: lexical matching first, then an LLM
+    call on the compact outline. Falls back to the full questionnaire when unsure.
+    """
+    targets = resolve_targets_lexically(q_index, modification_prompt)
+    if targets is not None:
+        return targets
+
+    full_scope: ModificationTargets = {"scope": FULL_SCOPE, "section_orders": [], "question_variable_names": []}
+    try:
+        targeting_chain = budgeted_chain(
+            "modification_targeting", MODIFICATION_TARGETING_PROMPT, ModificationTargetsOutput, output_budget(name=20)
+        )
+        response = targeting_chain.invoke({
+            "questionnaire_outline": compact_json(questionnaire_outline(q_index)),
+            "modification_prompt": modification_prompt
+        })
+    except Exception as e:
+        print(f"Warning: Modification targeting failed, sending the full questionnaire: {e}")
+        return full_scope
+
+    if not isinstance(response, dict) or response.get("needs_full_questionnaire"):
+        return full_scope
+    known_orders = q_index.section_orders()
+    orders = [order for order in response.get("section_orders") or [] if order in known_orders]
+    question_vars = [var for var in response.get("question_variable_names") or [] if var in q_index]
+    for var in question_vars:
+        section, _list_key, _position = q_index.locate(var)
+        if section.get("order") not in orders:
+            orders.append(section.get("order"))
+    return {"scope": LLM_SCOPE, "section_orders": orders, "question_variable_names": question_vars}
+
 
 # --- Langraph Node 4: modify_questionnaire_llm ---
 def modify_questionnaire_llm(state: GraphState) -> GraphState:
@@ -650,17 +1135,39 @@ def modify_questionnaire_llm(state: GraphState) -> GraphState:
         # Prepare business context
         business_context = f"Financial assessment questionnaire for small business income evaluation. Project ID: {project_id}"
         
+        # Shallow working copy: the section dicts and question lists are copied, the questions are shared.
+        # One index over it serves targeting, the scoped payload and then applying the modifications.
+        modified_questionnaire = current_questionnaire.copy()
+        modified_questionnaire["sections"] = [
+            {**sec, "core_questions": list(sec.get("core_questions") or []),
+             "conditional_questions": list(sec.get("conditional_questions") or [])}
+            for sec in modified_questionnaire.get("sections") or []
+        ]
+        q_index = QuestionnaireIndex(modified_questionnaire)
+
+        # Only the sections the request touches are sent in full, plus an outline of the rest
+        targets = _resolve_modification_targets(q_index, modification_prompt)
+        if targets["scope"] == FULL_SCOPE:
+            questionnaire_payload = current_questionnaire
+        else:
+            questionnaire_payload = build_scoped_questionnaire(q_index, targets["section_orders"])
+            print(f"Modification scoped ({targets['scope']}) to sections: {targets['section_orders']}")
+
         # Use the intelligent modification prompt
-        intelligent_chain = INTELLIGENT_QUESTIONNAIRE_MODIFICATIONS_PROMPT | llm.with_structured_output(
-            QuestionnaireModificationsOutput, method='function_calling'
+        intelligent_chain = budgeted_chain(
+            "questionnaire_modifications", INTELLIGENT_QUESTIONNAIRE_MODIFICATIONS_PROMPT, QuestionnaireModificationsOutput,
+            output_budget(modification=max(6, _question_count(questionnaire_payload) // 2))
         )
         
+        payload = PromptPayload("questionnaire_modifications")
+        payload.table("raw_indicators", raw_indicators, VARIABLE_SUMMARY_FIELDS)
+        payload.json("current_questionnaire", questionnaire_payload)
         llm_response = intelligent_chain.invoke({
+            **payload.values,
             "business_context": business_context,
-            "raw_indicators": json.dumps([{"var_name": ri["var_name"], "name": ri["name"]} for ri in raw_indicators]),
-            "current_questionnaire": json.dumps(current_questionnaire, indent=2),
             "modification_prompt": modification_prompt
         })
+        payload.report()
         
         # Store the modification reasoning
         if llm_response.get("reasoning"):
@@ -669,97 +1176,64 @@ def modify_questionnaire_llm(state: GraphState) -> GraphState:
             print(llm_response["reasoning"])
         
         modifications = llm_response
-        modified_questionnaire = current_questionnaire.copy()
-        modified_sections = [dict(sec) for sec in modified_questionnaire.get("sections", [])]
-        
+        if targets["scope"] != FULL_SCOPE:
+            for note in restrict_modifications_to_scope(modifications, targets["section_orders"]):
+                print(f"Warning: {note}")
         # Ensure raw_indicator_calculation exists and is a dict
         if "raw_indicator_calculation" not in modified_questionnaire or modified_questionnaire["raw_indicator_calculation"] is None:
             modified_questionnaire["raw_indicator_calculation"] = {}
         
-        modified_ri_calc = modified_questionnaire["raw_indicator_calculation"].copy()
-        
         # --- Apply Section Modifications ---
         
         # Remove sections
-        removed_section_orders = modifications.get("removed_section_orders", [])
+        removed_section_orders = modifications.get("removed_section_orders") or []
         if removed_section_orders:
-            modified_sections = [sec for sec in modified_sections if sec.get("order") not in removed_section_orders]
+            q_index.remove_sections(removed_section_orders)
             print(f"Removed {len(removed_section_orders)} sections.")
         
         # Update existing sections
-        updated_sections = modifications.get("updated_sections", [])
+        updated_sections = modifications.get("updated_sections") or []
         for update in updated_sections:
-            for section in modified_sections:
-                if section.get("order") == update.get("order"):
-                    section.update(update)
+            q_index.update_section(update)
         
         # Add new sections
-        new_sections = modifications.get("added_sections", [])
+        new_sections = modifications.get("added_sections") or []
         if new_sections:
-            # Ensure new sections have unique orders
-            existing_orders = {sec.get("order") for sec in modified_sections}
+            # add_section keeps section orders unique
             for new_sec in new_sections:
-                while new_sec.get("order") in existing_orders:
-                    new_sec["order"] = new_sec.get("order", 1) + 1
-                modified_sections.append(new_sec)
-                existing_orders.add(new_sec.get("order"))
+                q_index.add_section(new_sec)
             print(f"Added {len(new_sections)} new sections.")
         
         # --- Apply Question Modifications ---
         
         # Remove questions
-        removed_q_vars = modifications.get("removed_question_variable_names", [])
+        removed_q_vars = modifications.get("removed_question_variable_names") or []
         if removed_q_vars:
-            for section in modified_sections:
-                for qtype in ["core_questions", "conditional_questions"]:
-                    original_questions = section.get(qtype, [])
-                    filtered_questions = [q for q in original_questions if q.get("variable_name") not in removed_q_vars]
-                    section[qtype] = filtered_questions
+            q_index.remove_questions(removed_q_vars)
             print(f"Removed {len(removed_q_vars)} questions by variable_name.")
         
         # Update existing questions
-        updated_questions = modifications.get("updated_questions", [])
+        updated_questions = modifications.get("updated_questions") or []
         for update in updated_questions:
-            for section in modified_sections:
-                for qtype in ["core_questions", "conditional_questions"]:
-                    for question in section.get(qtype, []):
-                        if question.get("variable_name") == update.get("variable_name"):
-                            question.update(update)
+            q_index.update_question(update)
         
         # Add new questions
-        added_questions = modifications.get("added_questions", [])
+        added_questions = modifications.get("added_questions") or []
         if added_questions:
             # Track existing variable names to prevent duplicates
-            existing_var_names = set()
-            for section in modified_sections:
-                for qtype in ["core_questions", "conditional_questions"]:
-                    for q in section.get(qtype, []):
-                        existing_var_names.add(q.get("variable_name"))
+            existing_var_names = q_index.question_vars()
             
             for new_q in added_questions:
-                target_section = None
-                section_order = new_q.get("section_order")
+                target_section = q_index.section_by_order(new_q.get("section_order"))
                 is_core = new_q.get("is_core", True)
                 
-                # Find the target section
-                for section in modified_sections:
-                    if section.get("order") == section_order:
-                        target_section = section
-                        break
-                
                 if target_section:
                     question = new_q.get("question", {})
-                    if question.get("variable_name") not in existing_var_names:
+                    if question.get("variable_name") not in q_index:
                         _process_question_properties(question, is_core, existing_var_names, state, project_id=project_id)
-                        qtype = "core_questions" if is_core else "conditional_questions"
-                        if qtype not in target_section:
-                            target_section[qtype] = []
-                        target_section[qtype].append(question)
-                        existing_var_names.add(question.get("variable_name"))
+                        q_index.append_question(target_section, question, is_core)
             print(f"Added {len(added_questions)} new questions.")
         
-        # Update the questionnaire with modified sections
-        modified_questionnaire["sections"] = modified_sections
         state["questionnaire"] = modified_questionnaire
         
         print("\n--- Questionnaire Modification Summary ---")
@@ -780,46 +1254,6 @@ def modify_questionnaire_llm(state: GraphState) -> GraphState:
     return state
 
 
-def _upsert_single_item(table_name: str, item: Dict[str, Any], headers: Dict[str, str]) -> bool:
-    """
-    Alternative upsert method using Supabase's native upsert functionality.
-    This is more efficient as it does the upsert in a single operation.
-    """
-    item_id = item.get("id")
-    if not item_id:
-        print(f"❌ Error: Item for table '{table_name}' missing 'id'. Cannot upsert.")
-        return False
-
-    # FIX: Correct the URL construction by removing the redundant "/rest/v1"
-    url = f"{SUPABASE_URL}/{table_name}"
-    
-    # Use Supabase's upsert functionality
-    upsert_headers = headers.copy()
-    upsert_headers["Prefer"] = "resolution=merge-duplicates,return=minimal"
-    
-    print(f"\n🔄 Advanced upsert for '{table_name}' with ID '{item_id}'")
-    print(f"📡 URL: {url}")
-    print(f"📝 Payload: {json.dumps(item, indent=2)}")
-
-    try:
-        response = requests.post(url, headers=upsert_headers, json=item)
-        
-        print(f"📊 Status: {response.status_code}")
-        print(f"📋 Response: {response.text}")
-        
-        if response.status_code in [200, 201]:
-            print(f"✅ Successfully upserted record '{item_id}' in '{table_name}'")
-            return True
-        else:
-            print(f"❌ Upsert failed with status {response.status_code}")
-            print(f"📋 Error details: {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Error during advanced upsert for '{item_id}' in '{table_name}': {e}")
-        return False
-
-
 # --- Langraph Node 5: analyze_questionnaire_impact ---
 def analyze_questionnaire_impact(state: GraphState) -> GraphState:
     """
@@ -856,21 +1290,13 @@ def analyze_questionnaire_impact(state: GraphState) -> GraphState:
     # Create a quick lookup for raw indicator objects by var_name
     ri_varname_map = {ri['var_name']: ri for ri in raw_indicators}
 
+    # Single pass over the questionnaire; all lookups below go through the index
+    q_index = QuestionnaireIndex(questionnaire)
+
     # Track which raw indicators are explicitly covered by raw_indicators list in questions
-    explicitly_covered_ris = set()
-    all_question_vars = set()
+    explicitly_covered_ris = q_index.covered_raw_indicators()
     # New set to track RIs referenced by questions but not existing in state['raw_indicators']
-    referenced_but_missing_ris = set() 
-
-    for section in sections:
-        for q_list in [section.get('core_questions', []), section.get('conditional_questions', [])]:
-            for question in q_list:
-                all_question_vars.add(question.get('variable_name'))
-                for ri_name in question.get('raw_indicators', []):
-                    explicitly_covered_ris.add(ri_name)
-                    # Check if this referenced RI exists in our master list
-                    if ri_name not in ri_varname_map:
-                        referenced_but_missing_ris.add(ri_name)
+    referenced_but_missing_ris = {ri_name for ri_name in explicitly_covered_ris if ri_name not in ri_varname_map}
 
     # All raw indicators that are supposed to exist based on `state['raw_indicators']`
     existing_raw_indicator_names_in_state = {ri['var_name'] for ri in raw_indicators}
@@ -905,25 +1331,17 @@ def analyze_questionnaire_impact(state: GraphState) -> GraphState:
                 existing_raw_indicator_names_in_state.add(missing_ri_name) # Add to set to prevent re-adding
 
 
-    # Check for raw indicators whose calculation formula uses non-existent question variables
+    # Check for raw indicators whose calculation formula does not parse or reads unknown variables.
+    # Empty calculations are fine here: such RIs are taken from the questions capturing them.
     problemmatic_calculation_vars = []
-    # Identify all question variable names that currently exist in the questionnaire
-    existing_question_var_names = set()
-    for section in sections:
-        for q_list in [section.get('core_questions', []), section.get('conditional_questions', [])]:
-            for question in q_list:
-                existing_question_var_names.add(question.get('variable_name'))
+    known_names = known_variable_names(questionnaire, raw_indicators, state.get("decision_variables"))
 
     for ri_var_name, formula in ri_calculation_map.items():
-        if ri_var_name in ri_varname_map: # Only check if the RI itself exists
-            # Find all 'q_' type variables in the formula
-            import re
-            formula_question_vars = re.findall(r'\b(q_[a-zA-Z0-9_]+)\b', formula)
-            for fq_var in formula_question_vars:
-                if fq_var not in existing_question_var_names:
-                    problemmatic_calculation_vars.append(ri_var_name)
-                    print(f"Warning: Raw indicator '{ri_var_name}' formula references missing question variable '{fq_var}'.")
-                    break # Only need to flag once per RI
+        if ri_var_name in ri_varname_map and formula and formula.strip(): # Only check if the RI itself exists
+            validation = validate_expression(formula, known_names)
+            if validation["status"] in (SYNTAX_ERROR, UNKNOWN_IDENTIFIER):
+                problemmatic_calculation_vars.append(ri_var_name)
+                print(f"Warning: Raw indicator '{ri_var_name}' formula is invalid ({validation['status']}): {validation['message']}")
 
     # Combine all unique raw indicators that need attention
     # This list will now include any newly added placeholder RIs if they were referenced by questions
@@ -934,17 +1352,51 @@ def analyze_questionnaire_impact(state: GraphState) -> GraphState:
         list(referenced_but_missing_ris) # Include the newly created placeholder RIs here
     ))
 
+    if vars_to_address:
+        print(f"Raw indicators needing attention: {', '.join(vars_to_address)}")
+
+        # Deterministic remediation first; only what it cannot fix is sent to the LLM
+        local_remediation = remediate_coverage_locally(q_index, ri_varname_map, ri_calculation_map, vars_to_address,
+                                                       known_names=known_names)
+        for action in local_remediation["actions"]:
+            print(f"Local remediation: {action}")
+        if local_remediation["resolved"]:
+            print(f"Resolved locally without LLM: {', '.join(local_remediation['resolved'])}")
+        vars_to_address = local_remediation["unresolved"]
+
     if vars_to_address:
         state["error"] = (state.get("error") or "") + "Warning: Some raw indicators are not fully covered by questionnaire questions or have problematic calculations." # Concatenate
         print(state["error"])
-        print(f"Raw indicators needing attention: {', '.join(vars_to_address)}")
 
         # Attempt to generate new questions for uncovered/problemmatic variables
         print("\n---Attempting to generate new questions for affected raw indicators---")
         # Filter uncovered_vars_info to include newly added placeholder RIs that need questions
         uncovered_vars_info = [ri_varname_map[var_name] for var_name in vars_to_address if var_name in ri_varname_map]
 
+        # New questions go to the first mandatory section, falling back to the first section
+        target_section = None
+        for section in sections:
+            if section.get('is_mandatory', False) and section.get('core_questions') is not None:
+                target_section = section
+                break
+        if not target_section and sections:
+            target_section = sections[0]
+
         if uncovered_vars_info:
+            # Only the sections relevant to the residual RIs are attached, plus an outline of the rest
+            relevant_sections = select_relevant_sections(q_index, uncovered_vars_info, target_section)
+            questionnaire_context = {
+                "sections": relevant_sections,
+                "other_sections": [
+                    {"order": section.get("order"), "title": section.get("title")}
+                    for section in sections if not any(section is chosen for chosen in relevant_sections)
+                ],
+                "raw_indicator_calculation": {
+                    var_name: ri_calculation_map[var_name] for var_name in vars_to_address if var_name in ri_calculation_map
+                },
+                "existing_question_variable_names": sorted(v for v in q_index.question_vars() if v)
+            }
+
             remediation_prompt_template = ChatPromptTemplate.from_messages( # Re-defining here for specific remediation context
                 [
                     ("system",
@@ -972,13 +1424,16 @@ def analyze_questionnaire_impact(state: GraphState) -> GraphState:
                 ]
             )
 
-            remediation_chain = remediation_prompt_template | llm.with_structured_output(RemediationOutput, method='function_calling')
+            remediation_chain = budgeted_chain(
+                "coverage_remediation", remediation_prompt_template, RemediationOutput,
+                output_budget(question=2 * len(uncovered_vars_info), calculation=len(uncovered_vars_info)))
 
             try:
-                remediation_response_raw = remediation_chain.invoke({ # Changed variable name to emphasize raw output
-                    "uncovered_vars_json": json.dumps(uncovered_vars_info, indent=2),
-                    "questionnaire_json": json.dumps(questionnaire, indent=2)
-                })
+                payload = PromptPayload("coverage_remediation")
+                payload.table("uncovered_vars_json", uncovered_vars_info, VARIABLE_DESCRIBED_FIELDS)
+                payload.json("questionnaire_json", questionnaire_context)
+                remediation_response_raw = remediation_chain.invoke(payload.values) # Changed variable name to emphasize raw output
+                payload.report()
 
                 print(f"DEBUG: Raw remediation_response_raw from LLM: {remediation_response_raw}")
                 print(f"DEBUG: Type of remediation_response_raw: {type(remediation_response_raw)}")
@@ -1003,23 +1458,14 @@ def analyze_questionnaire_impact(state: GraphState) -> GraphState:
 
 
                 if new_questions_data:
-                    target_section = None
-                    # Try to find an existing mandatory core section
-                    for section in sections:
-                        if section.get('is_mandatory', False) and section.get('core_questions') is not None:
-                            target_section = section
-                            break
-                    if not target_section and sections: # If no mandatory core, try first existing section
-                        target_section = sections[0]
                     if target_section:
-                        # Prevent duplicate variable_name in the section
-                        existing_var_names = {q['variable_name'] for q in target_section.get('core_questions', [])}
+                        # Prevent duplicate variable_name across the questionnaire
+                        existing_var_names = q_index.question_vars()
                         added_count = 0
                         for new_q_data in new_questions_data:
-                            if new_q_data['variable_name'] not in existing_var_names:
+                            if new_q_data['variable_name'] not in q_index:
                                 _process_question_properties(new_q_data, True, existing_var_names, state, project_id=state.get("project_id"))
-                                target_section['core_questions'].append(new_q_data)
-                                existing_var_names.add(new_q_data['variable_name'])
+                                q_index.append_question(target_section, new_q_data, is_core=True)
                                 added_count += 1
                             else:
                                 print(f"Warning: Skipped adding duplicate question with variable_name '{new_q_data['variable_name']}' to section '{target_section.get('title', target_section['order'])}'.")
@@ -1048,52 +1494,38 @@ def analyze_questionnaire_impact(state: GraphState) -> GraphState:
     return state
 
 # --- Langraph Node 6: write_to_supabase ---
-def write_to_supabase(state: GraphState) -> GraphState:
+def build_supabase_rows(state: GraphState) -> Dict[str, List[Dict[str, Any]]]:
     """
-    Writes the generated (and potentially LLM-modified) raw indicators and decision variables
-    and questionnaire questions to your Supabase tables. This function now performs
-    upsert operations (update if exists, insert if new) for individual records.
-    Also saves the prompt, title, and project_id to the 'prompts' table.
+    Builds the rows of the Supabase tables (raw_indicators, decision_variables, questions, prompts)
+    from the state. Tables whose state field is None are omitted.
     """
-    print("\n---WRITING TO SUPABASE---")
-    state["error"] = state.get("error", "")
-
-    headers = {
-        "apikey": SUPABASE_API_KEY,
-        "Authorization": f"Bearer {SUPABASE_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    error_occurred = False
+    rows_by_table: Dict[str, List[Dict[str, Any]]] = {}
 
-    # --- Write Raw Indicators ---
+    # --- Raw Indicators ---
     raw_indicators_to_write = state.get("raw_indicators")
-    if raw_indicators_to_write:
-        print(f"Attempting to upsert {len(raw_indicators_to_write)} raw indicators...")
+    if raw_indicators_to_write is not None:
         for var in raw_indicators_to_write:
             var["project_id"] = state.get("project_id")
-            if not _upsert_single_item("raw_indicators", var, headers): 
-                error_occurred = True
+        rows_by_table["raw_indicators"] = raw_indicators_to_write
     else:
         print("No raw indicators found in state to write to Supabase.")
 
-    # --- Write Decision Variables ---
+    # --- Decision Variables ---
     decision_vars_to_write = state.get("decision_variables")
-    if decision_vars_to_write:
-        print(f"Attempting to upsert {len(decision_vars_to_write)} decision variables...")
+    if decision_vars_to_write is not None:
         for var in decision_vars_to_write:
             var["project_id"] = state.get("project_id")
-            if not _upsert_single_item("decision_variables", var, headers):
-                error_occurred = True
+        rows_by_table["decision_variables"] = decision_vars_to_write
     else:
         print("No decision variables found in state to write to Supabase.")
 
-    # --- Write Questionnaire Questions to 'questions' table ---
+    # --- Questionnaire Questions ('questions' table) ---
     questionnaire_data = state.get("questionnaire")
     raw_indicators_map = {ri['var_name']: ri for ri in (state.get("raw_indicators") or [])}
 
     questions_to_supabase = []
-    if questionnaire_data and questionnaire_data.get("sections"):
-        for section in questionnaire_data["sections"]:
+    if questionnaire_data is not None:
+        for section in questionnaire_data.get("sections") or []:
             for q_type_list, is_core_q_flag in [
                 (section.get('core_questions', []), True),
                 (section.get('conditional_questions', []), False)
@@ -1121,37 +1553,62 @@ def write_to_supabase(state: GraphState) -> GraphState:
                         "is_mandatory": is_q_mandatory_in_db,
                         "section_triggering_criteria": section.get("triggering_criteria"),
                         "question_var_name": question["variable_name"],
-                        "impacted_raw_indicators": json.dumps(impacted_ri_details),
+                        "impacted_raw_indicators": serialization.dumps_str(impacted_ri_details),
                         "question_triggering_criteria": question.get("triggering_criteria"),
                         "is_conditional": question.get("is_conditional", False),
                         "formula": question.get("formula")
                     }
                     questions_to_supabase.append(question_entry)
-        print(f"Attempting to upsert {len(questions_to_supabase)} questions...")
-        for q_entry in questions_to_supabase:
-            if not _upsert_single_item("questions", q_entry, headers):
-                error_occurred = True
+        rows_by_table["questions"] = questions_to_supabase
     else:
-        print("No questionnaire sections found in state to write to Supabase 'questions' table.")
+        print("No questionnaire found in state to write to Supabase 'questions' table.")
 
-    # --- Write Prompt, Title, and Project ID to 'prompts' table ---
+    # --- Prompt, Title, and Project ID ('prompts' table) ---
     prompt_entry = {
         "id": state.get("project_id"),  # Use project_id as the unique id
         "project_id": state.get("project_id"),
         "prompt": state.get("prompt"),
         "title": state.get("questionnaire_title", "")
     }
-    print(f"Upserting prompt entry to 'prompts' table: {prompt_entry}")
-    if not _upsert_single_item("prompts", prompt_entry, headers):
-        error_occurred = True
+    rows_by_table["prompts"] = [prompt_entry]
+    return rows_by_table
+
+
+def write_to_supabase(state: GraphState) -> GraphState:
+    """
+    Writes the generated (and potentially LLM-modified) raw indicators and decision variables
+    and questionnaire questions to your Supabase tables. This function now performs
+    upsert operations (update if exists, insert if new) for individual records.
+    Also saves the prompt, title, and project_id to the 'prompts' table.
+    The tables live in the configured storage backend (Supabase or SQLite, see storage.py).
+    Only rows changed since the last save are written; rows that disappeared (e.g. removed
+    questions) are deleted. Tables whose state field is None are left untouched.
+    """
+    print("\n---WRITING TO SUPABASE---")
+    state["error"] = state.get("error", "")
 
-    if error_occurred:
-        pass
+    summary = save_project_rows(get_storage(), state.get("project_id"), build_supabase_rows(state))
+    if summary["failed_tables"]:
+        print(f"Save incomplete for tables: {', '.join(summary['failed_tables'])}")
     else:
         state["error"] = None
 
     return state
 
+def enqueue_write_to_supabase(state: GraphState) -> GraphState:
+    """
+    Durable write-behind variant of write_to_supabase: commits the rows to the local save outbox and
+    returns; the outbox flusher persists them in the background (see save_outbox.py). The save can be
+    followed with get_outbox().status(project_id).
+    """
+    print("\n---QUEUEING SAVE TO SUPABASE---")
+    state["error"] = state.get("error", "")
+    save_id = get_outbox().enqueue(state.get("project_id"), build_supabase_rows(state))
+    print(f"Save {save_id} of project {state.get('project_id')} queued.")
+    state["status"] = "save_queued"
+    state["error"] = None
+    return state
+
 # --- NEW: Dependency Analysis Functions ---
 
 def analyze_variable_dependencies(raw_indicators: List[Dict], decision_variables: List[Dict]) -> Dict[str, Any]:
@@ -1350,28 +1807,64 @@ def synchronize_variables(state: GraphState) -> GraphState:
 # --- Supabase fetch utility ---
 def fetch_supabase_tables() -> Dict[str, Any]:
     """
-    Fetch all rows from the three Supabase tables: raw_indicators, decision_variables, questionnaire.
-    Returns a dict with keys 'raw_indicators', 'decision_variables', 'questionnaire'.
+    Fetch all rows from the Supabase tables: raw_indicators, decision_variables, questions, prompts.
+    Returns a dict keyed by table name.
     """
-    import requests
-    headers = {
-        "apikey": SUPABASE_API_KEY,
-        "Authorization": f"Bearer {SUPABASE_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    base_url = SUPABASE_URL
+    storage = get_storage()
     result = {}
-    for table in ["raw_indicators", "decision_variables", "questions", "prompts"]:
-        url = f"{base_url}/{table}?select=*"
+    for table in STORAGE_TABLES:
         try:
-            resp = requests.get(url, headers=headers)
-            resp.raise_for_status()
-            result[table] = resp.json()
+            result[table] = storage.fetch_all(table)
         except Exception as e:
-            print(f"Error fetching {table} from Supabase: {e}")
+            print(f"Error fetching {table} from {storage.name}: {e}")
             result[table] = []
     return result
 
+def fetch_project_tables(project_id: str, failed_tables: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Same as fetch_supabase_tables, restricted to the rows of one project.
+    Tables that could not be read come back empty; their names are appended to failed_tables if given.
+    """
+    storage = get_storage()
+    result = {}
+    for table in STORAGE_TABLES:
+        try:
+            result[table] = storage.fetch_project(table, project_id)
+        except Exception as e:
+            print(f"Error fetching {table} of project {project_id} from {storage.name}: {e}")
+            result[table] = []
+            if failed_tables is not None:
+                failed_tables.append(table)
+    return result
+
+async def afetch_supabase_tables() -> Dict[str, Any]:
+    """Async variant of fetch_supabase_tables for the API; the tables are read concurrently."""
+    storage = get_storage()
+
+    async def fetch(table: str) -> List[Dict[str, Any]]:
+        try:
+            return await storage.afetch_all(table)
+        except Exception as e:
+            print(f"Error fetching {table} from {storage.name}: {e}")
+            return []
+
+    return dict(zip(STORAGE_TABLES, await asyncio.gather(*(fetch(table) for table in STORAGE_TABLES))))
+
+async def afetch_project_tables(project_id: str, failed_tables: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Async variant of fetch_project_tables for the API; the tables are read concurrently."""
+    storage = get_storage()
+
+    async def fetch(table: str) -> List[Dict[str, Any]]:
+        try:
+            return await storage.afetch_project(table, project_id)
+        except Exception as e:
+            print(f"Error fetching {table} of project {project_id} from {storage.name}: {e}")
+            if failed_tables is not None:
+                failed_tables.append(table)
+            return []
+
+    return dict(zip(STORAGE_TABLES, await asyncio.gather(*(fetch(table) for table in STORAGE_TABLES))))
+
 def export_sections_for_card_generator(state):
     questionnaire = state.get("questionnaire")
     if not questionnaire:
@@ -1385,25 +1878,28 @@ def export_sections_for_card_generator(state):
             "section_title": section.get("title"),
             "section_order": section.get("order"),
             "section_description": section.get("description", ""),
-            "core_questions": section.get("core_questions", []),
-            "conditional_questions": section.get("conditional_questions", [])
+            "core_questions": project(section.get("core_questions", []), CARD_QUESTION_FIELDS),
+            "conditional_questions": project(section.get("conditional_questions", []), CARD_QUESTION_FIELDS)
         }
         sections.append(section_obj)
-    sections_json = json.dumps(sections, indent=2)
+    payload = PromptPayload("card_generator")
+    sections_json = payload.json("sections_json", sections)
+    payload.report()
     prompt = EXPORT_SECTION_CARDS_PROMPT.format(title=title, sections_json=sections_json)
-    state["card_generator_prompt"] = prompt
+    state["card_generator_prompt"] = f"{EXPORT_SECTION_CARDS_SYSTEM}\n\n{prompt}"
 
     # --- LLM CALL ---
     openai.api_key = os.getenv("OPENAI_API_KEY")  # Make sure your key is set in env vars
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
+    started = time.perf_counter()
+    response = model_router.complete(
+        "export_section_cards",
+        [
+            {"role": "system", "content": EXPORT_SECTION_CARDS_SYSTEM},
             {"role": "user", "content": prompt}
-        ],
-        max_tokens=2000,
-        temperature=0.3
+        ]
     )
+    record_usage("export_section_cards", response, (time.perf_counter() - started) * 1000,
+                 system_text=EXPORT_SECTION_CARDS_SYSTEM)
     llm_output = response.choices[0].message.content
     state["card_generator_llm_output"] = llm_output
     return llm_output
\ No newline at end of file
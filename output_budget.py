@@ -0,0 +1,261 @@
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict, Union
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.json import parse_partial_json
+
+from metrics import CallLog, register_section
+from model_routing import model_router
+from prompt_payloads import compact_json
+
+# --- Output token budgets ---
+# Structured chains used to run without max_tokens, so a runaway generation could keep emitting output for
+# minutes and a truncated function call surfaced only as a generic parse error. budgeted_chain gives every
+# call a max_tokens derived from the size of the output it is expected to produce (output_budget: tokens
+# per expected item, with headroom). When the model stops at the budget (finish_reason=length) the complete
+# part of the truncated JSON is kept and a targeted continuation asks only for the missing items of the
+# field that was cut and the fields after it, instead of rerunning the whole call. Every call records how
+# much of its budget it used.
+# A chain built with on_partial streams its first call: the partial output is passed to on_partial whenever
+# an object in it is complete, so a node can start dependent work before the whole output has arrived.
+
+# Approximate output tokens per item of the structured outputs (compact function-call JSON, o200k tokens)
+OUTPUT_TOKENS_PER_ITEM = {
+    "raw_indicator": 130,
+    "decision_variable": 180,
+    "question": 110,
+    "section": 100,
+    "calculation": 30,  # One raw_indicator_calculation entry
+    "name": 8,  # One var_name reference in a list
+    "modification": 150,  # One added/updated/removed variable or question
+}
+BASE_OUTPUT_TOKENS = 100  # Function-call wrapper and scalar fields
+BUDGET_HEADROOM = 1.5
+MIN_OUTPUT_BUDGET = 256
+MAX_OUTPUT_BUDGET = 16384  # gpt-4o / gpt-4o-mini output limit
+MAX_CONTINUATIONS = 2
+
+# Item fields that identify an already generated item to the continuation call
+IDENTITY_FIELDS = ("var_name", "variable_name", "title", "id")
+
+MAX_BUDGET_REPORTS = 200
+_budget_reports: "CallLog[BudgetReport]" = CallLog(MAX_BUDGET_REPORTS)
+
+
+class BudgetReport(TypedDict):
+    call: str  # Model route node
+    max_tokens: int  # Output budget of the call
+    output_tokens: Optional[int]  # Output tokens of the first response (None when the backend reports no usage)
+    usage_ratio: Optional[float]  # output_tokens / max_tokens
+    truncated: bool  # The first response hit the budget
+    continuations: int  # Continuation calls made to complete a truncated output
+    continuation_output_tokens: int
+
+
+class OutputTruncatedError(RuntimeError):
+    """Raised when an output is still cut off at the budget after MAX_CONTINUATIONS continuations."""
+
+
+class PartialOutputListener(BaseCallbackHandler):
+    """
+    Passes the partial output of a streaming structured call to on_partial. The streamed function-call
+    arguments (or JSON content) are parsed only when a chunk closes an object, which keeps the parsing
+    cost proportional to the number of items instead of the number of tokens.
+    """
+
+    def __init__(self, on_partial: Callable[[Dict[str, Any]], None]):
+        self.on_partial = on_partial
+        self._buffers: Dict[UUID, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def on_llm_new_token(self, token: str, *, chunk: Any = None, run_id: UUID, **kwargs: Any) -> None:
+        tool_call_chunks = getattr(getattr(chunk, "message", None), "tool_call_chunks", None)
+        text = "".join(part.get("args") or "" for part in tool_call_chunks) if tool_call_chunks else token
+        if not isinstance(text, str) or not text:
+            return
+        with self._lock:
+            buffer = self._buffers.setdefault(run_id, [])
+            buffer.append(text)
+            streamed = "".join(buffer) if "}" in text else None
+        if streamed is None:
+            return
+        partial = parse_partial_json(streamed)
+        if isinstance(partial, dict):
+            try:
+                self.on_partial(partial)
+            except Exception as e:
+                print(f"Warning: Partial output handler failed: {e}")
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._buffers.pop(run_id, None)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._buffers.pop(run_id, None)
+
+
+def output_budget(**expected_items: float) -> int:
+    """max_tokens for an output with the given expected item counts, e.g. output_budget(question=12, section=1)."""
+    expected = BASE_OUTPUT_TOKENS + sum(OUTPUT_TOKENS_PER_ITEM[kind] * count for kind, count in expected_items.items())
+    return max(MIN_OUTPUT_BUDGET, min(MAX_OUTPUT_BUDGET, math.ceil(expected * BUDGET_HEADROOM)))
+
+
+def _output_tokens(raw: Any) -> Optional[int]:
+    usage = getattr(raw, "usage_metadata", None)
+    return usage.get("output_tokens") if usage else None
+
+
+def _is_truncated(raw: Any) -> bool:
+    return (getattr(raw, "response_metadata", None) or {}).get("finish_reason") == "length"
+
+
+def _raw_arguments(raw: Any) -> Dict[str, Any]:
+    """The (possibly partial) JSON arguments of a function call or JSON-mode response, parsed tolerantly."""
+    if getattr(raw, "tool_calls", None):
+        return dict(raw.tool_calls[0]["args"])
+    invalid = getattr(raw, "invalid_tool_calls", None)
+    text = invalid[0].get("args") if invalid else getattr(raw, "content", None)
+    parsed = parse_partial_json(text) if isinstance(text, str) and text.strip() else None
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def _identity(item: Any) -> Any:
+    if isinstance(item, dict):
+        for field in IDENTITY_FIELDS:
+            if item.get(field):
+                return item[field]
+    return None
+
+
+def _trim_cut_field(arguments: Dict[str, Any], cut_field: str) -> None:
+    """Drops the item the output was cut inside of (the last one of the field being written)."""
+    value = arguments.get(cut_field)
+    if isinstance(value, list) and value:
+        arguments[cut_field] = value[:-1]
+    elif isinstance(value, dict) and value:
+        arguments[cut_field] = dict(list(value.items())[:-1])
+    else:
+        arguments.pop(cut_field, None)
+
+
+def _continuation_message(arguments: Dict[str, Any], cut_field: str) -> HumanMessage:
+    done = [field for field in arguments if field != cut_field]
+    written = arguments.get(cut_field)
+    if isinstance(written, list) and written:
+        identities = [_identity(item) for item in written]
+        listed = compact_json(identities) if all(identities) else f"the first {len(written)}"
+        progress = f"These items of '{cut_field}' are complete: {listed}. Return only the remaining items of '{cut_field}'"
+    elif isinstance(written, dict) and written:
+        progress = (f"These entries of '{cut_field}' are complete: {compact_json(list(written))}. "
+                    f"Return only the remaining entries of '{cut_field}'")
+    else:
+        progress = f"Return '{cut_field}' in full"
+    completed = f" The fields {compact_json(done)} are complete; leave them empty." if done else ""
+    return HumanMessage(content=(
+        "Your previous answer was cut off by the output token limit. " + progress +
+        ", plus any fields that come after it, in the same format. Do not repeat anything already written." + completed))
+
+
+def _merge_continuation(arguments: Dict[str, Any], continuation: Dict[str, Any], cut_field: str,
+                        done: List[str]) -> Dict[str, Any]:
+    merged = dict(arguments)
+    for field, value in continuation.items():
+        if field in done:
+            continue
+        current = merged.get(field)
+        if field == cut_field and isinstance(current, list) and isinstance(value, list):
+            seen = {_identity(item) for item in current} - {None}
+            merged[field] = current + [item for item in value if _identity(item) is None or _identity(item) not in seen]
+        elif field == cut_field and isinstance(current, dict) and isinstance(value, dict):
+            merged[field] = {**current, **value}
+        else:
+            merged[field] = value
+    return merged
+
+
+def _complete_truncated(node: str, structured: Any, messages: List[BaseMessage], raw: Any) -> Tuple[Dict[str, Any], int, int]:
+    """Completes a truncated output with targeted continuations; returns (output, continuations, output tokens)."""
+    arguments = latest = _raw_arguments(raw)
+    completed: List[str] = []
+    continuations = continuation_tokens = 0
+    while True:
+        # The field written last when the budget ran out is the one to resume
+        cut_field = list(latest)[-1] if latest else None
+        if cut_field is None or cut_field in completed:
+            raise OutputTruncatedError(f"{node} output was truncated at the max_tokens budget with nothing to resume")
+        if continuations >= MAX_CONTINUATIONS:
+            raise OutputTruncatedError(f"{node} output still truncated at the max_tokens budget after "
+                                       f"{continuations} continuations")
+        _trim_cut_field(arguments, cut_field)
+        completed = [field for field in arguments if field != cut_field]
+        print(f"{node}: output truncated at the token budget inside '{cut_field}'; requesting the remainder")
+        result = structured.invoke(messages + [_continuation_message(arguments, cut_field)])
+        continuations += 1
+        continuation_tokens += _output_tokens(result["raw"]) or 0
+        latest = _raw_arguments(result["raw"])
+        arguments = _merge_continuation(arguments, latest, cut_field, completed)
+        if not _is_truncated(result["raw"]):
+            return arguments, continuations, continuation_tokens
+
+
+def budgeted_chain(node: str, prompt: ChatPromptTemplate, schema: Any,
+                   budget: Union[int, Callable[[Dict[str, Any]], int]], method: str = 'function_calling',
+                   on_partial: Optional[Callable[[Dict[str, Any]], None]] = None) -> RunnableLambda:
+    """
+    prompt | model_router.structured(node, schema) with max_tokens = budget (or budget(inputs)) per call,
+    truncation detection and targeted continuation. Supports invoke and batch like the plain chain.
+    With on_partial, the first call streams and on_partial receives its partial output as objects complete.
+    """
+    def invoke(inputs: Dict[str, Any]) -> Any:
+        max_tokens = budget(inputs) if callable(budget) else budget
+        structured = model_router.structured(node, schema, streaming=on_partial is not None, method=method,
+                                             include_raw=True, max_tokens=max_tokens)
+        messages = prompt.format_messages(**inputs)
+        config = {"callbacks": [PartialOutputListener(on_partial)]} if on_partial is not None else None
+        result = structured.invoke(messages, config=config)
+        raw = result["raw"]
+        output_tokens = _output_tokens(raw)
+        report: BudgetReport = {
+            "call": node,
+            "max_tokens": max_tokens,
+            "output_tokens": output_tokens,
+            "usage_ratio": round(output_tokens / max_tokens, 3) if output_tokens is not None else None,
+            "truncated": _is_truncated(raw),
+            "continuations": 0,
+            "continuation_output_tokens": 0,
+        }
+        try:
+            if not report["truncated"]:
+                if result.get("parsing_error") is not None:
+                    raise result["parsing_error"]
+                return result["parsed"]
+            output, report["continuations"], report["continuation_output_tokens"] = _complete_truncated(
+                node, structured, messages, raw)
+            return output
+        finally:
+            _budget_reports.append(report)
+            print(f"Output budget [{node}]: {output_tokens}/{max_tokens} tokens"
+                  f"{' (truncated, %d continuations)' % report['continuations'] if report['truncated'] else ''}")
+
+    return RunnableLambda(invoke, name=f"{node}_budgeted")
+
+
+def get_budget_report() -> Dict[str, Any]:
+    """Most recent budget reports (oldest first) with truncation and continuation totals."""
+    reports = _budget_reports.entries()
+    ratios = [report["usage_ratio"] for report in reports if report["usage_ratio"] is not None]
+    return {
+        "calls": reports,
+        "truncated_calls": sum(1 for report in reports if report["truncated"]),
+        "continuations": sum(report["continuations"] for report in reports),
+        "max_usage_ratio": max(ratios) if ratios else None,
+    }
+
+
+register_section("output_budget", get_budget_report)
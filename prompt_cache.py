@@ -0,0 +1,177 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+import serialization
+from metrics import percentile_ms, register_section
+from prompt_payloads import count_tokens, tokens_are_exact
+from prompts import PROMPT_PREFIXES, prefix_hash
+
+# --- Prompt cache instrumentation ---
+# Every chain starts with a static, versioned system prefix (prompts.static_prefix_prompt), so repeated calls
+# of a chain can be served from OpenAI's prompt cache. PromptCacheRecorder is attached to every chat model
+# (llm_backend.get_chat_model): it identifies the chain by hashing the system message, times the call and
+# reads cached_tokens from the response usage. Plain chat completions report through record_usage.
+# get_prompt_cache_report aggregates per prefix: share of prompt tokens served from the cache, the input
+# cost saved (cached tokens are billed at CACHED_INPUT_PRICE_RATIO of the normal input price) and the
+# median latency of calls with and without a cache hit.
+# OpenAI only caches a prompt once its identical leading segment (tool schemas, then the messages) reaches
+# PROMPT_CACHE_MIN_TOKENS, so the first call of each prefix also measures the static part it sends (tool
+# schema + system message) and the report flags the prefixes that are long enough to ever be shared
+# between requests ("cacheable"). Shorter prefixes can still hit the cache when the per-request part that
+# follows is identical too (a retried or repeated request), but never across different requests.
+
+CACHED_INPUT_PRICE_RATIO = 0.5  # gpt-4o / gpt-4o-mini bill cached input tokens at half price
+PROMPT_CACHE_MIN_TOKENS = 1024
+MAX_LATENCY_SAMPLES = 500  # Per prefix and cache outcome
+UNREGISTERED_PREFIX = "unregistered"
+
+
+class _PrefixStats:
+    __slots__ = ("calls", "cache_hits", "prompt_tokens", "cached_tokens", "hit_latencies_ms", "miss_latencies_ms")
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.hit_latencies_ms: Deque[float] = deque(maxlen=MAX_LATENCY_SAMPLES)
+        self.miss_latencies_ms: Deque[float] = deque(maxlen=MAX_LATENCY_SAMPLES)
+
+
+_stats: Dict[str, _PrefixStats] = {}
+_stats_lock = threading.Lock()
+# Prefix name -> {"prefix_tokens", "prefix_tokens_exact", "cacheable"}
+_prefix_sizes: Dict[str, Dict[str, Any]] = {}
+
+
+def measure_prefix(name: str, system_text: Optional[str], tools: Optional[List[Any]] = None) -> None:
+    """Records the token size of a prefix's static part (tool schemas + system message), once per prefix."""
+    if name in _prefix_sizes:
+        return
+    tokens = count_tokens(system_text or "") + (count_tokens(serialization.dumps_str(tools)) if tools else 0)
+    _prefix_sizes[name] = {"prefix_tokens": tokens, "prefix_tokens_exact": tokens_are_exact(),
+                           "cacheable": tokens >= PROMPT_CACHE_MIN_TOKENS}
+
+
+def prefix_name(system_text: Optional[str]) -> str:
+    """Name of the registered prompt whose static prefix is system_text."""
+    if system_text:
+        digest = prefix_hash(system_text)
+        for name, prefix in PROMPT_PREFIXES.items():
+            if prefix["prefix_hash"] == digest:
+                return name
+    return UNREGISTERED_PREFIX
+
+
+def record_call(name: str, prompt_tokens: int, cached_tokens: int, latency_ms: Optional[float] = None) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(name, _PrefixStats())
+        stats.calls += 1
+        stats.prompt_tokens += prompt_tokens
+        stats.cached_tokens += cached_tokens
+        if cached_tokens:
+            stats.cache_hits += 1
+        if latency_ms is not None:
+            (stats.hit_latencies_ms if cached_tokens else stats.miss_latencies_ms).append(latency_ms)
+
+
+def _usage_from_result(response: LLMResult) -> Tuple[int, int]:
+    """(prompt_tokens, cached_tokens) of a chat model result."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                details = usage.get("input_token_details") or {}
+                return usage.get("input_tokens", 0), details.get("cache_read") or 0
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    details = token_usage.get("prompt_tokens_details") or {}
+    return token_usage.get("prompt_tokens") or 0, details.get("cached_tokens") or 0
+
+
+def record_usage(name: str, response: Any, latency_ms: Optional[float] = None,
+                 system_text: Optional[str] = None) -> None:
+    """Records the usage of a plain chat completion (openai ChatCompletion) sent with the prefix `name`."""
+    if system_text is not None:
+        measure_prefix(name, system_text)
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    record_call(name, usage.prompt_tokens or 0, getattr(details, "cached_tokens", None) or 0, latency_ms)
+
+
+class PromptCacheRecorder(BaseCallbackHandler):
+    """Records prompt and cached token counts and latency of every chat model call, per prompt prefix."""
+
+    def __init__(self):
+        self._runs: Dict[UUID, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *,
+                            run_id: UUID, **kwargs: Any) -> None:
+        system_text = next((message.content for message in (messages[0] if messages else [])
+                            if message.type == "system"), None)
+        system_text = system_text if isinstance(system_text, str) else None
+        name = prefix_name(system_text)
+        if name != UNREGISTERED_PREFIX:
+            invocation = kwargs.get("invocation_params") or {}
+            measure_prefix(name, system_text, invocation.get("tools") or invocation.get("functions"))
+        with self._lock:
+            self._runs[run_id] = (name, time.perf_counter())
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        name, started = run
+        prompt_tokens, cached_tokens = _usage_from_result(response)
+        record_call(name, prompt_tokens, cached_tokens, (time.perf_counter() - started) * 1000)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+
+prompt_cache_recorder = PromptCacheRecorder()
+
+
+def get_prompt_cache_report() -> Dict[str, Any]:
+    """Per prompt prefix: version, prefix hash, cache hit counts, cached token share, cost and latency win."""
+    with _stats_lock:
+        prefixes: Dict[str, Any] = {}
+        for name, stats in sorted(_stats.items()):
+            cached_ratio = stats.cached_tokens / stats.prompt_tokens if stats.prompt_tokens else 0.0
+            hit_ms, miss_ms = percentile_ms(stats.hit_latencies_ms, 0.5), percentile_ms(stats.miss_latencies_ms, 0.5)
+            prefixes[name] = {
+                **PROMPT_PREFIXES.get(name, {}),
+                **_prefix_sizes.get(name, {}),
+                "calls": stats.calls,
+                "cache_hits": stats.cache_hits,
+                "prompt_tokens": stats.prompt_tokens,
+                "cached_tokens": stats.cached_tokens,
+                "cached_token_ratio": round(cached_ratio, 3),
+                "input_cost_saving_ratio": round(cached_ratio * (1 - CACHED_INPUT_PRICE_RATIO), 3),
+                "p50_latency_ms_cache_hit": hit_ms,
+                "p50_latency_ms_cache_miss": miss_ms,
+                "latency_win_ms": round(miss_ms - hit_ms, 1) if hit_ms is not None and miss_ms is not None else None,
+            }
+        prompt_tokens = sum(stats.prompt_tokens for stats in _stats.values())
+        cached_tokens = sum(stats.cached_tokens for stats in _stats.values())
+    return {
+        "min_cacheable_prefix_tokens": PROMPT_CACHE_MIN_TOKENS,
+        "prefixes": prefixes,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "cached_token_ratio": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+    }
+
+
+register_section("prompt_cache", get_prompt_cache_report)
@@ -0,0 +1,153 @@
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, TypedDict
+
+from metrics import CallLog, register_section
+
+# --- Prompt payload encoding ---
+# Chain inputs used to be json.dumps(..., indent=2), where indentation whitespace alone costs 20-30% of
+# the payload tokens. PromptPayload encodes every structured input compactly, projects each object onto
+# the fields the prompt actually uses and records a token count per call next to the pretty-printed baseline.
+
+# tiktoken is optional (see requirements.txt) and downloads its encoding file on first use, so the tokenizer is
+# loaded on the first count rather than at import; without it token counts are a character-based estimate.
+_tokenizer_cache: Dict[str, Any] = {}
+_tokenizer_lock = threading.Lock()
+
+# Fields only needed by the database and the UI, never by a prompt
+PROMPT_OMITTED_FIELDS = ("project_id",)
+
+# Variable fields each prompt reads
+VARIABLE_SUMMARY_FIELDS = ("var_name", "name")
+VARIABLE_TYPED_FIELDS = ("var_name", "name", "type")
+VARIABLE_DESCRIBED_FIELDS = ("var_name", "name", "description", "type")
+VARIABLE_FORMULA_FIELDS = ("var_name", "name", "formula")
+
+# Question fields the card generator renders
+CARD_QUESTION_FIELDS = ("text", "type", "variable_name", "is_conditional")
+
+MAX_PAYLOAD_REPORTS = 200
+_payload_reports: "CallLog[PayloadReport]" = CallLog(MAX_PAYLOAD_REPORTS)
+
+
+class PayloadReport(TypedDict):
+    call: str  # Chain call the payload was built for
+    fields: Dict[str, int]  # Tokens per encoded input
+    tokens: int  # Tokens of all encoded inputs
+    baseline_tokens: int  # Tokens the same inputs would take as json.dumps(indent=2)
+    exact: bool  # False when counts are estimates (tiktoken unavailable)
+
+
+def _get_encoding() -> Any:
+    """tiktoken's o200k_base (gpt-4o / gpt-4o-mini tokenizer), loaded once; None when unavailable."""
+    if "encoding" not in _tokenizer_cache:
+        with _tokenizer_lock:
+            if "encoding" not in _tokenizer_cache:
+                try:
+                    import tiktoken
+                    _tokenizer_cache["encoding"] = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    print(f"Warning: tiktoken o200k_base unavailable ({e}); estimating token counts.")
+                    _tokenizer_cache["encoding"] = None
+    return _tokenizer_cache["encoding"]
+
+
+def tokens_are_exact() -> bool:
+    """False when count_tokens estimates (tiktoken or its encoding file unavailable)."""
+    return _get_encoding() is not None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def compact_json(value: Any) -> str:
+    """JSON without insignificant whitespace."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def project(records: Optional[Iterable[Dict]], fields: Sequence[str]) -> List[Dict]:
+    """Keeps only `fields` (in that order) of every record."""
+    return [{field: record.get(field) for field in fields} for record in records or []]
+
+
+def omit_fields(value: Any, omitted: Sequence[str] = PROMPT_OMITTED_FIELDS) -> Any:
+    """Recursively drops the given keys from nested dicts and lists."""
+    if isinstance(value, dict):
+        return {key: omit_fields(item, omitted) for key, item in value.items() if key not in omitted}
+    if isinstance(value, list):
+        return [omit_fields(item, omitted) for item in value]
+    return value
+
+
+def _table_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str) and "|" not in value and "\n" not in value:
+        return value
+    return compact_json(value)
+
+
+def encode_table(records: Optional[Iterable[Dict]], fields: Sequence[str]) -> str:
+    """
+    Encodes a list of flat records as a header line plus one '|'-separated row per record.
+    Cells that are not plain strings (or contain separators) are written as compact JSON; empty cells are null.
+    """
+    lines = ["|".join(fields)]
+    for record in records or []:
+        lines.append("|".join(_table_cell(record.get(field)) for field in fields))
+    return "\n".join(lines)
+
+
+class PromptPayload:
+    """
+    Collects the structured inputs of one chain call.
+    Usage: payload.table(...)/payload.json(...), then chain.invoke({**payload.values, ...}) and payload.report().
+    """
+
+    def __init__(self, call: str):
+        self.call = call
+        self.values: Dict[str, str] = {}
+        self._baseline: Dict[str, Any] = {}
+
+    def json(self, name: str, value: Any, omit: Sequence[str] = PROMPT_OMITTED_FIELDS) -> str:
+        self._baseline[name] = value
+        self.values[name] = compact_json(omit_fields(value, omit) if omit else value)
+        return self.values[name]
+
+    def table(self, name: str, records: Optional[Iterable[Dict]], fields: Sequence[str]) -> str:
+        records = list(records or [])
+        self._baseline[name] = project(records, fields)
+        self.values[name] = encode_table(records, fields)
+        return self.values[name]
+
+    def report(self) -> PayloadReport:
+        """Counts the tokens of the encoded inputs, records and prints the per-call report."""
+        field_tokens = {name: count_tokens(text) for name, text in self.values.items()}
+        baseline_tokens = sum(count_tokens(json.dumps(value, indent=2, default=str)) for value in self._baseline.values())
+        report: PayloadReport = {
+            "call": self.call,
+            "fields": field_tokens,
+            "tokens": sum(field_tokens.values()),
+            "baseline_tokens": baseline_tokens,
+            "exact": tokens_are_exact(),
+        }
+        _payload_reports.append(report)
+        print(f"Prompt payload [{self.call}]: {report['tokens']} tokens (pretty JSON: {baseline_tokens}) {field_tokens}")
+        return report
+
+
+def get_payload_report() -> Dict[str, Any]:
+    """Most recent payload reports (oldest first) with their token totals and the pretty-printed baseline."""
+    reports = _payload_reports.entries()
+    return {
+        "calls": reports,
+        "total_tokens": sum(report["tokens"] for report in reports),
+        "total_baseline_tokens": sum(report["baseline_tokens"] for report in reports),
+    }
+
+
+register_section("prompt_payloads", get_payload_report)
@@ -1,7 +1,53 @@
+import hashlib
+from typing import Any, Dict, List, Tuple
+
 from langchain_core.prompts import ChatPromptTemplate
 
+# --- Prompt assembly: static, versioned prefixes ---
+# OpenAI caches the longest identical leading segment of a request (tools/schema first, then the messages)
+# once it reaches 1024 tokens. Every chain is therefore built by static_prefix_prompt: a system message with
+# only fixed instructions (no template variables; enforced at import), followed by one human message carrying
+# all request data, ordered from the most to the least stable (project context, variables, then the request
+# itself and RAG context last). Bump a prompt's version whenever its system text changes; the version and a
+# hash of the rendered prefix are reported next to the measured cache hits (see prompt_cache.py).
+# Only some static prefixes (tool schema + system message) reach the 1024-token minimum, so only those chains
+# can share cached tokens between different requests. Approximate sizes (characters / 4; prompt_cache measures
+# them with the tokenizer at run time and reports "cacheable" per prefix):
+#   variable_modifications ~1300, questionnaire ~1500, questionnaire_modifications ~1400  -> cacheable
+#   raw_indicators ~740, decision_variables ~660, questionnaire_section ~700, template_adaptation ~630,
+#   export_section_cards ~480, questionnaire_outline ~420, js_refinement ~290, modification_targeting ~270,
+#   dependency_analysis ~260  -> below the minimum; cached only when a whole request repeats
+# The short prefixes are not padded to reach the minimum; whether padding pays off depends on the hit rate
+# of the cacheable chains, which get_prompt_cache_report measures.
+
+# Prompt name -> {"version", "prefix_hash"}
+PROMPT_PREFIXES: Dict[str, Dict[str, Any]] = {}
+
+
+def prefix_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def static_prefix_prompt(name: str, version: int, messages: List[Tuple[str, str]]) -> ChatPromptTemplate:
+    """Builds a (system, human) chat prompt whose system message is a static, cacheable prefix."""
+    prompt = ChatPromptTemplate.from_messages(messages)
+    if [role for role, _ in messages] != ["system", "human"]:
+        raise ValueError(f"Prompt '{name}' must consist of one system and one human message")
+    dynamic = prompt.messages[0].prompt.input_variables
+    if dynamic:
+        raise ValueError(f"Static prefix of prompt '{name}' contains template variables: {dynamic}")
+    register_prefix(name, version, prompt.messages[0].format().content)
+    return prompt
+
+
+def register_prefix(name: str, version: int, system_text: str) -> str:
+    """Records a static system prefix sent outside LangChain (plain chat completions); returns it unchanged."""
+    PROMPT_PREFIXES[name] = {"version": version, "prefix_hash": prefix_hash(system_text)}
+    return system_text
+
+
 # --- Prompt 1: Raw Indicators Generation (RAG enabled) ---
-RAW_INDICATORS_PROMPT = ChatPromptTemplate.from_messages(
+RAW_INDICATORS_PROMPT = static_prefix_prompt("raw_indicators", 2,
     [
         ("system",
          "You are an AI assistant for a fintech company lending to subprime customers with thin credit files. "
@@ -20,11 +66,9 @@ RAW_INDICATORS_PROMPT = ChatPromptTemplate.from_messages(
          "'formula' (always null for raw indicators), "
          "'function' (always null for raw indicators), "
          "'type' (the type of expected input for this variable, e.g., 'text', 'integer', 'float', 'boolean', 'dropdown'), "
-         "'value' (always null for raw indicators, this is for user input later), "
-         "'project_id' (the unique ID for the current project workflow). "
+         "'value' (always null for raw indicators, this is for user input later). "
          "**Ensure ALL fields in the schema are present and correctly formatted, including 'type', 'priority', 'impact_score', 'description', 'priority_rationale', and 'function'.**" # Explicit reminder
          "Generate atleast 15 realistic and useful raw indicators that are relevant to small business income assessment. "
-         "\n\n--- Supplementary Context from Historical Data (use to inspire and refine, but prioritize main task and schema adherence) ---\n{context}\n----------------------------------------------------------------------" # Moved to end, clarified role
          "Important note: The prompt given by the user might contain important information about the business context. Use it to generate raw indicators that are relevant to the business context. "
          "For example: If the user says 'The business is a small grocery store with 4 employees and earnings of Rs 6000 per month', generate raw indicators that are relevant to a grocery store keeping in mind its properties "
          "Remember the location of the business is in India, so use Indian currency and units: Rupees, Kilometers, etc. "
@@ -34,13 +78,14 @@ RAW_INDICATORS_PROMPT = ChatPromptTemplate.from_messages(
          "Provide the output in JSON format, strictly following the RawIndicatorsOutput schema. "
          "Ensure 'formula' is always null for raw indicators. "
          "Ensure 'function' is a human-readable assignment or math-like expression for UI display. "
-         "Ensure 'impact_score' (integer 0-100, higher means more important) and 'project_id' are included in each variable object using the provided project ID."
+         "Ensure 'impact_score' (integer 0-100, higher means more important) is included in each variable object."
+         "\n\n--- Supplementary Context from Historical Data (use to inspire and refine, but prioritize main task and schema adherence) ---\n{context}\n----------------------------------------------------------------------" # Last, so the system text stays a cacheable prefix
         )
     ]
 )
 
 # --- Prompt 2: Decision Variables Generation (RAG enabled) ---
-DECISION_VARIABLES_PROMPT = ChatPromptTemplate.from_messages(
+DECISION_VARIABLES_PROMPT = static_prefix_prompt("decision_variables", 2,
     [
         ("system",
          "You are an AI assistant helping a fintech company. Your task is to generate "
@@ -52,7 +97,6 @@ DECISION_VARIABLES_PROMPT = ChatPromptTemplate.from_messages(
          "'type' (e.g., 'float'), and a 'formula' (JavaScript string) "
          "that calculates its value based on other 'var_name's. 'value' should be null. "
          "'function' (a human-readable assignment or math-like expression for UI display, e.g., 'weekly_revenue = daily_sales * operating_days'), "
-         "Ensure 'project_id' is included. "
          "**Generate meaningful and accurate JavaScript formulas which tell how the decision variables are to be computed from the raw indicators, strictly adhering to the schema.**" # Explicit reminder
          "**Also generate a 'function' field for each variable, which is a human-readable assignment or math-like expression for UI display.**" # New requirement
          "**IMPORTANT**: For each decision variable, include a detailed rationale in the 'priority_rationale' field explaining why this variable is important for income assessment and decision-making.**" # New requirement
@@ -60,7 +104,6 @@ DECISION_VARIABLES_PROMPT = ChatPromptTemplate.from_messages(
          "Important note: The prompt given by the user might contain important information about the business context. Use it to generate decision variables that are relevant to the business context. "
          "For example: If the user says 'The business is a small grocery store with 4 employees and earnings of Rs 6000 per month', generate decision variablesthat are relevant to a grocery store keeping in mind its properties "
          "Remember the location of the business is in India, so use Indian currency and units: Rupees, Kilometers, etc. "
-         "\n\n--- Supplementary Context from Historical Data (use to inspire and refine, but prioritize main task and schema adherence) ---\n{context}\n----------------------------------------------------------------------" # Moved to end, clarified role
         ),
         ("human", "Given the following raw indicators:\n{raw_indicators}\n\n"
          "And considering these existing decision variables for modification or reference:\n{existing_decision_variables}\n\n"
@@ -71,13 +114,14 @@ DECISION_VARIABLES_PROMPT = ChatPromptTemplate.from_messages(
          "Example formula: 'return q_daily_sales * q_num_days_week * 4;' if q_daily_sales is a raw indicator. "
          "Example function: 'weekly_revenue = daily_sales * operating_days' for UI display. "
          "Only include variables that are directly calculable from the provided raw indicators. "
-         "Ensure 'impact_score' (integer 0-100, higher means more important) and 'project_id' are included in each variable object using the provided project ID."
+         "Ensure 'impact_score' (integer 0-100, higher means more important) is included in each variable object."
+         "\n\n--- Supplementary Context from Historical Data (use to inspire and refine, but prioritize main task and schema adherence) ---\n{context}\n----------------------------------------------------------------------" # Last, so the system text stays a cacheable prefix
         )
     ]
 )
 
 # --- Prompt 3: Intelligent Variable Modifications (NEW) ---
-INTELLIGENT_VARIABLE_MODIFICATIONS_PROMPT = ChatPromptTemplate.from_messages(
+INTELLIGENT_VARIABLE_MODIFICATIONS_PROMPT = static_prefix_prompt("variable_modifications", 1,
     [
         (
             "system",
@@ -113,9 +157,6 @@ INTELLIGENT_VARIABLE_MODIFICATIONS_PROMPT = ChatPromptTemplate.from_messages(
             "  LLM removes the variable with var_name: operating_days and updates any dependent formulas.\n"
             "- Modify: User says 'Make the profit variable more granular.'\n"
             "  LLM splits the profit variable into subcomponents (e.g., gross_profit, net_profit), invents new variable names and formulas, and updates all related functions and dependencies.\n"
-            "\n**BUSINESS CONTEXT:** {business_context}\n"
-            "\n**DEPENDENCY ANALYSIS:**\nRaw Indicators Available: {raw_indicators}\nDecision Variables and Their Dependencies:\n{dependency_analysis}\n"
-            "\n**MODIFICATION REQUEST:** {primary_modifications}\n"
             "\n**OUTPUT REQUIREMENTS:**\n"
             "- primary_modifications: Changes to the primary variable type (raw indicators or decision variables).\n"
             "- compensatory_modifications: Changes needed to the other variable type to maintain consistency.\n"
@@ -129,12 +170,18 @@ INTELLIGENT_VARIABLE_MODIFICATIONS_PROMPT = ChatPromptTemplate.from_messages(
             "  - Invent a realistic and relevant variable name, var_name, type, and description based on the business context and dependencies.\n"
             "  - For modifications, if asked to make a variable more granular or any other vague instruction, split or adapt the variable into logical subcomponents and update all related formulas and functions as needed.\n"
             "  - Never ask the user for clarification—always generate the most plausible and useful variable(s) for the context, regardless of the type of modification requested.\n"
+        ),
+        (
+            "human",
+            "**BUSINESS CONTEXT:** {business_context}\n"
+            "\n**DEPENDENCY ANALYSIS:**\nRaw Indicators Available: {raw_indicators}\nDecision Variables and Their Dependencies:\n{dependency_analysis}\n"
+            "\n**MODIFICATION REQUEST:** {primary_modifications}\n"
         )
     ]
 )
 
 # --- Prompt 4: Dependency Analysis (NEW) ---
-DEPENDENCY_ANALYSIS_PROMPT = ChatPromptTemplate.from_messages(
+DEPENDENCY_ANALYSIS_PROMPT = static_prefix_prompt("dependency_analysis", 1,
     [
         ("system",
          "You are an AI assistant specialized in analyzing dependencies between financial assessment variables. "
@@ -166,8 +213,31 @@ DEPENDENCY_ANALYSIS_PROMPT = ChatPromptTemplate.from_messages(
     ]
 )
 
+# --- Prompt: Template Adaptation (template library fast path) ---
+TEMPLATE_ADAPTATION_PROMPT = static_prefix_prompt("template_adaptation", 1,
+    [
+        ("system",
+         "You adapt an existing, proven income assessment template to a specific request. "
+         "The template's raw indicators and decision variables are already in place; return ONLY the differences "
+         "the request requires. Keep the template unchanged when it already fits.\n"
+         "- added_raw_indicators / added_decision_variables: new variables (snake_case var_name, name, description, type; "
+         "decision variables also need a JavaScript 'formula' over raw indicator var_names).\n"
+         "- removed_raw_indicators / removed_decision_variables: var_names that do not apply to this business.\n"
+         "- updated_formulas: decision variable var_name -> corrected JavaScript formula.\n"
+         "- reasoning: one or two sentences.\n"
+         "The business is located in India."
+        ),
+        ("human",
+         "Request: '{user_input}'\n"
+         "Template: {template_name}\n\n"
+         "Template raw indicators:\n{raw_indicators}\n\n"
+         "Template decision variables:\n{decision_variables}"
+        )
+    ]
+)
+
 # --- Prompt 5: Questionnaire Generation (RAG enabled) ---
-QUESTIONNAIRE_PROMPT = ChatPromptTemplate.from_messages(
+QUESTIONNAIRE_PROMPT = static_prefix_prompt("questionnaire", 1,
     [
         ("system",
          "You are an AI assistant that designs comprehensive and logical questionnaires "
@@ -224,9 +294,6 @@ QUESTIONNAIRE_PROMPT = ChatPromptTemplate.from_messages(
          "Every question must be relevant to the business context and is not too broad or complex"
          "Every raw indicator must be covered by atleast one question"
          "Generate 25-50 questions, with atleast 4-7 sections"
-         "--- Supplementary Context from Historical Data ---\n"
-         "{context}\n"
-         "----------------------------------------------------------------------"
         ),
         ("human", 
          "Generate a questionnaire based on the user's prompt: '{user_input}'. "
@@ -235,12 +302,79 @@ QUESTIONNAIRE_PROMPT = ChatPromptTemplate.from_messages(
          "Strictly provide the output in JSON format, following the QuestionnaireOutput schema. "
          "Ensure logical ordering, comprehensive coverage of variables, and appropriate question types. "
          "Remember: section mandatory flag and question conditional flag are independent!"
+         "\n\n--- Supplementary Context from Historical Data ---\n"
+         "{context}\n"
+         "----------------------------------------------------------------------"
+        )
+    ]
+)
+
+# --- Prompt 5a: Questionnaire Outline (outline-then-sections generation) ---
+QUESTIONNAIRE_OUTLINE_PROMPT = static_prefix_prompt("questionnaire_outline", 1,
+    [
+        ("system",
+         "You are an AI assistant that plans questionnaires for small business financial assessment. "
+         "Produce only the outline of the questionnaire: a short 'title' and 4-7 sections in a logical order. "
+         "Do NOT write any questions.\n"
+         "\n"
+         "For each section provide:\n"
+         "- 'order': 1-based position\n"
+         "- 'title' and a one-sentence 'description'\n"
+         "- 'rationale': why the section is needed\n"
+         "- 'is_mandatory': mostly true; exactly one section should be optional (false)\n"
+         "- 'triggering_criteria': description of when an optional section is displayed, null for mandatory sections\n"
+         "- 'raw_indicators': the var_names of the raw indicators this section's questions will capture\n"
+         "- 'target_question_count': how many questions the section needs (the whole questionnaire has 25-50)\n"
+         "\n"
+         "Every raw indicator must be assigned to at least one section. The business is located in India."
+        ),
+        ("human",
+         "Plan a questionnaire for: '{user_input}'.\n"
+         "Raw indicators to capture:\n{raw_indicators}\n\n"
+         "Decision variables they feed:\n{decision_variables}"
+        )
+    ]
+)
+
+# --- Prompt 5b: Questionnaire Section (outline-then-sections generation) ---
+QUESTIONNAIRE_SECTION_PROMPT = static_prefix_prompt("questionnaire_section", 1,
+    [
+        ("system",
+         "You are an AI assistant that writes one section of a small business financial assessment questionnaire. "
+         "The full outline is given so you can avoid asking what other sections already cover.\n"
+         "\n"
+         "**QUESTION PROPERTIES:**\n"
+         "For each `Question`, provide:\n"
+         "- 'id': unique identifier\n"
+         "- 'text': question text\n"
+         "- 'type': one of 'text', 'integer', 'float', 'boolean', 'dropdown'\n"
+         "- 'variable_name': snake_case name prefixed with 'q_'\n"
+         "- 'raw_indicators': list of var_names this question helps capture\n"
+         "- 'formula': JS function showing how to map the answer to raw indicators\n"
+         "- 'function': a human-readable assignment or math-like expression for UI display\n"
+         "- 'is_conditional': mostly false; at most one conditional question in the section, "
+         "which then needs 'question_triggering_criteria'\n"
+         "\n"
+         "Put unconditional questions in 'core_questions' and the conditional one (if any) in 'conditional_questions'. "
+         "Every raw indicator assigned to this section must be covered by at least one question; several questions may "
+         "capture one raw indicator for granularity. Also return 'raw_indicator_calculation', mapping each assigned raw "
+         "indicator var_name to a valid JS formula over this section's question variable_names. "
+         "Use Indian currency and units."
+        ),
+        ("human",
+         "User request: '{user_input}'.\n"
+         "Questionnaire outline:\n{questionnaire_outline}\n\n"
+         "Write section {section_order} '{section_title}' ({section_description}) with about {target_question_count} questions.\n"
+         "Raw indicators assigned to this section:\n{raw_indicators}"
+         "\n\n--- Supplementary Context from Historical Data ---\n"
+         "{context}\n"
+         "----------------------------------------------------------------------"
         )
     ]
 )
 
 # --- Prompt 7: Intelligent Questionnaire Modifications ---
-INTELLIGENT_QUESTIONNAIRE_MODIFICATIONS_PROMPT = ChatPromptTemplate.from_messages(
+INTELLIGENT_QUESTIONNAIRE_MODIFICATIONS_PROMPT = static_prefix_prompt("questionnaire_modifications", 1,
     [
         ("system",
          "You are an AI assistant tasked with making intelligent modifications to a financial assessment questionnaire. "
@@ -266,13 +400,9 @@ INTELLIGENT_QUESTIONNAIRE_MODIFICATIONS_PROMPT = ChatPromptTemplate.from_message
          "4. Ensure all raw indicators remain calculable.\n"
          "5. Explain your reasoning for all changes.\n"
          "\n\n"
-         "**BUSINESS CONTEXT:** {business_context}\n"
-         "\n\n"
-         "**CURRENT STATE:**\n"
-         "Raw Indicators Available: {raw_indicators}\n"
-         "Current Questionnaire Structure:\n{current_questionnaire}\n"
-         "\n\n"
-         "**MODIFICATION REQUEST:** {modification_prompt}\n"
+         "If the current questionnaire structure contains 'other_sections_outline', only the sections listed under 'sections' are shown in full; "
+         "the outline lists the remaining sections (order, title, question variable names) for reference. "
+         "Do not update or remove outlined sections or their questions unless the request requires it.\n"
          "\n\n"
          "**OUTPUT REQUIREMENTS:**\n"
          "- added_sections: New sections to add.\n"
@@ -284,6 +414,14 @@ INTELLIGENT_QUESTIONNAIRE_MODIFICATIONS_PROMPT = ChatPromptTemplate.from_message
          "- reasoning: Detailed explanation of changes and their impact.\n"
         ),
         ("human",
+         "**BUSINESS CONTEXT:** {business_context}\n"
+         "\n\n"
+         "**CURRENT STATE:**\n"
+         "Raw Indicators Available: {raw_indicators}\n"
+         "Current Questionnaire Structure:\n{current_questionnaire}\n"
+         "\n\n"
+         "**MODIFICATION REQUEST:** {modification_prompt}\n"
+         "\n\n"
          "Please analyze the current questionnaire and the modification request, then provide a comprehensive set of changes "
          "that maintains questionnaire completeness and logical flow. Ensure all raw indicators remain calculable and explain "
          "your reasoning."
@@ -291,8 +429,28 @@ INTELLIGENT_QUESTIONNAIRE_MODIFICATIONS_PROMPT = ChatPromptTemplate.from_message
     ]
 )
 
+# --- Prompt: Questionnaire Modification Targeting ---
+MODIFICATION_TARGETING_PROMPT = static_prefix_prompt("modification_targeting", 1,
+    [
+        ("system",
+         "You route questionnaire modification requests. Given a compact outline of a questionnaire "
+         "(section order, title and question variable names) and a modification request, identify the sections "
+         "the request touches.\n"
+         "- section_orders: orders of the existing sections that must be read or changed to fulfil the request.\n"
+         "- question_variable_names: existing questions the request refers to, if any.\n"
+         "- needs_full_questionnaire: true only if the request affects the questionnaire as a whole "
+         "(e.g. reordering, global tone or length changes).\n"
+         "Requests that only add a new section may return an empty section_orders list."
+        ),
+        ("human",
+         "Questionnaire outline:\n{questionnaire_outline}\n\n"
+         "Modification request: {modification_prompt}"
+        )
+    ]
+)
+
 # --- Prompt 8: JavaScript Expression Refinement (Remains same) ---
-JS_REFINEMENT_PROMPT = ChatPromptTemplate.from_messages(
+JS_REFINEMENT_PROMPT = static_prefix_prompt("js_refinement", 1,
     [
         ("system",
          "You are a JavaScript expert. Your task is to refine or generate a JavaScript expression. "
@@ -303,15 +461,15 @@ JS_REFINEMENT_PROMPT = ChatPromptTemplate.from_messages(
          "For example, 'q_income' for an income question. "
          "Available question variables are provided as `context_question_vars`. "
          "Avoid simplistic 'return true;' or empty expressions. "
-         "The purpose is to create a dynamic condition for '{target_entity_description}'. "
-         "Available question variables: {context_question_vars}. "
          "Generate only the JavaScript expression within a JSON object, with the key 'expression', nothing else. For example: `{{\"expression\": \"return q_var1 > 0 && q_var2 === \\\"Yes\\\";\"}}`. Provide a realistic and smart trigger for a financial assessment context. "
          "Consider using logical operators (&&, ||, !), numerical comparisons (>, <, >=, <=, ===), "
          "string comparisons, or checking for specific values. "
          "Examples for triggers: 'return q_has_dependents === true && q_income_source === \"Self-employed\";', "
          "'return q_business_type.includes(\\\"online\\\") || q_monthly_sales > 5000;'. "
         ),
-        ("human", "Generate a suitable JavaScript expression for the '{expression_type}' of '{target_entity_description}'. "
+        ("human", "The purpose is to create a dynamic condition for '{target_entity_description}'. "
+         "Available question variables: {context_question_vars}. "
+         "Generate a suitable JavaScript expression for the '{expression_type}' of '{target_entity_description}'. "
          "It should be intelligent and meaningful in the context of financial assessment conditional logic. "
          "The expression to refine is: ['expression_to_refine']. "
          "If '{expression_type}' is a formula, it should describe how the question's answer contributes to a raw indicator, or perform a relevant calculation. "
@@ -321,8 +479,8 @@ JS_REFINEMENT_PROMPT = ChatPromptTemplate.from_messages(
 )
 
 # --- Prompt: Export Section Cards for Card Generator ---
-EXPORT_SECTION_CARDS_PROMPT = (
-    "You are a UI/UX assistant. Convert the following questionnaire JSON into a human-readable, section-by-section design specification for a business questionnaire titled '{title}'.\n"
+EXPORT_SECTION_CARDS_SYSTEM = register_prefix("export_section_cards", 1, (
+    "You are a UI/UX assistant. Convert the questionnaire JSON you are given into a human-readable, section-by-section design specification for a business questionnaire with the given title.\n"
     "Design requirements:\n"
     "- Use clear cards or sections, with soft shadows, rounded corners, and ample spacing.\n"
     "- Each section must be clearly labeled and contain only the questions listed.\n"
@@ -356,8 +514,12 @@ EXPORT_SECTION_CARDS_PROMPT = (
     "Options: [list options] (if applicable)\n"
     "Do NOT use JSON or code blocks. Output only the filled-in design spec as described above, section by section.\n"
     "If a value is missing in the JSON, invent a sensible value or leave it blank.\n"
+    "Format your output exactly as described above, filling in all fields for each question."
+))
+
+EXPORT_SECTION_CARDS_PROMPT = (
+    "Questionnaire title: '{title}'\n"
     "\n"
     "Here is the questionnaire JSON:\n"
-    "{sections_json}\n"
-    "Format your output exactly as described above, filling in all fields for each question."
+    "{sections_json}"
 )
\ No newline at end of file
@@ -0,0 +1,225 @@
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# The two question lists every section carries
+QUESTION_LIST_KEYS = ("core_questions", "conditional_questions")
+
+# (section dict, question list key, position within that list)
+QuestionLocation = Tuple[Dict, str, int]
+
+
+class QuestionnaireIndex:
+    """
+    Indexed view over a questionnaire dict (the QuestionnaireOutput shape stored in GraphState).
+
+    Keeps three lookups in sync with the underlying sections so that nodes do not have to rescan
+    every section and question list for each lookup:
+    - variable_name -> locations (section, list key, position)
+    - section order -> section
+    - raw indicator var_name -> questions capturing it
+
+    All mutations of the questionnaire must go through the index methods to keep it consistent.
+    """
+
+    def __init__(self, questionnaire: Dict):
+        self.questionnaire = questionnaire
+        if questionnaire.get("sections") is None:
+            questionnaire["sections"] = []
+        self._by_var: Dict[str, List[QuestionLocation]] = {}
+        self._by_order: Dict[Any, Dict] = {}
+        self._by_ri: Dict[str, Dict[int, Dict]] = {}
+        for section in self.sections:
+            self._index_section(section)
+
+    # --- Read access ---
+
+    @property
+    def sections(self) -> List[Dict]:
+        return self.questionnaire["sections"]
+
+    def __contains__(self, variable_name: Any) -> bool:
+        return variable_name in self._by_var
+
+    def __len__(self) -> int:
+        return sum(len(locations) for locations in self._by_var.values())
+
+    def question_vars(self) -> Set[str]:
+        """Returns the set of all question variable_names in the questionnaire."""
+        return set(self._by_var)
+
+    def locate(self, variable_name: str) -> Optional[QuestionLocation]:
+        """Returns the first (section, list key, position) holding the question, or None."""
+        locations = self._by_var.get(variable_name)
+        return locations[0] if locations else None
+
+    def get_question(self, variable_name: str) -> Optional[Dict]:
+        location = self.locate(variable_name)
+        if location is None:
+            return None
+        section, list_key, position = location
+        return section[list_key][position]
+
+    def section_by_order(self, order: Any) -> Optional[Dict]:
+        return self._by_order.get(order)
+
+    def section_orders(self) -> Set[Any]:
+        return set(self._by_order)
+
+    def questions_for_ri(self, ri_var_name: str) -> List[Dict]:
+        """Returns the questions whose raw_indicators list references the given raw indicator."""
+        return list(self._by_ri.get(ri_var_name, {}).values())
+
+    def covered_raw_indicators(self) -> Set[str]:
+        """Returns the var_names of all raw indicators referenced by at least one question."""
+        return {ri_name for ri_name, questions in self._by_ri.items() if questions}
+
+    def iter_questions(self) -> Iterator[Tuple[Dict, str, Dict]]:
+        """Yields (section, list key, question) in questionnaire order."""
+        for section in self.sections:
+            for list_key in QUESTION_LIST_KEYS:
+                for question in section.get(list_key) or []:
+                    yield section, list_key, question
+
+    # --- Section mutations ---
+
+    def add_section(self, section: Dict) -> Dict:
+        """Appends a section, bumping its order until it is unique, and indexes its questions."""
+        order = section.get("order")
+        while order in self._by_order:
+            order = (order or 1) + 1
+        section["order"] = order
+        self.sections.append(section)
+        self._index_section(section)
+        return section
+
+    def update_section(self, update: Dict) -> int:
+        """Applies a partial section update to every section with the matching order."""
+        order = update.get("order")
+        updated = 0
+        for section in self.sections:
+            if section.get("order") != order:
+                continue
+            replaced_lists = {key: list(section.get(key) or []) for key in QUESTION_LIST_KEYS if key in update}
+            section.update(update)
+            for list_key, old_questions in replaced_lists.items():
+                self._reindex_list(section, list_key, old_questions)
+            updated += 1
+        return updated
+
+    def remove_sections(self, orders: List[Any]) -> int:
+        """Removes all sections whose order is in `orders`, together with their questions."""
+        orders_to_remove = set(orders or [])
+        if not orders_to_remove:
+            return 0
+        kept, removed = [], []
+        for section in self.sections:
+            (removed if section.get("order") in orders_to_remove else kept).append(section)
+        for section in removed:
+            for list_key in QUESTION_LIST_KEYS:
+                for question in section.get(list_key) or []:
+                    self._unindex_question(section, list_key, question)
+        self.questionnaire["sections"] = kept
+        self._by_order = {}
+        for section in kept:
+            self._by_order.setdefault(section.get("order"), section)
+        return len(removed)
+
+    # --- Question mutations ---
+
+    def add_question(self, section_order: Any, question: Dict, is_core: bool = True) -> bool:
+        """
+        Appends a question to the section with the given order.
+        Returns False if the section does not exist or the variable_name is already taken.
+        """
+        section = self._by_order.get(section_order)
+        if section is None or question.get("variable_name") in self._by_var:
+            return False
+        self.append_question(section, question, is_core)
+        return True
+
+    def append_question(self, section: Dict, question: Dict, is_core: bool = True) -> None:
+        """Appends a question to an already indexed section without duplicate checks."""
+        list_key = QUESTION_LIST_KEYS[0] if is_core else QUESTION_LIST_KEYS[1]
+        if section.get(list_key) is None:
+            section[list_key] = []
+        section[list_key].append(question)
+        self._index_question(section, list_key, len(section[list_key]) - 1, question)
+
+    def update_question(self, update: Dict) -> int:
+        """Applies a partial question update to every question with the matching variable_name."""
+        variable_name = update.get("variable_name")
+        updated = 0
+        for section, list_key, position in list(self._by_var.get(variable_name, [])):
+            question = section[list_key][position]
+            self._unindex_ris(question)
+            question.update(update)
+            self._index_ris(question)
+            updated += 1
+        return updated
+
+    def link_raw_indicator(self, variable_name: str, ri_var_name: str) -> int:
+        """Adds a raw indicator to the raw_indicators list of every question with the given variable_name."""
+        linked = 0
+        for section, list_key, position in self._by_var.get(variable_name, []):
+            question = section[list_key][position]
+            ri_list = question.get("raw_indicators") or []
+            if ri_var_name not in ri_list:
+                question["raw_indicators"] = ri_list + [ri_var_name]
+                self._by_ri.setdefault(ri_var_name, {})[id(question)] = question
+                linked += 1
+        return linked
+
+    def remove_questions(self, variable_names: List[str]) -> int:
+        """Removes every question whose variable_name is in `variable_names`."""
+        names_to_remove = set(variable_names or [])
+        affected: Dict[Tuple[int, str], Tuple[Dict, str]] = {}
+        for variable_name in names_to_remove:
+            for section, list_key, _position in self._by_var.get(variable_name, []):
+                affected[(id(section), list_key)] = (section, list_key)
+        removed = 0
+        for section, list_key in affected.values():
+            old_questions = section[list_key]
+            section[list_key] = [q for q in old_questions if q.get("variable_name") not in names_to_remove]
+            removed += len(old_questions) - len(section[list_key])
+            self._reindex_list(section, list_key, old_questions)
+        return removed
+
+    # --- Internal bookkeeping ---
+
+    def _index_section(self, section: Dict) -> None:
+        self._by_order.setdefault(section.get("order"), section)
+        for list_key in QUESTION_LIST_KEYS:
+            for position, question in enumerate(section.get(list_key) or []):
+                self._index_question(section, list_key, position, question)
+
+    def _index_question(self, section: Dict, list_key: str, position: int, question: Dict) -> None:
+        variable_name = question.get("variable_name")
+        if variable_name:
+            self._by_var.setdefault(variable_name, []).append((section, list_key, position))
+        self._index_ris(question)
+
+    def _unindex_question(self, section: Dict, list_key: str, question: Dict) -> None:
+        variable_name = question.get("variable_name")
+        locations = self._by_var.get(variable_name)
+        if locations:
+            locations[:] = [loc for loc in locations if not (loc[0] is section and loc[1] == list_key)]
+            if not locations:
+                del self._by_var[variable_name]
+        self._unindex_ris(question)
+
+    def _reindex_list(self, section: Dict, list_key: str, old_questions: List[Dict]) -> None:
+        for question in old_questions:
+            self._unindex_question(section, list_key, question)
+        for position, question in enumerate(section.get(list_key) or []):
+            self._index_question(section, list_key, position, question)
+
+    def _index_ris(self, question: Dict) -> None:
+        for ri_name in question.get("raw_indicators") or []:
+            self._by_ri.setdefault(ri_name, {})[id(question)] = question
+
+    def _unindex_ris(self, question: Dict) -> None:
+        for ri_name in question.get("raw_indicators") or []:
+            questions = self._by_ri.get(ri_name)
+            if questions is not None:
+                questions.pop(id(question), None)
+                if not questions:
+                    del self._by_ri[ri_name]
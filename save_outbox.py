@@ -0,0 +1,268 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import serialization
+from schemas.schemas import SaveStatus
+from storage import get_storage, save_project_rows
+
+# --- Durable save outbox ---
+# /step/save-questionnaire no longer writes to Supabase inline. The rows of a save are committed to a local
+# SQLite outbox in one transaction and the request returns; a background OutboxFlusher persists them with
+# storage.save_project_rows (delta upserts and deletes, idempotent, so a retried entry never duplicates rows)
+# and retries failures with exponential backoff. Each entry is a full snapshot of the project, so a newer save
+# supersedes older entries of the same project that have not started yet. SaveOutbox.status reports per project.
+# Finished entries are pruned after OUTBOX_RETENTION_SECONDS; the latest entry of each project is kept (with its
+# rows dropped) so its status stays reportable.
+
+DEFAULT_OUTBOX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_store", "save_outbox.db")
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+SUPERSEDED = "superseded"
+
+MAX_SAVE_ATTEMPTS = 8
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 300.0
+FLUSH_POLL_SECONDS = 2.0
+# An in-flight entry older than this is assumed orphaned by a crashed flusher and claimed again
+IN_FLIGHT_TIMEOUT_SECONDS = 600.0
+OUTBOX_RETENTION_SECONDS = float(os.getenv("SAVE_OUTBOX_RETENTION_DAYS", "7")) * 86400
+PRUNE_INTERVAL_SECONDS = 3600.0
+
+# Outbox state -> status reported to clients
+_CLIENT_STATUSES = {IN_FLIGHT: "saving", DONE: "saved", FAILED: "failed"}
+
+_outbox_cache: Dict[str, Any] = {"outbox": None, "flusher": None}
+_outbox_lock = threading.Lock()
+
+
+class SaveOutbox:
+    """SQLite-backed queue of pending project saves."""
+
+    def __init__(self, path: str = DEFAULT_OUTBOX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.wake = threading.Event()  # Set on enqueue so an idle flusher starts at once
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, project_id TEXT NOT NULL, rows_json TEXT NOT NULL, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, "
+                "queued_at REAL NOT NULL, next_attempt_at REAL NOT NULL, claimed_at REAL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_project ON outbox (project_id, seq)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)  # Explicit transactions below
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # An acknowledged save must survive a power loss
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, project_id: str, rows_by_table: Dict[str, List[Dict[str, Any]]]) -> int:
+        """Commits a save; returns its sequence number once it is durable."""
+        if not project_id:
+            raise ValueError("A project_id is required to queue a save")
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE outbox SET status = ?, finished_at = ? WHERE project_id = ? AND status = ?",
+                         (SUPERSEDED, now, project_id, PENDING))
+            cursor = conn.execute(
+                "INSERT INTO outbox (project_id, rows_json, status, queued_at, next_attempt_at) VALUES (?, ?, ?, ?, ?)",
+                (project_id, serialization.dumps_str(rows_by_table), PENDING, now, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.wake.set()
+        return cursor.lastrowid
+
+    def claim_due(self) -> Optional[Dict[str, Any]]:
+        """
+        Marks the oldest due entry in flight and returns it. Entries of a project with a save already in
+        flight wait, so the saves of one project are applied in order.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT seq, project_id, rows_json, attempts FROM outbox o "
+                "WHERE ((status = ? AND next_attempt_at <= ?) OR (status = ? AND claimed_at < ?)) "
+                "AND NOT EXISTS (SELECT 1 FROM outbox f WHERE f.project_id = o.project_id AND f.status = ? "
+                "AND f.seq != o.seq AND f.claimed_at >= ?) "
+                "ORDER BY seq LIMIT 1",
+                (PENDING, now, IN_FLIGHT, now - IN_FLIGHT_TIMEOUT_SECONDS, IN_FLIGHT, now - IN_FLIGHT_TIMEOUT_SECONDS)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE outbox SET status = ?, claimed_at = ? WHERE seq = ?", (IN_FLIGHT, now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if not row:
+            return None
+        return {"seq": row[0], "project_id": row[1], "rows_by_table": serialization.loads(row[2]), "attempts": row[3]}
+
+    def seconds_until_due(self) -> Optional[float]:
+        """Time until the next pending entry is due (0 if one is due now), None if nothing is pending."""
+        (next_attempt_at,) = self._connection().execute(
+            "SELECT MIN(next_attempt_at) FROM outbox WHERE status = ?", (PENDING,)).fetchone()
+        return None if next_attempt_at is None else max(0.0, next_attempt_at - time.time())
+
+    def mark_done(self, seq: int) -> None:
+        self._connection().execute("UPDATE outbox SET status = ?, finished_at = ?, last_error = NULL WHERE seq = ?",
+                                   (DONE, time.time(), seq))
+
+    def mark_failed_attempt(self, seq: int, attempts: int, error: str) -> None:
+        """Schedules a retry with exponential backoff (and jitter), or gives up after MAX_SAVE_ATTEMPTS."""
+        now = time.time()
+        if attempts >= MAX_SAVE_ATTEMPTS:
+            self._connection().execute(
+                "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, finished_at = ? WHERE seq = ?",
+                (FAILED, attempts, error, now, seq))
+            return
+        delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        self._connection().execute(
+            "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ? WHERE seq = ?",
+            (PENDING, attempts, error, now + delay, seq))
+
+    def prune(self, older_than_seconds: float = OUTBOX_RETENTION_SECONDS) -> int:
+        """
+        Deletes done and superseded entries finished more than older_than_seconds ago, except the latest
+        entry of each project, whose rows are dropped instead. Returns the number of deleted entries.
+        """
+        cutoff = time.time() - older_than_seconds
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = conn.execute(
+                "DELETE FROM outbox WHERE status IN (?, ?) AND finished_at < ? "
+                "AND seq < (SELECT MAX(l.seq) FROM outbox l WHERE l.project_id = outbox.project_id)",
+                (DONE, SUPERSEDED, cutoff)).rowcount
+            conn.execute("UPDATE outbox SET rows_json = '{}' WHERE status IN (?, ?) AND finished_at < ?",
+                         (DONE, SUPERSEDED, cutoff))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted
+
+    def status(self, project_id: str) -> SaveStatus:
+        """Status of the latest save of a project."""
+        row = self._connection().execute(
+            "SELECT seq, status, attempts, last_error, queued_at, next_attempt_at, finished_at FROM outbox "
+            "WHERE project_id = ? AND status != ? ORDER BY seq DESC LIMIT 1", (project_id, SUPERSEDED)
+        ).fetchone()
+        if not row:
+            return {"project_id": project_id, "status": "unknown", "save_id": None, "attempts": 0,
+                    "last_error": None, "queued_at": None, "next_attempt_at": None, "saved_at": None}
+        seq, status, attempts, last_error, queued_at, next_attempt_at, finished_at = row
+        client_status = _CLIENT_STATUSES.get(status) or ("retrying" if attempts else "queued")
+        return {
+            "project_id": project_id,
+            "status": client_status,
+            "save_id": seq,
+            "attempts": attempts,
+            "last_error": last_error,
+            "queued_at": queued_at,
+            "next_attempt_at": next_attempt_at if status == PENDING else None,
+            "saved_at": finished_at if status == DONE else None,
+        }
+
+
+def flush_entry(outbox: SaveOutbox, entry: Dict[str, Any]) -> bool:
+    """Persists one claimed entry; returns True when every table was saved."""
+    attempts = entry["attempts"] + 1
+    try:
+        summary = save_project_rows(get_storage(), entry["project_id"], entry["rows_by_table"])
+        error = f"Save incomplete for tables: {', '.join(summary['failed_tables'])}" if summary["failed_tables"] else None
+    except Exception as e:
+        error = f"Save failed: {e}"
+    if error:
+        print(f"Outbox save {entry['seq']} of project {entry['project_id']} failed (attempt {attempts}): {error}")
+        outbox.mark_failed_attempt(entry["seq"], attempts, error)
+        return False
+    outbox.mark_done(entry["seq"])
+    return True
+
+
+class OutboxFlusher(threading.Thread):
+    """Background thread draining the outbox."""
+
+    def __init__(self, outbox: SaveOutbox):
+        super().__init__(name="save-outbox-flusher", daemon=True)
+        self.outbox = outbox
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        pruned_at = 0.0
+        while not self._stop_event.is_set():
+            if time.time() - pruned_at >= PRUNE_INTERVAL_SECONDS:
+                pruned_at = time.time()
+                try:
+                    deleted = self.outbox.prune()
+                    if deleted:
+                        print(f"Pruned {deleted} finished save outbox entries.")
+                except sqlite3.Error as e:
+                    print(f"Warning: Could not prune the save outbox: {e}")
+            try:
+                entry = self.outbox.claim_due()
+            except sqlite3.Error as e:
+                print(f"Warning: Could not read the save outbox: {e}")
+                entry = None
+            if entry is not None:
+                try:
+                    flush_entry(self.outbox, entry)
+                except sqlite3.Error as e:
+                    # The entry stays in flight and is claimed again after IN_FLIGHT_TIMEOUT_SECONDS;
+                    # saves are idempotent, so writing it again is safe
+                    print(f"Warning: Could not record the outcome of outbox save {entry['seq']}: {e}")
+                    self._stop_event.wait(FLUSH_POLL_SECONDS)
+                continue
+            try:
+                due_in = self.outbox.seconds_until_due()
+            except sqlite3.Error:
+                due_in = None
+            self.outbox.wake.wait(FLUSH_POLL_SECONDS if due_in is None else min(FLUSH_POLL_SECONDS, due_in))
+            self.outbox.wake.clear()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        self.outbox.wake.set()
+        self.join(timeout)
+
+
+def get_outbox() -> SaveOutbox:
+    """The process-wide outbox; request threads race to create it, so creation holds a lock."""
+    with _outbox_lock:
+        if _outbox_cache["outbox"] is None:
+            _outbox_cache["outbox"] = SaveOutbox(os.getenv("SAVE_OUTBOX_PATH", DEFAULT_OUTBOX_PATH))
+        return _outbox_cache["outbox"]
+
+
+def start_outbox_flusher() -> OutboxFlusher:
+    if _outbox_cache["flusher"] is None or not _outbox_cache["flusher"].is_alive():
+        _outbox_cache["flusher"] = OutboxFlusher(get_outbox())
+        _outbox_cache["flusher"].start()
+    return _outbox_cache["flusher"]
+
+
+def stop_outbox_flusher(timeout: Optional[float] = 10.0) -> None:
+    flusher = _outbox_cache["flusher"]
+    if flusher is not None:
+        flusher.stop(timeout)
+        _outbox_cache["flusher"] = None
@@ -1,8 +1,8 @@
 from typing import List, Dict, Optional, Any, TypedDict
 
 # --- Pydantic/TypedDict Schemas for Structured Output ---
-class VariableSchema(TypedDict):
-    """Schema for individual raw indicators or decision variables."""
+class GeneratedVariableSchema(TypedDict):
+    """A raw indicator or decision variable as the LLM generates it; nodes add the project_id afterwards."""
     id: str
     name: str
     var_name: str
@@ -13,6 +13,9 @@ class VariableSchema(TypedDict):
     function: Optional[str] # New: Human-readable formula for UI display
     type: str # New field: text, int, float, dropdown, etc.
     value: Optional[str] # New field: initially null, for user input later
+
+class VariableSchema(GeneratedVariableSchema):
+    """Schema for individual raw indicators or decision variables."""
     project_id: Optional[str] # New: Added for project differentiation
 
 # --- Dependency Analysis Schemas ---
@@ -54,11 +57,11 @@ class SynchronizationPlan(TypedDict):
 
 class RawIndicatorsOutput(TypedDict):
     """Schema for the LLM's output when generating raw indicators."""
-    raw_indicators: List[VariableSchema]
+    raw_indicators: List[GeneratedVariableSchema]
 
 class DecisionVariablesOutput(TypedDict):
     """Schema for the LLM's output when generating decision variables."""
-    decision_variables: List[VariableSchema]
+    decision_variables: List[GeneratedVariableSchema]
 
 class IntelligentVariableModificationsOutput(TypedDict):
     """Schema for the LLM's output when making intelligent variable modifications."""
@@ -66,7 +69,7 @@ class IntelligentVariableModificationsOutput(TypedDict):
     compensatory_modifications: Dict[str, List[Dict[str, Any]]]  # Changes to other variable type
     removed_variables: List[str]  # Variables to be removed
     updated_formulas: Dict[str, str]  # Formula updates
-    new_variables: List[VariableSchema]  # New variables to be added
+    new_variables: List[GeneratedVariableSchema]  # New variables to be added
     reasoning: str  # LLM's reasoning for the changes
 
 class Question(TypedDict):
@@ -101,6 +104,29 @@ class QuestionnaireOutput(TypedDict):
     raw_indicator_calculation: Optional[Dict[str, str]] # Maps raw_indicator_var_name to JS formula
 
 
+class OutlineSection(TypedDict):
+    """One planned section in an outline-then-sections questionnaire generation."""
+    order: int
+    title: str
+    description: str
+    rationale: str
+    is_mandatory: bool
+    triggering_criteria: Optional[str]
+    raw_indicators: List[str]  # var_names of the raw indicators this section must capture
+    target_question_count: Optional[int]
+
+class QuestionnaireOutline(TypedDict):
+    """Schema for the LLM's output when planning the questionnaire sections."""
+    title: str
+    sections: List[OutlineSection]
+
+class SectionQuestionsOutput(TypedDict):
+    """Schema for the LLM's output when writing the questions of one outlined section."""
+    core_questions: List[Question]
+    conditional_questions: List[Question]
+    raw_indicator_calculation: Optional[Dict[str, str]]
+
+
 # --- Modification Schemas ---
 class VariableModification(TypedDict):
     """Base schema for variable modifications."""
@@ -132,6 +158,12 @@ class QuestionnaireModificationsOutput(TypedDict):
     updated_questions: Optional[List[QuestionModification]] # Dict containing question_variable_name and fields to update
     removed_question_variable_names: Optional[List[str]] # List of question_variable_names to remove
 
+class ModificationTargetsOutput(TypedDict):
+    """Schema for the LLM's output when resolving which sections a modification request touches."""
+    section_orders: List[int]
+    question_variable_names: Optional[List[str]]
+    needs_full_questionnaire: bool
+
 class GraphState(TypedDict):
     """
     Represents the state of our graph.
@@ -150,6 +182,8 @@ class GraphState(TypedDict):
         status: Optional[str] # New: Tracks the current status of the workflow
         needs_review: Optional[bool] # New: Indicates if modifications need review
         questionnaire_title: Optional[str] # New: Stores the generated questionnaire title
+        stage_timings: Optional[Dict] # Per-node stage start/end times (ms) from the last run
+        template_name: Optional[str] # Occupation template the project was seeded from, if any
     """
     prompt: str
     modification_prompt: Optional[str]
@@ -164,6 +198,8 @@ class GraphState(TypedDict):
     status: Optional[str]
     needs_review: Optional[bool]
     questionnaire_title: Optional[str]
+    stage_timings: Optional[Dict[str, Any]]
+    template_name: Optional[str]
 
 # For Remediation Output (used by analyze_questionnaire_impact)
 class RemediationOutput(TypedDict):
@@ -172,4 +208,61 @@ class RemediationOutput(TypedDict):
 
 # For JS Refinement Output (used by _refine_js_expression)
 class StringOutput(TypedDict):
-    expression: str
\ No newline at end of file
+    expression: str
+# For scoring filled questionnaires (used by scoring.score_answers)
+class ScoringResult(TypedDict):
+    raw_indicators: Dict[str, Any]  # Computed raw indicator values by var_name
+    decision_variables: Dict[str, Any]  # Computed decision variable values by var_name
+    errors: Dict[str, str]  # Per-variable errors (compile, dependency or runtime failures)
+# For scoring batches of filled questionnaires (used by bulk_scoring.score_responses_batch)
+class BulkScoringResult(TypedDict):
+    table: Any  # pandas DataFrame: one row per response, RI/DV columns plus has_error and errors
+    issues: Dict[str, str]  # Plan-level problems (compile errors, placeholders, cycles) by var_name
+    vectorized: List[str]  # Steps evaluated as array expressions over the whole batch
+    row_fallback: List[str]  # Steps evaluated row by row with the formula engine
+# For static formula validation (used by formula_validation.validate_project_formulas)
+class ExpressionValidation(TypedDict):
+    status: str  # valid / unknown_identifier / syntax_error / placeholder
+    message: str
+    unknown_identifiers: List[str]
+
+class FormulaValidationEntry(ExpressionValidation):
+    target: str  # e.g. "question:q_income", "raw_indicator:monthly_income", "section:2"
+    expression_type: str  # formula / triggering_criteria / question_triggering_criteria / raw_indicator_calculation
+    expression: str
+
+class FormulaValidationReport(TypedDict):
+    entries: List[FormulaValidationEntry]
+    counts: Dict[str, int]  # Number of expressions per status
+    invalid: List[str]  # Targets of every expression that is not valid
+# For the occupation template library (used by template_library.find_closest_template)
+class TemplateMatch(TypedDict):
+    name: str  # Template (occupation) name in the index
+    score: float  # Share of the template name matched by the prompt
+
+# For adapting a seeded template to the user's prompt (used by generate_variables)
+class TemplateAdaptationOutput(TypedDict):
+    """Schema for the LLM's output when adapting template variables to the user's prompt."""
+    added_raw_indicators: Optional[List[GeneratedVariableSchema]]
+    removed_raw_indicators: Optional[List[str]]  # var_names
+    added_decision_variables: Optional[List[GeneratedVariableSchema]]
+    removed_decision_variables: Optional[List[str]]  # var_names
+    updated_formulas: Optional[Dict[str, str]]  # decision variable var_name -> new JS formula
+    reasoning: Optional[str]
+# For delta-only saves (used by storage.save_project_rows)
+class SaveSummary(TypedDict):
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
+    failed_tables: List[str]  # Tables whose upsert or delete failed (retried on the next save)
+# For the durable save outbox (used by save_outbox.SaveOutbox.status)
+class SaveStatus(TypedDict):
+    project_id: str
+    status: str  # unknown / queued / saving / retrying / saved / failed
+    save_id: Optional[int]  # Outbox sequence number of the latest save
+    attempts: int
+    last_error: Optional[str]
+    queued_at: Optional[float]  # Unix timestamps
+    next_attempt_at: Optional[float]
+    saved_at: Optional[float]
@@ -0,0 +1,184 @@
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from formula_engine import (
+    UNDEFINED,
+    CompiledFormula,
+    FormulaError,
+    compile_formula,
+    to_number,
+    to_output_value,
+)
+from questionnaire_index import QuestionnaireIndex
+from schemas.schemas import GraphState, ScoringResult
+
+RAW_INDICATOR = "raw_indicator"
+DECISION_VARIABLE = "decision_variable"
+
+
+class ScoringStep:
+    """
+    One computed variable in a scoring plan.
+    A step either evaluates its own formula, or (for raw indicators without a calculation entry)
+    derives its value from the questions that capture it.
+    """
+    __slots__ = ("name", "kind", "formula", "sources", "dependencies")
+
+    def __init__(self, name: str, kind: str, formula: Optional[CompiledFormula] = None,
+                 sources: Optional[List[Tuple[str, Optional[CompiledFormula]]]] = None):
+        self.name = name
+        self.kind = kind
+        self.formula = formula
+        # (question variable_name, compiled question formula or None) for question-derived raw indicators
+        self.sources = sources or []
+        self.dependencies: Set[str] = set()
+
+
+class ScoringPlan:
+    """
+    Compiled, topologically ordered evaluation plan for a questionnaire's raw indicators and
+    decision variables. Build it once per state and reuse it for every set of answers.
+    """
+
+    def __init__(self, questionnaire: Optional[Dict], raw_indicators: Optional[List[Dict]],
+                 decision_variables: Optional[List[Dict]]):
+        questionnaire = questionnaire or {}
+        q_index = QuestionnaireIndex({"sections": questionnaire.get("sections") or []})
+        ri_calculation_map = questionnaire.get("raw_indicator_calculation") or {}
+
+        self.question_vars: Set[str] = {var for var in q_index.question_vars() if var}
+        # Problems found while building the plan (syntax errors, cycles), keyed by variable name
+        self.issues: Dict[str, str] = {}
+
+        steps: Dict[str, ScoringStep] = {}
+        for ri in raw_indicators or []:
+            name = ri.get("var_name")
+            if not name:
+                continue
+            calculation = ri_calculation_map.get(name)
+            if calculation and calculation.strip():
+                steps[name] = self._formula_step(name, RAW_INDICATOR, calculation)
+                continue
+            sources = []
+            for question in q_index.questions_for_ri(name):
+                question_formula = None
+                if question.get("formula"):
+                    try:
+                        question_formula = compile_formula(question["formula"])
+                    except FormulaError:
+                        question_formula = None  # Fall back to the raw answer
+                    if question_formula is not None and question_formula.is_empty:
+                        question_formula = None
+                sources.append((question.get("variable_name"), question_formula))
+            if not sources:
+                self.issues[name] = f"Raw indicator '{name}' has no calculation and no question capturing it."
+            steps[name] = ScoringStep(name, RAW_INDICATOR, sources=sources)
+
+        for dv in decision_variables or []:
+            name = dv.get("var_name")
+            if name:
+                steps[name] = self._formula_step(name, DECISION_VARIABLE, dv.get("formula") or "")
+
+        self.raw_indicator_names = [name for name, step in steps.items() if step.kind == RAW_INDICATOR]
+        self.decision_variable_names = [name for name, step in steps.items() if step.kind == DECISION_VARIABLE]
+        self.steps = self._order_steps(steps)
+
+    def _formula_step(self, name: str, kind: str, source: str) -> ScoringStep:
+        try:
+            formula = compile_formula(source)
+        except FormulaError as e:
+            self.issues[name] = f"Formula for '{name}' could not be compiled: {e}"
+            return ScoringStep(name, kind)
+        if formula.is_empty:
+            self.issues[name] = f"Formula for '{name}' is empty or a placeholder."
+        return ScoringStep(name, kind, formula=formula)
+
+    def _order_steps(self, steps: Dict[str, ScoringStep]) -> List[ScoringStep]:
+        """Orders steps so every step runs after the steps it reads (Kahn's algorithm, stable)."""
+        for step in steps.values():
+            if step.formula is None:
+                continue
+            for identifier in step.formula.identifiers:
+                if identifier in steps and identifier != step.name:
+                    step.dependencies.add(identifier)
+                elif identifier.startswith("q_") and identifier not in self.question_vars and identifier[2:] in steps:
+                    # DV formulas often read raw indicators through a q_ prefix
+                    step.dependencies.add(identifier[2:])
+
+        ordered: List[ScoringStep] = []
+        remaining = dict(steps)
+        while remaining:
+            ready = [step for step in remaining.values() if not (step.dependencies & remaining.keys())]
+            if not ready:
+                for step in remaining.values():
+                    self.issues[step.name] = f"Circular dependency involving '{step.name}'."
+                    step.formula = None
+                    step.dependencies = set()
+                ready = list(remaining.values())
+            for step in ready:
+                ordered.append(step)
+                del remaining[step.name]
+        return ordered
+
+    def _step_value(self, step: ScoringStep, values: Dict[str, Any]) -> Any:
+        if step.formula is not None:
+            return step.formula.evaluate(values)
+        if step.name in self.issues:
+            return UNDEFINED
+        contributions = []
+        for question_var, question_formula in step.sources:
+            if question_formula is not None:
+                contributions.append(question_formula.evaluate(values))
+            else:
+                contributions.append(values.get(question_var, UNDEFINED))
+        if len(contributions) == 1:
+            return contributions[0]
+        # Several questions capturing one raw indicator are its granular parts (e.g. rent + utilities)
+        return sum(to_number(value) for value in contributions)
+
+    def evaluate(self, answers: Mapping[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Computes every raw indicator and decision variable from one set of answers.
+        Returns (values by var_name, runtime errors by var_name). Values are engine values.
+        """
+        values: Dict[str, Any] = {var: UNDEFINED for var in self.question_vars}
+        values.update(answers)
+        computed: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        for step in self.steps:
+            failed_dependency = next((dep for dep in step.dependencies if dep in errors or dep in self.issues), None)
+            if failed_dependency is not None:
+                errors[step.name] = f"Depends on '{failed_dependency}', which could not be computed."
+                value = UNDEFINED
+            else:
+                try:
+                    value = self._step_value(step, values)
+                except FormulaError as e:
+                    errors[step.name] = str(e)
+                    value = UNDEFINED
+            computed[step.name] = value
+            values[step.name] = value
+            alias = f"q_{step.name}"
+            if step.kind == RAW_INDICATOR and alias not in self.question_vars:
+                values[alias] = value
+        return computed, errors
+
+    def score(self, answers: Mapping[str, Any]) -> ScoringResult:
+        """Scores one applicant's answers into JSON-safe raw indicator and decision variable values."""
+        computed, errors = self.evaluate(answers)
+        for name, issue in self.issues.items():
+            errors.setdefault(name, issue)
+        return {
+            "raw_indicators": {name: to_output_value(computed.get(name)) for name in self.raw_indicator_names},
+            "decision_variables": {name: to_output_value(computed.get(name)) for name in self.decision_variable_names},
+            "errors": errors,
+        }
+
+
+def build_scoring_plan(state: GraphState) -> ScoringPlan:
+    """Builds the scoring plan for the questionnaire and variables held in the workflow state."""
+    return ScoringPlan(state.get("questionnaire"), state.get("raw_indicators"), state.get("decision_variables"))
+
+
+def score_answers(state: GraphState, answers: Mapping[str, Any]) -> ScoringResult:
+    """Computes raw indicators and decision variables for a filled questionnaire (answers keyed by variable_name)."""
+    return build_scoring_plan(state).score(answers)
@@ -0,0 +1,86 @@
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from questionnaire_index import QUESTION_LIST_KEYS
+
+# --- Outline-then-sections questionnaire generation ---
+# Pure helpers around the two LLM stages in nodes.generate_questionnaire_sectioned: completing the
+# outline so every raw indicator has a home, and merging the independently generated sections.
+
+DEFAULT_SECTION_QUESTION_COUNT = 6
+
+# Section fields taken from the outline; questions come from the per-section calls
+OUTLINE_SECTION_FIELDS = ("title", "description", "rationale", "is_mandatory", "triggering_criteria")
+
+
+def _words(text: str) -> Set[str]:
+    return {word for word in re.findall(r'[a-z0-9]+', (text or "").replace("_", " ").lower()) if len(word) > 2}
+
+
+def complete_outline(outline_sections: Optional[List[Dict]], raw_indicators: List[Dict]) -> List[Dict]:
+    """
+    Normalizes the outline: orders become 1..n, unknown raw indicators are dropped, and every raw
+    indicator the outline forgot is assigned to the section whose title/description overlaps it most
+    (the first mandatory section when nothing overlaps).
+    """
+    known_ris = {ri["var_name"]: ri for ri in raw_indicators if ri.get("var_name")}
+    sections = []
+    for position, section in enumerate(sorted(outline_sections or [], key=lambda item: item.get("order") or 0), start=1):
+        section = dict(section)
+        section["order"] = position
+        section["raw_indicators"] = [name for name in dict.fromkeys(section.get("raw_indicators") or []) if name in known_ris]
+        sections.append(section)
+    if not sections:
+        return sections
+
+    assigned = {name for section in sections for name in section["raw_indicators"]}
+    fallback = next((section for section in sections if section.get("is_mandatory", True)), sections[0])
+    for name, ri in known_ris.items():
+        if name in assigned:
+            continue
+        ri_words = _words(" ".join([name, ri.get("name") or "", ri.get("description") or ""]))
+        best, best_overlap = fallback, 0
+        for section in sections:
+            overlap = len(ri_words & _words(f"{section.get('title')} {section.get('description')}"))
+            if overlap > best_overlap:
+                best, best_overlap = section, overlap
+        best["raw_indicators"].append(name)
+    return sections
+
+
+def merge_section_outputs(outline_sections: List[Dict], section_outputs: List[Optional[Dict]],
+                          title: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Assembles the questionnaire from the outline and the per-section outputs (None for failed sections).
+    A variable_name generated by more than one section is kept once, in the first section; the
+    duplicate's raw indicators are merged into the kept question. Calculations are assembled from the
+    section outputs, keeping the first formula per raw indicator.
+    """
+    sections: List[Dict] = []
+    questions_by_var: Dict[str, Dict] = {}
+    ri_calculation: Dict[str, str] = {}
+
+    for outline_section, output in zip(outline_sections, section_outputs):
+        section = {field: outline_section.get(field) for field in OUTLINE_SECTION_FIELDS}
+        section["order"] = outline_section["order"]
+        for list_key in QUESTION_LIST_KEYS:
+            section[list_key] = []
+            for question in (output or {}).get(list_key) or []:
+                variable_name = question.get("variable_name")
+                kept = questions_by_var.get(variable_name) if variable_name else None
+                if kept is not None:
+                    kept_ris = kept.get("raw_indicators") or []
+                    kept["raw_indicators"] = kept_ris + [ri for ri in question.get("raw_indicators") or [] if ri not in kept_ris]
+                    continue
+                if variable_name:
+                    questions_by_var[variable_name] = question
+                section[list_key].append(question)
+        for ri_var_name, formula in ((output or {}).get("raw_indicator_calculation") or {}).items():
+            if formula and ri_var_name not in ri_calculation:
+                ri_calculation[ri_var_name] = formula
+        sections.append(section)
+
+    questionnaire: Dict[str, Any] = {"sections": sections, "raw_indicator_calculation": ri_calculation}
+    if title:
+        questionnaire["title"] = title
+    return questionnaire
@@ -0,0 +1,39 @@
+import json
+from typing import Any
+
+# --- Fast JSON serialization ---
+# API responses, Supabase/PostgREST request bodies, the SQLite store and the save outbox all encode through
+# here. orjson (optional; pip install orjson) encodes straight to UTF-8 bytes several times faster than the
+# stdlib; without it the same compact encoding falls back to json. Both produce identical JSON for the plain
+# dict/list/str/number values the assessment state is made of.
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def dumps(value: Any, sort_keys: bool = False) -> bytes:
+    """Compact UTF-8 JSON bytes; values JSON cannot represent are encoded with str()."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=str, option=_ORJSON_OPTIONS | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+        except orjson.JSONEncodeError:
+            # orjson rejects ints wider than 64 bits (e.g. an answer or AI-written value); the stdlib encodes them
+            pass
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, sort_keys=sort_keys, default=str).encode("utf-8")
+
+
+def dumps_str(value: Any, sort_keys: bool = False) -> str:
+    """dumps as a str, for JSON stored inside text columns and event streams."""
+    return dumps(value, sort_keys=sort_keys).decode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Parses JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import serialization
+from metrics import register_section
+
+# --- Request coalescing (single flight) ---
+# A double-clicked "generate", or several reviewers opening the same project, used to start one LLM pipeline
+# per request. Generation endpoints now run their pipeline through SingleFlight.run keyed on the normalized
+# request content: while a pipeline for a key is in flight, identical requests attach to the same future and
+# receive its result (or its exception) instead of starting another one. Nothing is cached once the flight
+# lands; the next identical request runs again. The pipeline runs in a worker thread and is shielded, so a
+# caller that disconnects does not cancel the flight for the others.
+
+# State fields that do not influence what a generation produces
+VOLATILE_STATE_FIELDS = ("stage_timings", "status", "needs_review", "error", "modification_reasoning")
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: Optional[str]) -> str:
+    return _WHITESPACE_PATTERN.sub(" ", prompt or "").strip().lower()
+
+
+def request_key(kind: str, payload: Dict[str, Any], ignore: Iterable[str] = VOLATILE_STATE_FIELDS) -> str:
+    """Hash of a request's content: the endpoint kind plus the payload without volatile fields."""
+    ignored = set(ignore)
+    content = {key: value for key, value in payload.items() if key not in ignored}
+    if "prompt" in content:
+        content["prompt"] = normalize_prompt(content["prompt"])
+    digest = hashlib.sha256(serialization.dumps(content, sort_keys=True)).hexdigest()[:32]
+    return f"{kind}:{digest}"
+
+
+class SingleFlight:
+    """Shares one in-flight call per key between concurrent async callers; counts leaders and followers."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, field: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(kind, {"executed": 0, "coalesced": 0, "in_flight": 0})
+            stats[field] += 1
+
+    async def run(self, key: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs fn(*args) in a worker thread, or waits for the identical call already in flight.
+        The result object is shared by every caller of the flight and must be treated as read-only.
+        """
+        kind = key.split(":", 1)[0]
+        future = self._inflight.get(key)
+        if future is not None:
+            self._count(kind, "coalesced")
+            print(f"Coalesced request onto in-flight {kind} ({key.split(':', 1)[1][:8]})")
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+        self._inflight[key] = future
+        self._count(kind, "executed")
+        self._count(kind, "in_flight")
+        future.add_done_callback(lambda _done: self._land(key, kind))
+        return await asyncio.shield(future)
+
+    def _land(self, key: str, kind: str) -> None:
+        self._inflight.pop(key, None)
+        with self._lock:
+            self._stats[kind]["in_flight"] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-kind counts of executed and coalesced requests, with the share of requests coalesced."""
+        with self._lock:
+            report: Dict[str, Any] = {}
+            for kind, stats in self._stats.items():
+                total = stats["executed"] + stats["coalesced"]
+                report[kind] = {**stats, "coalesced_ratio": round(stats["coalesced"] / total, 3) if total else 0.0}
+            return report
+
+
+generation_flights = SingleFlight()
+register_section("coalescing", generation_flights.stats)
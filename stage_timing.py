@@ -0,0 +1,39 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """
+    Records when each stage of a node starts and ends, in milliseconds since the timer was created.
+    Stages may run on worker threads, so overlapping intervals show which work actually ran concurrently.
+    Recording a stage is a single dict assignment and summary() takes one snapshot, so no lock is needed.
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def _now_ms(self) -> float:
+        return round((time.perf_counter() - self._origin) * 1000, 1)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = self._now_ms()
+        try:
+            yield
+        finally:
+            end = self._now_ms()
+            self.stages[name] = {"start_ms": start, "end_ms": end, "duration_ms": round(end - start, 1)}
+
+    def timed(self, name: str, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Runs function inside a stage; convenient for executor.submit(timer.timed, name, function, ...)."""
+        with self.stage(name):
+            return function(*args, **kwargs)
+
+    def summary(self) -> Dict[str, Any]:
+        """Stages ordered by start time, plus the total elapsed time."""
+        stages = dict(sorted(list(self.stages.items()), key=lambda item: item[1]["start_ms"]))
+        return {"stages": stages, "total_ms": self._now_ms()}
@@ -0,0 +1,334 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import http_client
+import serialization
+from schemas.schemas import SaveSummary
+
+# --- Assessment storage ---
+# write_to_supabase / fetch_supabase_tables go through a StorageBackend chosen by STORAGE_BACKEND:
+#   supabase (default) - the hosted PostgREST API (bulk upserts, one request per batch of rows).
+#   sqlite             - an embedded database at SQLITE_DB_PATH (WAL mode, indexed on project_id, bulk
+#                        upserts in one transaction) for single-node deployments, tests and benchmarks.
+#
+# Saves are delta-only: a per-project ledger row in SAVE_LEDGER_TABLE holds the content hash of every row
+# last persisted, so save_project_rows only upserts inserted/changed rows and deletes rows that disappeared.
+# On Supabase the ledger needs a table `save_ledger` (id text primary key, project_id text, hashes jsonb);
+# without it every save falls back to a full upsert, as before.
+#
+# All Supabase traffic goes through http_client (pooled keep-alive client, timeouts, circuit breaker).
+# The async API paths read through afetch_all / afetch_project: the async HTTP client on Supabase, a worker
+# thread on backends without native async I/O.
+
+SUPABASE_URL = "https://kvzvonrozcmpiflnzcjy.supabase.co/rest/v1"
+SUPABASE_API_KEY = os.getenv("SUPABASE_CLIENT_ANON_KEY", "YOUR_SUPABASE_CLIENT_ANON_KEY")
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_store", "assessments.db")
+
+# Tables an assessment is saved to
+STORAGE_TABLES = ("raw_indicators", "decision_variables", "questions", "prompts")
+SAVE_LEDGER_TABLE = "save_ledger"
+
+# Ids per PostgREST `in.(...)` delete request, to keep URLs short
+DELETE_BATCH_SIZE = 100
+# Rows per PostgREST bulk upsert request
+UPSERT_BATCH_SIZE = 500
+
+_storage_cache: Dict[str, Optional["StorageBackend"]] = {"backend": None}
+
+
+class StorageBackend:
+    """Row store for the assessment tables; rows are dicts keyed by 'id' and carry a 'project_id'."""
+    name = "base"
+
+    def upsert(self, table: str, rows: List[Dict[str, Any]]) -> bool:
+        """Inserts or replaces rows by id. Returns False if any row could not be written."""
+        raise NotImplementedError
+
+    def fetch_all(self, table: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def fetch_project(self, table: str, project_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def delete(self, table: str, ids: List[str]) -> bool:
+        """Deletes rows by id. Returns False if the rows could not be deleted."""
+        raise NotImplementedError
+
+    async def afetch_all(self, table: str) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.fetch_all, table)
+
+    async def afetch_project(self, table: str, project_id: str) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.fetch_project, table, project_id)
+
+
+class PostgrestStorage(StorageBackend):
+    """Supabase (PostgREST) REST API."""
+    name = "supabase"
+
+    def __init__(self, base_url: str = SUPABASE_URL, api_key: str = SUPABASE_API_KEY):
+        self.base_url = base_url
+        self.headers = {
+            "apikey": api_key,
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _upsert_batch(self, table_name: str, items: List[Dict[str, Any]]) -> bool:
+        """
+        Upserts rows in one request using Supabase's native upsert functionality
+        (update if exists, insert if new). All rows of a batch must have the same keys.
+        """
+        url = f"{self.base_url}/{table_name}"
+
+        upsert_headers = self.headers.copy()
+        upsert_headers["Prefer"] = "resolution=merge-duplicates,return=minimal"
+
+        print(f"🔄 Upserting {len(items)} rows into '{table_name}'")
+        try:
+            response = http_client.request("POST", url, headers=upsert_headers, json_body=items)
+            if response.status_code in [200, 201]:
+                return True
+            print(f"❌ Upsert into '{table_name}' failed with status {response.status_code}")
+            print(f"📋 Error details: {response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ Error during upsert into '{table_name}': {e}")
+            return False
+
+    def upsert(self, table: str, rows: List[Dict[str, Any]]) -> bool:
+        ok = True
+        # PostgREST bulk upserts need identical keys in every object, so rows are grouped by key set
+        batches: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in rows:
+            if not row.get("id"):
+                print(f"❌ Error: Item for table '{table}' missing 'id'. Cannot upsert.")
+                ok = False
+                continue
+            batches.setdefault(tuple(sorted(row)), []).append(row)
+        for batch in batches.values():
+            for start in range(0, len(batch), UPSERT_BATCH_SIZE):
+                if not self._upsert_batch(table, batch[start:start + UPSERT_BATCH_SIZE]):
+                    ok = False
+        return ok
+
+    def _select(self, table: str, query: str) -> List[Dict[str, Any]]:
+        resp = http_client.request("GET", f"{self.base_url}/{table}?{query}", headers=self.headers)
+        resp.raise_for_status()
+        return resp.json()
+
+    def fetch_all(self, table: str) -> List[Dict[str, Any]]:
+        return self._select(table, "select=*")
+
+    def fetch_project(self, table: str, project_id: str) -> List[Dict[str, Any]]:
+        return self._select(table, f"project_id=eq.{project_id}&select=*")
+
+    async def _aselect(self, table: str, query: str) -> List[Dict[str, Any]]:
+        resp = await http_client.arequest("GET", f"{self.base_url}/{table}?{query}", headers=self.headers)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def afetch_all(self, table: str) -> List[Dict[str, Any]]:
+        return await self._aselect(table, "select=*")
+
+    async def afetch_project(self, table: str, project_id: str) -> List[Dict[str, Any]]:
+        return await self._aselect(table, f"project_id=eq.{project_id}&select=*")
+
+    def delete(self, table: str, ids: List[str]) -> bool:
+        ok = True
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            quoted = ",".join(json.dumps(str(row_id)) for row_id in ids[start:start + DELETE_BATCH_SIZE])
+            try:
+                response = http_client.request("DELETE", f"{self.base_url}/{table}", headers=self.headers,
+                                               params={"id": f"in.({quoted})"})
+                if response.status_code not in [200, 204]:
+                    print(f"❌ Delete from '{table}' failed with status {response.status_code}: {response.text}")
+                    ok = False
+            except Exception as e:
+                print(f"❌ Error deleting from '{table}': {e}")
+                ok = False
+        return ok
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Embedded SQLite store. Every table keeps the row as JSON next to its id (primary key) and
+    project_id (indexed); one connection per thread, WAL journal so readers never block the writer.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            for table in STORAGE_TABLES:
+                self._create_table(conn, table)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Durable across application crashes in WAL mode
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection, table: str) -> None:
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (id TEXT PRIMARY KEY, project_id TEXT, data TEXT NOT NULL)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_project_id" ON "{table}" (project_id)')
+
+    def upsert(self, table: str, rows: List[Dict[str, Any]]) -> bool:
+        valid_rows = [row for row in rows if row.get("id")]
+        if len(valid_rows) < len(rows):
+            print(f"❌ Error: {len(rows) - len(valid_rows)} items for table '{table}' missing 'id'. Cannot upsert them.")
+        try:
+            conn = self._connection()
+            with conn:  # One transaction for the whole batch
+                self._create_table(conn, table)
+                conn.executemany(
+                    f'INSERT INTO "{table}" (id, project_id, data) VALUES (?, ?, ?) '
+                    f'ON CONFLICT(id) DO UPDATE SET project_id = excluded.project_id, data = excluded.data',
+                    [(str(row["id"]), row.get("project_id"), serialization.dumps_str(row)) for row in valid_rows]
+                )
+        except sqlite3.Error as e:
+            print(f"❌ Error upserting {len(valid_rows)} rows into SQLite table '{table}': {e}")
+            return False
+        return len(valid_rows) == len(rows)
+
+    def _select(self, table: str, where: str = "", params: tuple = ()) -> List[Dict[str, Any]]:
+        conn = self._connection()
+        try:
+            cursor = conn.execute(f'SELECT data FROM "{table}" {where} ORDER BY rowid', params)
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                return []
+            raise
+        return [serialization.loads(data) for (data,) in cursor]
+
+    def fetch_all(self, table: str) -> List[Dict[str, Any]]:
+        return self._select(table)
+
+    def fetch_project(self, table: str, project_id: str) -> List[Dict[str, Any]]:
+        return self._select(table, "WHERE project_id = ?", (project_id,))
+
+    def delete(self, table: str, ids: List[str]) -> bool:
+        try:
+            conn = self._connection()
+            with conn:
+                self._create_table(conn, table)
+                conn.executemany(f'DELETE FROM "{table}" WHERE id = ?', [(str(row_id),) for row_id in ids])
+        except sqlite3.Error as e:
+            print(f"❌ Error deleting {len(ids)} rows from SQLite table '{table}': {e}")
+            return False
+        return True
+
+
+def create_storage(backend: Optional[str] = None) -> StorageBackend:
+    backend = (backend or os.getenv("STORAGE_BACKEND", PostgrestStorage.name)).strip().lower()
+    if backend == SQLiteStorage.name:
+        return SQLiteStorage(os.getenv("SQLITE_DB_PATH", DEFAULT_SQLITE_PATH))
+    if backend != PostgrestStorage.name:
+        print(f"Warning: Unknown STORAGE_BACKEND '{backend}', using '{PostgrestStorage.name}'.")
+    return PostgrestStorage()
+
+
+def get_storage() -> StorageBackend:
+    """The process-wide storage backend (created from STORAGE_BACKEND on first use)."""
+    if _storage_cache["backend"] is None:
+        _storage_cache["backend"] = create_storage()
+    return _storage_cache["backend"]
+
+
+def set_storage(backend: Optional[StorageBackend]) -> None:
+    """Replaces the process-wide backend (None: re-read STORAGE_BACKEND on next use)."""
+    _storage_cache["backend"] = backend
+
+
+# --- Delta-only saves ---
+
+def row_hash(row: Dict[str, Any]) -> str:
+    return hashlib.sha256(serialization.dumps(row, sort_keys=True)).hexdigest()[:16]
+
+
+def load_save_ledger(storage: StorageBackend, project_id: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """Row hashes of the last save ({table: {row_id: hash}}), or None when unknown."""
+    try:
+        rows = storage.fetch_project(SAVE_LEDGER_TABLE, project_id)
+    except Exception as e:
+        print(f"Warning: Could not load the save ledger of project {project_id} ({e}); saving every row.")
+        return None
+    return _ledger_hashes(rows)
+
+
+async def aload_save_ledger(storage: StorageBackend, project_id: str) -> Optional[Dict[str, Dict[str, str]]]:
+    """Async variant of load_save_ledger."""
+    try:
+        rows = await storage.afetch_project(SAVE_LEDGER_TABLE, project_id)
+    except Exception as e:
+        print(f"Warning: Could not load the save ledger of project {project_id} ({e}).")
+        return None
+    return _ledger_hashes(rows)
+
+
+def _ledger_hashes(rows: List[Dict[str, Any]]) -> Optional[Dict[str, Dict[str, str]]]:
+    if not rows:
+        return None
+    return rows[0].get("hashes") or {}
+
+
+def save_project_rows(storage: StorageBackend, project_id: str,
+                      rows_by_table: Dict[str, Iterable[Dict[str, Any]]]) -> SaveSummary:
+    """
+    Persists the current rows of a project, given per table (tables missing from rows_by_table are
+    left untouched). Compared with the ledger of the last save, only inserted and changed rows are
+    upserted and rows that disappeared are deleted. The ledger only records what was actually
+    written, so rows of a failed upsert or delete are retried on the next save.
+    """
+    previous = load_save_ledger(storage, project_id)
+    ledger: Dict[str, Dict[str, str]] = {table: dict(hashes) for table, hashes in (previous or {}).items()}
+    summary: SaveSummary = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0, "failed_tables": []}
+
+    for table, rows in rows_by_table.items():
+        rows = list(rows)
+        old_hashes = ledger.get(table, {})
+        new_hashes = {str(row.get("id")): row_hash(row) for row in rows}
+        changed = [row for row in rows if old_hashes.get(str(row.get("id"))) != new_hashes[str(row.get("id"))]]
+        removed = [row_id for row_id in old_hashes if row_id not in new_hashes]
+        table_hashes = {row_id: digest for row_id, digest in old_hashes.items() if row_id in new_hashes}
+
+        if changed:
+            print(f"Upserting {len(changed)} of {len(rows)} rows into '{table}' ({len(rows) - len(changed)} unchanged)...")
+            if storage.upsert(table, changed):
+                for row in changed:
+                    row_id = str(row.get("id"))
+                    summary["updated" if row_id in old_hashes else "inserted"] += 1
+                    table_hashes[row_id] = new_hashes[row_id]
+            else:
+                summary["failed_tables"].append(table)
+        summary["unchanged"] += len(rows) - len(changed)
+
+        if removed:
+            print(f"Deleting {len(removed)} rows no longer in the project from '{table}'...")
+            if storage.delete(table, removed):
+                summary["deleted"] += len(removed)
+            else:
+                table_hashes.update({row_id: old_hashes[row_id] for row_id in removed})
+                if table not in summary["failed_tables"]:
+                    summary["failed_tables"].append(table)
+        ledger[table] = table_hashes
+
+    if ledger != (previous or {}) or previous is None:
+        ledger_row = {"id": project_id, "project_id": project_id, "hashes": ledger}
+        if not storage.upsert(SAVE_LEDGER_TABLE, [ledger_row]):
+            print(f"Warning: Could not store the save ledger of project {project_id}; the next save writes every row.")
+    print(f"Save of project {project_id}: {summary['inserted']} inserted, {summary['updated']} updated, "
+          f"{summary['deleted']} deleted, {summary['unchanged']} unchanged")
+    return summary
@@ -0,0 +1,409 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import difflib
+
+import pandas as pd
+
+from compact_state import CompactAssessment
+from formula_validation import VALID, validate_project_formulas
+from schemas.schemas import TemplateMatch
+
+# --- Occupation template library ---
+# data_store/filtered_flow_data.csv holds fully specified occupation flows (cards, question data names,
+# function bodies). build_template_index converts each of them offline into a normalized assessment
+# (raw indicators, decision variables, questionnaire) and writes a compact JSON index, so that
+# generate_variables / generate_questionnaire can start from the closest template instead of from scratch.
+#
+# The index is a build artifact and is not committed: load_template_index (called at API startup) builds it
+# whenever it is missing or was built from another version of the CSV. Rebuild by hand with:
+# python template_library.py
+# Converted templates are validated like project formulas; decision variables and triggering criteria that do
+# not pass are dropped, and placeholder function arguments (str1, param1, ...) never become raw indicators.
+#
+# At runtime the index is held as compact records (see compact_state.py); get_template materializes the
+# dict shape of one template on demand.
+
+DATA_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_store")
+TEMPLATE_CSV_PATH = os.path.join(DATA_STORE_DIR, "filtered_flow_data.csv")
+TEMPLATE_INDEX_PATH = os.path.join(DATA_STORE_DIR, "template_index.json")
+TEMPLATE_INDEX_VERSION = 2
+
+# Minimum share of a template name's words found in the prompt (prefix matches count 0.8)
+TEMPLATE_MATCH_THRESHOLD = 0.5
+
+# Test and scratch flows in the export that must never seed a project
+EXCLUDED_TEMPLATE_PATTERN = re.compile(r'test|trigger|transition|hydration', re.I)
+VERSION_PATTERN = re.compile(r'\s*\bV(\d+)\b', re.I)
+
+# Function arguments that are placeholders rather than variables (generic helpers, grid callbacks)
+GENERIC_ARGUMENT_PATTERN = re.compile(r'^(params?\d*|args?\d*|str\d*|num\d*|val\d*|value\d*|input\d*|[a-z]\d*|infoGrid|)$', re.I)
+# Function bodies that manipulate the page instead of computing a value
+DOM_FUNCTION_PATTERN = re.compile(r'\b(document|window|console)\b')
+OUTPUT_SUFFIX_PATTERN = re.compile(r'(Function|Calculation|Calc)$')
+
+_MATCH_STOPWORDS = {"shop", "store", "business", "income", "and", "the", "for", "with", "from"}
+# Separators between alternative names of one template ("Salon/Beauty Parlor", "Hotel or Eatery")
+NAME_ALTERNATIVES_PATTERN = re.compile(r'\s*(?:/|&|\bor\b)\s*', re.I)
+# Common names of the occupations a template covers that its own name does not contain
+TEMPLATE_ALIASES: Dict[str, List[str]] = {
+    "Kirana/Provision Store": ["Grocery", "General Store", "Supermarket"],
+    "Hotel or Eatery": ["Street Food", "Food Stall", "Food Vendor", "Restaurant", "Dhaba", "Canteen"],
+    "Livestock": ["Dairy", "Dairy Farming", "Cattle", "Goat Farming", "Poultry"],
+    "Livestock Buffalo Addition": ["Buffalo"],
+    "Salon/Beauty Parlor": ["Barber", "Hair Cutting"],
+    "Vegetable & Fruit Shop": ["Greengrocer", "Vegetable Vendor", "Fruit Vendor"],
+    "Tailoring": ["Tailor", "Boutique"],
+    "Garage": ["Mechanic", "Auto Repair", "Bike Repair"],
+    "Mobile Shop": ["Mobile Repair", "Phone Repair"],
+    "Tea Shop": ["Tea Stall", "Chai"],
+    "Cloth Business": ["Clothes", "Garments", "Textile"],
+}
+# Minimum similarity of two spellings of a word (parlour/parlor) to count as a partial match
+FUZZY_TOKEN_RATIO = 0.85
+
+_QUESTION_TYPES = {
+    "number": "float",
+    "text": "text",
+    "textArea": "text",
+    "radio": "dropdown",
+    "select": "dropdown",
+    "checkbox": "dropdown",
+    "date": "text",
+}
+
+# Impact score of raw indicators captured only for context (not read by any template computation)
+CONTEXT_IMPACT_SCORE = 20
+
+# Index entry keys besides the assessment itself
+TEMPLATE_METADATA_KEYS = ("name", "source_template", "tokens")
+
+_template_index_cache: Dict[str, Any] = {"path": None, "templates": None}
+
+
+def _snake_case(name: str) -> str:
+    name = re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', (name or "").strip())
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def _humanize(name: str) -> str:
+    return _snake_case(name).replace('_', ' ').capitalize()
+
+
+def _clean(value: Any) -> str:
+    return "" if pd.isna(value) else str(value).strip()
+
+
+def _match_tokens(text: str) -> List[str]:
+    words = re.findall(r'[a-z]+', VERSION_PATTERN.sub(" ", text or "").lower())
+    return [word for word in dict.fromkeys(words) if len(word) > 2 and word not in _MATCH_STOPWORDS]
+
+
+def _name_alternatives(base_name: str) -> List[List[str]]:
+    """Match tokens of every name a template answers to: its full name, each alternative in it and its aliases."""
+    names = [base_name] + NAME_ALTERNATIVES_PATTERN.split(base_name) + TEMPLATE_ALIASES.get(base_name, [])
+    alternatives: List[List[str]] = []
+    for name in names:
+        tokens = _match_tokens(name)
+        if tokens and tokens not in alternatives:
+            alternatives.append(tokens)
+    return alternatives
+
+
+# --- Offline conversion ---
+
+def _template_functions(rows: pd.DataFrame) -> Dict[str, Tuple[str, List[str], str]]:
+    """Named computations of a template: output name -> (function body, argument names, card name)."""
+    functions: Dict[str, Tuple[str, List[str], str]] = {}
+    for _, row in rows[rows["record_type"] == "Function Definition"].iterrows():
+        function_name, body = _clean(row["function_name"]), _clean(row["function_body"])
+        try:
+            arguments = [str(arg).strip() for arg in json.loads(_clean(row["function_args"]) or "[]")]
+        except json.JSONDecodeError:
+            continue
+        if not function_name or not body or DOM_FUNCTION_PATTERN.search(body):
+            continue
+        if not arguments or any(GENERIC_ARGUMENT_PATTERN.match(arg) for arg in arguments):
+            continue
+        output_name = OUTPUT_SUFFIX_PATTERN.sub("", function_name)
+        functions.setdefault(output_name, (body, arguments, _clean(row["card_name"])))
+    return functions
+
+
+def convert_template(template_name: str, rows: pd.DataFrame) -> Dict[str, Any]:
+    """Converts the CSV rows of one template into raw indicators, decision variables and a questionnaire."""
+    questions_by_data_name: Dict[str, Dict] = {}
+    sections: List[Dict] = []
+    sections_by_card: Dict[str, Dict] = {}
+    for _, row in rows[rows["record_type"] == "Question"].iterrows():
+        data_name = _clean(row["question_data_name"])
+        if not data_name or data_name in questions_by_data_name:
+            continue
+        card_name = _clean(row["card_name"])
+        section = sections_by_card.get(card_name)
+        if section is None:
+            title = re.sub(r'^\s*\d+(\.\d+)*\s*-?\s*', '', card_name).strip() or card_name
+            is_sub_card = bool(re.match(r'^\s*\d+\.\d+', card_name))
+            section = {
+                "title": title,
+                "description": f"{title} ({template_name})",
+                "order": len(sections) + 1,
+                # The export carries no card visibility conditions, so sub-cards are kept as regular sections
+                "is_mandatory": True,
+                "rationale": f"Card '{card_name}' of the {template_name} template" +
+                             (f"; applies when earlier answers call for '{title}' details." if is_sub_card else "."),
+                "triggering_criteria": None,
+                "core_questions": [],
+                "conditional_questions": [],
+            }
+            sections_by_card[card_name] = section
+            sections.append(section)
+        input_type = _clean(row["question_input_type"])
+        variable_name = f"q_{_snake_case(data_name)}"
+        question = {
+            "id": variable_name,
+            "text": _clean(row["question_label"]),
+            "type": _QUESTION_TYPES.get(input_type, "text"),
+            "variable_name": variable_name,
+            "raw_indicators": [],
+            "formula": f"return Number({variable_name});" if input_type == "number" else f"return {variable_name};",
+            "is_conditional": False,
+        }
+        questions_by_data_name[data_name] = question
+        section["core_questions"].append(question)
+
+    functions = _template_functions(rows)
+    decision_variables: List[Dict] = []
+    raw_indicators: Dict[str, Dict] = {}
+    ri_calculation: Dict[str, str] = {}
+    for output_name, (body, arguments, card_name) in functions.items():
+        formula = body
+        for argument in arguments:
+            formula = re.sub(r'\b' + re.escape(argument) + r'\b', _snake_case(argument), formula)
+            if argument in functions or _snake_case(argument) in raw_indicators:
+                continue
+            ri_var_name = _snake_case(argument)
+            question = questions_by_data_name.get(argument)
+            raw_indicators[ri_var_name] = {
+                "id": ri_var_name,
+                "name": question["text"] if question else _humanize(argument),
+                "var_name": ri_var_name,
+                "description": question["text"] if question else f"{_humanize(argument)}, computed on the '{card_name}' card.",
+                "type": "float",
+                "impact_score": 50,
+                "priority_rationale": f"Input of the {template_name} template computations.",
+                "formula": None,
+            }
+            if question:
+                question["raw_indicators"].append(ri_var_name)
+                ri_calculation[ri_var_name] = f"return Number({question['variable_name']});"
+        decision_variables.append({
+            "id": _snake_case(output_name),
+            "name": _humanize(output_name),
+            "var_name": _snake_case(output_name),
+            "description": f"{_humanize(output_name)} computed by the {template_name} template.",
+            "type": "float",
+            "impact_score": 50,
+            "priority_rationale": f"Computed by the {template_name} template.",
+            "formula": formula,
+        })
+
+    # Every question of the project model captures a raw indicator: questions the computations do not read
+    # (profile and context questions) capture one of their own, so that seeding keeps them
+    dv_names = {dv["var_name"] for dv in decision_variables}
+    for question in questions_by_data_name.values():
+        ri_var_name = question["variable_name"][len("q_"):]
+        if question["raw_indicators"] or ri_var_name in raw_indicators or ri_var_name in dv_names:
+            continue
+        raw_indicators[ri_var_name] = {
+            "id": ri_var_name,
+            "name": question["text"] or _humanize(ri_var_name),
+            "var_name": ri_var_name,
+            "description": question["text"] or _humanize(ri_var_name),
+            "type": question["type"],
+            "impact_score": CONTEXT_IMPACT_SCORE,
+            "priority_rationale": f"Context captured by the {template_name} questionnaire; not used by its computations.",
+            "formula": None,
+        }
+        question["raw_indicators"].append(ri_var_name)
+        ri_calculation[ri_var_name] = question["formula"]
+
+    assessment = {
+        "raw_indicators": list(raw_indicators.values()),
+        "decision_variables": decision_variables,
+        "questionnaire": {"title": f"{template_name} Income Assessment", "sections": sections,
+                          "raw_indicator_calculation": ri_calculation},
+    }
+    _drop_invalid_formulas(template_name, assessment)
+    return assessment
+
+
+def _drop_invalid_formulas(template_name: str, assessment: Dict[str, Any]) -> None:
+    """
+    Drops the decision variables whose formula fails validation (then those reading a dropped one, until
+    none fail) and invalid raw indicator calculations and question formulas, so a template never seeds a
+    project with formulas that need refinement.
+    """
+    while True:
+        report = validate_project_formulas(assessment)
+        invalid = [entry for entry in report["entries"] if entry["status"] != VALID]
+        invalid_dvs = {entry["target"].split(":", 1)[1] for entry in invalid if entry["target"].startswith("decision_variable:")}
+        if invalid_dvs:
+            print(f"Template '{template_name}': dropping decision variables with invalid formulas: {sorted(invalid_dvs)}")
+            assessment["decision_variables"] = [dv for dv in assessment["decision_variables"]
+                                                if dv["var_name"] not in invalid_dvs]
+            continue
+        break
+    if invalid:
+        print(f"Template '{template_name}': clearing {len(invalid)} invalid expressions")
+    targets = {entry["target"] for entry in invalid}
+    ri_calculation = assessment["questionnaire"]["raw_indicator_calculation"]
+    for name in [name for name in ri_calculation if f"raw_indicator:{name}" in targets]:
+        del ri_calculation[name]
+    for question in [question for section in assessment["questionnaire"]["sections"]
+                     for question in section["core_questions"] + section["conditional_questions"]]:
+        if f"question:{question['variable_name']}" in targets:
+            question["formula"] = None
+
+
+def build_template_index(csv_path: str = TEMPLATE_CSV_PATH, index_path: str = TEMPLATE_INDEX_PATH) -> Dict[str, Any]:
+    """
+    Converts every occupation template of the CSV export and writes the compact index.
+    Test flows are skipped; of several versions of a template only the latest is kept.
+    """
+    with open(csv_path, "rb") as f:
+        source_hash = hashlib.sha256(f.read()).hexdigest()
+    df = pd.read_csv(csv_path)
+    df.columns = df.columns.str.strip()
+
+    # Versions of one occupation ("Bakery", "Bakery V2", "Livestock - Buffalo Addition") share their name tokens
+    latest: Dict[Tuple[str, ...], Tuple[int, str, str]] = {}
+    for template_name in df["template_name"].dropna().unique():
+        if EXCLUDED_TEMPLATE_PATTERN.search(template_name):
+            continue
+        version_match = VERSION_PATTERN.search(template_name)
+        version = int(version_match.group(1)) if version_match else 0
+        base_name = VERSION_PATTERN.sub("", template_name).strip()
+        key = tuple(_match_tokens(base_name))
+        if key not in latest or version > latest[key][0]:
+            latest[key] = (version, base_name, template_name)
+
+    templates = []
+    for _version, base_name, template_name in sorted(latest.values(), key=lambda item: item[1]):
+        assessment = convert_template(base_name, df[df["template_name"] == template_name])
+        if not assessment["questionnaire"]["sections"]:
+            continue
+        templates.append({"name": base_name, "source_template": template_name,
+                          "tokens": _name_alternatives(base_name), **assessment})
+
+    index = {"version": TEMPLATE_INDEX_VERSION, "source_hash": source_hash, "templates": templates}
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"), ensure_ascii=False)
+    print(f"Wrote {len(templates)} templates to {index_path}")
+    return index
+
+
+# --- Runtime lookup ---
+
+def _csv_hash(csv_path: str) -> Optional[str]:
+    try:
+        with open(csv_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def ensure_template_index(csv_path: str = TEMPLATE_CSV_PATH, index_path: str = TEMPLATE_INDEX_PATH) -> None:
+    """Builds the index when it is missing, of an older index version or built from a different CSV."""
+    source_hash = _csv_hash(csv_path)
+    if source_hash is None:
+        return  # No export to build from; load_template_index then works with whatever index exists
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == TEMPLATE_INDEX_VERSION and index.get("source_hash") == source_hash:
+            return
+    except (OSError, json.JSONDecodeError):
+        pass
+    try:
+        build_template_index(csv_path, index_path)
+    except Exception as e:
+        print(f"Warning: Could not build the template index ({e}).")
+
+
+def load_template_index(index_path: str = TEMPLATE_INDEX_PATH) -> List[CompactAssessment]:
+    """
+    Loads (and caches) the template index as compact records, building it first if needed;
+    returns [] when no index can be built.
+    """
+    if _template_index_cache["path"] != index_path:
+        if index_path == TEMPLATE_INDEX_PATH:
+            ensure_template_index()
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            templates = index.get("templates", []) if index.get("version") == TEMPLATE_INDEX_VERSION else []
+            templates = [CompactAssessment.from_state(template, extra_keys=TEMPLATE_METADATA_KEYS) for template in templates]
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Template index unavailable ({e}); generating from scratch.")
+            templates = []
+        _template_index_cache["path"] = index_path
+        _template_index_cache["templates"] = templates
+    return _template_index_cache["templates"]
+
+
+def _similar_tokens(template_token: str, token: str) -> bool:
+    """Inflections (buffalo/buffaloes) and spelling variants (parlor/parlour) of one word."""
+    if len(min(template_token, token, key=len)) < 4:
+        return False
+    if token.startswith(template_token) or template_token.startswith(token):
+        return True
+    return difflib.SequenceMatcher(None, template_token, token).ratio() >= FUZZY_TOKEN_RATIO
+
+
+def _name_score(template_tokens: List[str], prompt_tokens: List[str]) -> float:
+    if not template_tokens:
+        return 0.0
+    total = 0.0
+    for template_token in template_tokens:
+        if template_token in prompt_tokens:
+            total += 1.0
+        elif any(_similar_tokens(template_token, token) for token in prompt_tokens):
+            total += 0.8
+    return total / len(template_tokens)
+
+
+def _template_score(alternatives: List[List[str]], prompt_tokens: List[str]) -> float:
+    """Score of the template name (or alias) that best matches the prompt."""
+    return max((_name_score(tokens, prompt_tokens) for tokens in alternatives or []), default=0.0)
+
+
+def find_closest_template(prompt: str, index_path: str = TEMPLATE_INDEX_PATH) -> Optional[TemplateMatch]:
+    """
+    Returns the template whose occupation name best matches the prompt, or None when no template
+    reaches TEMPLATE_MATCH_THRESHOLD or the best two are tied (ambiguous prompts use full generation).
+    """
+    prompt_tokens = _match_tokens(prompt)
+    scored = sorted(((_template_score(template.get("tokens"), prompt_tokens), template.get("name"))
+                     for template in load_template_index(index_path)), reverse=True)
+    if not scored or scored[0][0] < TEMPLATE_MATCH_THRESHOLD:
+        return None
+    if len(scored) > 1 and scored[1][0] == scored[0][0]:
+        print(f"Template match ambiguous between '{scored[0][1]}' and '{scored[1][1]}'; generating from scratch.")
+        return None
+    return {"name": scored[0][1], "score": round(scored[0][0], 3)}
+
+
+def get_template(name: str, index_path: str = TEMPLATE_INDEX_PATH) -> Optional[Dict]:
+    """Returns a fresh dict copy of a template's assessment (safe to mutate), or None."""
+    for template in load_template_index(index_path):
+        if template.get("name") == name:
+            return template.to_state()
+    return None
+
+
+if __name__ == "__main__":
+    build_template_index()
@@ -0,0 +1,42 @@
+import pytest
+
+from bulk_scoring import records_to_columns, score_responses_batch, table_to_records
+from scoring import score_answers
+
+STATE = {
+    "raw_indicators": [{"var_name": "monthly", "name": "Monthly sales"}],
+    "decision_variables": [
+        {"var_name": "dv_sales", "name": "Sales plus one", "formula": "return q_sales + 1;"},
+        {"var_name": "dv_income", "name": "Income", "formula": "return monthly * 0.2;"},
+    ],
+    "questionnaire": {
+        "sections": [{"title": "Sales", "core_questions": [
+            {"variable_name": "q_sales", "text": "Daily sales?"},
+            {"variable_name": "q_days", "text": "Days open per week?"},
+        ]}],
+        "raw_indicator_calculation": {"monthly": "return q_sales * q_days * 4;"},
+    },
+}
+
+RESPONSES = [
+    {"q_sales": None, "q_days": 2},
+    {"q_days": 2},
+    {"q_sales": 250, "q_days": 6},
+    {"q_sales": "300", "q_days": 5},
+    {"q_sales": 10 ** 30, "q_days": 1},
+]
+
+
+@pytest.mark.parametrize("index", range(len(RESPONSES)))
+def test_batch_matches_single_scoring(index):
+    batch = score_responses_batch(STATE, records_to_columns(RESPONSES))
+    row = table_to_records(batch["table"])[index]
+    single = score_answers(STATE, RESPONSES[index])
+    assert {**single["raw_indicators"], **single["decision_variables"]} == {
+        name: row[name] for name in ("monthly", "dv_sales", "dv_income")}
+
+
+def test_null_answer_is_zero_and_missing_answer_is_undefined():
+    rows = table_to_records(score_responses_batch(STATE, records_to_columns(RESPONSES[:2]))["table"])
+    assert (rows[0]["monthly"], rows[0]["dv_sales"]) == (0, 1)
+    assert (rows[1]["monthly"], rows[1]["dv_sales"]) == (None, None)
@@ -0,0 +1,142 @@
+import math
+import time
+
+import pytest
+
+from formula_engine import (
+    UNDEFINED,
+    FormulaEvaluationError,
+    FormulaSyntaxError,
+    evaluate_formula,
+    parse_int,
+    to_output_value,
+)
+
+
+def run(source, **values):
+    return evaluate_formula(source, values)
+
+
+# --- Arithmetic ---
+
+@pytest.mark.parametrize("source, expected", [
+    ("return 1 + 2 * 3;", 7),
+    ("return 7 / 2;", 3.5),
+    ("return 7 % 3;", 1),
+    ("return -7 % 3;", -1),
+    ("return 2 ** 10;", 1024),
+    ("return Math.round(2.5);", 3),
+    ("return Math.round(-2.5);", -2),
+    ("return Math.floor(-1.5);", -2),
+    ("return Math.max(1, 5, 3);", 5),
+    ("return '5' * '2';", 10),
+    ("return 5 + '1';", "51"),
+    ("return (2.345).toFixed(1);", "2.3"),
+    ("return (5).toFixed();", "5"),
+])
+def test_arithmetic_matches_js(source, expected):
+    assert to_output_value(run(source)) == expected
+
+
+def test_numbers_are_doubles():
+    assert isinstance(run("return 3;"), float)
+    assert isinstance(run("return q_x * 2;", q_x=4), float)
+    assert run("return 9007199254740993;") == 9007199254740992
+    assert run("return 0.1 + 0.2;") == 0.30000000000000004
+
+
+def test_division_by_zero():
+    assert run("return 1 / 0;") == math.inf
+    assert run("return -1 / 0;") == -math.inf
+    assert math.isnan(run("return 0 / 0;"))
+    assert math.isnan(run("return 1 % 0;"))
+
+
+# --- Overflow and resource limits ---
+
+def test_huge_powers_overflow_to_infinity_quickly():
+    started = time.perf_counter()
+    assert run("return 7 ** 9 ** 9;") == math.inf
+    assert run("return 10 ** 400;") == math.inf
+    assert run("return (-2) ** 1025;") == -math.inf
+    assert run("return (-2) ** 1024;") == math.inf
+    assert run("return 2 ** 100000000 > 1;") is True
+    assert run("return Math.pow(10, 400) - Math.pow(10, 400);") != 0
+    assert time.perf_counter() - started < 1
+
+
+def test_overflowing_results_serialize_as_null():
+    assert to_output_value(run("return 10 ** 400;")) is None
+    assert to_output_value(run("return q_x * 1000000000000;", q_x=1000000)) == 1e18
+
+
+def test_big_integer_inputs_become_doubles():
+    assert run("return q_x + 1;", q_x=10 ** 400) == math.inf
+    assert to_output_value(10 ** 30) == 1e30
+    assert isinstance(to_output_value(2 ** 53), int)
+
+
+def test_special_powers():
+    assert math.isnan(run("return 1 ** Infinity;"))
+    assert run("return 0 ** -1;") == math.inf
+    assert math.isnan(run("return Math.pow(-8, 1 / 3);"))
+    assert run("return Math.exp(1000);") == math.inf
+
+
+@pytest.mark.parametrize("digits", ["-1", "101", "100000000", "Infinity"])
+def test_to_fixed_rejects_out_of_range_digits(digits):
+    with pytest.raises(FormulaEvaluationError, match="RangeError"):
+        run(f"return (1).toFixed({digits});")
+
+
+def test_to_fixed_limits():
+    assert run("return (1).toFixed(100);") == "1." + "0" * 100
+    assert run("return (1e21).toFixed(2);") == "1e+21"
+    assert run("return (1 / 0).toFixed(2);") == "Infinity"
+
+
+def test_string_growth_is_capped():
+    doubling = " a += a;" * 20
+    with pytest.raises(FormulaEvaluationError, match="Invalid string length"):
+        run(f"let a = 'xx';{doubling} return a.length;")
+
+
+def test_deep_nesting_is_a_syntax_error():
+    with pytest.raises(FormulaSyntaxError):
+        run("return " + "(" * 5000 + "1" + ")" * 5000 + ";")
+
+
+# --- parseInt ---
+
+@pytest.mark.parametrize("args, expected", [
+    (("42px",), 42),
+    ((" -17",), -17),
+    (("0x1F",), 31),
+    (("ff", 16), 255),
+    (("z", 36), 35),
+    (("0" * 3000 + "7",), 7),
+])
+def test_parse_int(args, expected):
+    assert parse_int(*args) == expected
+
+
+def test_parse_int_edge_cases():
+    assert math.isnan(parse_int("abc"))
+    assert math.isnan(parse_int("12", 1))
+    assert parse_int("9" * 5000) == math.inf
+
+
+# --- null and undefined ---
+
+def test_null_is_zero_and_undefined_is_nan():
+    assert run("return q_x + 1;", q_x=None) == 1
+    assert math.isnan(run("return q_x + 1;", q_x=UNDEFINED))
+    assert to_output_value(run("return q_x * 2;", q_x=UNDEFINED)) is None
+    assert run("return q_x ?? 5;", q_x=None) == 5
+    assert run("return q_x == null;", q_x=UNDEFINED) is True
+    assert run("return q_x === null;", q_x=UNDEFINED) is False
+
+
+def test_unknown_identifier_is_an_evaluation_error():
+    with pytest.raises(FormulaEvaluationError):
+        run("return missing + 1;")
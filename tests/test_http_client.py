@@ -0,0 +1,162 @@
+import asyncio
+
+import httpx
+import pytest
+
+import http_client
+from http_client import CircuitBreaker, CircuitOpenError, arequest, request
+
+URL = "https://supabase.test/rest/v1/prompts"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Supabase:
+    """MockTransport handler answering with the queued statuses (or raising queued exceptions)."""
+
+    def __init__(self):
+        self.responses = []
+        self.calls = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return httpx.Response(response, json=[])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_client.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    supabase = Supabase()
+    transport = httpx.MockTransport(supabase)
+    monkeypatch.setitem(http_client._client_cache, "sync", httpx.Client(transport=transport))
+    monkeypatch.setitem(http_client._client_cache, "async", httpx.AsyncClient(transport=transport))
+    return supabase
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=2, reset_seconds=30)
+
+
+def open_breaker(breaker, supabase):
+    supabase.responses += [503, 503]
+    for _ in range(2):
+        request("GET", URL, breaker=breaker)
+    assert breaker.state == "open"
+
+
+# --- Closed -> open ---
+
+def test_consecutive_failures_open_the_circuit(breaker, supabase):
+    supabase.responses += [500, 200, 429, 503]
+    request("GET", URL, breaker=breaker)
+    request("GET", URL, breaker=breaker)  # A success resets the count
+    request("GET", URL, breaker=breaker)
+    assert breaker.state == "closed"
+    request("GET", URL, breaker=breaker)
+    assert breaker.state == "open"
+
+
+def test_network_errors_count_as_failures(breaker, supabase):
+    supabase.responses += [httpx.ConnectError("refused"), httpx.ReadTimeout("slow")]
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPError):
+            request("GET", URL, breaker=breaker)
+    assert breaker.state == "open"
+
+
+def test_open_circuit_fails_fast(breaker, supabase):
+    open_breaker(breaker, supabase)
+    with pytest.raises(CircuitOpenError):
+        request("GET", URL, breaker=breaker)
+    assert supabase.calls == 2
+
+
+# --- Half-open ---
+
+def test_successful_trial_closes_the_circuit(breaker, supabase, clock):
+    open_breaker(breaker, supabase)
+    clock.now += 30
+    assert breaker.state == "half_open"
+    supabase.responses += [200, 200]
+    request("GET", URL, breaker=breaker)
+    assert breaker.state == "closed"
+    assert request("GET", URL, breaker=breaker).status_code == 200
+
+
+def test_failed_trial_reopens_the_circuit(breaker, supabase, clock):
+    open_breaker(breaker, supabase)
+    clock.now += 30
+    supabase.responses.append(500)
+    request("GET", URL, breaker=breaker)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        request("GET", URL, breaker=breaker)
+    assert supabase.calls == 3
+
+
+def test_only_one_trial_while_half_open(breaker, supabase, clock):
+    open_breaker(breaker, supabase)
+    clock.now += 30
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_unrelated_exception_releases_the_trial(breaker, supabase, clock):
+    # Regression: an exception that says nothing about Supabase left the breaker half-open for good
+    open_breaker(breaker, supabase)
+    clock.now += 30
+    supabase.responses += [RuntimeError("bug in a hook"), 200]
+    with pytest.raises(RuntimeError):
+        request("GET", URL, breaker=breaker)
+    assert breaker.state == "half_open"
+    assert breaker.failures == 2
+    request("GET", URL, breaker=breaker)
+    assert breaker.state == "closed"
+
+
+def test_encoding_error_does_not_take_the_trial(breaker, supabase, clock):
+    open_breaker(breaker, supabase)
+    clock.now += 30
+    body = {}
+    body["self"] = body
+    with pytest.raises(ValueError):
+        request("POST", URL, json_body=body, breaker=breaker)
+    supabase.responses.append(200)
+    request("GET", URL, breaker=breaker)
+    assert breaker.state == "closed"
+    assert supabase.calls == 3
+
+
+# --- Async client ---
+
+def test_async_requests_share_the_breaker(breaker, supabase, clock):
+    async def scenario():
+        supabase.responses += [502, 502, 200]
+        for _ in range(2):
+            await arequest("GET", URL, breaker=breaker)
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await arequest("GET", URL, breaker=breaker)
+        clock.now += 30
+        await arequest("GET", URL, breaker=breaker)
+        assert breaker.state == "closed"
+
+    asyncio.run(scenario())
+    assert supabase.calls == 3
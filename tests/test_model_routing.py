@@ -0,0 +1,191 @@
+import json
+from typing import Any, List, Optional, TypedDict
+
+import httpx
+import openai
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import model_routing
+from model_routing import DEFAULT_ROUTES, LARGE_MODEL, SMALL_MODEL, ModelRouter, build_routes
+
+OPENAI_REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def timeout_error():
+    return openai.APITimeoutError(request=OPENAI_REQUEST)
+
+
+def rate_limit_error():
+    return openai.RateLimitError("Rate limit reached", response=httpx.Response(429, request=OPENAI_REQUEST), body=None)
+
+
+class Answer(TypedDict):
+    text: str
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers every structured call with its own model name, or raises the error queued for its model."""
+    model_name: str
+    errors: dict = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any):
+        return self.bind(tools=tools, **kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.model_name in self.errors:
+            raise self.errors[self.model_name]()
+        message = AIMessage(content="", tool_calls=[{"name": "Answer", "args": {"text": self.model_name}, "id": "call_1"}])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class FakeFactory:
+    """Model factory for set_model_factory; records the options each model was built with."""
+
+    def __init__(self):
+        self.errors = {}
+        self.built = []
+
+    def __call__(self, model, temperature, **options):
+        self.built.append({"model": model, "temperature": temperature, **options})
+        return FakeChatModel(model_name=model, errors=self.errors, callbacks=options["callbacks"])
+
+
+@pytest.fixture
+def factory():
+    return FakeFactory()
+
+
+@pytest.fixture
+def router(factory, monkeypatch):
+    monkeypatch.delenv("MODEL_ROUTES", raising=False)
+    router = ModelRouter(build_routes())
+    router.set_model_factory(factory)
+    return router
+
+
+def model_stats(router, node, model):
+    return router.report()["nodes"][node]["models"][model]
+
+
+# --- Structured output ---
+
+def test_structured_uses_the_primary_model(router, factory):
+    assert router.structured("decision_variables", Answer).invoke("hi") == {"text": LARGE_MODEL}
+    assert factory.built[0]["timeout"] == DEFAULT_ROUTES["decision_variables"]["timeout"]
+    stats = model_stats(router, "decision_variables", LARGE_MODEL)
+    assert (stats["calls"], stats["fallback_calls"], stats["errors"]) == (1, 0, {})
+    assert stats["p50_ms"] is not None
+
+
+@pytest.mark.parametrize("error", [timeout_error, rate_limit_error])
+def test_structured_falls_back_on_timeout_and_rate_limit(router, factory, error):
+    factory.errors[LARGE_MODEL] = error
+    assert router.structured("decision_variables", Answer).invoke("hi") == {"text": SMALL_MODEL}
+    primary = model_stats(router, "decision_variables", LARGE_MODEL)
+    fallback = model_stats(router, "decision_variables", SMALL_MODEL)
+    assert primary["errors"] == {error().__class__.__name__: 1}
+    assert (fallback["calls"], fallback["fallback_calls"], fallback["errors"]) == (1, 1, {})
+
+
+def test_other_errors_do_not_fall_back(router, factory):
+    factory.errors[LARGE_MODEL] = lambda: ValueError("bad request")
+    with pytest.raises(ValueError):
+        router.structured("decision_variables", Answer).invoke("hi")
+    assert SMALL_MODEL not in router.report()["nodes"]["decision_variables"]["models"]
+
+
+def test_stats_are_kept_per_node_and_model(router):
+    router.structured("raw_indicators", Answer).invoke("hi")
+    router.structured("raw_indicators", Answer).invoke("hi")
+    router.structured("decision_variables", Answer).invoke("hi")
+    assert model_stats(router, "raw_indicators", SMALL_MODEL)["calls"] == 2
+    assert model_stats(router, "decision_variables", LARGE_MODEL)["calls"] == 1
+    assert router.report()["nodes"]["questionnaire"]["models"] == {}
+
+
+def test_models_are_cached_until_the_factory_changes(router, factory):
+    assert router.chat_model("questionnaire") is router.chat_model("questionnaire")
+    assert router.chat_model("questionnaire", streaming=True) is not router.chat_model("questionnaire")
+    assert factory.built[-1].get("streaming") is True
+    router.set_model_factory(FakeFactory())
+    assert len(factory.built) == 2
+    router.chat_model("questionnaire")
+    assert len(factory.built) == 2
+
+
+def test_unknown_node_has_no_route(router):
+    with pytest.raises(KeyError):
+        router.structured("unknown_node", Answer)
+
+
+# --- Plain completions ---
+
+def test_complete_falls_back_to_the_next_model(router, monkeypatch):
+    requests = []
+
+    def chat_completion(**request):
+        requests.append(request)
+        if request["model"] == LARGE_MODEL:
+            raise timeout_error()
+        return {"model": request["model"]}
+
+    monkeypatch.setattr(model_routing, "chat_completion", chat_completion)
+    assert router.complete("export_section_cards", [{"role": "user", "content": "hi"}]) == {"model": SMALL_MODEL}
+    assert [request["model"] for request in requests] == [LARGE_MODEL, SMALL_MODEL]
+    assert requests[0]["max_tokens"] == DEFAULT_ROUTES["export_section_cards"]["max_tokens"]
+    assert model_stats(router, "export_section_cards", LARGE_MODEL)["errors"] == {"APITimeoutError": 1}
+    assert model_stats(router, "export_section_cards", SMALL_MODEL)["fallback_calls"] == 1
+
+
+def test_complete_raises_when_every_model_fails(router, monkeypatch):
+    def chat_completion(**request):
+        raise rate_limit_error()
+
+    monkeypatch.setattr(model_routing, "chat_completion", chat_completion)
+    with pytest.raises(openai.RateLimitError):
+        router.complete("export_section_cards", [{"role": "user", "content": "hi"}])
+    assert model_stats(router, "export_section_cards", SMALL_MODEL)["errors"] == {"RateLimitError": 1}
+
+
+# --- MODEL_ROUTES overrides ---
+
+def test_overrides_are_applied_and_cast(monkeypatch):
+    monkeypatch.setenv("MODEL_ROUTES", json.dumps({"questionnaire": {"model": "gpt-4.1", "timeout": "240", "max_tokens": "4000"}}))
+    route = build_routes()["questionnaire"]
+    assert route == {**DEFAULT_ROUTES["questionnaire"], "model": "gpt-4.1", "timeout": 240.0, "max_tokens": 4000}
+
+
+def test_invalid_override_entries_are_ignored(monkeypatch):
+    monkeypatch.setenv("MODEL_ROUTES", json.dumps({
+        "unknown_node": {"model": "gpt-4.1"},
+        "questionnaire": "gpt-4.1",
+        "raw_indicators": {"model": "gpt-4.1-nano", "retries": 5},
+    }))
+    routes = build_routes()
+    assert "unknown_node" not in routes
+    assert routes["questionnaire"] == DEFAULT_ROUTES["questionnaire"]
+    assert routes["raw_indicators"] == {**DEFAULT_ROUTES["raw_indicators"], "model": "gpt-4.1-nano"}
+
+
+@pytest.mark.parametrize("spec", ["{not json", "[1, 2]"])
+def test_malformed_overrides_keep_the_default_routes(monkeypatch, spec):
+    monkeypatch.setenv("MODEL_ROUTES", spec)
+    assert build_routes() == DEFAULT_ROUTES
+
+
+def test_null_fallback_model_disables_the_fallback(monkeypatch, factory):
+    monkeypatch.setenv("MODEL_ROUTES", json.dumps({"decision_variables": {"fallback_model": None}}))
+    router = ModelRouter(build_routes())
+    router.set_model_factory(factory)
+    factory.errors[LARGE_MODEL] = timeout_error
+    with pytest.raises(openai.APITimeoutError):
+        router.structured("decision_variables", Answer).invoke("hi")
+    assert [built["model"] for built in factory.built] == [LARGE_MODEL]
@@ -0,0 +1,240 @@
+import threading
+import time
+
+import pytest
+
+import save_outbox
+from save_outbox import (
+    DONE,
+    IN_FLIGHT_TIMEOUT_SECONDS,
+    MAX_SAVE_ATTEMPTS,
+    OutboxFlusher,
+    SaveOutbox,
+    flush_entry,
+)
+from storage import StorageBackend
+
+
+class Clock:
+    """Stands in for the time module inside save_outbox."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+class StubStorage(StorageBackend):
+    """In-memory storage; fails every write while `failing` is set."""
+
+    def __init__(self):
+        self.tables = {}
+        self.failing = False
+
+    def upsert(self, table, rows):
+        if self.failing:
+            return False
+        self.tables.setdefault(table, {}).update({row["id"]: row for row in rows})
+        return True
+
+    def fetch_all(self, table):
+        return list(self.tables.get(table, {}).values())
+
+    def fetch_project(self, table, project_id):
+        return [row for row in self.fetch_all(table) if row.get("project_id") == project_id]
+
+    def delete(self, table, ids):
+        if self.failing:
+            return False
+        for row_id in ids:
+            self.tables.get(table, {}).pop(row_id, None)
+        return True
+
+
+def rows(project_id, *names):
+    return {"raw_indicators": [{"id": f"{project_id}_{name}", "project_id": project_id, "name": name} for name in names]}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(save_outbox, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = StubStorage()
+    monkeypatch.setattr(save_outbox, "get_storage", lambda: storage)
+    return storage
+
+
+@pytest.fixture
+def outbox(tmp_path, clock):
+    return SaveOutbox(str(tmp_path / "save_outbox.db"))
+
+
+def entry_row(outbox, seq):
+    return outbox._connection().execute(
+        "SELECT status, attempts, rows_json FROM outbox WHERE seq = ?", (seq,)).fetchone()
+
+
+# --- Enqueue ---
+
+def test_newer_save_supersedes_pending_saves_of_the_project(outbox):
+    first = outbox.enqueue("a", rows("a", "sales"))
+    other = outbox.enqueue("b", rows("b", "sales"))
+    latest = outbox.enqueue("a", rows("a", "sales", "costs"))
+    assert entry_row(outbox, first)[0] == save_outbox.SUPERSEDED
+    assert entry_row(outbox, other)[0] == save_outbox.PENDING
+    assert outbox.status("a")["save_id"] == latest
+    assert outbox.status("a")["status"] == "queued"
+
+
+def test_enqueue_requires_a_project_id(outbox):
+    with pytest.raises(ValueError):
+        outbox.enqueue("", rows("a", "sales"))
+
+
+def test_in_flight_save_is_not_superseded(outbox):
+    first = outbox.enqueue("a", rows("a", "sales"))
+    outbox.claim_due()
+    outbox.enqueue("a", rows("a", "costs"))
+    assert entry_row(outbox, first)[0] == save_outbox.IN_FLIGHT
+
+
+# --- Claiming ---
+
+def test_saves_of_one_project_are_claimed_in_order(outbox):
+    a1 = outbox.enqueue("a", rows("a", "sales"))
+    b1 = outbox.enqueue("b", rows("b", "sales"))
+    assert outbox.claim_due()["seq"] == a1
+    a2 = outbox.enqueue("a", rows("a", "costs"))
+    assert outbox.claim_due()["seq"] == b1
+    assert outbox.claim_due() is None  # a2 waits for a1
+    outbox.mark_done(a1)
+    claimed = outbox.claim_due()
+    assert claimed["seq"] == a2
+    assert claimed["rows_by_table"] == rows("a", "costs")
+
+
+def test_orphaned_in_flight_save_is_claimed_again(outbox, clock):
+    seq = outbox.enqueue("a", rows("a", "sales"))
+    assert outbox.claim_due()["seq"] == seq
+    assert outbox.claim_due() is None
+    clock.now += IN_FLIGHT_TIMEOUT_SECONDS + 1
+    assert outbox.claim_due()["seq"] == seq
+
+
+def test_orphaned_save_does_not_block_the_next_save_of_the_project(outbox, clock):
+    orphan = outbox.enqueue("a", rows("a", "sales"))
+    outbox.claim_due()
+    outbox.enqueue("a", rows("a", "costs"))
+    clock.now += IN_FLIGHT_TIMEOUT_SECONDS + 1
+    assert outbox.claim_due()["seq"] == orphan
+
+
+# --- Retries ---
+
+def test_failed_save_is_retried_with_backoff(outbox, storage, clock):
+    seq = outbox.enqueue("a", rows("a", "sales"))
+    storage.failing = True
+    assert flush_entry(outbox, outbox.claim_due()) is False
+    status = outbox.status("a")
+    assert status["status"] == "retrying" and status["attempts"] == 1
+    assert clock.now < status["next_attempt_at"] <= clock.now + save_outbox.BASE_BACKOFF_SECONDS
+    assert outbox.claim_due() is None
+
+    clock.now = status["next_attempt_at"]
+    storage.failing = False
+    assert flush_entry(outbox, outbox.claim_due()) is True
+    assert outbox.status("a")["status"] == "saved"
+    assert set(storage.tables["raw_indicators"]) == {"a_sales"}
+    assert entry_row(outbox, seq)[:2] == (DONE, 1)
+
+
+def test_backoff_grows_exponentially(outbox, clock):
+    seq = outbox.enqueue("a", rows("a", "sales"))
+    outbox.mark_failed_attempt(seq, 4, "Supabase down")
+    delay = outbox.status("a")["next_attempt_at"] - clock.now
+    assert 4 * save_outbox.BASE_BACKOFF_SECONDS <= delay <= 8 * save_outbox.BASE_BACKOFF_SECONDS
+
+
+def test_save_fails_after_the_last_attempt(outbox, storage):
+    seq = outbox.enqueue("a", rows("a", "sales"))
+    outbox.mark_failed_attempt(seq, MAX_SAVE_ATTEMPTS, "Supabase down")
+    status = outbox.status("a")
+    assert status["status"] == "failed"
+    assert status["last_error"] == "Supabase down"
+    assert status["next_attempt_at"] is None
+    assert outbox.claim_due() is None
+
+
+# --- Pruning ---
+
+def test_prune_keeps_the_latest_entry_of_each_project(outbox, clock):
+    superseded = outbox.enqueue("a", rows("a", "sales"))
+    done = outbox.enqueue("a", rows("a", "costs"))
+    outbox.mark_done(outbox.claim_due()["seq"])
+    latest = outbox.enqueue("a", rows("a", "stock"))
+    outbox.mark_done(outbox.claim_due()["seq"])
+    only = outbox.enqueue("b", rows("b", "sales"))
+    outbox.mark_done(outbox.claim_due()["seq"])
+
+    clock.now += 100
+    assert outbox.prune(older_than_seconds=50) == 2
+    assert entry_row(outbox, superseded) is None
+    assert entry_row(outbox, done) is None
+    assert entry_row(outbox, latest) == (DONE, 0, "{}")
+    assert entry_row(outbox, only) == (DONE, 0, "{}")
+    assert outbox.status("a")["status"] == "saved"
+    assert outbox.status("b")["save_id"] == only
+
+
+def test_prune_keeps_recent_and_unfinished_entries(outbox, clock):
+    done = outbox.enqueue("a", rows("a", "sales"))
+    outbox.mark_done(outbox.claim_due()["seq"])
+    pending = outbox.enqueue("a", rows("a", "costs"))
+    clock.now += 100
+    assert outbox.prune(older_than_seconds=500) == 0
+    assert outbox.prune(older_than_seconds=50) == 1
+    assert entry_row(outbox, done) is None
+    assert entry_row(outbox, pending)[0] == save_outbox.PENDING
+
+
+# --- Flusher and singleton ---
+
+def test_flusher_drains_the_outbox(tmp_path, storage):
+    outbox = SaveOutbox(str(tmp_path / "save_outbox.db"))
+    flusher = OutboxFlusher(outbox)
+    flusher.start()
+    try:
+        outbox.enqueue("a", rows("a", "sales"))
+        deadline = time.monotonic() + 5
+        while outbox.status("a")["status"] != "saved" and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        flusher.stop(timeout=5)
+    assert outbox.status("a")["status"] == "saved"
+    assert set(storage.tables["raw_indicators"]) == {"a_sales"}
+
+
+def test_get_outbox_creates_one_outbox_under_concurrent_calls(monkeypatch):
+    created = []
+
+    class SlowOutbox:
+        def __init__(self, path):
+            time.sleep(0.05)
+            created.append(self)
+
+    monkeypatch.setattr(save_outbox, "SaveOutbox", SlowOutbox)
+    monkeypatch.setitem(save_outbox._outbox_cache, "outbox", None)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(save_outbox.get_outbox())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(result is created[0] for result in results)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, request_key
+
+
+class Work:
+    """Work function that counts its runs and takes long enough for a second caller to attach."""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.calls += 1
+        time.sleep(0.05)
+        if self.error is not None:
+            raise self.error
+        return self.result if self.result is not None else {"args": list(args)}
+
+
+# --- Coalescing ---
+
+def test_concurrent_identical_calls_run_once():
+    flights, work = SingleFlight(), Work()
+
+    async def scenario():
+        return await asyncio.gather(flights.run("kind:a", work, "bakery"), flights.run("kind:a", work, "bakery"))
+
+    first, second = asyncio.run(scenario())
+    assert work.calls == 1
+    assert first is second
+    assert flights.stats()["kind"] == {"executed": 1, "coalesced": 1, "in_flight": 0, "coalesced_ratio": 0.5}
+
+
+def test_different_keys_run_separately():
+    flights, work = SingleFlight(), Work()
+
+    async def scenario():
+        return await asyncio.gather(flights.run("kind:a", work, "bakery"), flights.run("kind:b", work, "tailor"))
+
+    first, second = asyncio.run(scenario())
+    assert work.calls == 2
+    assert (first["args"], second["args"]) == (["bakery"], ["tailor"])
+
+
+def test_landed_flight_is_not_cached():
+    flights, work = SingleFlight(), Work()
+
+    async def scenario():
+        await flights.run("kind:a", work)
+        await flights.run("kind:a", work)
+
+    asyncio.run(scenario())
+    assert work.calls == 2
+
+
+def test_error_reaches_every_caller():
+    flights, work = SingleFlight(), Work(error=RuntimeError("model down"))
+
+    async def scenario():
+        return await asyncio.gather(flights.run("kind:a", work), flights.run("kind:a", work), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert work.calls == 1
+    assert [str(result) for result in results] == ["model down", "model down"]
+
+
+def test_disconnected_caller_does_not_cancel_the_flight():
+    flights, work = SingleFlight(), Work(result={"ok": True})
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.run("kind:a", work))
+        follower = asyncio.ensure_future(flights.run("kind:a", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == {"ok": True}
+    assert work.calls == 1
+
+
+# --- Request keys ---
+
+def test_request_key_ignores_volatile_fields_and_prompt_formatting():
+    key = request_key("generate_questionnaire", {"prompt": "Tea  stall\n", "decision_variables": [], "status": "a"})
+    assert key == request_key("generate_questionnaire", {"prompt": "tea stall", "decision_variables": [], "error": "x"})
+    assert key != request_key("generate_questionnaire", {"prompt": "tea stall", "decision_variables": [{}]})
+    assert key.startswith("generate_questionnaire:")
+
+
+# --- Generation endpoint ---
+
+def test_coalesced_generations_get_their_own_project(monkeypatch):
+    api = pytest.importorskip("api")
+    shared_project_id = "11111111-1111-1111-1111-111111111111"
+    work = Work(result={
+        "prompt": "Tea stall",
+        "project_id": shared_project_id,
+        "raw_indicators": [{"id": f"{shared_project_id}_ri_1", "var_name": "cups_per_day", "project_id": shared_project_id}],
+        "decision_variables": [{"id": f"{shared_project_id}_dv_1", "var_name": "monthly_income", "project_id": shared_project_id}],
+    })
+    monkeypatch.setattr(api, "generation_flights", SingleFlight())
+    monkeypatch.setattr(api, "_generate_variables_pipeline", work)
+
+    async def scenario():
+        request = api.InitialWorkflowRequest(prompt="Tea stall")
+        return await asyncio.gather(api.step_generate_variables(request), api.step_generate_variables(request))
+
+    states = [json.loads(response.body) for response in asyncio.run(scenario())]
+    assert work.calls == 1
+    project_ids = {state["project_id"] for state in states}
+    assert len(project_ids) == 2 and shared_project_id not in project_ids
+    for state in states:
+        for var in state["raw_indicators"] + state["decision_variables"]:
+            assert var["project_id"] == state["project_id"]
+            assert var["id"].startswith(f"{state['project_id']}_")
+    # The shared result itself is left as the flight produced it
+    assert work.result["raw_indicators"][0]["id"] == f"{shared_project_id}_ri_1"
+
+
+def test_new_project_copies_do_not_share_lists():
+    api = pytest.importorskip("api")
+    shared = {"project_id": "p", "raw_indicators": [{"id": "p_ri_1", "project_id": "p"}], "decision_variables": []}
+    first, second = api._as_new_project(shared), api._as_new_project(shared)
+    assert first["raw_indicators"] is not second["raw_indicators"]
+    assert first["raw_indicators"][0] is not second["raw_indicators"][0]
+    first["raw_indicators"].append({"id": "extra"})
+    assert len(second["raw_indicators"]) == 1 and len(shared["raw_indicators"]) == 1
@@ -0,0 +1,120 @@
+import pytest
+
+from storage import SAVE_LEDGER_TABLE, SQLiteStorage, load_save_ledger, save_project_rows
+
+PROJECT = "project-1"
+
+
+class RecordingStorage(SQLiteStorage):
+    """SQLiteStorage that records the writes save_project_rows sends, and can be made to fail them."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.upserts = []
+        self.deletes = []
+        self.failing_tables = set()
+
+    def upsert(self, table, rows):
+        if table != SAVE_LEDGER_TABLE:
+            self.upserts.append((table, sorted(row["id"] for row in rows)))
+        return table not in self.failing_tables and super().upsert(table, rows)
+
+    def delete(self, table, ids):
+        self.deletes.append((table, sorted(ids)))
+        return table not in self.failing_tables and super().delete(table, ids)
+
+
+def indicator(row_id, name):
+    return {"id": row_id, "project_id": PROJECT, "var_name": row_id, "name": name}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = RecordingStorage(str(tmp_path / "assessments.db"))
+    save_project_rows(storage, PROJECT, {
+        "raw_indicators": [indicator("ri_1", "Sales"), indicator("ri_2", "Costs")],
+        "questions": [{"id": "q_1", "project_id": PROJECT, "text": "Daily sales?"}],
+    })
+    storage.upserts.clear()
+    return storage
+
+
+def stored(storage, table):
+    return {row["id"]: row for row in storage.fetch_project(table, PROJECT)}
+
+
+# --- Delta saves ---
+
+def test_first_save_inserts_every_row(tmp_path):
+    storage = RecordingStorage(str(tmp_path / "assessments.db"))
+    summary = save_project_rows(storage, PROJECT, {"raw_indicators": [indicator("ri_1", "Sales")]})
+    assert summary["inserted"] == 1
+    assert storage.upserts == [("raw_indicators", ["ri_1"])]
+    assert set(load_save_ledger(storage, PROJECT)["raw_indicators"]) == {"ri_1"}
+
+
+def test_unchanged_rows_are_skipped(storage):
+    summary = save_project_rows(storage, PROJECT, {
+        "raw_indicators": [indicator("ri_1", "Sales"), indicator("ri_2", "Costs")]})
+    assert summary["unchanged"] == 2
+    assert summary["inserted"] == summary["updated"] == summary["deleted"] == 0
+    assert storage.upserts == [] and storage.deletes == []
+
+
+def test_changed_rows_are_upserted(storage):
+    summary = save_project_rows(storage, PROJECT, {
+        "raw_indicators": [indicator("ri_1", "Sales"), indicator("ri_2", "Operating costs"), indicator("ri_3", "Stock")]})
+    assert (summary["updated"], summary["inserted"], summary["unchanged"]) == (1, 1, 1)
+    assert storage.upserts == [("raw_indicators", ["ri_2", "ri_3"])]
+    assert stored(storage, "raw_indicators")["ri_2"]["name"] == "Operating costs"
+
+
+def test_removed_rows_are_deleted(storage):
+    summary = save_project_rows(storage, PROJECT, {"raw_indicators": [indicator("ri_1", "Sales")]})
+    assert summary["deleted"] == 1
+    assert storage.deletes == [("raw_indicators", ["ri_2"])]
+    assert set(stored(storage, "raw_indicators")) == {"ri_1"}
+    assert set(load_save_ledger(storage, PROJECT)["raw_indicators"]) == {"ri_1"}
+
+
+def test_missing_table_is_left_untouched(storage):
+    # A state field that is None is omitted from rows_by_table by build_supabase_rows
+    save_project_rows(storage, PROJECT, {"questions": [{"id": "q_1", "project_id": PROJECT, "text": "Daily sales?"}]})
+    assert storage.upserts == [] and storage.deletes == []
+    assert set(stored(storage, "raw_indicators")) == {"ri_1", "ri_2"}
+
+
+def test_empty_table_is_cleared(storage):
+    summary = save_project_rows(storage, PROJECT, {"raw_indicators": []})
+    assert summary["deleted"] == 2
+    assert stored(storage, "raw_indicators") == {}
+    assert set(stored(storage, "questions")) == {"q_1"}
+
+
+def test_failed_writes_are_retried_on_the_next_save(storage):
+    rows = [indicator("ri_1", "Monthly sales")]
+    storage.failing_tables.add("raw_indicators")
+    summary = save_project_rows(storage, PROJECT, {"raw_indicators": rows})
+    assert summary["failed_tables"] == ["raw_indicators"]
+
+    storage.failing_tables.clear()
+    storage.upserts.clear()
+    storage.deletes.clear()
+    summary = save_project_rows(storage, PROJECT, {"raw_indicators": rows})
+    assert summary["failed_tables"] == []
+    assert storage.upserts == [("raw_indicators", ["ri_1"])]
+    assert storage.deletes == [("raw_indicators", ["ri_2"])]
+    assert set(stored(storage, "raw_indicators")) == {"ri_1"}
+
+
+# --- Rows from the workflow state ---
+
+def test_build_supabase_rows_omits_none_and_keeps_empty_lists():
+    nodes = pytest.importorskip("nodes")
+    rows_by_table = nodes.build_supabase_rows({
+        "project_id": PROJECT, "prompt": "Assess a bakery", "raw_indicators": [], "decision_variables": None,
+        "questionnaire": None,
+    })
+    assert rows_by_table["raw_indicators"] == []
+    assert "decision_variables" not in rows_by_table
+    assert "questions" not in rows_by_table